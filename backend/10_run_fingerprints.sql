@@ -0,0 +1,21 @@
+-- ============================================================================
+-- Run deduplication by parameter fingerprint
+-- Run this in Supabase SQL Editor
+-- ============================================================================
+--
+-- runs.fingerprint is a SHA-256 of geomarker_id (per version), start_date,
+-- end_date, method, cloud_threshold and parameters (app/utils/fingerprint.py).
+-- create_run returns an existing queued/processing/completed run with the
+-- same fingerprint instead of queueing duplicate GEE work.
+
+ALTER TABLE runs
+ADD COLUMN IF NOT EXISTS fingerprint TEXT;
+
+COMMENT ON COLUMN runs.fingerprint IS 'Canonical hash of the analysis parameters (deduplication)';
+
+CREATE INDEX IF NOT EXISTS idx_runs_fingerprint
+ON runs (fingerprint, created_at DESC);
+
+-- At most one in-flight run per fingerprint, even under concurrent clicks
+CREATE UNIQUE INDEX IF NOT EXISTS uq_runs_fingerprint_in_flight
+ON runs (fingerprint) WHERE status IN ('queued', 'processing');
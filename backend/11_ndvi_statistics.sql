@@ -0,0 +1,34 @@
+-- ============================================================================
+-- Statistics-only monitoring cache (Sentinel Hub Statistical API)
+-- Run this in Supabase SQL Editor
+-- ============================================================================
+--
+-- One row per geomarker version and aggregation interval (see
+-- app/services/statistics_service.py). A geomarker version never changes
+-- its geometry, so a cached interval is valid forever; a new version
+-- starts a new set of rows. cache_key also covers resolution, the
+-- cloud filter and the NDVI floor, so changing any of them does not serve
+-- stale numbers.
+
+CREATE TABLE IF NOT EXISTS ndvi_statistics (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  cache_key TEXT NOT NULL UNIQUE,
+  geomarker_id UUID NOT NULL REFERENCES geomarkers(id) ON DELETE CASCADE,
+  geomarker_version INTEGER NOT NULL,
+  interval_from DATE NOT NULL,
+  interval_to DATE NOT NULL,
+  resolution_m INTEGER NOT NULL,
+  max_cloud_coverage INTEGER NOT NULL,
+  ndvi_floor DOUBLE PRECISION NOT NULL,
+  mean_ndvi DOUBLE PRECISION,
+  below_fraction DOUBLE PRECISION,
+  cloud_fraction DOUBLE PRECISION,
+  valid_pixel_count BIGINT NOT NULL DEFAULT 0,
+  sample_count BIGINT NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE ndvi_statistics IS 'Cached per-geomarker NDVI aggregates from the Sentinel Hub Statistical API';
+
+CREATE INDEX IF NOT EXISTS idx_ndvi_statistics_geomarker
+ON ndvi_statistics (geomarker_id, geomarker_version, interval_from);
@@ -0,0 +1,25 @@
+-- ============================================================================
+-- Incremental monitoring: acquisition watermarks
+-- Run this in Supabase SQL Editor
+-- ============================================================================
+--
+-- One row per project and geomarker: the last Sentinel-2 acquisition date
+-- folded into the cached composite at composite_path (a compressed .npz in
+-- the results bucket, see app/services/monitoring_service.py). The next run
+-- only fetches acquisitions after last_acquisition_date and compares them
+-- against that composite. A new geomarker version or resolution invalidates
+-- the row and the next run rebuilds the composite from scratch.
+
+CREATE TABLE IF NOT EXISTS acquisition_watermarks (
+  project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+  geomarker_id UUID NOT NULL REFERENCES geomarkers(id) ON DELETE CASCADE,
+  geomarker_version INTEGER NOT NULL,
+  resolution_m INTEGER NOT NULL,
+  last_acquisition_date DATE NOT NULL,
+  composite_path TEXT NOT NULL,
+  run_id UUID REFERENCES runs(id) ON DELETE SET NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (project_id, geomarker_id)
+);
+
+COMMENT ON TABLE acquisition_watermarks IS 'Last processed acquisition and cached composite per project/geomarker';
@@ -0,0 +1,236 @@
+-- ============================================================================
+-- Per-project rollups, maintained incrementally on ingestion
+-- Run this in Supabase SQL Editor (after 5_ingest_gee_result.sql)
+-- ============================================================================
+--
+-- One row per project with cumulative run figures, so project lists and
+-- dashboards read one row per project instead of scanning every run.
+--
+-- apply_run_rollups(p_run_ids) is called by the backend right after a GEE
+-- result is ingested (app/services/rollup_service.py). runs.rolled_up_hectares
+-- remembers what each run already contributed, so a run that is ingested
+-- again (new idempotency key) only adds the difference and is counted once.
+-- It locks runs in id order, like ingest_gee_results
+-- (6_ingest_gee_results_bulk.sql), then rollup rows in project_id order,
+-- so concurrent ingestions and rollups cannot deadlock.
+--
+-- backfill_project_rollups() recomputes every row from the runs table in
+-- one statement: run it once after this migration (backfill_rollups.py),
+-- and again whenever rollups are suspected to be off.
+
+ALTER TABLE runs
+ADD COLUMN IF NOT EXISTS rolled_up_hectares NUMERIC;
+
+COMMENT ON COLUMN runs.rolled_up_hectares IS 'hectares_change already counted in project_rollups (NULL = not yet)';
+
+CREATE TABLE IF NOT EXISTS project_rollups (
+  project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+  run_count INTEGER NOT NULL DEFAULT 0,
+  total_hectares_lost NUMERIC NOT NULL DEFAULT 0,
+  worst_run_id UUID REFERENCES runs(id) ON DELETE SET NULL,
+  worst_hectares_change NUMERIC,
+  worst_end_date DATE,
+  last_run_id UUID REFERENCES runs(id) ON DELETE SET NULL,
+  last_hectares_change NUMERIC,
+  last_end_date DATE,
+  previous_run_id UUID REFERENCES runs(id) ON DELETE SET NULL,
+  previous_hectares_change NUMERIC,
+  previous_end_date DATE,
+  -- Last vs previous run loss: increasing | decreasing | stable | unknown
+  trend TEXT NOT NULL DEFAULT 'unknown',
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE project_rollups IS 'Cumulative run figures per project, updated on each ingested run';
+
+-- Loss differences up to this many hectares count as a stable trend
+CREATE OR REPLACE FUNCTION rollup_trend(p_last NUMERIC, p_previous NUMERIC)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE
+    WHEN p_last IS NULL OR p_previous IS NULL THEN 'unknown'
+    WHEN p_last > p_previous + 0.1 THEN 'increasing'
+    WHEN p_last < p_previous - 0.1 THEN 'decreasing'
+    ELSE 'stable'
+  END;
+$$;
+
+CREATE OR REPLACE FUNCTION apply_run_rollups(p_run_ids UUID[])
+RETURNS SETOF project_rollups
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_run runs%ROWTYPE;
+  v_roll project_rollups%ROWTYPE;
+  v_hectares NUMERIC;
+BEGIN
+  -- Take every lock up front in a fixed order; the loop below then folds
+  -- runs in end_date order without acquiring new row locks out of order
+  PERFORM 1 FROM runs
+  WHERE id = ANY(p_run_ids) AND status = 'completed'
+  ORDER BY id
+  FOR UPDATE;
+
+  INSERT INTO project_rollups (project_id)
+  SELECT DISTINCT project_id FROM runs
+  WHERE id = ANY(p_run_ids) AND status = 'completed'
+  ORDER BY project_id
+  ON CONFLICT (project_id) DO NOTHING;
+
+  PERFORM 1 FROM project_rollups
+  WHERE project_id IN (SELECT project_id FROM runs WHERE id = ANY(p_run_ids) AND status = 'completed')
+  ORDER BY project_id
+  FOR UPDATE;
+
+  FOR v_run IN
+    SELECT * FROM runs
+    WHERE id = ANY(p_run_ids) AND status = 'completed'
+    ORDER BY end_date, id
+  LOOP
+    v_hectares := COALESCE(v_run.hectares_change, 0);
+
+    SELECT * INTO v_roll FROM project_rollups
+    WHERE project_id = v_run.project_id;
+
+    IF v_run.rolled_up_hectares IS NULL THEN
+      v_roll.run_count := v_roll.run_count + 1;
+    END IF;
+    v_roll.total_hectares_lost := v_roll.total_hectares_lost + v_hectares - COALESCE(v_run.rolled_up_hectares, 0);
+
+    IF v_roll.worst_run_id IS NULL OR v_hectares > v_roll.worst_hectares_change THEN
+      v_roll.worst_run_id := v_run.id;
+      v_roll.worst_hectares_change := v_hectares;
+      v_roll.worst_end_date := v_run.end_date;
+    ELSIF v_roll.worst_run_id = v_run.id THEN
+      -- The worst run shrank: look for the new worst (rare)
+      SELECT id, COALESCE(hectares_change, 0), end_date
+      INTO v_roll.worst_run_id, v_roll.worst_hectares_change, v_roll.worst_end_date
+      FROM runs
+      WHERE project_id = v_run.project_id AND status = 'completed'
+      ORDER BY COALESCE(hectares_change, 0) DESC, end_date DESC
+      LIMIT 1;
+    END IF;
+
+    -- Keep the two most recent runs by end_date (runs may arrive out of order)
+    IF v_roll.last_run_id = v_run.id THEN
+      v_roll.last_hectares_change := v_hectares;
+    ELSIF v_roll.previous_run_id = v_run.id THEN
+      v_roll.previous_hectares_change := v_hectares;
+    ELSIF v_roll.last_run_id IS NULL OR v_run.end_date >= v_roll.last_end_date THEN
+      v_roll.previous_run_id := v_roll.last_run_id;
+      v_roll.previous_hectares_change := v_roll.last_hectares_change;
+      v_roll.previous_end_date := v_roll.last_end_date;
+      v_roll.last_run_id := v_run.id;
+      v_roll.last_hectares_change := v_hectares;
+      v_roll.last_end_date := v_run.end_date;
+    ELSIF v_roll.previous_run_id IS NULL OR v_run.end_date >= v_roll.previous_end_date THEN
+      v_roll.previous_run_id := v_run.id;
+      v_roll.previous_hectares_change := v_hectares;
+      v_roll.previous_end_date := v_run.end_date;
+    END IF;
+
+    v_roll.trend := rollup_trend(v_roll.last_hectares_change, v_roll.previous_hectares_change);
+    v_roll.updated_at := NOW();
+
+    UPDATE project_rollups SET
+      run_count = v_roll.run_count,
+      total_hectares_lost = v_roll.total_hectares_lost,
+      worst_run_id = v_roll.worst_run_id,
+      worst_hectares_change = v_roll.worst_hectares_change,
+      worst_end_date = v_roll.worst_end_date,
+      last_run_id = v_roll.last_run_id,
+      last_hectares_change = v_roll.last_hectares_change,
+      last_end_date = v_roll.last_end_date,
+      previous_run_id = v_roll.previous_run_id,
+      previous_hectares_change = v_roll.previous_hectares_change,
+      previous_end_date = v_roll.previous_end_date,
+      trend = v_roll.trend,
+      updated_at = v_roll.updated_at
+    WHERE project_id = v_run.project_id;
+
+    UPDATE runs SET rolled_up_hectares = v_hectares WHERE id = v_run.id;
+
+    RETURN NEXT v_roll;
+  END LOOP;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION backfill_project_rollups()
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  -- Block concurrent apply_run_rollups() until the backfill commits
+  LOCK TABLE project_rollups IN SHARE ROW EXCLUSIVE MODE;
+
+  WITH ranked AS (
+    SELECT
+      r.id,
+      r.project_id,
+      r.end_date,
+      COALESCE(r.hectares_change, 0) AS hectares,
+      ROW_NUMBER() OVER (PARTITION BY r.project_id ORDER BY r.end_date DESC, r.id DESC) AS recency,
+      ROW_NUMBER() OVER (
+        PARTITION BY r.project_id ORDER BY COALESCE(r.hectares_change, 0) DESC, r.end_date DESC
+      ) AS severity
+    FROM runs r
+    WHERE r.status = 'completed'
+  ),
+  rollups AS (
+    SELECT
+      project_id,
+      COUNT(*) AS run_count,
+      SUM(hectares) AS total_hectares_lost,
+      (ARRAY_AGG(id) FILTER (WHERE severity = 1))[1] AS worst_run_id,
+      MAX(hectares) FILTER (WHERE severity = 1) AS worst_hectares_change,
+      MAX(end_date) FILTER (WHERE severity = 1) AS worst_end_date,
+      (ARRAY_AGG(id) FILTER (WHERE recency = 1))[1] AS last_run_id,
+      MAX(hectares) FILTER (WHERE recency = 1) AS last_hectares_change,
+      MAX(end_date) FILTER (WHERE recency = 1) AS last_end_date,
+      (ARRAY_AGG(id) FILTER (WHERE recency = 2))[1] AS previous_run_id,
+      MAX(hectares) FILTER (WHERE recency = 2) AS previous_hectares_change,
+      MAX(end_date) FILTER (WHERE recency = 2) AS previous_end_date
+    FROM ranked
+    GROUP BY project_id
+  )
+  INSERT INTO project_rollups (
+    project_id, run_count, total_hectares_lost,
+    worst_run_id, worst_hectares_change, worst_end_date,
+    last_run_id, last_hectares_change, last_end_date,
+    previous_run_id, previous_hectares_change, previous_end_date,
+    trend, updated_at
+  )
+  SELECT
+    project_id, run_count, total_hectares_lost,
+    worst_run_id, worst_hectares_change, worst_end_date,
+    last_run_id, last_hectares_change, last_end_date,
+    previous_run_id, previous_hectares_change, previous_end_date,
+    rollup_trend(last_hectares_change, previous_hectares_change), NOW()
+  FROM rollups
+  ON CONFLICT (project_id) DO UPDATE SET
+    run_count = EXCLUDED.run_count,
+    total_hectares_lost = EXCLUDED.total_hectares_lost,
+    worst_run_id = EXCLUDED.worst_run_id,
+    worst_hectares_change = EXCLUDED.worst_hectares_change,
+    worst_end_date = EXCLUDED.worst_end_date,
+    last_run_id = EXCLUDED.last_run_id,
+    last_hectares_change = EXCLUDED.last_hectares_change,
+    last_end_date = EXCLUDED.last_end_date,
+    previous_run_id = EXCLUDED.previous_run_id,
+    previous_hectares_change = EXCLUDED.previous_hectares_change,
+    previous_end_date = EXCLUDED.previous_end_date,
+    trend = EXCLUDED.trend,
+    updated_at = EXCLUDED.updated_at;
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+
+  UPDATE runs SET rolled_up_hectares = COALESCE(hectares_change, 0)
+  WHERE status = 'completed'
+    AND rolled_up_hectares IS DISTINCT FROM COALESCE(hectares_change, 0);
+
+  RETURN v_count;
+END;
+$$;
@@ -0,0 +1,72 @@
+-- ============================================================================
+-- Alerts raised on ingestion, with indexes for filtered keyset pagination
+-- Run this in Supabase SQL Editor (after 13_project_rollups.sql)
+-- ============================================================================
+--
+-- The backend evaluates alert rules on each batch of ingested runs
+-- (app/services/alerts_service.py) and writes the alerts here, so alert
+-- generation costs O(ingested runs) and never rescans the runs table.
+--
+-- GET /alerts pages newest first by (created_at, id). Every combination of
+-- the project, severity and rule filters has a composite index ending in
+-- (created_at DESC, id DESC), so a page is one index range scan whatever
+-- the table size.
+--
+-- One alert per (run, rule): re-ingesting a run replaces its alerts, in one
+-- transaction through replace_run_alerts(p_run_ids, p_alerts).
+
+CREATE TABLE IF NOT EXISTS alerts (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+  run_id UUID REFERENCES runs(id) ON DELETE CASCADE,
+  -- loss_threshold | risk_jump | boundary_breach
+  rule TEXT NOT NULL,
+  severity TEXT NOT NULL CHECK (severity IN ('info', 'warning', 'critical')),
+  title TEXT NOT NULL,
+  message TEXT NOT NULL,
+  geometry JSONB,
+  metric JSONB,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  UNIQUE (run_id, rule)
+);
+
+COMMENT ON TABLE alerts IS 'Alerts raised by rules evaluated on ingested runs and project rollups';
+
+CREATE INDEX IF NOT EXISTS idx_alerts_created ON alerts (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_alerts_project_created ON alerts (project_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_alerts_severity_created ON alerts (severity, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_alerts_project_severity_created
+  ON alerts (project_id, severity, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_alerts_rule_created ON alerts (rule, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_alerts_project_rule_created
+  ON alerts (project_id, rule, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_alerts_severity_rule_created
+  ON alerts (severity, rule, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_alerts_project_severity_rule_created
+  ON alerts (project_id, severity, rule, created_at DESC, id DESC);
+
+-- Called by the backend as supabase.rpc('replace_run_alerts', {p_run_ids, p_alerts})
+-- (AlertQueries.replace_for_runs). p_alerts is a JSON array of alert rows
+-- without id / created_at. Readers never see a run without its alerts.
+CREATE OR REPLACE FUNCTION replace_run_alerts(p_run_ids UUID[], p_alerts JSONB)
+RETURNS SETOF alerts
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  DELETE FROM alerts WHERE run_id = ANY(p_run_ids);
+
+  RETURN QUERY
+  INSERT INTO alerts (project_id, run_id, rule, severity, title, message, geometry, metric)
+  SELECT a.project_id, a.run_id, a.rule, a.severity, a.title, a.message, a.geometry, a.metric
+  FROM jsonb_populate_recordset(NULL::alerts, COALESCE(p_alerts, '[]'::jsonb)) AS a
+  -- A concurrent replace of the same run may have inserted first
+  ON CONFLICT (run_id, rule) DO UPDATE SET
+    severity = EXCLUDED.severity,
+    title = EXCLUDED.title,
+    message = EXCLUDED.message,
+    geometry = EXCLUDED.geometry,
+    metric = EXCLUDED.metric,
+    created_at = NOW()
+  RETURNING alerts.*;
+END;
+$$;
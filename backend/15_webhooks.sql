@@ -0,0 +1,161 @@
+-- ============================================================================
+-- Webhook endpoints and a persistent delivery outbox
+-- Run this in Supabase SQL Editor (after 14_alerts.sql)
+-- ============================================================================
+--
+-- Ingestion turns events (run.completed, alert.raised) into outbox rows,
+-- one per subscribed endpoint, with a single enqueue_webhook_events() call.
+-- Nothing is sent on the request path: the backend's webhook dispatcher
+-- (app/services/webhook_service.py) claims due rows with
+-- claim_webhook_deliveries(), posts them in batches per endpoint and marks
+-- them delivered, schedules a retry with backoff, or dead-letters them.
+--
+-- Claims are leases (like claim_runs in 7_run_leases.sql): rows claimed by
+-- an instance that died go back to pending once the lease expires, so
+-- events survive restarts and are delivered at least once.
+--
+-- Delivered rows are only kept for webhook_retention_days: the dispatcher
+-- deletes older ones in batches with prune_webhook_outbox().
+
+CREATE TABLE IF NOT EXISTS webhook_endpoints (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  url TEXT NOT NULL,
+  -- HMAC-SHA256 key for the X-Bioma-Signature header
+  secret TEXT,
+  -- Event types to receive; empty = every type
+  event_types TEXT[] NOT NULL DEFAULT '{}',
+  -- Only events of this project; NULL = every project
+  project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+  -- Batches in flight at once to this endpoint
+  max_concurrency INTEGER NOT NULL DEFAULT 2 CHECK (max_concurrency > 0),
+  is_active BOOLEAN NOT NULL DEFAULT TRUE,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE webhook_endpoints IS 'Subscribers pushed events by the webhook dispatcher';
+
+CREATE TABLE IF NOT EXISTS webhook_outbox (
+  id BIGSERIAL PRIMARY KEY,
+  endpoint_id UUID NOT NULL REFERENCES webhook_endpoints(id) ON DELETE CASCADE,
+  -- Same for every endpoint an event fans out to; receivers dedupe on it
+  event_id UUID NOT NULL,
+  event_type TEXT NOT NULL,
+  payload JSONB NOT NULL,
+  -- pending | delivering (leased) | delivered | dead
+  status TEXT NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  lease_owner TEXT,
+  lease_expires_at TIMESTAMPTZ,
+  last_error TEXT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  delivered_at TIMESTAMPTZ
+);
+
+COMMENT ON TABLE webhook_outbox IS 'One row per (event, endpoint) until delivered or dead-lettered';
+
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_due
+ON webhook_outbox (next_attempt_at, id) WHERE status = 'pending';
+
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_leased
+ON webhook_outbox (lease_expires_at) WHERE status = 'delivering';
+
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_dead
+ON webhook_outbox (endpoint_id, created_at) WHERE status = 'dead';
+
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_delivered
+ON webhook_outbox (delivered_at) WHERE status = 'delivered';
+
+
+-- p_events: [{"id": uuid, "type": text, "created_at": timestamptz, "data": {...}}]
+CREATE OR REPLACE FUNCTION enqueue_webhook_events(p_events JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  INSERT INTO webhook_outbox (endpoint_id, event_id, event_type, payload, created_at)
+  SELECT e.id, (ev->>'id')::UUID, ev->>'type', ev->'data', COALESCE((ev->>'created_at')::TIMESTAMPTZ, now())
+  FROM jsonb_array_elements(COALESCE(p_events, '[]'::jsonb)) AS ev
+  JOIN webhook_endpoints e
+    ON e.is_active
+   AND (cardinality(e.event_types) = 0 OR ev->>'type' = ANY(e.event_types))
+   AND (e.project_id IS NULL OR e.project_id::TEXT = ev->'data'->>'project_id');
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$;
+
+
+CREATE OR REPLACE FUNCTION claim_webhook_deliveries(
+  p_worker TEXT,
+  p_limit INTEGER,
+  p_lease_seconds INTEGER DEFAULT 300,
+  p_exclude_endpoints UUID[] DEFAULT '{}'
+) RETURNS TABLE (
+  id BIGINT,
+  endpoint_id UUID,
+  event_id UUID,
+  event_type TEXT,
+  payload JSONB,
+  attempts INTEGER,
+  created_at TIMESTAMPTZ,
+  url TEXT,
+  secret TEXT,
+  max_concurrency INTEGER
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  -- Deliveries of a dispatcher that died go back to the queue
+  UPDATE webhook_outbox o SET status = 'pending', lease_owner = NULL, lease_expires_at = NULL
+  WHERE o.status = 'delivering' AND o.lease_expires_at < now();
+
+  RETURN QUERY
+  WITH claimed AS (
+    UPDATE webhook_outbox o SET
+      status = 'delivering',
+      lease_owner = p_worker,
+      lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+      attempts = o.attempts + 1
+    WHERE o.id IN (
+      SELECT d.id FROM webhook_outbox d
+      WHERE d.status = 'pending'
+        AND d.next_attempt_at <= now()
+        AND NOT (d.endpoint_id = ANY(COALESCE(p_exclude_endpoints, '{}')))
+      ORDER BY d.next_attempt_at, d.id
+      LIMIT p_limit
+      FOR UPDATE SKIP LOCKED
+    )
+    RETURNING o.*
+  )
+  SELECT c.id, c.endpoint_id, c.event_id, c.event_type, c.payload, c.attempts, c.created_at,
+         e.url, e.secret, e.max_concurrency
+  FROM claimed c
+  JOIN webhook_endpoints e ON e.id = c.endpoint_id
+  ORDER BY c.id;
+END;
+$$;
+
+
+CREATE OR REPLACE FUNCTION prune_webhook_outbox(p_before TIMESTAMPTZ, p_limit INTEGER DEFAULT 10000)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  DELETE FROM webhook_outbox
+  WHERE id IN (
+    SELECT d.id FROM webhook_outbox d
+    WHERE d.status = 'delivered' AND d.delivered_at < p_before
+    ORDER BY d.delivered_at
+    LIMIT p_limit
+  );
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$;
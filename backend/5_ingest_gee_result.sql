@@ -0,0 +1,69 @@
+-- ============================================================================
+-- Single round-trip, atomic ingestion of GEE results
+-- Run this in Supabase SQL Editor
+-- ============================================================================
+--
+-- Called by the backend as supabase.rpc('ingest_gee_result', {...}) from
+-- POST /runs/{id}/gee-result. Replaces the previous four sequential calls
+-- (get run, update run, update project, insert reports) with one function
+-- that runs in a single transaction.
+--
+-- Idempotency: runs.ingest_key stores the key of the last ingested payload.
+-- A retry with the same key returns outcome='duplicate' and changes nothing;
+-- a new key replaces the run's reports instead of appending to them.
+
+ALTER TABLE runs
+ADD COLUMN IF NOT EXISTS ingest_key TEXT;
+
+COMMENT ON COLUMN runs.ingest_key IS 'Idempotency key of the last ingested GEE result';
+
+CREATE INDEX IF NOT EXISTS idx_reports_run_id ON reports (run_id);
+
+CREATE OR REPLACE FUNCTION ingest_gee_result(
+  p_run_id UUID,
+  p_project_id UUID,
+  p_idempotency_key TEXT,
+  p_stats JSONB,
+  p_hectares_change NUMERIC,
+  p_risk_label TEXT,
+  p_image_url TEXT,
+  p_reports JSONB
+) RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_run runs%ROWTYPE;
+BEGIN
+  -- Lock the run so concurrent retries serialize on it
+  SELECT * INTO v_run FROM runs WHERE id = p_run_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RETURN jsonb_build_object('outcome', 'not_found');
+  END IF;
+
+  IF v_run.status = 'completed' AND v_run.ingest_key = p_idempotency_key THEN
+    RETURN jsonb_build_object('outcome', 'duplicate', 'run', to_jsonb(v_run));
+  END IF;
+
+  UPDATE runs SET
+    status = 'completed',
+    stats = p_stats,
+    hectares_change = p_hectares_change,
+    finished_at = now(),
+    ingest_key = p_idempotency_key
+  WHERE id = p_run_id
+  RETURNING * INTO v_run;
+
+  UPDATE projects SET
+    risk_label = p_risk_label,
+    image_url = COALESCE(p_image_url, image_url)
+  WHERE id = p_project_id;
+
+  DELETE FROM reports WHERE run_id = p_run_id;
+
+  INSERT INTO reports (run_id, report_type, public_url, metadata)
+  SELECT p_run_id, r->>'report_type', r->>'public_url', r->'metadata'
+  FROM jsonb_array_elements(COALESCE(p_reports, '[]'::jsonb)) AS r;
+
+  RETURN jsonb_build_object('outcome', 'ingested', 'run', to_jsonb(v_run));
+END;
+$$;
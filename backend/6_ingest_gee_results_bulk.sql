@@ -0,0 +1,93 @@
+-- ============================================================================
+-- Bulk, set-based ingestion of GEE results
+-- Run this in Supabase SQL Editor (after 5_ingest_gee_result.sql)
+-- ============================================================================
+--
+-- Called by the backend as supabase.rpc('ingest_gee_results', {p_items})
+-- from POST /runs/gee-results. A whole batch is applied with one statement
+-- per table (runs, projects, reports) instead of four calls per run.
+--
+-- p_items is a JSON array of objects with the same fields as the single-run
+-- ingest_gee_result() parameters (without the p_ prefix) plus end_date:
+--   run_id, project_id, idempotency_key, stats, hectares_change,
+--   risk_label, image_url, reports, end_date
+--
+-- Returns a JSON array with one entry per item:
+--   {"run_id": ..., "outcome": "ingested" | "duplicate" | "not_found", "run": {...}}
+
+CREATE OR REPLACE FUNCTION ingest_gee_results(p_items JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_result JSONB;
+BEGIN
+  -- Lock every run in the batch (in id order, so concurrent batches cannot
+  -- deadlock) before reading its status: a concurrent retry of the same
+  -- batch waits here and then sees the first one's ingest_key
+  PERFORM 1 FROM runs
+  WHERE id IN (SELECT (item->>'run_id')::UUID FROM jsonb_array_elements(p_items) AS item)
+  ORDER BY id
+  FOR UPDATE;
+
+  CREATE TEMP TABLE _gee_items ON COMMIT DROP AS
+  SELECT i.*, r.id IS NOT NULL AS run_exists,
+         COALESCE(r.status = 'completed' AND r.ingest_key = i.idempotency_key, false) AS is_duplicate
+  FROM jsonb_to_recordset(p_items) AS i(
+    run_id UUID,
+    project_id UUID,
+    idempotency_key TEXT,
+    stats JSONB,
+    hectares_change NUMERIC,
+    risk_label TEXT,
+    image_url TEXT,
+    reports JSONB,
+    end_date DATE
+  )
+  LEFT JOIN runs r ON r.id = i.run_id;
+
+  UPDATE runs SET
+    status = 'completed',
+    stats = i.stats,
+    hectares_change = i.hectares_change,
+    finished_at = now(),
+    ingest_key = i.idempotency_key
+  FROM _gee_items i
+  WHERE runs.id = i.run_id AND i.run_exists AND NOT i.is_duplicate;
+
+  -- Project risk label follows the newest ingested run of each project
+  UPDATE projects SET
+    risk_label = latest.risk_label,
+    image_url = COALESCE(latest.image_url, projects.image_url)
+  FROM (
+    SELECT DISTINCT ON (project_id) project_id, risk_label, image_url
+    FROM _gee_items
+    WHERE run_exists AND NOT is_duplicate
+    ORDER BY project_id, end_date DESC
+  ) AS latest
+  WHERE projects.id = latest.project_id;
+
+  DELETE FROM reports
+  WHERE run_id IN (SELECT run_id FROM _gee_items WHERE run_exists AND NOT is_duplicate);
+
+  INSERT INTO reports (run_id, report_type, public_url, metadata)
+  SELECT i.run_id, r->>'report_type', r->>'public_url', r->'metadata'
+  FROM _gee_items i, jsonb_array_elements(COALESCE(i.reports, '[]'::jsonb)) AS r
+  WHERE i.run_exists AND NOT i.is_duplicate;
+
+  SELECT COALESCE(jsonb_agg(jsonb_build_object(
+    'run_id', i.run_id,
+    'outcome', CASE
+      WHEN NOT i.run_exists THEN 'not_found'
+      WHEN i.is_duplicate THEN 'duplicate'
+      ELSE 'ingested'
+    END,
+    'run', to_jsonb(r)
+  )), '[]'::jsonb)
+  INTO v_result
+  FROM _gee_items i
+  LEFT JOIN runs r ON r.id = i.run_id;
+
+  RETURN v_result;
+END;
+$$;
@@ -0,0 +1,92 @@
+-- ============================================================================
+-- Claim/lease queue for GEE workers
+-- Run this in Supabase SQL Editor
+-- ============================================================================
+--
+-- Workers call POST /runs/claim, which runs claim_runs(): up to p_limit
+-- queued runs are atomically moved to 'processing' and leased to the worker.
+-- FOR UPDATE SKIP LOCKED guarantees two workers never get the same run.
+-- Workers extend their lease with POST /runs/{id}/heartbeat; runs whose lease
+-- expired (worker died) are re-queued automatically on the next claim, or
+-- marked 'failed' after p_max_attempts.
+
+ALTER TABLE runs
+ADD COLUMN IF NOT EXISTS lease_owner TEXT,
+ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ,
+ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN runs.lease_owner IS 'Worker currently processing the run';
+COMMENT ON COLUMN runs.lease_expires_at IS 'Lease deadline; expired processing runs are re-queued';
+
+CREATE INDEX IF NOT EXISTS idx_runs_queued_created
+ON runs (created_at) WHERE status = 'queued';
+
+CREATE INDEX IF NOT EXISTS idx_runs_processing_lease
+ON runs (lease_expires_at) WHERE status = 'processing';
+
+
+CREATE OR REPLACE FUNCTION requeue_expired_runs(p_max_attempts INTEGER DEFAULT 3)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  UPDATE runs SET
+    status = CASE WHEN attempts >= p_max_attempts THEN 'failed' ELSE 'queued' END,
+    summary = CASE WHEN attempts >= p_max_attempts
+                   THEN 'Lease expired after ' || attempts || ' attempts'
+                   ELSE summary END,
+    lease_owner = NULL,
+    lease_expires_at = NULL
+  WHERE status = 'processing' AND lease_expires_at < now();
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$;
+
+
+CREATE OR REPLACE FUNCTION claim_runs(
+  p_worker TEXT,
+  p_limit INTEGER,
+  p_lease_seconds INTEGER DEFAULT 600,
+  p_max_attempts INTEGER DEFAULT 3
+) RETURNS SETOF runs
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM requeue_expired_runs(p_max_attempts);
+
+  RETURN QUERY
+  UPDATE runs SET
+    status = 'processing',
+    lease_owner = p_worker,
+    lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+    attempts = runs.attempts + 1
+  WHERE runs.id IN (
+    SELECT id FROM runs
+    WHERE status = 'queued'
+    ORDER BY created_at
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  )
+  RETURNING runs.*;
+END;
+$$;
+
+
+CREATE OR REPLACE FUNCTION heartbeat_run(
+  p_run_id UUID,
+  p_worker TEXT,
+  p_lease_seconds INTEGER DEFAULT 600
+) RETURNS SETOF runs
+LANGUAGE sql
+AS $$
+  UPDATE runs SET
+    lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+  WHERE id = p_run_id
+    AND status = 'processing'
+    AND lease_owner = p_worker
+  RETURNING *;
+$$;
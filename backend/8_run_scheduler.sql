@@ -0,0 +1,38 @@
+-- ============================================================================
+-- Claim of scheduler-selected runs
+-- Run this in Supabase SQL Editor (after 7_run_leases.sql)
+-- ============================================================================
+--
+-- The backend scheduler (app/services/scheduler_service.py) orders queued
+-- runs by project risk and age, applies per-company fair share and the
+-- global concurrency cap, then leases its picks with claim_run_ids().
+-- Runs that another worker took in the meantime are skipped, never doubled.
+
+-- Supports the candidate query filtered by project risk label
+CREATE INDEX IF NOT EXISTS idx_projects_risk_label ON projects (risk_label);
+
+CREATE OR REPLACE FUNCTION claim_run_ids(
+  p_run_ids UUID[],
+  p_worker TEXT,
+  p_lease_seconds INTEGER DEFAULT 600,
+  p_max_attempts INTEGER DEFAULT 3
+) RETURNS SETOF runs
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM requeue_expired_runs(p_max_attempts);
+
+  RETURN QUERY
+  UPDATE runs SET
+    status = 'processing',
+    lease_owner = p_worker,
+    lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+    attempts = runs.attempts + 1
+  WHERE runs.id IN (
+    SELECT id FROM runs
+    WHERE id = ANY(p_run_ids) AND status = 'queued'
+    FOR UPDATE SKIP LOCKED
+  )
+  RETURNING runs.*;
+END;
+$$;
@@ -0,0 +1,42 @@
+-- ============================================================================
+-- Cadence auto-scheduler support
+-- Run this in Supabase SQL Editor
+-- ============================================================================
+--
+-- The backend cadence scheduler (app/services/cadence_service.py) rebuilds
+-- its timer heap on startup from this view: one row per active project with
+-- its active geomarker (highest version) and its latest run, which gives the
+-- cadence, method and the end of the last analysed window.
+
+CREATE INDEX IF NOT EXISTS idx_runs_project_end_date
+ON runs (project_id, end_date DESC, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_geomarkers_project_active_version
+ON geomarkers (project_id, version DESC) WHERE is_active;
+
+CREATE OR REPLACE VIEW project_run_schedule AS
+SELECT
+  p.id AS project_id,
+  p.monitoring_start_date,
+  p.monitoring_end_date,
+  g.id AS geomarker_id,
+  r.id AS last_run_id,
+  r.end_date AS last_end_date,
+  r.cadence,
+  r.method,
+  r.cloud_threshold,
+  r.parameters
+FROM projects p
+JOIN LATERAL (
+  SELECT id FROM geomarkers
+  WHERE project_id = p.id AND is_active
+  ORDER BY version DESC
+  LIMIT 1
+) g ON true
+LEFT JOIN LATERAL (
+  SELECT id, end_date, cadence, method, cloud_threshold, parameters FROM runs
+  WHERE project_id = p.id
+  ORDER BY end_date DESC, created_at DESC
+  LIMIT 1
+) r ON true
+WHERE p.status = 'active';
@@ -6,17 +6,23 @@ from app.api.routes.alerts import router as alerts_router
 from app.api.routes.boundaries import router as boundaries_router
 from app.api.routes.projects import router as projects_router
 from app.api.routes.runs import router as runs_router
+from app.api.routes.reports import router as reports_router
 from app.api.routes.debug_images import router as debug_router
 from app.api.routes.images import router as images_router
+from app.api.routes.analytics import router as analytics_router
+from app.api.routes.webhooks import router as webhooks_router
 
 api_router = APIRouter()
 
 api_router.include_router(health_router, tags=["health"])
 api_router.include_router(projects_router)
 api_router.include_router(runs_router)
+api_router.include_router(reports_router)
 api_router.include_router(risk_router, tags=["risk-map"])
 api_router.include_router(deforestation_router, tags=["deforestation"])
 api_router.include_router(alerts_router, tags=["alerts"])
 api_router.include_router(boundaries_router, tags=["boundaries"])
 api_router.include_router(debug_router, tags=["debug"])
 api_router.include_router(images_router)
+api_router.include_router(analytics_router)
+api_router.include_router(webhooks_router)
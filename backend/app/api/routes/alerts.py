@@ -1,22 +1,22 @@
 from fastapi import APIRouter
-from datetime import datetime, timezone
+from app.schemas.alerts import AlertsResponse
+from app.services.alerts_service import list_alerts
 
 router = APIRouter(prefix="/alerts")
 
-@router.get("")
-def alerts(project_id: str | None = None, severity: str | None = None):
-    now = datetime.now(timezone.utc).isoformat()
-    return {
-        "alerts": [
-            {
-                "id": "alert-1",
-                "project_id": project_id or "demo-project-1",
-                "severity": severity or "warning",
-                "title": "Vegetation loss detected",
-                "message": "Estimated 7.1 ha loss in the last monitoring window.",
-                "created_at": now,
-                "metric": {"area_ha": 7.1},
-            }
-        ]
-    }
+@router.get("", response_model=AlertsResponse)
+def alerts(
+    project_id: str | None = None,
+    severity: str | None = None,
+    rule: str | None = None,
+    limit: int = 50,
+    cursor: str | None = None,
+):
+    """
+    [FRONTEND] Alerts newest first, raised when GEE results are ingested.
 
+    Filters: project_id, severity (info | warning | critical), rule
+    (loss_threshold | risk_jump | boundary_breach). Pass next_cursor back
+    as ?cursor= for the following page; it is null on the last page.
+    """
+    return list_alerts(project_id, severity, limit, cursor, rule)
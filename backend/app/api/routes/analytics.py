@@ -0,0 +1,55 @@
+"""Analytics API routes
+
+Reporting aggregates for dashboards, computed from the analytics snapshot
+(see analytics_service) instead of the live database.
+
+Frontend Usage:
+- GET /analytics/hectares-by-region-month - Loss per region and month
+- GET /analytics/company-risk - Risk label distribution per company
+- GET /analytics/carbon-by-state - Carbon from deforestation per state
+"""
+
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Query
+from app.services.analytics_service import (
+    carbon_by_state,
+    company_risk_distribution,
+    hectares_by_region_month,
+)
+from app.schemas.analytics import (
+    CarbonByStateResponse,
+    CompanyRiskDistributionResponse,
+    RegionMonthResponse,
+)
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+
+@router.get("/hectares-by-region-month", response_model=RegionMonthResponse)
+def get_hectares_by_region_month(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+):
+    """
+    [FRONTEND] Hectares lost per region per month (by run end_date).
+    
+    Query parameters:
+    - from / to: Run end_date range, inclusive (optional)
+    
+    Served from the analytics snapshot (see snapshot_at); 503 until the
+    first snapshot has been built.
+    """
+    return hectares_by_region_month(date_from, date_to)
+
+
+@router.get("/company-risk", response_model=CompanyRiskDistributionResponse)
+def get_company_risk():
+    """[FRONTEND] Projects per company by current risk label, with hectares lost"""
+    return company_risk_distribution()
+
+
+@router.get("/carbon-by-state", response_model=CarbonByStateResponse)
+def get_carbon_by_state():
+    """[FRONTEND] Cumulative hectares lost and t CO2 per state (regions with admin_level='state')"""
+    return carbon_by_state()
@@ -1,9 +1,15 @@
 from fastapi import APIRouter
 from datetime import datetime
 from app.schemas.common import HealthResponse
+from app.services.sentinel_scheduler import get_scheduler
 
 router = APIRouter(prefix="/health")
 
 @router.get("", response_model=HealthResponse)
 def health():
     return HealthResponse(status="ok", timestamp=datetime.utcnow())
+
+@router.get("/sentinel")
+def sentinel_health():
+    """Sentinel Hub scheduler counters (requests, retries, throttled, PU spent)"""
+    return {"timestamp": datetime.utcnow(), **get_scheduler().snapshot()}
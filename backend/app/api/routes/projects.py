@@ -7,12 +7,27 @@ Frontend Usage:
 - GET /projects - Get list of all projects for map view
 - GET /projects/{id} - Get detailed project information
 - POST /projects/{id}/runs - Trigger new analysis run (queues for GEE processing)
+- GET /projects/{id}/runs/events - SSE stream of status changes for the project's runs
+- GET /projects/{id}/timeseries - NDVI and forest-loss trend for charts
+- GET /projects/{id}/forecast - Monte Carlo expansion forecast with projected polygons
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from app.services.projects_service import get_projects_list, get_project_detail, create_project
-from app.services.runs_service import create_run
-from app.schemas.projects import ProjectsListResponse, ProjectDetailResponse, ProjectCreate, ProjectCreateResponse
+from app.services.runs_service import create_run, get_project_run_event_stream
+from app.services.timeseries_service import get_project_timeseries
+from app.services.forecast_service import get_project_forecast
+from app.schemas.forecast import ProjectForecast
+from app.schemas.projects import (
+    ProjectsListResponse,
+    ProjectDetailResponse,
+    ProjectCreate,
+    ProjectCreateResponse,
+    ProjectTimeSeriesResponse,
+)
 from app.schemas.runs import RunCreate, RunCreateResponse
 from app.deps import get_database
 
@@ -107,6 +122,12 @@ def create_project_run(
     - method: Analysis method (e.g., 'ndvi')
     - cloud_threshold: Max cloud cover percentage
     - parameters: Custom analysis parameters (optional)
+    - force: Queue a new run even if an identical one completed (optional)
+    
+    Deduplication:
+    - If an identical run (same geomarker version, dates, method,
+      cloud_threshold, parameters) is queued/processing/completed, that run
+      is returned with deduplicated=true instead of queueing a new one
     
     Validations:
     - Project must exist
@@ -118,6 +139,69 @@ def create_project_run(
     2. Run created with status='queued'
     3. GEE pipeline picks up queued runs
     4. GEE processes and calls POST /runs/{id}/gee-result
-    5. Frontend polls GET /runs/{id} to check status
+    5. Frontend listens on GET /runs/{id}/events for the status change
     """
     return create_run(project_id, run_data)
+
+
+@router.get("/{project_id}/runs/events")
+def get_project_run_events(project_id: str, db=Depends(get_database)):
+    """
+    [FRONTEND] Server-Sent Events stream for all runs of a project.
+    
+    Emits a 'run' event whenever any run of the project changes status
+    (queued -> processing -> completed/failed). Same payload as
+    GET /runs/{id}/events; the stream stays open until the client disconnects.
+    """
+    return StreamingResponse(
+        get_project_run_event_stream(project_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{project_id}/timeseries", response_model=ProjectTimeSeriesResponse)
+def get_project_timeseries_route(
+    project_id: str,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    resolution: str = Query("run", pattern="^(run|week|month|year)$"),
+    db=Depends(get_database)
+):
+    """
+    [FRONTEND] NDVI and forest-loss history of a project.
+    
+    Served from the project's time-series store, so trend charts never
+    re-run analyses or scan the runs table.
+    
+    Query parameters:
+    - from / to: Run end_date range, inclusive (optional)
+    - resolution: 'run' (one point per run), 'week', 'month' or 'year'
+    
+    Each point has mean NDVI before/after, mean NDVI change, loss area
+    (summed per period), cumulative loss and cloud fraction.
+    """
+    return get_project_timeseries(project_id, date_from, date_to, resolution)
+
+
+@router.get("/{project_id}/forecast", response_model=ProjectForecast)
+def get_project_forecast_route(
+    project_id: str,
+    horizon_days: Optional[int] = Query(None, gt=0),
+    step_days: Optional[int] = Query(None, gt=0),
+    samples: Optional[int] = Query(None, gt=0),
+    db=Depends(get_database)
+):
+    """
+    [FRONTEND] Expansion forecast of a project for the risk timeline.
+    
+    Monte Carlo ensemble of the frontend risk model's expansion (work
+    type rate, current risk score and loss trend), summarised per horizon:
+    - expansion / risk_score_envelope: p5, p25, p50, p75, p95
+    - risk_levels: level of the median score
+    - projected_polygons: boundary grown by the p50 and p95 expansion
+    
+    Query parameters (defaults from settings): horizon_days, step_days,
+    samples. Cached until a new run lands for the project.
+    """
+    return get_project_forecast(project_id, horizon_days, step_days, samples)
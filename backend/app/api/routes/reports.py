@@ -0,0 +1,30 @@
+"""Report API routes
+
+Endpoint Usage:
+- GET /reports?run_ids=a,b,c - [FRONTEND] Get reports for several runs in one request
+"""
+
+from fastapi import APIRouter, Depends, Query
+from app.services.runs_service import get_reports_batch, parse_id_list
+from app.schemas.runs import ReportsBatchResponse
+from app.deps import get_database
+
+router = APIRouter(prefix="/reports", tags=["runs"])
+
+
+@router.get("", response_model=ReportsBatchResponse)
+def get_reports(
+    run_ids: str = Query(..., description="Comma-separated run IDs (max 100)"),
+    db=Depends(get_database)
+):
+    """
+    [FRONTEND] Get reports for several runs in one request.
+    
+    Batch counterpart of GET /runs/{id}/reports, backed by a single query.
+    
+    Returns:
+    - reports: map of run_id -> list of reports (empty list if none)
+    
+    Example: GET /reports?run_ids=uuid1,uuid2
+    """
+    return get_reports_batch(parse_id_list(run_ids, "run_ids"))
@@ -1,30 +1,31 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
+from app.schemas.projects import RiskMapResponse
+from app.schemas.forecast import ForecastMapResponse
+from app.services.risk_service import get_risk_map
+from app.services.forecast_service import get_forecast_map
 
 router = APIRouter(prefix="/risk-map")
 
-@router.get("")
-def risk_map():
-    return {
-        "projects": [
-            {
-                "project_id": "demo-project-1",
-                "name": "Road Expansion A",
-                "risk_label": "high",
-                "risk_score": 0.86,
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [[[9.18,45.46],[9.18,45.47],[9.20,45.47],[9.18,45.46]]]
-                }
-            },
-            {
-                "project_id": "demo-project-2",
-                "name": "Mining Site B",
-                "risk_label": "medium",
-                "risk_score": 0.55,
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [[[9.15,45.45],[9.15,45.46],[9.17,45.46],[9.15,45.45]]]
-                }
-            }
-        ]
-    }
+@router.get("", response_model=RiskMapResponse)
+def risk_map(region_id: str | None = None, company_id: str | None = None):
+    """
+    [FRONTEND] Risk score (1-100) and level of every project, with its
+    boundary for the map. Optional filters: region_id, company_id.
+    """
+    return get_risk_map(region_id, company_id)
+
+
+@router.get("/forecast", response_model=ForecastMapResponse)
+def risk_map_forecast(
+    region_id: str | None = None,
+    company_id: str | None = None,
+    horizon_days: int | None = Query(None, gt=0),
+    step_days: int | None = Query(None, gt=0),
+    samples: int | None = Query(None, gt=0),
+):
+    """
+    [FRONTEND] Monte Carlo expansion and risk score envelopes (p5-p95) of
+    every project, per horizon. Projected polygons are only returned by
+    GET /projects/{id}/forecast.
+    """
+    return get_forecast_map(region_id, company_id, horizon_days, step_days, samples)
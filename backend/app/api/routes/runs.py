@@ -3,35 +3,73 @@
 These endpoints handle deforestation analysis runs.
 
 Endpoint Usage:
+- GET /runs?ids=a,b,c - [FRONTEND] Get several runs in one request (keyed map)
 - GET /runs/{id} - [FRONTEND] Check run status and get results
+- GET /runs/{id}/events - [FRONTEND] SSE stream of run status changes
 - GET /runs/{id}/reports - [FRONTEND] Get generated reports/images
+- POST /runs/claim - [GEE PIPELINE] Lease a batch of queued runs
+- POST /runs/{id}/heartbeat - [GEE PIPELINE] Extend a run's lease
 - POST /runs/{id}/gee-result - [GEE PIPELINE] Submit analysis results
+- POST /runs/gee-results - [GEE PIPELINE] Submit a batch of analysis results
 
 Data Flow:
 1. Frontend creates run via POST /projects/{id}/runs (status='queued')
-2. GEE pipeline processes queued runs
+2. GEE workers claim queued runs via POST /runs/claim (status='processing')
 3. GEE pipeline posts results to POST /runs/{id}/gee-result
 4. Backend updates run status to 'completed' and creates reports
-5. Frontend fetches updated data via GET /runs/{id}
+5. Backend pushes the status change to GET /runs/{id}/events subscribers
+6. Frontend fetches updated data via GET /runs/{id}
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from app.services.runs_service import (
     get_run_detail,
     get_run_reports,
-    process_gee_result
+    get_runs_batch,
+    parse_id_list,
+    get_run_event_stream,
+    claim_runs,
+    heartbeat_run,
+    process_gee_result,
+    process_gee_results_bulk
 )
 from app.schemas.runs import (
     RunDetail,
     ReportsResponse,
+    RunsBatchResponse,
+    RunClaimResponse,
+    RunHeartbeatResponse,
     GEEResultInput,
-    GEEResultResponse
+    GEEResultResponse,
+    GEEBulkResultResponse
 )
 from app.deps import get_database
 
 router = APIRouter(prefix="/runs", tags=["runs"])
 
 
+@router.get("", response_model=RunsBatchResponse)
+def get_runs(
+    ids: str = Query(..., description="Comma-separated run IDs (max 100)"),
+    db=Depends(get_database)
+):
+    """
+    [FRONTEND] Get several runs in one request.
+    
+    Dashboards tracking many runs should use this instead of calling
+    GET /runs/{id} once per run: all runs are fetched with a single query.
+    
+    Returns:
+    - runs: map of run_id -> run details
+    - missing: requested IDs that do not exist
+    
+    Example: GET /runs?ids=uuid1,uuid2,uuid3
+    """
+    return get_runs_batch(parse_id_list(ids, "ids"))
+
+
 @router.get("/{run_id}", response_model=RunDetail)
 def get_run(run_id: str, db=Depends(get_database)):
     """
@@ -58,6 +96,32 @@ def get_run(run_id: str, db=Depends(get_database)):
     return get_run_detail(run_id)
 
 
+@router.get("/{run_id}/events")
+def get_run_events(run_id: str, db=Depends(get_database)):
+    """
+    [FRONTEND] Server-Sent Events stream of run status changes.
+    
+    Replaces polling GET /runs/{id}. The first event carries the current
+    state; further events are pushed when the GEE result is ingested (or
+    picked up by the shared fallback poller). The stream closes after a
+    'completed' or 'failed' event.
+    
+    Event format:
+        event: run
+        data: {"run_id": "...", "project_id": "...", "status": "completed",
+               "hectares_change": 12.4, "finished_at": "..."}
+    
+    Frontend Usage:
+        const es = new EventSource(`${API_BASE_URL}/runs/${runId}/events`);
+        es.addEventListener('run', (e) => update(JSON.parse(e.data)));
+    """
+    return StreamingResponse(
+        get_run_event_stream(run_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/{run_id}/reports", response_model=ReportsResponse)
 def get_reports(run_id: str, db=Depends(get_database)):
     """
@@ -83,10 +147,51 @@ def get_reports(run_id: str, db=Depends(get_database)):
     return get_run_reports(run_id)
 
 
+@router.post("/claim", response_model=RunClaimResponse)
+def claim_queued_runs(
+    worker: str = Query(..., description="Unique worker identifier"),
+    limit: int = Query(default=10, description="Maximum runs to lease (1-100)"),
+    db=Depends(get_database)
+):
+    """
+    [GEE PIPELINE] Lease up to `limit` queued runs to this worker.
+    
+    Claimed runs move to status='processing' with lease_owner=worker and a
+    lease_expires_at deadline. Claims are atomic: two workers never receive
+    the same run, so workers can be scaled horizontally.
+    
+    Workers should:
+    1. POST /runs/claim?worker=gee-1&limit=10
+    2. POST /runs/{id}/heartbeat?worker=gee-1 periodically while processing
+    3. POST /runs/{id}/gee-result when done
+    
+    Runs whose lease expires (crashed worker) are re-queued automatically,
+    or marked 'failed' after too many attempts.
+    """
+    return claim_runs(worker, limit)
+
+
+@router.post("/{run_id}/heartbeat", response_model=RunHeartbeatResponse)
+def heartbeat(
+    run_id: str,
+    worker: str = Query(..., description="Worker holding the lease"),
+    db=Depends(get_database)
+):
+    """
+    [GEE PIPELINE] Extend the lease on a run being processed.
+    
+    Returns 409 if the worker no longer holds the lease (it expired and the
+    run was re-queued or claimed by another worker); the worker should then
+    abandon the run.
+    """
+    return heartbeat_run(run_id, worker)
+
+
 @router.post("/{run_id}/gee-result", response_model=GEEResultResponse)
 def submit_gee_result(
     run_id: str,
     gee_data: GEEResultInput,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
     db=Depends(get_database)
 ):
     """
@@ -98,16 +203,20 @@ def submit_gee_result(
     - loss_polygons_url: URL to GeoJSON file with deforestation polygons
     - metadata: Satellite info, processing platform, date
     
-    Backend Actions:
+    Backend Actions (single atomic round-trip via the ingest_gee_result RPC):
     1. Updates run status to 'completed'
     2. Stores stats and hectares_change
     3. Calculates and updates project risk_label based on affected area:
        - affected_area_ha >= 10: 'high'
        - >= 3 and < 10: 'medium'
        - < 3: 'low'
-    4. Creates report entries for each output URL
+    4. Replaces report entries with one per output URL
     5. Sets finished_at timestamp
     
+    Retries are safe: send an Idempotency-Key header (or idempotency_key in
+    the body). Without one, a hash of the payload is used. Re-posting the same
+    key returns duplicate=true and changes nothing.
+    
     GEE Payload Example:
     {
       "project_id": "uuid",
@@ -141,4 +250,29 @@ def submit_gee_result(
             detail="run_id in URL does not match run_id in body"
         )
     
+    if idempotency_key and not gee_data.idempotency_key:
+        gee_data.idempotency_key = idempotency_key
+    
     return process_gee_result(gee_data)
+
+
+
+@router.post("/gee-results", response_model=GEEBulkResultResponse)
+def submit_gee_results(
+    results: list[GEEResultInput],
+    db=Depends(get_database)
+):
+    """
+    [GEE PIPELINE] Submit a batch of analysis results in one request.
+    
+    Body: JSON array of the same objects accepted by POST /runs/{id}/gee-result.
+    
+    The batch is written with multi-row statements (a few queries in total
+    instead of four per run). Each item is processed independently:
+    - status='completed': ingested (duplicate=true for idempotent retries)
+    - status='not_found': run does not exist
+    - status='rejected': run_id repeated within the batch
+    
+    Returns per-item results in request order plus counts.
+    """
+    return process_gee_results_bulk(results)
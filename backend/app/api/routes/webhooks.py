@@ -0,0 +1,60 @@
+"""Webhook API routes
+
+Endpoints subscribed to ingestion events (run.completed, alert.raised),
+delivered in batches by the background dispatcher (see webhook_service).
+
+Usage:
+- POST /webhooks - Register an endpoint (the signing secret is returned once)
+- GET /webhooks - List endpoints
+- DELETE /webhooks/{id} - Remove an endpoint and its queued deliveries
+- GET /webhooks/{id}/dead-letters - Deliveries that exhausted their retries
+- POST /webhooks/{id}/dead-letters/replay - Queue them again
+"""
+
+from fastapi import APIRouter
+from app.schemas.webhooks import (
+    DeadLettersResponse,
+    ReplayResponse,
+    WebhookEndpointCreate,
+    WebhookEndpointCreated,
+    WebhookEndpointsResponse,
+)
+from app.services.webhook_service import (
+    create_endpoint,
+    delete_endpoint,
+    list_dead_letters,
+    list_endpoints,
+    replay_dead_letters,
+)
+
+router = APIRouter(prefix="/webhooks", tags=["webhooks"])
+
+
+@router.post("", response_model=WebhookEndpointCreated, status_code=201)
+def register_webhook(data: WebhookEndpointCreate):
+    """
+    Register an endpoint. Each POST it receives is {"events": [...]}, with
+    an X-Bioma-Signature header (sha256=HMAC of the body with the secret).
+    Delivery is at-least-once: dedupe on events[].id.
+    """
+    return create_endpoint(data)
+
+
+@router.get("", response_model=WebhookEndpointsResponse)
+def get_webhooks():
+    return list_endpoints()
+
+
+@router.delete("/{endpoint_id}", status_code=204)
+def remove_webhook(endpoint_id: str):
+    delete_endpoint(endpoint_id)
+
+
+@router.get("/{endpoint_id}/dead-letters", response_model=DeadLettersResponse)
+def get_dead_letters(endpoint_id: str, limit: int = 100):
+    return list_dead_letters(endpoint_id, limit)
+
+
+@router.post("/{endpoint_id}/dead-letters/replay", response_model=ReplayResponse)
+def replay_webhook_dead_letters(endpoint_id: str):
+    return replay_dead_letters(endpoint_id)
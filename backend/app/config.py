@@ -9,5 +9,137 @@ class Settings(BaseSettings):
 
     database_url: str | None = None
 
+    # Run status streaming (SSE)
+    run_events_poll_interval_seconds: float = 5.0
+    run_events_keepalive_seconds: float = 15.0
+
+    # GEE worker leases (POST /runs/claim)
+    run_lease_seconds: int = 600
+    run_max_attempts: int = 3
+
+    # Claim scheduler: priority + per-company fair share
+    run_scheduler_enabled: bool = True
+    run_max_concurrency: int = 20
+    run_company_share: float = 0.5
+    run_scheduler_aging_per_hour: float = 0.1
+    run_scheduler_work_conserving: bool = True
+    run_scheduler_candidate_window: int = 200
+
+    # Cadence auto-scheduler (creates recurring runs); enable on ONE instance
+    cadence_scheduler_enabled: bool = False
+    cadence_default: str = "weekly"
+    cadence_batch_size: int = 500
+
+    # Local NDVI change detection (analysis_service)
+    analysis_resolution_m: int = 20
+    analysis_window_days: int = 14
+    analysis_ndvi_threshold: float = -0.2
+    analysis_min_loss_pixels: int = 3
+    analysis_block_rows: int = 512
+    analysis_memmap_min_pixels: int = 4_000_000
+
+    # Sentinel Hub tiling (Process API limit is 2500 px per side)
+    sentinel_max_tile_px: int = 2500
+    sentinel_tile_workers: int = 4
+
+    # Sentinel Hub request scheduler, shared by every Sentinel call: size the
+    # rates from the account quota; run budget in processing units (0 = none)
+    sentinel_requests_per_minute: float = 300
+    sentinel_processing_units_per_minute: float = 300
+    sentinel_max_retries: int = 5
+    sentinel_backoff_base_seconds: float = 1.0
+    sentinel_backoff_max_seconds: float = 60.0
+    sentinel_run_pu_budget: float = 500
+
+    # Loss polygons (minimum mapping unit, Douglas-Peucker tolerance)
+    polygon_min_area_ha: float = 0.5
+    polygon_simplify_px: float = 0.5
+
+    # Statistics-only pre-check (Sentinel Hub Statistical API): full imagery
+    # is fetched only when one of the triggers fires
+    statistics_precheck_enabled: bool = True
+    statistics_ndvi_floor: float = 0.3  # NDVI below this counts as non-vegetated
+    statistics_trigger_mean_drop: float = 0.05
+    statistics_trigger_area_ha: float = 1.0
+    statistics_min_valid_fraction: float = 0.2
+
+    # Incremental monitoring: fetch only acquisitions after the watermark
+    incremental_monitoring_enabled: bool = True
+
+    # Multi-date compositing ("median", "weighted" or "none" = one
+    # least-cloudy scene per window). Scenes are cloud-masked per pixel, so
+    # scenes up to scene_max_cloud_coverage are still useful
+    composite_method: str = "median"
+    composite_max_scenes: int = 6
+    composite_samples: int = 5
+    scene_max_cloud_coverage: int = 80
+
+    # Catalog pre-check: +/- days around a target date, doubled up to the max
+    catalog_initial_window_days: int = 7
+    catalog_max_window_days: int = 56
+
+    # Per-project NDVI time series (derived from runs, rebuilt when missing).
+    # Relative to the working directory: deployments point TIMESERIES_DIR at
+    # a persistent volume outside the source tree. Runs completed on other
+    # instances are caught up at most every timeseries_catchup_seconds,
+    # re-reading timeseries_catchup_overlap_seconds before the last query
+    # (runs committed late, clock skew between instances).
+    timeseries_dir: str = "data/timeseries"
+    timeseries_catchup_seconds: float = 30.0
+    timeseries_catchup_overlap_seconds: float = 300.0
+
+    # Analytics snapshot (/analytics/*), refreshed in the background on ONE
+    # instance; others read the same file
+    analytics_refresh_enabled: bool = False
+    analytics_refresh_minutes: float = 60
+    analytics_snapshot_path: str = "data/analytics/snapshot.npz"
+    analytics_export_page_size: int = 1000
+
+    # Monte Carlo expansion forecasts (forecast_service): ensemble size,
+    # horizons, spread of the expansion rate (log-normal sigma) and of the
+    # risk score (points per sqrt(30 days)), drift at temporal_trend = 1
+    forecast_samples: int = 500
+    forecast_max_samples: int = 5000
+    forecast_horizon_days: int = 180
+    forecast_step_days: int = 30
+    forecast_rate_sigma: float = 0.35
+    forecast_score_sigma: float = 5.0
+    forecast_trend_points: float = 5.0
+    forecast_chunk_projects: int = 256
+    # Projects x samples x horizons simulated at once (~50 bytes each at peak)
+    forecast_max_chunk_elements: int = 2_000_000
+    forecast_cache_size: int = 5000
+
+    # Alert rules (alerts_service): loss per run in hectares, minimum loss
+    # inside a protected / buffer zone; GET /alerts page size cap
+    alerts_loss_warning_ha: float = 3.0
+    alerts_loss_critical_ha: float = 10.0
+    alerts_breach_min_ha: float = 0.5
+    alerts_max_page_size: int = 200
+
+    # Webhook dispatcher (webhook_service): delivery workers, events per
+    # POST, outbox claim size and lease, retry backoff and dead-lettering,
+    # and how long delivered outbox rows are kept. When disabled, ingestion
+    # does not write to the outbox at all
+    webhooks_enabled: bool = False
+    webhook_workers: int = 8
+    webhook_batch_size: int = 50
+    webhook_claim_limit: int = 500
+    webhook_lease_seconds: int = 300
+    webhook_poll_seconds: float = 5.0
+    webhook_timeout_seconds: float = 10.0
+    webhook_max_attempts: int = 8
+    webhook_backoff_base_seconds: float = 5.0
+    webhook_backoff_max_seconds: float = 3600.0
+    webhook_retention_days: float = 7.0
+    webhook_prune_interval_seconds: float = 3600.0
+
+    # /deforestation loss polygons: parsed, simplified layers cached per run
+    # in memory (runs) and on disk; Douglas-Peucker tolerance in degrees
+    deforestation_cache_dir: str = "data/deforestation"
+    deforestation_cache_runs: int = 64
+    deforestation_simplify_deg: float = 0.00001
+    deforestation_fetch_timeout_seconds: float = 60.0
+
 settings = Settings()
 
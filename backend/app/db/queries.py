@@ -1,9 +1,12 @@
 """Database query functions"""
 
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, timezone
 from app.db.session import supabase
 
+# IDs per in_() filter, to keep PostgREST URLs short
+IN_CHUNK_SIZE = 200
+
 
 class ProjectQueries:
     @staticmethod
@@ -49,6 +52,27 @@ class GeomarkerQueries:
         ).eq("is_active", True).order("version", desc=True).limit(1).execute()
         return response.data[0] if response.data else None
 
+    @staticmethod
+    def get_active_for_projects(project_ids: List[str]) -> List[Dict[Any, Any]]:
+        """Get every active geomarker (any type) of several projects"""
+        rows: List[Dict[Any, Any]] = []
+        for offset in range(0, len(project_ids), IN_CHUNK_SIZE):
+            response = supabase.table("geomarkers").select(
+                "id, project_id, geomarker_type, version, geojson"
+            ).in_("project_id", project_ids[offset:offset + IN_CHUNK_SIZE]).eq("is_active", True).execute()
+            rows.extend(response.data)
+        return rows
+
+    @staticmethod
+    def get_by_ids(geomarker_ids: List[str]) -> List[Dict[Any, Any]]:
+        """Get several geomarkers by id in one query"""
+        if not geomarker_ids:
+            return []
+        response = supabase.table("geomarkers").select(
+            "id, project_id, geomarker_type, version, geojson"
+        ).in_("id", geomarker_ids).execute()
+        return response.data
+
     @staticmethod
     def get_history_for_project(project_id: str) -> List[Dict[Any, Any]]:
         """Get geomarker history for project"""
@@ -87,24 +111,210 @@ class RunQueries:
         ).eq("project_id", project_id).order("end_date", desc=True).limit(limit).execute()
         return response.data
 
+    @staticmethod
+    def get_completed_since(
+        project_id: str, finished_since: Optional[str] = None, page_size: int = 1000,
+    ) -> List[Dict[Any, Any]]:
+        """Completed runs of a project (finished at or after finished_since), oldest first"""
+        rows: List[Dict[Any, Any]] = []
+        while True:
+            query = supabase.table("runs").select(
+                "id, project_id, end_date, finished_at, hectares_change, stats"
+            ).eq("project_id", project_id).eq("status", "completed")
+            if finished_since:
+                query = query.gte("finished_at", finished_since)
+            response = query.order("id").range(len(rows), len(rows) + page_size - 1).execute()
+            rows.extend(response.data)
+            if len(response.data) < page_size:
+                break
+        rows.sort(key=lambda row: str(row["end_date"]))
+        return rows
+
+    @staticmethod
+    def get_completed_for_projects(project_ids: List[str], page_size: int = 1000) -> List[Dict[Any, Any]]:
+        """Loss history (end_date, hectares_change) of several projects' completed runs"""
+        rows: List[Dict[Any, Any]] = []
+        for offset in range(0, len(project_ids), IN_CHUNK_SIZE):
+            chunk = project_ids[offset:offset + IN_CHUNK_SIZE]
+            start = 0
+            while True:
+                response = supabase.table("runs").select(
+                    "id, project_id, end_date, hectares_change"
+                ).in_("project_id", chunk).eq("status", "completed").order("id").range(
+                    start, start + page_size - 1
+                ).execute()
+                rows.extend(response.data)
+                if len(response.data) < page_size:
+                    break
+                start += page_size
+        return rows
+
     @staticmethod
     def get_by_id(run_id: str) -> Optional[Dict[Any, Any]]:
         """Get run by ID"""
         response = supabase.table("runs").select("*").eq("id", run_id).execute()
         return response.data[0] if response.data else None
 
+    @staticmethod
+    def get_by_ids(run_ids: List[str]) -> List[Dict[Any, Any]]:
+        """Get several runs by ID in one query"""
+        if not run_ids:
+            return []
+        response = supabase.table("runs").select("*").in_("id", run_ids).execute()
+        return response.data
+
+    @staticmethod
+    def get_status_by_ids(run_ids: List[str]) -> List[Dict[Any, Any]]:
+        """Get lightweight status rows for several runs in one query"""
+        if not run_ids:
+            return []
+        response = supabase.table("runs").select(
+            "id, project_id, status, hectares_change, finished_at"
+        ).in_("id", run_ids).execute()
+        return response.data
+
+    @staticmethod
+    def get_status_for_projects(project_ids: List[str], finished_since: str) -> List[Dict[Any, Any]]:
+        """Get status rows of in-flight or recently finished runs for several projects"""
+        if not project_ids:
+            return []
+        response = supabase.table("runs").select(
+            "id, project_id, status, hectares_change, finished_at"
+        ).in_("project_id", project_ids).or_(
+            f"status.in.(queued,processing),finished_at.gte.{finished_since}"
+        ).execute()
+        return response.data
+
     @staticmethod
     def create(data: Dict[str, Any]) -> Dict[Any, Any]:
         """Create a new run"""
         response = supabase.table("runs").insert(data).execute()
         return response.data[0]
 
+    @staticmethod
+    def find_by_fingerprint(fingerprint: str, statuses: List[str]) -> List[Dict[Any, Any]]:
+        """Newest runs with the given parameter fingerprint and status"""
+        response = supabase.table("runs").select("*").eq(
+            "fingerprint", fingerprint
+        ).in_("status", statuses).order("created_at", desc=True).limit(5).execute()
+        return response.data
+
+    @staticmethod
+    def get_existing_fingerprints(fingerprints: List[str], statuses: List[str]) -> set[str]:
+        """Which of the given fingerprints already have a run in one of the statuses"""
+        if not fingerprints:
+            return set()
+        response = supabase.table("runs").select("fingerprint").in_(
+            "fingerprint", fingerprints
+        ).in_("status", statuses).execute()
+        return {r["fingerprint"] for r in response.data}
+
+    @staticmethod
+    def create_many(data: List[Dict[str, Any]]) -> List[Dict[Any, Any]]:
+        """Create multiple runs in one insert"""
+        if not data:
+            return []
+        response = supabase.table("runs").insert(data).execute()
+        return response.data
+
+    @staticmethod
+    def get_schedule_page(offset: int, limit: int) -> List[Dict[Any, Any]]:
+        """Page of active projects with their active geomarker and latest run"""
+        response = supabase.table("project_run_schedule").select("*").order(
+            "project_id"
+        ).range(offset, offset + limit - 1).execute()
+        return response.data
+
+    @staticmethod
+    def get_schedule_rows(project_ids: List[str]) -> List[Dict[Any, Any]]:
+        """Schedule rows of the given projects that are still active with an active geomarker"""
+        if not project_ids:
+            return []
+        response = supabase.table("project_run_schedule").select(
+            "project_id, geomarker_id, monitoring_end_date"
+        ).in_("project_id", project_ids).execute()
+        return response.data
+
     @staticmethod
     def update(run_id: str, data: Dict[str, Any]) -> Dict[Any, Any]:
         """Update a run"""
         response = supabase.table("runs").update(data).eq("id", run_id).execute()
         return response.data[0] if response.data else None
 
+    @staticmethod
+    def claim(worker: str, limit: int, lease_seconds: int, max_attempts: int) -> List[Dict[Any, Any]]:
+        """Atomically lease up to `limit` queued runs to a worker (re-queues expired leases first)"""
+        response = supabase.rpc("claim_runs", {
+            "p_worker": worker,
+            "p_limit": limit,
+            "p_lease_seconds": lease_seconds,
+            "p_max_attempts": max_attempts,
+        }).execute()
+        return response.data or []
+
+    @staticmethod
+    def requeue_expired(max_attempts: int) -> int:
+        """Re-queue processing runs whose lease expired (or fail them after max_attempts)"""
+        response = supabase.rpc("requeue_expired_runs", {"p_max_attempts": max_attempts}).execute()
+        return int(response.data or 0)
+
+    @staticmethod
+    def claim_ids(run_ids: List[str], worker: str, lease_seconds: int, max_attempts: int) -> List[Dict[Any, Any]]:
+        """Atomically lease the given runs if they are still queued (skips ones taken meanwhile)"""
+        if not run_ids:
+            return []
+        response = supabase.rpc("claim_run_ids", {
+            "p_run_ids": run_ids,
+            "p_worker": worker,
+            "p_lease_seconds": lease_seconds,
+            "p_max_attempts": max_attempts,
+        }).execute()
+        return response.data or []
+
+    @staticmethod
+    def get_queued_candidates(limit: int, risk_labels: Optional[List[str]] = None) -> List[Dict[Any, Any]]:
+        """Oldest queued runs with their project's risk label and company"""
+        query = supabase.table("runs").select(
+            "id, project_id, created_at, project:projects!inner(risk_label, company_id)"
+        ).eq("status", "queued")
+        if risk_labels:
+            query = query.in_("project.risk_label", risk_labels)
+        response = query.order("created_at").limit(limit).execute()
+        return response.data
+
+    @staticmethod
+    def get_processing_companies() -> List[Dict[Any, Any]]:
+        """Company of every run currently being processed under a live lease (bounded by the concurrency cap)"""
+        now = datetime.now(timezone.utc).isoformat()
+        response = supabase.table("runs").select(
+            "id, project:projects(company_id)"
+        ).eq("status", "processing").or_(
+            f'lease_expires_at.is.null,lease_expires_at.gt."{now}"'
+        ).execute()
+        return response.data
+
+    @staticmethod
+    def heartbeat(run_id: str, worker: str, lease_seconds: int) -> Optional[Dict[Any, Any]]:
+        """Extend a worker's lease; None if the worker no longer holds it"""
+        response = supabase.rpc("heartbeat_run", {
+            "p_run_id": run_id,
+            "p_worker": worker,
+            "p_lease_seconds": lease_seconds,
+        }).execute()
+        return response.data[0] if response.data else None
+
+    @staticmethod
+    def ingest_gee_result(params: Dict[str, Any]) -> Optional[Dict[Any, Any]]:
+        """Atomically complete a run, update its project and replace its reports (one RPC)"""
+        response = supabase.rpc("ingest_gee_result", params).execute()
+        return response.data
+
+    @staticmethod
+    def ingest_gee_results(items: List[Dict[str, Any]]) -> List[Dict[Any, Any]]:
+        """Set-based ingestion of many GEE results in one RPC (one result per item)"""
+        response = supabase.rpc("ingest_gee_results", {"p_items": items}).execute()
+        return response.data or []
+
 
 class ReportQueries:
     @staticmethod
@@ -113,6 +323,14 @@ class ReportQueries:
         response = supabase.table("reports").select("*").eq("run_id", run_id).execute()
         return response.data
 
+    @staticmethod
+    def get_by_run_ids(run_ids: List[str]) -> List[Dict[Any, Any]]:
+        """Get all reports for several runs in one query"""
+        if not run_ids:
+            return []
+        response = supabase.table("reports").select("*").in_("run_id", run_ids).execute()
+        return response.data
+
     @staticmethod
     def create(data: Dict[str, Any]) -> Dict[Any, Any]:
         """Create a new report"""
@@ -124,3 +342,228 @@ class ReportQueries:
         """Create multiple reports"""
         response = supabase.table("reports").insert(data).execute()
         return response.data
+
+
+class StatisticsQueries:
+    @staticmethod
+    def get_by_cache_keys(cache_keys: List[str]) -> List[Dict[Any, Any]]:
+        """Get cached Statistical API intervals by cache key"""
+        if not cache_keys:
+            return []
+        response = supabase.table("ndvi_statistics").select("*").in_("cache_key", cache_keys).execute()
+        return response.data
+
+    @staticmethod
+    def upsert_many(data: List[Dict[str, Any]]) -> List[Dict[Any, Any]]:
+        """Store Statistical API intervals (one row per cache key)"""
+        if not data:
+            return []
+        response = supabase.table("ndvi_statistics").upsert(data, on_conflict="cache_key").execute()
+        return response.data
+
+
+class WatermarkQueries:
+    @staticmethod
+    def get(project_id: str, geomarker_id: str) -> Optional[Dict[Any, Any]]:
+        """Get the acquisition watermark of a project's geomarker"""
+        response = supabase.table("acquisition_watermarks").select("*").eq(
+            "project_id", project_id
+        ).eq("geomarker_id", geomarker_id).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    @staticmethod
+    def upsert(data: Dict[str, Any]) -> Dict[Any, Any]:
+        """Create or move the acquisition watermark of a project's geomarker"""
+        response = supabase.table("acquisition_watermarks").upsert(
+            data, on_conflict="project_id,geomarker_id"
+        ).execute()
+        return response.data[0]
+
+
+class RollupQueries:
+    @staticmethod
+    def get(project_id: str) -> Optional[Dict[Any, Any]]:
+        """Get the rollup of one project"""
+        response = supabase.table("project_rollups").select("*").eq("project_id", project_id).execute()
+        return response.data[0] if response.data else None
+
+    @staticmethod
+    def get_by_project_ids(project_ids: List[str]) -> List[Dict[Any, Any]]:
+        """Get the rollups of several projects in one query"""
+        if not project_ids:
+            return []
+        response = supabase.table("project_rollups").select("*").in_("project_id", project_ids).execute()
+        return response.data
+
+    @staticmethod
+    def apply_runs(run_ids: List[str]) -> List[Dict[Any, Any]]:
+        """Fold freshly ingested runs into their projects' rollups (13_project_rollups.sql)"""
+        if not run_ids:
+            return []
+        response = supabase.rpc("apply_run_rollups", {"p_run_ids": run_ids}).execute()
+        return response.data or []
+
+    @staticmethod
+    def backfill() -> int:
+        """Recompute every project's rollup from the runs table"""
+        response = supabase.rpc("backfill_project_rollups", {}).execute()
+        return int(response.data or 0)
+
+
+class AlertQueries:
+    @staticmethod
+    def get_all(project_id: str) -> List[Dict[Any, Any]]:
+        """Get every alert of a project, newest first"""
+        response = supabase.table("alerts").select("*").eq(
+            "project_id", project_id
+        ).order("created_at", desc=True).order("id", desc=True).execute()
+        return response.data
+
+    @staticmethod
+    def get_page(
+        limit: int,
+        project_id: Optional[str] = None,
+        severity: Optional[str] = None,
+        rule: Optional[str] = None,
+        before: Optional[tuple[str, str]] = None,
+    ) -> List[Dict[Any, Any]]:
+        """
+        One page of alerts newest first, strictly after the (created_at, id)
+        keyset `before` (14_alerts.sql indexes every filter combination).
+        `before` must be normalised (alerts_service.decode_cursor)
+        """
+        query = supabase.table("alerts").select("*")
+        if project_id:
+            query = query.eq("project_id", project_id)
+        if severity:
+            query = query.eq("severity", severity)
+        if rule:
+            query = query.eq("rule", rule)
+        if before:
+            created_at, alert_id = before
+            query = query.or_(
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{alert_id})'
+            )
+        response = query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute()
+        return response.data
+
+    @staticmethod
+    def replace_for_runs(run_ids: List[str], alerts: List[Dict[str, Any]]) -> List[Dict[Any, Any]]:
+        """Replace the alerts of freshly ingested runs, in one transaction (14_alerts.sql)"""
+        if not run_ids and not alerts:
+            return []
+        response = supabase.rpc("replace_run_alerts", {"p_run_ids": run_ids, "p_alerts": alerts}).execute()
+        return response.data or []
+
+
+class WebhookQueries:
+    @staticmethod
+    def get_endpoints() -> List[Dict[Any, Any]]:
+        """Get every webhook endpoint"""
+        response = supabase.table("webhook_endpoints").select("*").order("created_at").execute()
+        return response.data
+
+    @staticmethod
+    def get_endpoint(endpoint_id: str) -> Optional[Dict[Any, Any]]:
+        response = supabase.table("webhook_endpoints").select("*").eq("id", endpoint_id).execute()
+        return response.data[0] if response.data else None
+
+    @staticmethod
+    def create_endpoint(data: Dict[str, Any]) -> Dict[Any, Any]:
+        response = supabase.table("webhook_endpoints").insert(data).execute()
+        return response.data[0]
+
+    @staticmethod
+    def delete_endpoint(endpoint_id: str) -> None:
+        """Delete an endpoint with its pending and dead-lettered deliveries"""
+        supabase.table("webhook_endpoints").delete().eq("id", endpoint_id).execute()
+
+    @staticmethod
+    def enqueue(events: List[Dict[str, Any]]) -> int:
+        """Fan events out to subscribed endpoints' outbox rows (15_webhooks.sql)"""
+        if not events:
+            return 0
+        response = supabase.rpc("enqueue_webhook_events", {"p_events": events}).execute()
+        return int(response.data or 0)
+
+    @staticmethod
+    def claim(worker: str, limit: int, lease_seconds: int, exclude_endpoints: List[str]) -> List[Dict[Any, Any]]:
+        """Lease due deliveries, with their endpoint's url, secret and concurrency cap"""
+        response = supabase.rpc("claim_webhook_deliveries", {
+            "p_worker": worker,
+            "p_limit": limit,
+            "p_lease_seconds": lease_seconds,
+            "p_exclude_endpoints": exclude_endpoints,
+        }).execute()
+        return response.data or []
+
+    @staticmethod
+    def mark_delivered(delivery_ids: List[int]) -> None:
+        supabase.table("webhook_outbox").update({
+            "status": "delivered",
+            "delivered_at": datetime.now(timezone.utc).isoformat(),
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "last_error": None,
+        }).in_("id", delivery_ids).execute()
+
+    @staticmethod
+    def prune_delivered(before: str, limit: int) -> int:
+        """Delete up to `limit` rows delivered before `before`; returns the count"""
+        response = supabase.rpc("prune_webhook_outbox", {"p_before": before, "p_limit": limit}).execute()
+        return int(response.data or 0)
+
+    @staticmethod
+    def retry(delivery_ids: List[int], error: str, next_attempt_at: str) -> None:
+        """Put failed deliveries back in the queue, due at next_attempt_at"""
+        supabase.table("webhook_outbox").update({
+            "status": "pending",
+            "next_attempt_at": next_attempt_at,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "last_error": error,
+        }).in_("id", delivery_ids).execute()
+
+    @staticmethod
+    def dead_letter(delivery_ids: List[int], error: str) -> None:
+        supabase.table("webhook_outbox").update({
+            "status": "dead",
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "last_error": error,
+        }).in_("id", delivery_ids).execute()
+
+    @staticmethod
+    def get_dead_letters(endpoint_id: str, limit: int) -> List[Dict[Any, Any]]:
+        """Get an endpoint's dead-lettered deliveries, oldest first"""
+        response = supabase.table("webhook_outbox").select(
+            "id, event_id, event_type, payload, attempts, last_error, created_at"
+        ).eq("endpoint_id", endpoint_id).eq("status", "dead").order("created_at").limit(limit).execute()
+        return response.data
+
+    @staticmethod
+    def replay_dead_letters(endpoint_id: str) -> int:
+        """Queue an endpoint's dead-lettered deliveries again, with fresh attempts"""
+        response = supabase.table("webhook_outbox").update({
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": datetime.now(timezone.utc).isoformat(),
+            "last_error": None,
+        }).eq("endpoint_id", endpoint_id).eq("status", "dead").execute()
+        return len(response.data or [])
+
+class AnalyticsQueries:
+    @staticmethod
+    def export_page(
+        table: str,
+        columns: str,
+        offset: int,
+        limit: int,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[Any, Any]]:
+        """One page of a table for the analytics snapshot, in id order"""
+        query = supabase.table(table).select(columns)
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+        response = query.order("id").range(offset, offset + limit - 1).execute()
+        return response.data
@@ -10,6 +10,9 @@ class AlertOut(BaseModel):
     created_at: str
     geometry: dict[str, Any] | None = None
     metric: dict[str, Any] | None = None
+    run_id: str | None = None
+    rule: str | None = None
 
 class AlertsResponse(BaseModel):
     alerts: list[AlertOut]
+    next_cursor: str | None = None  # pass as ?cursor= for the next page; None on the last page
@@ -0,0 +1,41 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import date, datetime
+
+
+class RegionMonthItem(BaseModel):
+    region: Optional[str] = None  # None = projects without a region
+    month: date  # first day of the month
+    hectares_lost: float
+    run_count: int
+
+
+class RegionMonthResponse(BaseModel):
+    snapshot_at: datetime
+    items: list[RegionMonthItem]
+
+
+class CompanyRiskItem(BaseModel):
+    company: Optional[str] = None  # None = projects without a company
+    project_count: int
+    risk_distribution: dict[str, int]  # risk_label -> project count
+    hectares_lost: float
+
+
+class CompanyRiskDistributionResponse(BaseModel):
+    snapshot_at: datetime
+    items: list[CompanyRiskItem]
+
+
+class StateCarbonItem(BaseModel):
+    state: str
+    country_code: Optional[str] = None
+    project_count: int
+    hectares_lost: float
+    carbon_tonnes: float
+
+
+class CarbonByStateResponse(BaseModel):
+    snapshot_at: datetime
+    items: list[StateCarbonItem]
+    total_carbon_tonnes: float
@@ -0,0 +1,25 @@
+from pydantic import BaseModel
+from typing import Any
+
+
+class ProjectedPolygon(BaseModel):
+    day: int  # days from today
+    percentile: int  # of the expansion ensemble
+    geometry: dict[str, Any]  # MultiPolygon
+
+
+class ProjectForecast(BaseModel):
+    project_id: str
+    work_type: str
+    risk_score: float  # current score (1-100)
+    horizons_days: list[int]
+    samples: int
+    expansion: dict[str, list[float]]  # "p5".."p95" -> factor per horizon
+    risk_score_envelope: dict[str, list[float]]  # "p5".."p95" -> score per horizon
+    risk_levels: list[str]  # level of the median score per horizon
+    exceed_max_probability: list[float]  # share of members at the work type's cap
+    projected_polygons: list[ProjectedPolygon] = []
+
+
+class ForecastMapResponse(BaseModel):
+    projects: list[ProjectForecast]
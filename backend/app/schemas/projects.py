@@ -9,7 +9,12 @@ class RiskProject(BaseModel):
     project_id: str
     name: str
     risk_label: str
-    risk_score: float | None = None
+    risk_score: float | None = None  # 1-100 (risk_service.score_variables)
+    risk_level: str | None = None  # low / medium / high / critical
+    work_type: str | None = None  # punctual / linear / extensive
+    region_id: str | None = None
+    company_id: str | None = None
+    variables: dict[str, float] | None = None
     geometry: dict[str, Any] | None = None
 
 class RiskMapResponse(BaseModel):
@@ -37,6 +42,22 @@ class ProjectCreateResponse(BaseModel):
     created_at: datetime
 
 
+class ProjectRollup(BaseModel):
+    """Cumulative run figures of a project (project_rollups)"""
+    run_count: int = 0
+    total_hectares_lost: float = 0.0
+    carbon_footprint_tonnes: float = 0.0  # total_hectares_lost x 400 t CO2/ha
+    trend: str = "unknown"  # last vs previous run loss: increasing/decreasing/stable/unknown
+    last_run_id: Optional[str] = None
+    last_hectares_change: Optional[float] = None
+    last_end_date: Optional[date] = None
+    previous_hectares_change: Optional[float] = None
+    worst_run_id: Optional[str] = None
+    worst_hectares_change: Optional[float] = None
+    worst_end_date: Optional[date] = None
+    updated_at: Optional[datetime] = None
+
+
 class ProjectListItem(BaseModel):
     """Project item for list view"""
     id: str
@@ -48,6 +69,7 @@ class ProjectListItem(BaseModel):
     active_geomarker: Optional[GeomarkerBase] = None
     last_run: Optional[RunHistoryItem] = None
     carbon_footprint_tonnes: Optional[float] = None
+    rollup: Optional[ProjectRollup] = None
     latest_image_url: Optional[str] = None  # Most recent satellite image from last run
     center_lat: Optional[float] = None  # Latitude for map marker placement
     center_lng: Optional[float] = None  # Longitude for map marker placement
@@ -73,6 +95,26 @@ class ProjectDetailData(BaseModel):
     updated_at: datetime
 
 
+class TimeSeriesPoint(BaseModel):
+    """One run, or one period of runs, of a project's NDVI history"""
+    date: date  # run end_date, or first day of the period
+    run_count: int
+    mean_ndvi_before: Optional[float] = None
+    mean_ndvi_after: Optional[float] = None
+    mean_delta_ndvi: Optional[float] = None
+    loss_ha: float
+    cumulative_loss_ha: float
+    cloud_fraction: Optional[float] = None
+
+
+class ProjectTimeSeriesResponse(BaseModel):
+    project_id: str
+    resolution: str
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    points: list[TimeSeriesPoint]
+
+
 class ProjectDetailResponse(BaseModel):
     """Complete project detail response"""
     project: ProjectDetailData
@@ -80,3 +122,4 @@ class ProjectDetailResponse(BaseModel):
     latest_run: Optional[RunDetail] = None
     reports: list[ReportBase] = []
     run_history: list[RunHistoryItem] = []
+    rollup: Optional[ProjectRollup] = None
@@ -38,6 +38,7 @@ class RunCreate(BaseModel):
     method: str = "ndvi"
     cloud_threshold: int = Field(default=30, ge=0, le=100)
     parameters: Optional[dict[str, Any]] = None
+    force: bool = False  # Queue a new run even if an identical one exists
 
     @field_validator('end_date')
     @classmethod
@@ -50,6 +51,7 @@ class RunCreate(BaseModel):
 class RunCreateResponse(BaseModel):
     run_id: str
     status: str
+    deduplicated: bool = False  # True when an identical existing run was returned
 
 
 class RunHistoryItem(BaseModel):
@@ -75,6 +77,10 @@ class RunDetail(BaseModel):
     parameters: Optional[dict[str, Any]] = None
     stats: Optional[dict[str, Any]] = None
     finished_at: Optional[datetime] = None
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    attempts: Optional[int] = None
+    fingerprint: Optional[str] = None
 
 
 class ReportBase(BaseModel):
@@ -90,6 +96,17 @@ class ReportsResponse(BaseModel):
     reports: list[ReportBase]
 
 
+class RunsBatchResponse(BaseModel):
+    """Runs keyed by run_id; unknown IDs are listed in missing"""
+    runs: dict[str, RunDetail]
+    missing: list[str] = []
+
+
+class ReportsBatchResponse(BaseModel):
+    """Reports keyed by run_id (empty list when a run has none)"""
+    reports: dict[str, list[ReportBase]]
+
+
 class GEEResultInput(BaseModel):
     """Input from Google Earth Engine pipeline"""
     project_id: str
@@ -100,6 +117,7 @@ class GEEResultInput(BaseModel):
     loss_polygons_url: str
     outputs: dict[str, str]
     metadata: dict[str, Any]
+    idempotency_key: Optional[str] = None  # Defaults to a hash of the payload
 
 
 class GEEResultResponse(BaseModel):
@@ -107,3 +125,32 @@ class GEEResultResponse(BaseModel):
     run_id: str
     status: str
     message: str
+    duplicate: bool = False  # True when this was an idempotent retry
+
+
+class GEEBulkResultItem(BaseModel):
+    """Outcome of one item of a bulk GEE submission"""
+    run_id: str
+    status: str  # 'completed' | 'not_found' | 'rejected'
+    duplicate: bool = False
+    message: str
+
+
+class GEEBulkResultResponse(BaseModel):
+    results: list[GEEBulkResultItem]
+    ingested: int
+    duplicates: int
+    failed: int
+
+
+class RunClaimResponse(BaseModel):
+    """Runs leased to a GEE worker"""
+    worker: str
+    lease_seconds: int
+    runs: list[RunDetail]
+
+
+class RunHeartbeatResponse(BaseModel):
+    run_id: str
+    worker: str
+    lease_expires_at: datetime
@@ -0,0 +1,48 @@
+from pydantic import BaseModel, Field
+from typing import Any, Optional
+
+
+class WebhookEndpointCreate(BaseModel):
+    url: str = Field(pattern=r"^https?://")
+    secret: Optional[str] = None  # generated when omitted
+    event_types: list[str] = []  # empty = every event type
+    project_id: Optional[str] = None  # None = every project
+    max_concurrency: int = Field(2, ge=1, le=32)
+
+
+class WebhookEndpoint(BaseModel):
+    id: str
+    url: str
+    event_types: list[str]
+    project_id: Optional[str] = None
+    max_concurrency: int
+    is_active: bool
+    created_at: str
+
+
+class WebhookEndpointCreated(WebhookEndpoint):
+    secret: str  # only returned on creation
+
+
+class WebhookEndpointsResponse(BaseModel):
+    endpoints: list[WebhookEndpoint]
+
+
+class DeadLetter(BaseModel):
+    id: int
+    event_id: str
+    event_type: str
+    payload: dict[str, Any]
+    attempts: int
+    last_error: Optional[str] = None
+    created_at: str
+
+
+class DeadLettersResponse(BaseModel):
+    endpoint_id: str
+    dead_letters: list[DeadLetter]
+
+
+class ReplayResponse(BaseModel):
+    endpoint_id: str
+    requeued: int
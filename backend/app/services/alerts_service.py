@@ -1,18 +1,242 @@
+"""Alerts service - alerts raised on ingestion, paged from indexed storage
+
+Alerts Service Layer
+
+Rules are evaluated on each batch of ingested runs, with the rollups that
+ingestion just updated (rollup_service) and the runs' geomarkers, so
+raising alerts costs O(ingested runs) and never rescans the runs table:
+- loss_threshold: a run's loss reaches alerts_loss_warning_ha /
+  alerts_loss_critical_ha
+- risk_jump: the project's latest run moves its risk label up (rollup
+  last vs previous run loss)
+- boundary_breach: loss inside a protected or buffer zone geomarker, or
+  cumulative loss crossing the work zone's authorized area_hectares
+
+Alerts live in the alerts table (14_alerts.sql), one per (run, rule), and
+GET /alerts pages them newest first with an opaque (created_at, id)
+keyset cursor, served by an index range scan for every filter.
+
+Key Functions:
+- evaluate_rules(): alerts for a batch of runs (pure)
+- raise_alerts(): evaluate and store alerts for ingested runs
+- list_alerts(): GET /alerts
+"""
+
+import base64
+import binascii
+import json
 import uuid
 from datetime import datetime, timezone
-from app.schemas.alerts import AlertOut
-
-def list_alerts(project_id: str | None, severity: str | None, limit: int) -> list[AlertOut]:
-    alerts = [
-        AlertOut(
-            id=str(uuid.uuid4()),
-            project_id=project_id or "demo-project",
-            severity=severity or "warning",
-            title="Vegetation loss detected",
-            message="Estimated vegetation loss detected in the last monitoring window.",
-            created_at=datetime.now(timezone.utc).isoformat(),
-            geometry=None,
-            metric={"area_ha": 2.3},
-        )
-    ]
-    return alerts[:limit]
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.db.queries import AlertQueries, GeomarkerQueries
+from app.schemas.alerts import AlertOut, AlertsResponse
+
+RULES = ("loss_threshold", "risk_jump", "boundary_breach")
+SEVERITIES = ("info", "warning", "critical")
+RISK_RANK = {"unknown": 0, "low": 1, "medium": 2, "high": 3}
+
+# Geomarker types where any loss is a breach, with the alert severity
+RESTRICTED_ZONES = {"protected_zone": "critical", "buffer_zone": "warning"}
+
+
+def _geometry(geomarker: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    geojson = (geomarker or {}).get("geojson")
+    if not geojson:
+        return None
+    return geojson.get("geometry") if geojson.get("type") == "Feature" else geojson
+
+
+def _authorized_area_ha(geomarker: Dict[str, Any]) -> Optional[float]:
+    properties = (geomarker.get("geojson") or {}).get("properties") or {}
+    area = properties.get("area_hectares")
+    return float(area) if area else None
+
+
+def _alert(run: Dict[str, Any], rule: str, severity: str, title: str, message: str,
+           geometry: Optional[Dict[str, Any]], metric: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "project_id": str(run["project_id"]),
+        "run_id": str(run["id"]),
+        "rule": rule,
+        "severity": severity,
+        "title": title,
+        "message": message,
+        "geometry": geometry,
+        "metric": metric,
+    }
+
+
+def evaluate_rules(
+    runs: List[Dict[str, Any]],
+    rollups: List[Dict[str, Any]],
+    geomarkers: Dict[str, Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """
+    Alert rows for freshly ingested runs (runs rows), given the rollup
+    rows returned by apply_run_rollups and geomarker id -> geomarker.
+    """
+    # Imported here: runs_service raises alerts through this module
+    from app.services.runs_service import risk_label_for_area
+
+    # apply_run_rollups returns one row per run; the last one per project is current
+    rollup_by_project = {str(row["project_id"]): row for row in rollups}
+    batch_loss: Dict[str, float] = {}
+    for run in runs:
+        pid = str(run["project_id"])
+        batch_loss[pid] = batch_loss.get(pid, 0.0) + float(run.get("hectares_change") or 0)
+
+    alerts = []
+    footprint_alerted = set()
+    for run in runs:
+        pid = str(run["project_id"])
+        loss = float(run.get("hectares_change") or 0)
+        window = f"{str(run.get('start_date'))[:10]} to {str(run.get('end_date'))[:10]}"
+        geomarker = geomarkers.get(str(run.get("geomarker_id")))
+        geometry = _geometry(geomarker)
+
+        if loss >= settings.alerts_loss_warning_ha:
+            critical = loss >= settings.alerts_loss_critical_ha
+            alerts.append(_alert(
+                run, "loss_threshold", "critical" if critical else "warning",
+                "Vegetation loss detected",
+                f"Estimated {loss:.1f} ha loss between {window}.",
+                geometry,
+                {
+                    "area_ha": loss,
+                    "threshold_ha": settings.alerts_loss_critical_ha if critical else settings.alerts_loss_warning_ha,
+                },
+            ))
+
+        rollup = rollup_by_project.get(pid)
+        if (
+            rollup
+            and str(rollup.get("last_run_id")) == str(run["id"])
+            and rollup.get("previous_hectares_change") is not None
+        ):
+            before = risk_label_for_area(float(rollup["previous_hectares_change"]))
+            after = risk_label_for_area(float(rollup.get("last_hectares_change") or 0))
+            if RISK_RANK[after] > RISK_RANK[before]:
+                alerts.append(_alert(
+                    run, "risk_jump", "critical" if after == "high" else "warning",
+                    f"Risk level rose to {after}",
+                    f"Risk level went from {before} to {after} with the run ending {str(run.get('end_date'))[:10]}.",
+                    geometry,
+                    {
+                        "from": before,
+                        "to": after,
+                        "hectares_change": rollup.get("last_hectares_change"),
+                        "previous_hectares_change": rollup["previous_hectares_change"],
+                    },
+                ))
+
+        if not geomarker:
+            continue
+        zone = geomarker.get("geomarker_type")
+        if zone in RESTRICTED_ZONES and loss >= settings.alerts_breach_min_ha:
+            alerts.append(_alert(
+                run, "boundary_breach", RESTRICTED_ZONES[zone],
+                f"Loss inside {zone.replace('_', ' ')}",
+                f"Estimated {loss:.1f} ha loss inside a {zone.replace('_', ' ')} between {window}.",
+                geometry,
+                {"area_ha": loss, "geomarker_type": zone},
+            ))
+        elif zone not in RESTRICTED_ZONES and rollup and loss > 0 and pid not in footprint_alerted:
+            # Fires for the batch that crosses the authorized area, not after
+            authorized = _authorized_area_ha(geomarker)
+            total = float(rollup.get("total_hectares_lost") or 0)
+            if authorized and total >= authorized > total - batch_loss[pid]:
+                footprint_alerted.add(pid)
+                alerts.append(_alert(
+                    run, "boundary_breach", "critical",
+                    "Loss exceeds authorized footprint",
+                    f"Cumulative loss of {total:.1f} ha exceeds the {authorized:.0f} ha authorized for the work zone.",
+                    geometry,
+                    {"total_hectares_lost": total, "authorized_area_ha": authorized},
+                ))
+    return alerts
+
+
+def raise_alerts(runs: List[Optional[Dict[str, Any]]], rollups: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Evaluate and store the alerts of freshly ingested runs (called by
+    process_gee_result). Failures are logged: ingestion must not fail
+    because of an alert.
+    """
+    runs = [run for run in runs if run]
+    if not runs:
+        return []
+    try:
+        geomarker_ids = sorted({str(run["geomarker_id"]) for run in runs if run.get("geomarker_id")})
+        geomarkers = {str(g["id"]): g for g in GeomarkerQueries.get_by_ids(geomarker_ids)}
+        alerts = evaluate_rules(runs, rollups, geomarkers)
+        return AlertQueries.replace_for_runs([str(run["id"]) for run in runs], alerts)
+    except Exception as e:
+        print(f"Warning: could not raise alerts for {len(runs)} run(s): {e}")
+        return []
+
+
+def encode_cursor(alert: Dict[str, Any]) -> str:
+    key = json.dumps([str(alert["created_at"]), str(alert["id"])])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """
+    (created_at, id) keyset of a cursor, normalised to an ISO timestamp and
+    a UUID: the values end up in a PostgREST filter string
+    """
+    try:
+        created_at, alert_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        instant = datetime.fromisoformat(str(created_at).replace("Z", "+00:00"))
+        if instant.tzinfo is None:
+            instant = instant.replace(tzinfo=timezone.utc)
+        return instant.isoformat(), str(uuid.UUID(str(alert_id)))
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def to_alert_out(row: Dict[str, Any]) -> AlertOut:
+    return AlertOut(
+        id=str(row["id"]),
+        project_id=str(row["project_id"]),
+        severity=row["severity"],
+        title=row["title"],
+        message=row["message"],
+        created_at=str(row["created_at"]),
+        geometry=row.get("geometry"),
+        metric=row.get("metric"),
+        run_id=str(row["run_id"]) if row.get("run_id") else None,
+        rule=row.get("rule"),
+    )
+
+
+def list_alerts(
+    project_id: str | None = None,
+    severity: str | None = None,
+    limit: int = 50,
+    cursor: str | None = None,
+    rule: str | None = None,
+) -> AlertsResponse:
+    """Alerts newest first, filtered, one page after `cursor`"""
+    if severity and severity not in SEVERITIES:
+        raise HTTPException(status_code=400, detail=f"severity must be one of {list(SEVERITIES)}")
+    if rule and rule not in RULES:
+        raise HTTPException(status_code=400, detail=f"rule must be one of {list(RULES)}")
+    limit = max(1, min(limit, settings.alerts_max_page_size))
+
+    rows = AlertQueries.get_page(
+        limit + 1,  # one more tells whether there is a next page
+        project_id=project_id,
+        severity=severity,
+        rule=rule,
+        before=decode_cursor(cursor) if cursor else None,
+    )
+    page = rows[:limit]
+    return AlertsResponse(
+        alerts=[to_alert_out(row) for row in page],
+        next_cursor=encode_cursor(page[-1]) if len(rows) > limit else None,
+    )
@@ -0,0 +1,657 @@
+"""Analysis service - local NDVI change detection (no GEE round-trip)
+
+Analysis Service Layer
+
+Runs the deforestation analysis of a run in-process with NumPy instead of
+waiting for the external GEE pipeline.
+
+Key Functions:
+- detect_change(): delta-NDVI, loss threshold, connected loss patches
+- analyze_run(): fetch before/after scenes for a run's AOI and detect change
+- upload_loss_polygons(): polygonize loss patches, upload the GeoJSON
+- precheck_run(): Statistical API aggregates deciding whether imagery is needed
+- process_run_locally(): analyze a run and ingest it via process_gee_result()
+
+Method:
+0. Statistics-only pre-check (statistics_service): mean NDVI, area below
+   statistics_ndvi_floor and cloud fraction per window, cached per
+   geomarker version. Unless the NDVI drop or the newly non-vegetated area
+   crosses a trigger (or too few clear pixels were seen), the run is
+   ingested from these numbers alone and steps 1-6 are skipped
+1. One multi-output scene (display RGB, cloud-masked NDVI, SCL) is fetched
+   for a "before" window ending at run.start_date and an "after" window
+   ending at run.end_date (SentinelService.fetch_scene). Sources that can
+   search the catalog instead get every acquisition of each window (up to
+   composite_max_scenes) streamed into a cloud-masked median or
+   quality-weighted composite (app/utils/composite.py)
+2. Delta-NDVI is computed for every pixel at once (vectorized)
+3. Pixels inside the geomarker whose NDVI dropped by at least the
+   threshold are loss pixels
+4. Loss pixels are grouped into 8-connected patches (scipy.ndimage.label);
+   patches smaller than min_loss_pixels are dropped as noise
+5. Patches at or above the minimum mapping unit are polygonized
+   (app/utils/polygonize.py) and uploaded as the loss_polygons GeoJSON;
+   the RGB layers become the before/after images
+6. stats has the same shape GEE submits (affected_area_ha, ...), so the
+   result goes through the normal ingestion path
+
+Sources that can also search the catalog (SentinelService) run steps 1-4
+incrementally instead: only acquisitions after the project's watermark
+are fetched and folded into its cached composite (monitoring_service).
+
+Large AOIs:
+- Scenes are fetched tile by tile (Sentinel Hub pixel limit), concurrently,
+  into one mosaic per layer (app/utils/raster.py)
+- Rasters above analysis_memmap_min_pixels live in memory-mapped .npy
+  files in a temporary work directory instead of RAM
+- Steps 2-4 run analysis_block_rows rows at a time
+"""
+
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+from scipy import ndimage
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from app.config import settings
+from app.db.queries import GeomarkerQueries, RunQueries
+from app.schemas.runs import GEEResultInput, GEEResultResponse
+from app.services.catalog_service import CatalogSource, list_acquisitions
+from app.services.runs_service import process_gee_result
+from app.services.statistics_service import StatisticsSource, get_interval_statistics
+from app.services.storage_service import upload_bytes
+from app.utils.geo import BBox, bbox_from_geojson, pixel_area_ha, polygon_mask
+from app.utils.composite import Compositor
+from app.utils.polygonize import polygonize
+from app.utils.raster import allocate, encode_png, fetch_tiled_layers, raster_shape, row_blocks
+
+# 8-connectivity: diagonal neighbours belong to the same patch
+CONNECTIVITY = np.ones((3, 3), dtype=bool)
+
+
+# Layers of SentinelService.fetch_scene: name -> (extra dims, dtype)
+SCENE_LAYERS = {
+    "rgb": ((3,), np.uint8),
+    "ndvi": ((), np.float32),
+    "scl": ((), np.uint8),
+}
+
+# Sentinel-2 scene classification: cloud shadow, cloud (medium/high), cirrus
+SCL_CLOUD_CLASSES = (3, 8, 9, 10)
+
+
+class SceneSource(Protocol):
+    """Anything that returns scene layers like SentinelService.fetch_scene"""
+
+    def fetch_scene(
+        self,
+        bbox: BBox,
+        date_from: datetime,
+        date_to: datetime,
+        resolution: int = 20,
+        max_cloud_coverage: int = 30,
+        size: Optional[Tuple[int, int]] = None,
+    ) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        ...
+
+
+@dataclass
+class ChangeResult:
+    delta: np.ndarray  # float32 delta-NDVI, NaN where invalid
+    labels: np.ndarray  # int32 patch id per pixel, 0 = no loss
+    stats: Dict[str, Any]
+
+    @property
+    def loss_mask(self) -> np.ndarray:
+        """Loss pixels kept after the size filter (materialises a full bool raster)"""
+        return self.labels > 0
+
+
+def _seam_pairs(upper: np.ndarray, lower: np.ndarray) -> np.ndarray:
+    """(2, n) label pairs touching across a block seam (8-connectivity)"""
+    pairs = []
+    for shift in (-1, 0, 1):
+        a = upper[max(shift, 0): len(upper) + min(shift, 0)]
+        b = lower[max(-shift, 0): len(lower) + min(-shift, 0)]
+        hit = (a > 0) & (b > 0)
+        pairs.append(np.stack([a[hit], b[hit]]))
+    return np.concatenate(pairs, axis=1)
+
+
+def workfile(workdir: Optional[str], name: str) -> Optional[str]:
+    """Path of a memmap file under workdir (None keeps arrays in memory)"""
+    return os.path.join(workdir, name) if workdir else None
+
+
+def detect_change(
+    before: np.ndarray,
+    after: np.ndarray,
+    pixel_ha: float,
+    aoi_mask: Optional[np.ndarray] = None,
+    ndvi_threshold: float = -0.2,
+    min_loss_pixels: int = 1,
+    block_rows: Optional[int] = None,
+    workdir: Optional[str] = None,
+) -> ChangeResult:
+    """
+    Compare two (rows, cols) NDVI rasters (NaN = no data / cloud).
+
+    A pixel is valid when both dates have NDVI (and it lies in aoi_mask);
+    it is lost when after - before NDVI <= ndvi_threshold.
+
+    Inputs may be memmaps: they are read block_rows rows at a time, and with
+    a workdir the delta/label rasters are memory-mapped there too, so peak
+    memory depends on the block size, not the AOI. Patches are labelled per
+    block and merged across block seams with a connected-components pass
+    over the (small) graph of touching labels.
+    """
+    if before.shape != after.shape:
+        raise ValueError(f"NDVI shapes differ: {before.shape} vs {after.shape}")
+
+    rows, cols = before.shape
+    delta = allocate((rows, cols), np.float32, workfile(workdir, "delta.npy"))
+    labels = allocate((rows, cols), np.int32, workfile(workdir, "labels.npy"))
+
+    n_labels = 0
+    sizes = [np.zeros(1, dtype=np.int64)]  # provisional label -> pixel count
+    seams = [np.zeros((2, 0), dtype=np.int64)]
+    previous_row = None
+    valid_pixels = aoi_pixels = 0
+    sum_before = sum_after = sum_delta = 0.0
+
+    # Pass 1: per-block NDVI, delta, provisional labels and running sums
+    for block in row_blocks(rows, block_rows):
+        ndvi_before = np.asarray(before[block], dtype=np.float32)
+        ndvi_after = np.asarray(after[block], dtype=np.float32)
+
+        aoi = np.asarray(aoi_mask[block]) if aoi_mask is not None else np.ones(ndvi_before.shape, dtype=bool)
+        valid = aoi & np.isfinite(ndvi_before) & np.isfinite(ndvi_after)
+
+        block_delta = np.where(valid, ndvi_after - ndvi_before, np.nan).astype(np.float32)
+        delta[block] = block_delta
+        loss = valid & (block_delta <= ndvi_threshold)
+
+        block_labels, count = ndimage.label(loss, structure=CONNECTIVITY)
+        block_labels[loss] += n_labels
+        labels[block] = block_labels
+        sizes.append(np.bincount(block_labels[loss] - n_labels, minlength=count + 1)[1:])
+        if previous_row is not None:
+            seams.append(_seam_pairs(previous_row, block_labels[0]))
+        previous_row = block_labels[-1].copy()
+        n_labels += count
+
+        valid_pixels += int(valid.sum())
+        aoi_pixels += int(aoi.sum())
+        sum_before += float(ndvi_before[valid].sum(dtype=np.float64))
+        sum_after += float(ndvi_after[valid].sum(dtype=np.float64))
+        sum_delta += float(block_delta[valid].sum(dtype=np.float64))
+
+    # Merge labels that touch across seams, drop small patches, renumber 1..n
+    edges = np.concatenate(seams, axis=1)
+    graph = coo_matrix((np.ones(edges.shape[1]), (edges[0], edges[1])), shape=(n_labels + 1,) * 2)
+    _, component = connected_components(graph, directed=False)
+    component_sizes = np.bincount(component, weights=np.concatenate(sizes))
+    keep = component_sizes >= max(1, min_loss_pixels)
+    keep[component[0]] = False
+    relabel = (np.cumsum(keep) * keep)[component].astype(np.int32)
+
+    # Pass 2: final labels
+    loss_pixels = 0
+    for block in row_blocks(rows, block_rows):
+        final = relabel[labels[block]]
+        labels[block] = final
+        loss_pixels += int((final > 0).sum())
+
+    for raster in (delta, labels):
+        if isinstance(raster, np.memmap):
+            raster.flush()
+
+    def mean(total: float) -> Optional[float]:
+        return round(total / valid_pixels, 4) if valid_pixels else None
+
+    stats = {
+        "affected_area_ha": round(loss_pixels * pixel_ha, 4),
+        "loss_pixel_count": loss_pixels,
+        "polygon_count": int(keep.sum()),
+        "mean_ndvi_before": mean(sum_before),
+        "mean_ndvi_after": mean(sum_after),
+        "mean_delta_ndvi": mean(sum_delta),
+        "valid_pixel_fraction": round(valid_pixels / aoi_pixels, 4) if aoi_pixels else 0.0,
+        "pixel_area_ha": round(pixel_ha, 6),
+        "ndvi_threshold": ndvi_threshold,
+        "min_loss_pixels": min_loss_pixels,
+        "method": "local_numpy",
+    }
+    return ChangeResult(delta=delta, labels=labels, stats=stats)
+
+
+def as_datetime(value: Any) -> datetime:
+    """Run date (date, datetime or ISO string) as a datetime"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(str(value)[:10])
+
+
+def _cloud_threshold(run: Dict[str, Any]) -> int:
+    return run.get("cloud_threshold") if run.get("cloud_threshold") is not None else 30
+
+
+def aoi_raster(
+    geojson: Dict[str, Any],
+    bbox: BBox,
+    shape: Tuple[int, int],
+    path: Optional[str] = None,
+) -> np.ndarray:
+    """AOI mask on the bbox grid, rasterized block by block (memory-mapped at path)"""
+    mask = allocate(shape, bool, path)
+    for block in row_blocks(shape[0], settings.analysis_block_rows):
+        mask[block] = polygon_mask(geojson, bbox, shape, row_range=(block.start, block.stop))
+    return mask
+
+
+def cloud_fraction(scl: np.ndarray, aoi_mask: np.ndarray, block_rows: Optional[int] = None) -> float:
+    """Share of AOI pixels classified as cloud or cloud shadow"""
+    cloudy = inside = 0
+    for block in row_blocks(scl.shape[0], block_rows):
+        aoi = np.asarray(aoi_mask[block])
+        cloudy += int((np.isin(scl[block], SCL_CLOUD_CLASSES) & aoi).sum())
+        inside += int(aoi.sum())
+    return round(cloudy / inside, 4) if inside else 0.0
+
+
+def unobserved_fraction(layers: Dict[str, np.ndarray], aoi_mask: np.ndarray, block_rows: Optional[int] = None) -> float:
+    """Share of AOI pixels a composite never saw clear (NaN NDVI)"""
+    missing = inside = 0
+    for block in row_blocks(aoi_mask.shape[0], block_rows):
+        aoi = np.asarray(aoi_mask[block])
+        missing += int((~np.isfinite(layers["ndvi"][block]) & aoi).sum())
+        inside += int(aoi.sum())
+    return round(missing / inside, 4) if inside else 0.0
+
+
+def window_cloud_fraction(layers: Dict[str, np.ndarray], aoi_mask: np.ndarray) -> float:
+    """Cloud fraction of a single scene (SCL), or unobserved fraction of a composite"""
+    if "scl" in layers:
+        return cloud_fraction(layers["scl"], aoi_mask, settings.analysis_block_rows)
+    return unobserved_fraction(layers, aoi_mask, settings.analysis_block_rows)
+
+
+def fetch_scene_layers(
+    source: SceneSource,
+    bbox: BBox,
+    shape: Tuple[int, int],
+    date_from: datetime,
+    date_to: datetime,
+    resolution: int,
+    max_cloud_coverage: int,
+    workdir: Optional[str] = None,
+    name: str = "scene",
+) -> Dict[str, np.ndarray]:
+    """One (least-cloudy) scene over bbox, fetched tile by tile into SCENE_LAYERS mosaics"""
+    return fetch_tiled_layers(
+        source.fetch_scene,
+        bbox,
+        shape,
+        SCENE_LAYERS,
+        paths={layer: workfile(workdir, f"{name}_{layer}.npy") for layer in SCENE_LAYERS} if workdir else None,
+        max_tile_px=settings.sentinel_max_tile_px,
+        max_workers=settings.sentinel_tile_workers,
+        date_from=date_from,
+        date_to=date_to,
+        resolution=resolution,
+        max_cloud_coverage=max_cloud_coverage,
+    )
+
+
+def select_acquisitions(source: CatalogSource, bbox: BBox, date_from: date, date_to: date) -> List[date]:
+    """Days of the composite_max_scenes clearest acceptable acquisitions, in date order"""
+    usable = [
+        a for a in list_acquisitions(source, bbox, date_from, date_to)
+        if a.cloud_cover <= settings.scene_max_cloud_coverage
+    ]
+    clearest = sorted(usable, key=lambda a: (a.cloud_cover, a.day))[: settings.composite_max_scenes]
+    return sorted(a.day for a in clearest)
+
+
+def composite_scenes(
+    source: SceneSource,
+    bbox: BBox,
+    shape: Tuple[int, int],
+    days: List[date],
+    resolution: int,
+    workdir: Optional[str] = None,
+    name: str = "composite",
+) -> Dict[str, np.ndarray]:
+    """
+    Cloud-masked composite (composite_method) of one acquisition per day.
+
+    Scenes are fetched and added one at a time, so memory holds one scene
+    plus the accumulators however many days there are. Returns ndvi, rgb,
+    count and observed layers (app/utils/composite.py).
+    """
+    compositor = Compositor(
+        shape,
+        method=settings.composite_method,
+        samples=settings.composite_samples,
+        block_rows=settings.analysis_block_rows,
+        workdir=workdir,
+        name=name,
+    )
+    for day in sorted(days):
+        day_start = datetime.combine(day, datetime.min.time())
+        scene = fetch_scene_layers(
+            source, bbox, shape, day_start, day_start + timedelta(days=1),
+            resolution, settings.scene_max_cloud_coverage, workdir, "scene",
+        )
+        compositor.add(scene, day)
+    return compositor.result()
+
+
+@dataclass
+class RunAnalysis:
+    result: ChangeResult
+    metadata: Dict[str, Any]
+    before: Dict[str, np.ndarray]  # scene layers: rgb, ndvi, scl
+    after: Dict[str, np.ndarray]
+    # Incremental monitoring state to store after ingestion (monitoring_service)
+    composite: Optional[Dict[str, np.ndarray]] = None
+    watermark: Optional[date] = None
+
+
+def analyze_run(
+    run: Dict[str, Any],
+    geomarker: Dict[str, Any],
+    source: SceneSource,
+    workdir: Optional[str] = None,
+) -> RunAnalysis:
+    """
+    Fetch before/after scenes for a run and detect change inside its geomarker.
+
+    Run parameters may override ndvi_threshold, min_loss_pixels and
+    resolution_m. With a workdir, rasters of at least
+    analysis_memmap_min_pixels are memory-mapped there.
+    """
+    params = run.get("parameters") or {}
+    threshold = float(params.get("ndvi_threshold", settings.analysis_ndvi_threshold))
+    min_pixels = int(params.get("min_loss_pixels", settings.analysis_min_loss_pixels))
+    resolution = int(params.get("resolution_m", settings.analysis_resolution_m))
+    cloud = _cloud_threshold(run)
+    window = timedelta(days=settings.analysis_window_days)
+
+    geojson = geomarker["geojson"]
+    bbox = bbox_from_geojson(geojson)
+    start = as_datetime(run["start_date"])
+    end = as_datetime(run["end_date"])
+
+    shape = raster_shape(bbox, resolution)
+    if shape[0] * shape[1] < settings.analysis_memmap_min_pixels:
+        workdir = None
+
+    compositing = settings.composite_method != "none" and isinstance(source, CatalogSource)
+    composited: Dict[str, list] = {}
+
+    def fetch(date_from: datetime, date_to: datetime, name: str) -> Dict[str, np.ndarray]:
+        if compositing:
+            days = select_acquisitions(source, bbox, date_from.date(), date_to.date())
+            if days:
+                composited[name] = [day.isoformat() for day in days]
+                return composite_scenes(source, bbox, shape, days, resolution, workdir, name)
+        return fetch_scene_layers(source, bbox, shape, date_from, date_to, resolution, cloud, workdir, name)
+
+    before = fetch(start - window, start, "before")
+    after = fetch(end - window, end, "after")
+    aoi = aoi_raster(geojson, bbox, shape, workfile(workdir, "aoi.npy"))
+
+    result = detect_change(
+        before["ndvi"],
+        after["ndvi"],
+        pixel_area_ha(bbox, shape),
+        aoi_mask=aoi,
+        ndvi_threshold=threshold,
+        min_loss_pixels=min_pixels,
+        block_rows=settings.analysis_block_rows,
+        workdir=workdir,
+    )
+    result.stats["cloud_fraction_before"] = window_cloud_fraction(before, aoi)
+    result.stats["cloud_fraction_after"] = window_cloud_fraction(after, aoi)
+    metadata = {
+        "satellite": "Sentinel-2 L2A",
+        "engine": "local_numpy",
+        "resolution_m": resolution,
+        "size": [int(shape[1]), int(shape[0])],
+        "bbox": list(bbox),
+        "before_window": [(start - window).date().isoformat(), start.date().isoformat()],
+        "after_window": [(end - window).date().isoformat(), end.date().isoformat()],
+        "processed_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if composited:
+        metadata["composite"] = {
+            "method": settings.composite_method,
+            "before_scenes": composited.get("before", []),
+            "after_scenes": composited.get("after", []),
+        }
+    return RunAnalysis(result=result, metadata=metadata, before=before, after=after)
+
+
+@dataclass
+class StatisticsCheck:
+    before: Dict[str, Any]  # statistics_service interval dicts
+    after: Dict[str, Any]
+    triggers: list  # why full imagery is needed; empty when it is not
+    stats: Dict[str, Any]
+    metadata: Dict[str, Any]
+
+    @property
+    def needs_imagery(self) -> bool:
+        return bool(self.triggers)
+
+
+def _valid_fraction(interval: Dict[str, Any]) -> float:
+    samples = interval.get("sample_count") or 0
+    return (interval.get("valid_pixel_count") or 0) / samples if samples else 0.0
+
+
+def precheck_run(
+    run: Dict[str, Any],
+    geomarker: Dict[str, Any],
+    source: StatisticsSource,
+    today: Optional[date] = None,
+) -> StatisticsCheck:
+    """
+    Cheap before/after aggregates of a run from the Statistical API.
+
+    Uses the same windows as analyze_run(). Full imagery is needed when:
+    - either window has less than statistics_min_valid_fraction clear pixels
+    - mean NDVI dropped by at least statistics_trigger_mean_drop
+    - the area below statistics_ndvi_floor grew by statistics_trigger_area_ha
+    """
+    params = run.get("parameters") or {}
+    resolution = int(params.get("resolution_m", settings.analysis_resolution_m))
+    window = timedelta(days=settings.analysis_window_days)
+    start = as_datetime(run["start_date"]).date()
+    end = as_datetime(run["end_date"]).date()
+    floor = settings.statistics_ndvi_floor
+
+    before, after = get_interval_statistics(
+        geomarker,
+        [(start - window, start), (end - window, end)],
+        source,
+        resolution=resolution,
+        max_cloud_coverage=_cloud_threshold(run),
+        ndvi_floor=floor,
+        today=today,
+    )
+
+    pixel_ha = resolution * resolution / 10_000
+    triggers = []
+    mean_delta = below_growth_ha = None
+    if min(_valid_fraction(before), _valid_fraction(after)) < settings.statistics_min_valid_fraction:
+        triggers.append("insufficient_clear_pixels")
+    else:
+        mean_delta = after["mean_ndvi"] - before["mean_ndvi"]
+        # Share of clear pixels below the floor, scaled to the AOI's area
+        aoi_ha = after["sample_count"] * pixel_ha
+        below_growth_ha = (after["below_fraction"] - before["below_fraction"]) * aoi_ha
+        if mean_delta <= -settings.statistics_trigger_mean_drop:
+            triggers.append("mean_ndvi_drop")
+        if below_growth_ha >= settings.statistics_trigger_area_ha:
+            triggers.append("non_vegetated_area_growth")
+
+    stats = {
+        # Nothing crossed a trigger: no loss is reported for stats-only runs
+        "affected_area_ha": 0.0,
+        "loss_pixel_count": 0,
+        "polygon_count": 0,
+        "mean_ndvi_before": before["mean_ndvi"],
+        "mean_ndvi_after": after["mean_ndvi"],
+        "mean_delta_ndvi": round(mean_delta, 6) if mean_delta is not None else None,
+        "below_fraction_before": before["below_fraction"],
+        "below_fraction_after": after["below_fraction"],
+        "non_vegetated_growth_ha": round(below_growth_ha, 4) if below_growth_ha is not None else None,
+        "cloud_fraction_before": before["cloud_fraction"],
+        "cloud_fraction_after": after["cloud_fraction"],
+        "ndvi_floor": floor,
+        "method": "statistics",
+    }
+    metadata = {
+        "satellite": "Sentinel-2 L2A",
+        "engine": "statistical_api",
+        "resolution_m": resolution,
+        "before_window": [before["interval_from"], before["interval_to"]],
+        "after_window": [after["interval_from"], after["interval_to"]],
+        "cached_intervals": int(before["cached"]) + int(after["cached"]),
+        "processed_at": datetime.now(timezone.utc).isoformat(),
+    }
+    return StatisticsCheck(before=before, after=after, triggers=triggers, stats=stats, metadata=metadata)
+
+
+def upload_loss_polygons(
+    run: Dict[str, Any],
+    result: ChangeResult,
+    metadata: Dict[str, Any],
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Polygonize a run's loss patches and upload them as GeoJSON.
+
+    Patches smaller than polygon_min_area_ha (minimum mapping unit) are
+    left out. Returns (public_url, feature_collection).
+    """
+    collection = polygonize(
+        result.labels,
+        tuple(metadata["bbox"]),
+        delta=result.delta,
+        pixel_ha=result.stats["pixel_area_ha"],
+        min_area_ha=settings.polygon_min_area_ha,
+        simplify_px=settings.polygon_simplify_px,
+        ndvi_threshold=result.stats["ndvi_threshold"],
+        block_rows=settings.analysis_block_rows,
+    )
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    url = upload_bytes(
+        path=f"projects/{run['project_id']}/runs/{run['id']}/loss_polygons_{timestamp}.geojson",
+        content=json.dumps(collection, separators=(",", ":")).encode(),
+        content_type="application/geo+json",
+    )
+    return url, collection
+
+
+def _upload_png(run: Dict[str, Any], name: str, image: np.ndarray, timestamp: str) -> str:
+    return upload_bytes(
+        path=f"projects/{run['project_id']}/runs/{run['id']}/{name}_{timestamp}.png",
+        content=encode_png(image, block_rows=settings.analysis_block_rows),
+        content_type="image/png",
+    )
+
+
+def process_run_locally(run_id: str, source: Optional[SceneSource] = None) -> GEEResultResponse:
+    """
+    Analyze a run in-process and ingest the result like a GEE submission.
+
+    Args:
+        run_id: Run to analyze (normally claimed first, see POST /runs/claim)
+        source: Scene source; defaults to the Sentinel Hub service. Sources
+            that also provide fetch_statistics get the statistics-only
+            pre-check; parameters.full_imagery skips it
+    """
+    run = RunQueries.get_by_id(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
+
+    geomarker = GeomarkerQueries.get_by_id(run["geomarker_id"]) if run.get("geomarker_id") else None
+    if not geomarker:
+        raise HTTPException(status_code=400, detail=f"Run {run_id} has no geomarker to analyze")
+
+    if source is None:
+        # sentinelhub is only needed when imagery is actually fetched
+        from app.services.sentinel_service import get_sentinel_service
+        source = get_sentinel_service(pu_budget=settings.sentinel_run_pu_budget)
+
+    triggers = None
+    params = run.get("parameters") or {}
+    if (
+        settings.statistics_precheck_enabled
+        and not params.get("full_imagery")
+        and isinstance(source, StatisticsSource)
+    ):
+        check = precheck_run(run, geomarker, source)
+        if not check.needs_imagery:
+            return process_gee_result(GEEResultInput(
+                project_id=run["project_id"],
+                run_id=run_id,
+                start_date=run["start_date"],
+                end_date=run["end_date"],
+                stats=check.stats,
+                loss_polygons_url="",
+                outputs={},
+                metadata=check.metadata,
+            ))
+        triggers = check.triggers
+
+    # Imported here: monitoring_service builds on this module
+    from app.services.monitoring_service import analyze_run_incremental, save_checkpoint
+    incremental = settings.incremental_monitoring_enabled and isinstance(source, CatalogSource)
+
+    with tempfile.TemporaryDirectory(prefix="ndvi-") as workdir:
+        if incremental:
+            analysis = analyze_run_incremental(run, geomarker, source, workdir=workdir)
+        else:
+            analysis = analyze_run(run, geomarker, source, workdir=workdir)
+        result, metadata = analysis.result, analysis.metadata
+
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+        outputs = {
+            "before_image_url": _upload_png(run, "before", analysis.before["rgb"], timestamp),
+            "after_image_url": _upload_png(run, "after", analysis.after["rgb"], timestamp),
+        }
+        polygons_url = ""
+        if result.stats["polygon_count"]:
+            polygons_url, collection = upload_loss_polygons(run, result, metadata)
+            features = collection["features"]
+            result.stats["mapped_polygon_count"] = len(features)
+            result.stats["mapped_area_ha"] = round(sum(f["properties"]["area_ha"] for f in features), 4)
+            result.stats["min_mapping_unit_ha"] = settings.polygon_min_area_ha
+        if triggers is not None:
+            result.stats["statistics_triggers"] = triggers
+
+        response = process_gee_result(GEEResultInput(
+            project_id=run["project_id"],
+            run_id=run_id,
+            start_date=run["start_date"],
+            end_date=run["end_date"],
+            stats=result.stats,
+            loss_polygons_url=polygons_url,
+            outputs=outputs,
+            metadata=metadata,
+        ))
+        # Only an ingested run moves the watermark (a retry redoes the same window)
+        save_checkpoint(run, geomarker, analysis, workdir=workdir)
+    return response
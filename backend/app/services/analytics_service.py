@@ -0,0 +1,311 @@
+"""Analytics service - reporting aggregates from a local columnar snapshot
+
+Analytics Service Layer
+
+Reporting views (hectares lost per region per month, risk distribution
+per company, carbon per state) aggregate every run. Through PostgREST
+that means pulling all runs into Python on every request, on the same
+database that serves ingestion. Instead:
+- A periodic export copies regions, companies, projects and completed
+  runs, page by page, into a columnar snapshot: one numpy array per
+  column, strings dictionary-encoded to integer indexes
+- The snapshot is kept in memory and written to analytics_snapshot_path
+  (.npz) so a restart serves the last snapshot immediately
+- /analytics/* endpoints only read the snapshot; group-bys are
+  np.unique / np.bincount over whole columns
+
+Key Functions:
+- build_snapshot(): rows -> AnalyticsSnapshot (pure)
+- refresh_snapshot(): export from the database and swap the snapshot in
+- hectares_by_region_month(), company_risk_distribution(), carbon_by_state()
+- AnalyticsRefresher.run_forever(): background refresh loop (main.py)
+
+Figures are as fresh as the snapshot (analytics_refresh_minutes); every
+response carries snapshot_at.
+"""
+
+import asyncio
+import os
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+
+from app.config import settings
+from app.db.queries import AnalyticsQueries
+from app.schemas.analytics import (
+    CarbonByStateResponse,
+    CompanyRiskDistributionResponse,
+    CompanyRiskItem,
+    RegionMonthItem,
+    RegionMonthResponse,
+    StateCarbonItem,
+)
+from app.services.rollup_service import CARBON_TONNES_PER_HA
+
+RISK_LABELS = ("high", "medium", "low", "unknown")
+
+# table -> columns exported from the database
+EXPORT_COLUMNS = {
+    "regions": "id, name, country_code, admin_level",
+    "companies": "id, name",
+    "projects": "id, name, region_id, company_id, risk_label",
+    "runs": "id, project_id, end_date, hectares_change",
+}
+
+EXPORT_FILTERS = {"runs": {"status": "completed"}}
+
+Table = Dict[str, np.ndarray]
+
+
+@dataclass
+class AnalyticsSnapshot:
+    """Column arrays per table; foreign keys are row indexes (-1 = none)"""
+    built_at: datetime
+    regions: Table  # name, country_code, admin_level
+    companies: Table  # name
+    projects: Table  # region, company, risk (index into RISK_LABELS)
+    runs: Table  # project, end_date (datetime64[D]), hectares
+
+    def save(self, path: str) -> None:
+        arrays = {"built_at": np.array(self.built_at.isoformat())}
+        for table in ("regions", "companies", "projects", "runs"):
+            for column, values in getattr(self, table).items():
+                arrays[f"{table}.{column}"] = values
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "AnalyticsSnapshot":
+        with np.load(path) as archive:
+            tables: Dict[str, Table] = {"regions": {}, "companies": {}, "projects": {}, "runs": {}}
+            for key in archive.files:
+                if "." in key:
+                    table, column = key.split(".", 1)
+                    tables[table][column] = archive[key]
+            built_at = datetime.fromisoformat(str(archive["built_at"]))
+        return cls(built_at=built_at, **tables)
+
+
+def _strings(rows: List[Dict[str, Any]], column: str) -> np.ndarray:
+    return np.array([str(row.get(column) or "") for row in rows], dtype=np.str_)
+
+
+def _indexes(rows: List[Dict[str, Any]], column: str, index: Dict[str, int]) -> np.ndarray:
+    return np.array([index.get(str(row.get(column)), -1) for row in rows], dtype=np.int32)
+
+
+def build_snapshot(
+    regions: List[Dict[str, Any]],
+    companies: List[Dict[str, Any]],
+    projects: List[Dict[str, Any]],
+    runs: List[Dict[str, Any]],
+    built_at: Optional[datetime] = None,
+) -> AnalyticsSnapshot:
+    """Encode exported rows as columns"""
+    region_index = {str(r["id"]): i for i, r in enumerate(regions)}
+    company_index = {str(c["id"]): i for i, c in enumerate(companies)}
+    project_index = {str(p["id"]): i for i, p in enumerate(projects)}
+    risk_index = {label: i for i, label in enumerate(RISK_LABELS)}
+
+    return AnalyticsSnapshot(
+        built_at=built_at or datetime.now(timezone.utc),
+        regions={
+            "name": _strings(regions, "name"),
+            "country_code": _strings(regions, "country_code"),
+            "admin_level": _strings(regions, "admin_level"),
+        },
+        companies={"name": _strings(companies, "name")},
+        projects={
+            "region": _indexes(projects, "region_id", region_index),
+            "company": _indexes(projects, "company_id", company_index),
+            "risk": np.array(
+                [risk_index.get(p.get("risk_label") or "unknown", risk_index["unknown"]) for p in projects],
+                dtype=np.int8,
+            ),
+        },
+        runs={
+            "project": _indexes(runs, "project_id", project_index),
+            "end_date": np.array([str(r["end_date"])[:10] for r in runs], dtype="M8[D]"),
+            "hectares": np.array([float(r.get("hectares_change") or 0) for r in runs], dtype=np.float64),
+        },
+    )
+
+
+_snapshot: Optional[AnalyticsSnapshot] = None
+_snapshot_mtime: Optional[float] = None  # of the file _snapshot was loaded from / saved to
+_snapshot_lock = threading.Lock()
+
+
+def export_rows(table: str) -> List[Dict[str, Any]]:
+    """Every row of a table, page by page (completed runs only)"""
+    rows: List[Dict[str, Any]] = []
+    page = settings.analytics_export_page_size
+    while True:
+        batch = AnalyticsQueries.export_page(
+            table, EXPORT_COLUMNS[table], len(rows), page, EXPORT_FILTERS.get(table),
+        )
+        rows.extend(batch)
+        if len(batch) < page:
+            return rows
+
+
+def refresh_snapshot() -> AnalyticsSnapshot:
+    """Export the database into a new snapshot and swap it in"""
+    snapshot = build_snapshot(**{table: export_rows(table) for table in EXPORT_COLUMNS})
+    snapshot.save(settings.analytics_snapshot_path)
+    set_snapshot(snapshot, os.path.getmtime(settings.analytics_snapshot_path))
+    return snapshot
+
+
+def set_snapshot(snapshot: Optional[AnalyticsSnapshot], mtime: Optional[float] = None) -> None:
+    global _snapshot, _snapshot_mtime
+    with _snapshot_lock:
+        _snapshot = snapshot
+        _snapshot_mtime = mtime
+
+
+def get_snapshot() -> AnalyticsSnapshot:
+    """
+    The current snapshot; 503 when none exists. Reloads the file when
+    another instance (or process) wrote a newer one.
+    """
+    global _snapshot, _snapshot_mtime
+    path = settings.analytics_snapshot_path
+    with _snapshot_lock:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime != _snapshot_mtime:
+            try:
+                _snapshot = AnalyticsSnapshot.load(path)
+                _snapshot_mtime = mtime
+            except Exception as e:
+                print(f"Warning: could not load analytics snapshot: {e}")
+        snapshot = _snapshot
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="Analytics snapshot not built yet")
+    return snapshot
+
+
+def _group_sum(keys: np.ndarray, weights: np.ndarray):
+    """Unique keys with the sum of weights and row count of each"""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=weights), np.bincount(inverse)
+
+
+def hectares_by_region_month(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> RegionMonthResponse:
+    """Hectares lost per region and calendar month of the run end_date"""
+    snap = get_snapshot()
+    runs = snap.runs
+    keep = runs["project"] >= 0
+    if date_from:
+        keep &= runs["end_date"] >= np.datetime64(date_from, "D")
+    if date_to:
+        keep &= runs["end_date"] <= np.datetime64(date_to, "D")
+
+    region = snap.projects["region"][runs["project"][keep]]
+    month = runs["end_date"][keep].astype("M8[M]")
+    month_index = (month - np.datetime64("1970-01", "M")).astype(np.int64)
+    # One int64 key per (region, month); region -1 (none) sorts first
+    keys = (region.astype(np.int64) + 1) << 32 | month_index
+    unique, hectares, counts = _group_sum(keys, runs["hectares"][keep])
+
+    names = snap.regions["name"]
+    items = []
+    for key, total, count in zip(unique.tolist(), hectares.tolist(), counts.tolist()):
+        region_i = (key >> 32) - 1
+        items.append(RegionMonthItem(
+            region=str(names[region_i]) if region_i >= 0 else None,
+            month=(np.datetime64("1970-01", "M") + np.timedelta64(key & 0xFFFFFFFF, "M")).astype("M8[D]").item(),
+            hectares_lost=round(total, 4),
+            run_count=count,
+        ))
+    return RegionMonthResponse(snapshot_at=snap.built_at, items=items)
+
+
+def company_risk_distribution() -> CompanyRiskDistributionResponse:
+    """Projects per company and current risk label, with hectares lost"""
+    snap = get_snapshot()
+    n_companies = len(snap.companies["name"]) + 1  # last slot: no company
+    n_labels = len(RISK_LABELS)
+    company = np.where(snap.projects["company"] >= 0, snap.projects["company"], n_companies - 1)
+
+    counts = np.bincount(
+        company.astype(np.int64) * n_labels + snap.projects["risk"], minlength=n_companies * n_labels,
+    ).reshape(n_companies, n_labels)
+
+    runs = snap.runs
+    valid = runs["project"] >= 0
+    hectares = np.bincount(
+        company[runs["project"][valid]], weights=runs["hectares"][valid], minlength=n_companies,
+    )
+
+    names = snap.companies["name"]
+    items = [
+        CompanyRiskItem(
+            company=str(names[i]) if i < len(names) else None,
+            project_count=int(counts[i].sum()),
+            risk_distribution={label: int(counts[i, j]) for j, label in enumerate(RISK_LABELS)},
+            hectares_lost=round(float(hectares[i]), 4),
+        )
+        for i in range(n_companies)
+        if counts[i].sum()
+    ]
+    return CompanyRiskDistributionResponse(snapshot_at=snap.built_at, items=items)
+
+
+def carbon_by_state() -> CarbonByStateResponse:
+    """Cumulative hectares lost and carbon (t CO2) per state-level region"""
+    snap = get_snapshot()
+    n_regions = len(snap.regions["name"])
+    runs = snap.runs
+    known = runs["project"] >= 0
+    region = snap.projects["region"][runs["project"][known]]
+    in_region = region >= 0
+
+    hectares = np.bincount(region[in_region], weights=runs["hectares"][known][in_region], minlength=n_regions)
+    projects = np.bincount(snap.projects["region"][snap.projects["region"] >= 0], minlength=n_regions)
+    is_state = snap.regions["admin_level"] == "state"
+
+    items = [
+        StateCarbonItem(
+            state=str(snap.regions["name"][i]),
+            country_code=str(snap.regions["country_code"][i]) or None,
+            project_count=int(projects[i]),
+            hectares_lost=round(float(hectares[i]), 4),
+            carbon_tonnes=round(float(hectares[i]) * CARBON_TONNES_PER_HA, 2),
+        )
+        for i in np.flatnonzero(is_state)
+    ]
+    total = sum(item.carbon_tonnes for item in items)
+    return CarbonByStateResponse(snapshot_at=snap.built_at, items=items, total_carbon_tonnes=round(total, 2))
+
+
+class AnalyticsRefresher:
+    """Background loop rebuilding the snapshot every analytics_refresh_minutes"""
+
+    def __init__(self, interval_seconds: Optional[float] = None):
+        self.interval_seconds = interval_seconds
+
+    async def run_forever(self) -> None:
+        interval = self.interval_seconds or settings.analytics_refresh_minutes * 60
+        while True:
+            try:
+                # The export is blocking I/O: keep it off the event loop
+                await asyncio.to_thread(refresh_snapshot)
+            except Exception as e:
+                print(f"Warning: analytics snapshot refresh failed: {e}")
+            await asyncio.sleep(interval)
+
+
+analytics_refresher = AnalyticsRefresher()
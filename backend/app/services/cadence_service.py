@@ -0,0 +1,417 @@
+"""Cadence service - automatic creation of recurring runs
+
+Cadence Scheduler Service Layer
+
+RunCreate.cadence ('weekly' by default) says how often a project should be
+analysed; this service creates those recurring runs so nobody has to call
+POST /projects/{id}/runs by hand.
+
+How it works:
+- A min-heap holds the next due time of every active project (with its
+  active geomarker), so each wake-up only looks at the earliest item
+- The background task sleeps until that item is due (or until a new run
+  reschedules a project) instead of scanning the runs table every tick
+- All runs due at the same moment are created with one batched insert,
+  skipping windows an identical run (same fingerprint) already covers
+- Before inserting, due projects are checked against the schedule view:
+  projects deactivated (or left without an active geomarker) since the
+  heap was built are dropped, and geomarker swaps are followed
+- A project only moves on to its next window once the runs are inserted.
+  A failed batch insert is retried row by row: rows failing permanently
+  (constraint or data errors, e.g. a deleted project) drop their project
+  from the heap until the next rebuild; on any other error the remaining
+  windows stay due, to be retried
+- On startup the heap is rebuilt from the latest run per project
+  (project_run_schedule view, 9_cadence_scheduler.sql), so restarts never
+  lose or double schedules
+- Heap entries are invalidated lazily: rescheduling a project bumps its
+  token and stale entries are skipped when popped
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+from dataclasses import dataclass, replace
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.db.queries import RunQueries
+from app.utils.fingerprint import run_fingerprint
+
+CADENCE_INTERVALS = {
+    "daily": timedelta(days=1),
+    "weekly": timedelta(days=7),
+    "biweekly": timedelta(days=14),
+    "monthly": timedelta(days=30),
+}
+
+ScheduleRow = Dict[str, Any]
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _at_midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+@dataclass
+class ScheduleEntry:
+    project_id: str
+    geomarker_id: str
+    cadence: str
+    method: str
+    cloud_threshold: int
+    parameters: Dict[str, Any]
+    window_start: date
+    monitoring_end_date: Optional[date] = None
+
+    @property
+    def interval(self) -> timedelta:
+        return CADENCE_INTERVALS.get(self.cadence, CADENCE_INTERVALS["weekly"])
+
+    @property
+    def due_at(self) -> datetime:
+        """A window is analysed once it has fully elapsed"""
+        return _at_midnight(self.window_start + self.interval)
+
+    def to_run(self) -> Dict[str, Any]:
+        end_date = self.window_start + self.interval
+        return {
+            "project_id": self.project_id,
+            "geomarker_id": self.geomarker_id,
+            "start_date": self.window_start.isoformat(),
+            "end_date": end_date.isoformat(),
+            "cadence": self.cadence,
+            "method": self.method,
+            "cloud_threshold": self.cloud_threshold,
+            "parameters": self.parameters,
+            "status": "queued",
+            "fingerprint": run_fingerprint(
+                self.geomarker_id, self.window_start, end_date,
+                self.method, self.cloud_threshold, self.parameters,
+            ),
+        }
+
+    def advanced(self) -> "ScheduleEntry":
+        return ScheduleEntry(
+            project_id=self.project_id,
+            geomarker_id=self.geomarker_id,
+            cadence=self.cadence,
+            method=self.method,
+            cloud_threshold=self.cloud_threshold,
+            parameters=self.parameters,
+            window_start=self.window_start + self.interval,
+            monitoring_end_date=self.monitoring_end_date,
+        )
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """Postgres data exceptions (22xxx) and constraint violations (23xxx) fail again on retry"""
+    return str(getattr(error, "code", None) or "")[:2] in ("22", "23")
+
+
+def entry_from_schedule_row(row: ScheduleRow, today: date) -> ScheduleEntry:
+    """Next window for a project, continuing from its latest run"""
+    cadence = row.get("cadence") or settings.cadence_default
+    interval = CADENCE_INTERVALS.get(cadence, CADENCE_INTERVALS["weekly"])
+    # Continue after the latest run; never-analysed projects start at their
+    # monitoring start. Missed windows are not back-filled: at most the most
+    # recent full window is due right away.
+    window_start = (
+        _as_date(row.get("last_end_date"))
+        or _as_date(row.get("monitoring_start_date"))
+        or today - interval
+    )
+    window_start = max(window_start, today - interval)
+
+    return ScheduleEntry(
+        project_id=row["project_id"],
+        geomarker_id=row["geomarker_id"],
+        cadence=cadence,
+        method=row.get("method") or "ndvi",
+        cloud_threshold=row.get("cloud_threshold") if row.get("cloud_threshold") is not None else 30,
+        parameters=row.get("parameters") or {},
+        window_start=window_start,
+        monitoring_end_date=_as_date(row.get("monitoring_end_date")),
+    )
+
+
+class CadenceScheduler:
+    """Timer heap of next-due runs, one live entry per project"""
+
+    def __init__(
+        self,
+        load_rows: Callable[[], List[ScheduleRow]],
+        insert_runs: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+        batch_size: int = 500,
+        max_sleep_seconds: float = 3600,
+        load_active: Optional[Callable[[List[str]], List[ScheduleRow]]] = None,
+    ):
+        self._load_rows = load_rows
+        self._insert_runs = insert_runs
+        # project_ids -> their current schedule rows (None: trust the heap)
+        self._load_active = load_active
+        self.batch_size = batch_size
+        self.max_sleep_seconds = max_sleep_seconds
+        self._lock = threading.RLock()
+        self._heap: list = []
+        # project_id -> (token, entry) of its single live heap entry
+        self._live: Dict[str, tuple] = {}
+        self._counter = itertools.count()
+        self._loaded = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def rebuild(self, now: Optional[datetime] = None) -> int:
+        """Reload every active project from the latest run per project"""
+        today = (now or datetime.now(timezone.utc)).date()
+        rows = self._load_rows()
+        with self._lock:
+            self._heap = []
+            self._live = {}
+            for row in rows:
+                self.schedule(entry_from_schedule_row(row, today))
+            self._loaded = True
+            return len(self._live)
+
+    def schedule(self, entry: ScheduleEntry) -> None:
+        """(Re)schedule a project; any previous entry for it becomes stale"""
+        with self._lock:
+            if entry.monitoring_end_date and entry.window_start >= entry.monitoring_end_date:
+                self._live.pop(entry.project_id, None)
+                return
+            token = next(self._counter)
+            self._live[entry.project_id] = (token, entry)
+            heapq.heappush(self._heap, (entry.due_at, token, entry))
+        self._wake()
+
+    def observe_run(self, run: Dict[str, Any]) -> None:
+        """
+        A run was created elsewhere (e.g. manually): continue the cadence
+        after it. No-op until rebuild() has loaded the schedule, i.e. while
+        the scheduler is not running; rebuild() picks the run up itself.
+        """
+        end_date = _as_date(run.get("end_date"))
+        if not self._loaded or end_date is None or not run.get("geomarker_id"):
+            return
+        with self._lock:
+            current = self._live.get(run["project_id"])
+        if current is not None and current[1].window_start >= end_date:
+            return
+        self.schedule(ScheduleEntry(
+            project_id=run["project_id"],
+            geomarker_id=run["geomarker_id"],
+            cadence=run.get("cadence") or settings.cadence_default,
+            method=run.get("method") or "ndvi",
+            cloud_threshold=run.get("cloud_threshold") if run.get("cloud_threshold") is not None else 30,
+            parameters=run.get("parameters") or {},
+            window_start=end_date,
+            monitoring_end_date=current[1].monitoring_end_date if current else None,
+        ))
+
+    def next_due(self) -> Optional[datetime]:
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> List[tuple]:
+        """
+        Remove up to batch_size (token, entry) items due at `now`. They stay
+        live but out of the heap until finish_due() settles them.
+        """
+        due: List[tuple] = []
+        with self._lock:
+            while len(due) < self.batch_size:
+                self._drop_stale()
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                _, token, entry = heapq.heappop(self._heap)
+                due.append((token, entry))
+        return due
+
+    def finish_due(self, due: List[tuple], created: bool) -> None:
+        """
+        Settle popped items: once their runs exist, move each project one
+        window on; otherwise push the items back unchanged so the windows
+        are retried. Projects rescheduled meanwhile (observe_run, rebuild)
+        keep their new entry.
+        """
+        with self._lock:
+            for token, entry in due:
+                live = self._live.get(entry.project_id)
+                if live is None or live[0] != token:
+                    continue
+                if created:
+                    self.schedule(entry.advanced())
+                else:
+                    heapq.heappush(self._heap, (entry.due_at, token, entry))
+        self._wake()
+
+    def drop(self, due: List[tuple]) -> None:
+        """Remove popped items' projects from the schedule (unless rescheduled meanwhile)"""
+        with self._lock:
+            for token, entry in due:
+                live = self._live.get(entry.project_id)
+                if live is not None and live[0] == token:
+                    del self._live[entry.project_id]
+
+    def refresh_due(self, due: List[tuple]) -> List[tuple]:
+        """
+        Drop popped items of projects that are no longer active; follow
+        geomarker and monitoring end changes of the others
+        """
+        if self._load_active is None or not due:
+            return due
+        rows = {str(row["project_id"]): row for row in self._load_active([entry.project_id for _, entry in due])}
+        kept, gone = [], []
+        with self._lock:
+            for token, entry in due:
+                row = rows.get(entry.project_id)
+                if row is not None:
+                    entry = replace(
+                        entry,
+                        geomarker_id=row.get("geomarker_id") or entry.geomarker_id,
+                        monitoring_end_date=_as_date(row.get("monitoring_end_date")),
+                    )
+                if row is None or (entry.monitoring_end_date and entry.window_start >= entry.monitoring_end_date):
+                    gone.append((token, entry))
+                    continue
+                live = self._live.get(entry.project_id)
+                if live is not None and live[0] == token:
+                    self._live[entry.project_id] = (token, entry)
+                kept.append((token, entry))
+        self.drop(gone)
+        return kept
+
+    def create_due_runs(self, now: Optional[datetime] = None) -> int:
+        """Create every due run, batch_size rows per insert"""
+        now = now or datetime.now(timezone.utc)
+        created = 0
+        while True:
+            due = self.pop_due(now)
+            if not due:
+                return created
+            try:
+                due = self.refresh_due(due)
+            except Exception:
+                self.finish_due(due, created=False)
+                raise
+            if not due:
+                continue
+            try:
+                self._insert_runs([entry.to_run() for _, entry in due])
+            except Exception:
+                created += self._insert_one_by_one(due)
+                continue
+            self.finish_due(due, created=True)
+            created += len(due)
+
+    def _insert_one_by_one(self, due: List[tuple]) -> int:
+        """
+        Fallback after a failed batch: rows failing permanently drop their
+        project; the first other error puts the rest back and is raised
+        """
+        created = 0
+        for i, (token, entry) in enumerate(due):
+            try:
+                self._insert_runs([entry.to_run()])
+            except Exception as e:
+                if not is_permanent_error(e):
+                    self.finish_due(due[i:], created=False)
+                    raise
+                print(f"Warning: cadence scheduler dropped project {entry.project_id}: {e}")
+                self.drop([(token, entry)])
+                continue
+            self.finish_due([(token, entry)], created=True)
+            created += 1
+        return created
+
+    async def run_forever(self) -> None:
+        """Background loop: sleep until the earliest entry is due, then create runs"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self.rebuild)
+        while True:
+            self._wakeup.clear()
+            next_due = self.next_due()
+            if next_due is not None:
+                delay = (next_due - datetime.now(timezone.utc)).total_seconds()
+                if delay <= 0:
+                    try:
+                        await asyncio.to_thread(self.create_due_runs)
+                    except Exception as e:
+                        print(f"Warning: cadence scheduler failed to create runs: {e}")
+                        await asyncio.sleep(min(60, self.max_sleep_seconds))
+                    continue
+            else:
+                delay = self.max_sleep_seconds
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, self.max_sleep_seconds))
+            except asyncio.TimeoutError:
+                pass
+
+    def _drop_stale(self) -> None:
+        while self._heap:
+            _, token, entry = self._heap[0]
+            live = self._live.get(entry.project_id)
+            if live is not None and live[0] == token:
+                return
+            heapq.heappop(self._heap)
+
+    def _wake(self) -> None:
+        # schedule() may run in a request thread; the event belongs to the loop
+        if self._wakeup is None or self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            pass
+
+
+def _insert_new_runs(runs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Batched insert that skips windows an identical run already covers"""
+    existing = RunQueries.get_existing_fingerprints(
+        [r["fingerprint"] for r in runs], ["queued", "processing", "completed"]
+    )
+    fresh = [r for r in runs if r["fingerprint"] not in existing]
+    try:
+        return RunQueries.create_many(fresh)
+    except Exception as e:
+        if getattr(e, "code", None) != "23505":
+            raise
+        # A concurrent identical run slipped in; insert the rest one by one
+        created = []
+        for run in fresh:
+            try:
+                created.append(RunQueries.create(run))
+            except Exception as row_error:
+                if getattr(row_error, "code", None) != "23505":
+                    raise
+        return created
+
+
+def _load_schedule_rows() -> List[ScheduleRow]:
+    rows: List[ScheduleRow] = []
+    page = 1000
+    while True:
+        chunk = RunQueries.get_schedule_page(offset=len(rows), limit=page)
+        rows += chunk
+        if len(chunk) < page:
+            return rows
+
+
+cadence_scheduler = CadenceScheduler(
+    load_rows=_load_schedule_rows,
+    insert_runs=_insert_new_runs,
+    batch_size=settings.cadence_batch_size,
+    load_active=RunQueries.get_schedule_rows,
+)
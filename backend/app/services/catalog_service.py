@@ -0,0 +1,194 @@
+"""Catalog service - which Sentinel-2 acquisitions exist before paying for imagery
+
+Catalog Service Layer
+
+A Process API request for a window with no scene under max_cloud_coverage
+still costs a request and fails with "No imagery returned". The Catalog
+API lists acquisitions and their cloud cover for a bbox and time range
+almost for free, so callers can pick a good date up front.
+
+Key Functions:
+- list_acquisitions(): acquisitions per day for a bbox, cached per tile and day
+- pick_acquisition(): clearest acceptable acquisition closest to a target date
+- find_acquisition(): widen a window around a target date until one qualifies
+
+Caching:
+- Keyed by tile (the requested bbox, rounded) and day; a day with no
+  acquisition is cached as an empty list so it is never searched twice
+- Days within INGESTION_LAG of today are not cached, as late
+  acquisitions may still appear
+- Only uncached days are searched, one request per run of consecutive days
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Protocol, Tuple, runtime_checkable
+
+from app.config import settings
+from app.utils.geo import BBox
+
+# Sentinel-2 scenes can appear in the catalog a day or two after sensing
+INGESTION_LAG = timedelta(days=2)
+
+TileKey = Tuple[float, float, float, float]
+
+
+@runtime_checkable
+class CatalogSource(Protocol):
+    """Anything that searches acquisitions like SentinelService.search_catalog"""
+
+    def search_catalog(self, bbox: BBox, date_from: date, date_to: date) -> List[Dict[str, Any]]:
+        ...
+
+
+@dataclass(frozen=True)
+class Acquisition:
+    day: date
+    cloud_cover: float  # mean eo:cloud_cover of the day's granules, percent
+    scene_ids: Tuple[str, ...]
+
+
+class CatalogCache:
+    """Bounded LRU of (tile, day) -> that day's catalog items"""
+
+    def __init__(self, max_entries: int = 50_000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[TileKey, date], List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, tile: TileKey, day: date) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            items = self._entries.get((tile, day))
+            if items is not None:
+                self._entries.move_to_end((tile, day))
+            return items
+
+    def put(self, tile: TileKey, day: date, items: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._entries[(tile, day)] = items
+            self._entries.move_to_end((tile, day))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = CatalogCache()
+
+
+def _tile_key(bbox: BBox) -> TileKey:
+    # ~10 m: bboxes of the same geomarker (or raster tile) always match
+    return tuple(round(value, 4) for value in bbox)
+
+
+def _days(date_from: date, date_to: date) -> List[date]:
+    return [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+
+
+def _runs(days: List[date]) -> List[Tuple[date, date]]:
+    """Sorted days -> (first, last) of each run of consecutive days"""
+    runs: List[Tuple[date, date]] = []
+    for day in days:
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+def list_acquisitions(
+    source: CatalogSource,
+    bbox: BBox,
+    date_from: date,
+    date_to: date,
+    today: Optional[date] = None,
+    cache: Optional[CatalogCache] = None,
+) -> List[Acquisition]:
+    """
+    Acquisitions over bbox between date_from and date_to (inclusive), by day.
+
+    Cached days are answered locally; each run of consecutive uncached
+    days is one catalog request.
+    """
+    cache = _cache if cache is None else cache
+    today = today or datetime.now(timezone.utc).date()
+    tile = _tile_key(bbox)
+    days = _days(date_from, date_to)
+
+    by_day = {day: cache.get(tile, day) for day in days}
+    missing = [day for day, items in by_day.items() if items is None]
+    for first, last in _runs(missing):
+        found: Dict[date, List[Dict[str, Any]]] = {day: [] for day in _days(first, last)}
+        for item in source.search_catalog(bbox, first, last):
+            day = date.fromisoformat(str(item["datetime"])[:10])
+            if day in found:
+                found[day].append(item)
+        for day, items in found.items():
+            if day + INGESTION_LAG <= today:
+                cache.put(tile, day, items)
+            by_day[day] = items
+
+    acquisitions = []
+    for day in days:
+        items = by_day[day]
+        if not items:
+            continue
+        covers = [float(item["cloud_cover"]) for item in items if item.get("cloud_cover") is not None]
+        acquisitions.append(Acquisition(
+            day=day,
+            cloud_cover=round(sum(covers) / len(covers), 2) if covers else 100.0,
+            scene_ids=tuple(str(item["id"]) for item in items),
+        ))
+    return acquisitions
+
+
+def pick_acquisition(
+    acquisitions: List[Acquisition],
+    target: date,
+    max_cloud_coverage: float,
+) -> Optional[Acquisition]:
+    """Closest acquisition to target under max_cloud_coverage (clearest on ties)"""
+    usable = [a for a in acquisitions if a.cloud_cover <= max_cloud_coverage]
+    if not usable:
+        return None
+    return min(usable, key=lambda a: (abs((a.day - target).days), a.cloud_cover, a.day))
+
+
+def find_acquisition(
+    source: CatalogSource,
+    bbox: BBox,
+    target: date,
+    max_cloud_coverage: float,
+    initial_days: Optional[int] = None,
+    max_days: Optional[int] = None,
+    today: Optional[date] = None,
+    cache: Optional[CatalogCache] = None,
+) -> Optional[Acquisition]:
+    """
+    Best acquisition within ±initial_days of target, doubling the window up
+    to ±max_days when nothing qualifies. Never looks past today.
+
+    Widening only searches the newly added days (the rest is cached).
+    Returns None when no acquisition qualifies at all.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    days = initial_days or settings.catalog_initial_window_days
+    max_days = max_days or settings.catalog_max_window_days
+
+    while True:
+        days = min(days, max_days)
+        acquisitions = list_acquisitions(
+            source, bbox, target - timedelta(days=days), min(target + timedelta(days=days), today),
+            today=today, cache=cache,
+        )
+        best = pick_acquisition(acquisitions, target, max_cloud_coverage)
+        if best is not None or days >= max_days:
+            return best
+        days *= 2
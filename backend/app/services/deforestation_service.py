@@ -0,0 +1,290 @@
+"""Deforestation service - loss polygons of a project's latest completed run
+
+Deforestation Service Layer
+
+Loss polygons are stored as a GeoJSON file per run (loss_polygons_geojson
+report, written by analysis_service.upload_loss_polygons). Files can be
+large, and a completed run's file never changes (re-ingesting a run
+writes a new file under a new URL), so each file is read once:
+- the download is parsed as a stream (utils.geojson_stream), one feature
+  at a time
+- rings are simplified (Douglas-Peucker, deforestation_simplify_deg) and
+  kept as a columnar layer: flat coordinate array with ring / polygon /
+  feature offsets, plus per-feature id, area, confidence and bbox
+- layers are cached per (run, report URL) in memory (LRU) and on disk
+  (.npz under deforestation_cache_dir), so restarts do not download again
+- bbox and minimum-area filters are vectorised over the layer columns;
+  only matching features are turned back into GeoJSON
+
+Key Functions:
+- build_layer(): features -> LossPolygonLayer (pure)
+- load_layer(): cached layer of one run's polygons file
+- get_deforestation(): GET /deforestation
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import httpx
+import numpy as np
+from fastapi import HTTPException
+
+from app.config import settings
+from app.db.queries import ProjectQueries, ReportQueries, RunQueries
+from app.schemas.runs import DeforestationPolygon, DeforestationResponse, DeforestationStats, OutputLinks
+from app.utils.geo import BBox, iter_polygons, polygon_area_ha
+from app.utils.geojson_stream import iter_features
+from app.utils.polygonize import simplify_ring
+
+# report_type -> OutputLinks field
+OUTPUT_REPORTS = {
+    "before_image": "before_rgb",
+    "after_image": "after_rgb",
+    "delta_map": "delta_png",
+    "report_pdf": "report_pdf",
+    "loss_polygons_geojson": "polygons_geojson",
+}
+
+# Bump when the layer layout changes
+LAYER_VERSION = 1
+
+
+@dataclass
+class LossPolygonLayer:
+    """Simplified loss polygons of one run, as columns"""
+    ids: np.ndarray  # str
+    area_ha: np.ndarray  # float64
+    confidence: np.ndarray  # str
+    bbox: np.ndarray  # (features, 4): min_lng, min_lat, max_lng, max_lat
+    coords: np.ndarray  # (vertices, 2), rings closed
+    ring_offsets: np.ndarray  # rings + 1, into coords
+    polygon_offsets: np.ndarray  # polygons + 1, into rings
+    feature_offsets: np.ndarray  # features + 1, into polygons
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **{name: getattr(self, name) for name in self.__dataclass_fields__})
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "LossPolygonLayer":
+        with np.load(path) as archive:
+            return cls(**{name: archive[name] for name in cls.__dataclass_fields__})
+
+    def geometry(self, i: int) -> Dict[str, Any]:
+        polygons = []
+        for p in range(self.feature_offsets[i], self.feature_offsets[i + 1]):
+            polygons.append([
+                self.coords[self.ring_offsets[r]:self.ring_offsets[r + 1]].round(7).tolist()
+                for r in range(self.polygon_offsets[p], self.polygon_offsets[p + 1])
+            ])
+        if len(polygons) == 1:
+            return {"type": "Polygon", "coordinates": polygons[0]}
+        return {"type": "MultiPolygon", "coordinates": polygons}
+
+    def select(self, bbox: Optional[BBox] = None, min_area_ha: Optional[float] = None) -> np.ndarray:
+        """Indexes of features intersecting bbox with at least min_area_ha"""
+        keep = np.ones(len(self), dtype=bool)
+        if min_area_ha:
+            keep &= self.area_ha >= min_area_ha
+        if bbox:
+            min_lng, min_lat, max_lng, max_lat = bbox
+            keep &= (
+                (self.bbox[:, 0] <= max_lng) & (self.bbox[:, 2] >= min_lng)
+                & (self.bbox[:, 1] <= max_lat) & (self.bbox[:, 3] >= min_lat)
+            )
+        return np.flatnonzero(keep)
+
+
+def build_layer(features: Iterable[Dict[str, Any]], tolerance: float = 0.0) -> LossPolygonLayer:
+    """Simplify and pack features (any iterable, consumed once)"""
+    ids, areas, confidences, boxes = [], [], [], []
+    coords: List[np.ndarray] = []
+    ring_sizes: List[int] = []
+    rings_per_polygon: List[int] = []
+    polygons_per_feature: List[int] = []
+
+    for n, feature in enumerate(features):
+        polygons = []
+        for polygon in iter_polygons(feature):
+            rings = []
+            for ring in polygon:
+                points = np.asarray(ring, dtype=np.float64)[:, :2]
+                if len(points) < 4:
+                    continue
+                open_ring = points[:-1] if np.array_equal(points[0], points[-1]) else points
+                kept = open_ring[simplify_ring(open_ring, tolerance)]
+                rings.append(np.vstack([kept, kept[:1]]))
+            if rings:
+                polygons.append(rings)
+        if not polygons:
+            continue
+
+        properties = feature.get("properties") or {}
+        area = properties.get("area_ha")
+        if area is None:
+            area = sum(polygon_area_ha(polygon) for polygon in iter_polygons(feature))
+        outer = np.vstack([rings[0] for rings in polygons])
+        ids.append(str(properties.get("id", feature.get("id", n))))
+        areas.append(float(area))
+        confidences.append(str(properties.get("confidence") or "unknown"))
+        boxes.append([*outer.min(axis=0), *outer.max(axis=0)])
+        for rings in polygons:
+            coords.extend(rings)
+            ring_sizes.extend(len(ring) for ring in rings)
+            rings_per_polygon.append(len(rings))
+        polygons_per_feature.append(len(polygons))
+
+    def offsets(sizes: List[int]) -> np.ndarray:
+        return np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]).astype(np.int64)
+
+    return LossPolygonLayer(
+        ids=np.array(ids, dtype=np.str_),
+        area_ha=np.array(areas, dtype=np.float64),
+        confidence=np.array(confidences, dtype=np.str_),
+        bbox=np.array(boxes, dtype=np.float64).reshape(-1, 4),
+        coords=np.vstack(coords) if coords else np.zeros((0, 2)),
+        ring_offsets=offsets(ring_sizes),
+        polygon_offsets=offsets(rings_per_polygon),
+        feature_offsets=offsets(polygons_per_feature),
+    )
+
+
+def stream_url(url: str) -> Iterator[bytes]:
+    """Body of a storage URL, chunk by chunk"""
+    with httpx.stream(
+        "GET", url, timeout=settings.deforestation_fetch_timeout_seconds, follow_redirects=True,
+    ) as response:
+        response.raise_for_status()
+        yield from response.iter_bytes()
+
+
+class LayerCache:
+    """Bounded LRU of cache key -> layer, backed by .npz files"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, LossPolygonLayer]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One loader per key: concurrent requests for a new run download once
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    def get_or_load(self, key: str, load) -> LossPolygonLayer:
+        with self._lock:
+            layer = self._entries.get(key)
+            if layer is not None:
+                self._entries.move_to_end(key)
+                return layer
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                layer = self._entries.get(key)
+            if layer is None:
+                layer = load()
+            with self._lock:
+                self._entries[key] = layer
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self._key_locks.pop(key, None)
+        return layer
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = LayerCache(settings.deforestation_cache_runs)
+
+
+def layer_path(key: str) -> str:
+    return os.path.join(settings.deforestation_cache_dir, f"{key}.npz")
+
+
+def load_layer(run_id: str, url: str) -> LossPolygonLayer:
+    """Simplified polygons of a run's polygons file: memory, then disk, then download"""
+    digest = hashlib.sha256(f"{url}|{settings.deforestation_simplify_deg}".encode()).hexdigest()[:16]
+    key = f"{run_id}-{digest}-v{LAYER_VERSION}"
+
+    def load() -> LossPolygonLayer:
+        path = layer_path(key)
+        if os.path.exists(path):
+            try:
+                return LossPolygonLayer.load(path)
+            except Exception as e:
+                print(f"Warning: could not read cached loss polygons {path}: {e}")
+        try:
+            layer = build_layer(iter_features(stream_url(url)), settings.deforestation_simplify_deg)
+        except (httpx.HTTPError, ValueError) as e:
+            raise HTTPException(status_code=502, detail=f"Could not load loss polygons of run {run_id}: {e}")
+        try:
+            layer.save(path)
+        except OSError as e:
+            print(f"Warning: could not cache loss polygons of run {run_id}: {e}")
+        return layer
+
+    return _cache.get_or_load(key, load)
+
+
+def parse_bbox(raw: Optional[str]) -> Optional[BBox]:
+    """'min_lng,min_lat,max_lng,max_lat' -> BBox"""
+    if not raw:
+        return None
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(part) for part in raw.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_lng,min_lat,max_lng,max_lat")
+    if min_lng > max_lng or min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="bbox minimums must not exceed maximums")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def get_deforestation(
+    project_id: str,
+    bbox: Optional[BBox] = None,
+    min_area_ha: Optional[float] = None,
+) -> DeforestationResponse:
+    """Loss polygons of the project's latest completed run, filtered"""
+    if not ProjectQueries.get_by_id(project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    run = RunQueries.get_last_completed_for_project(project_id)
+    if not run:
+        raise HTTPException(status_code=404, detail=f"Project {project_id} has no completed run")
+
+    outputs: Dict[str, Optional[str]] = {}
+    for report in ReportQueries.get_by_run_id(run["id"]):
+        field = OUTPUT_REPORTS.get(report.get("report_type"))
+        if field and report.get("public_url"):
+            outputs[field] = report["public_url"]
+
+    polygons: List[DeforestationPolygon] = []
+    if outputs.get("polygons_geojson"):
+        layer = load_layer(str(run["id"]), outputs["polygons_geojson"])
+        for i in layer.select(bbox, min_area_ha):
+            polygons.append(DeforestationPolygon(
+                id=str(layer.ids[i]),
+                area_ha=round(float(layer.area_ha[i]), 4),
+                confidence=str(layer.confidence[i]),
+                geometry=layer.geometry(i),
+            ))
+
+    return DeforestationResponse(
+        project_id=project_id,
+        run_id=str(run["id"]),
+        start_date=str(run["start_date"])[:10],
+        end_date=str(run["end_date"])[:10],
+        stats=DeforestationStats(
+            area_ha=round(sum(p.area_ha for p in polygons), 4),
+            polygon_count=len(polygons),
+        ),
+        outputs=OutputLinks(**outputs),
+        polygons=polygons,
+    )
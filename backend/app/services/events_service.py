@@ -0,0 +1,234 @@
+"""Run event service - in-process pub/sub for run status changes
+
+Run Events Service Layer
+
+Feeds the Server-Sent Events streams (GET /runs/{id}/events and
+GET /projects/{id}/runs/events) so the frontend no longer has to poll
+GET /runs/{id} until a run completes.
+
+How it works:
+- process_gee_result() publishes the updated run as soon as it is stored
+- Subscribers get an asyncio.Queue per stream, keyed by run or project
+- A single fallback poller runs while anyone is subscribed and checks all
+  watched runs/projects with one batched query per tick, so N watchers of
+  the same run cost one backend check instead of N
+- Only real changes (status, hectares_change, finished_at) are delivered
+"""
+
+import asyncio
+import json
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.db.queries import RunQueries
+
+TERMINAL_STATUSES = {"completed", "failed"}
+
+RunRow = Dict[str, Any]
+Fetcher = Callable[[List[str], List[str], str], List[RunRow]]
+
+
+def _fetch_run_statuses(run_ids: List[str], project_ids: List[str], finished_since: str) -> List[RunRow]:
+    """Default poller backend: at most two batched queries per tick"""
+    rows = RunQueries.get_status_by_ids(run_ids)
+    rows += RunQueries.get_status_for_projects(project_ids, finished_since)
+    return rows
+
+
+def _to_event(run: RunRow) -> Dict[str, Any]:
+    finished_at = run.get("finished_at")
+    if isinstance(finished_at, datetime):
+        finished_at = finished_at.isoformat()
+    return {
+        "run_id": run["id"],
+        "project_id": run.get("project_id"),
+        "status": run.get("status"),
+        "hectares_change": run.get("hectares_change"),
+        "finished_at": finished_at,
+    }
+
+
+class RunEventBroker:
+    """Fan-out of run status events to SSE subscribers.
+
+    publish() is thread-safe: sync route handlers run in FastAPI's threadpool,
+    so events are handed to the event loop with call_soon_threadsafe.
+    """
+
+    def __init__(self, poll_interval: float, fetcher: Fetcher = _fetch_run_statuses):
+        self.poll_interval = poll_interval
+        self._fetcher = fetcher
+        self._lock = threading.Lock()
+        self._run_subs: Dict[str, set[asyncio.Queue]] = {}
+        self._project_subs: Dict[str, set[asyncio.Queue]] = {}
+        self._project_since: Dict[str, datetime] = {}
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._poller: Optional[asyncio.Task] = None
+        self.poll_count = 0
+
+    def publish(self, run: RunRow, notify: bool = True) -> None:
+        """Record a run's latest state and notify subscribers if it changed.
+
+        State is only kept for runs somebody is watching (directly or through
+        their project), so the snapshot cache is bounded by open streams.
+        """
+        event = _to_event(run)
+        run_id = event["run_id"]
+        with self._lock:
+            queues = list(self._run_subs.get(run_id, ()))
+            queues += list(self._project_subs.get(event["project_id"], ()))
+            if not queues:
+                return
+            if self._snapshots.get(run_id) == event:
+                return
+            self._snapshots[run_id] = event
+            loop = self._loop
+
+        if not notify or loop is None:
+            return
+        for queue in queues:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # Event loop already closed (shutdown); nothing to deliver to
+                return
+
+    def snapshot(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Last known state of a run, if any subscriber or publisher has seen it"""
+        with self._lock:
+            return self._snapshots.get(run_id)
+
+    @asynccontextmanager
+    async def subscribe(
+        self, run_id: Optional[str] = None, project_id: Optional[str] = None
+    ) -> AsyncIterator[asyncio.Queue]:
+        """Register a queue for one run or for every run of one project"""
+        if (run_id is None) == (project_id is None):
+            raise ValueError("Subscribe to exactly one of run_id or project_id")
+
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            if run_id is not None:
+                self._run_subs.setdefault(run_id, set()).add(queue)
+            else:
+                self._project_subs.setdefault(project_id, set()).add(queue)
+                self._project_since.setdefault(project_id, datetime.utcnow())
+        self._ensure_poller()
+
+        try:
+            yield queue
+        finally:
+            with self._lock:
+                if run_id is not None:
+                    subs = self._run_subs.get(run_id)
+                    if subs is not None:
+                        subs.discard(queue)
+                        if not subs:
+                            del self._run_subs[run_id]
+                            self._forget(run_id)
+                else:
+                    subs = self._project_subs.get(project_id)
+                    if subs is not None:
+                        subs.discard(queue)
+                        if not subs:
+                            del self._project_subs[project_id]
+                            self._project_since.pop(project_id, None)
+                            for watched_run_id, event in list(self._snapshots.items()):
+                                if event["project_id"] == project_id:
+                                    self._forget(watched_run_id)
+
+    def _forget(self, run_id: str) -> None:
+        """Drop a cached snapshot once nothing watches the run (lock held)"""
+        event = self._snapshots.get(run_id)
+        if event is None or run_id in self._run_subs:
+            return
+        if event["project_id"] in self._project_subs:
+            return
+        del self._snapshots[run_id]
+
+    def _ensure_poller(self) -> None:
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+
+    async def poll_once(self) -> bool:
+        """Run one shared poll tick. Returns False when nobody is subscribed."""
+        with self._lock:
+            run_ids = list(self._run_subs)
+            project_ids = list(self._project_subs)
+            since = min(self._project_since.values(), default=datetime.utcnow())
+        if not run_ids and not project_ids:
+            return False
+
+        # Small overlap so a completion right before subscribing is not missed
+        finished_since = (since - timedelta(seconds=self.poll_interval)).isoformat()
+        self.poll_count += 1
+        try:
+            rows = await asyncio.to_thread(self._fetcher, run_ids, project_ids, finished_since)
+        except Exception as e:
+            print(f"Warning: run event poll failed: {e}")
+            return True
+
+        for row in rows:
+            self.publish(row)
+        return True
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if not await self.poll_once():
+                return
+
+
+broker = RunEventBroker(poll_interval=settings.run_events_poll_interval_seconds)
+
+
+def publish_run_update(run: Optional[RunRow]) -> None:
+    """Publish a stored run row to SSE subscribers (no-op for None)"""
+    if run:
+        broker.publish(run)
+
+
+def format_sse(event: Dict[str, Any], event_name: str = "run") -> str:
+    """Serialize one event in text/event-stream framing"""
+    return f"event: {event_name}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+async def stream_run_events(run_id: str, initial: Optional[RunRow] = None) -> AsyncIterator[str]:
+    """SSE generator for a single run; closes once the run is terminal"""
+    keepalive = settings.run_events_keepalive_seconds
+    async with broker.subscribe(run_id=run_id) as queue:
+        if broker.snapshot(run_id) is None and initial is not None:
+            broker.publish(initial, notify=False)
+        current = broker.snapshot(run_id)
+        if current is not None:
+            yield format_sse(current)
+            if current["status"] in TERMINAL_STATUSES:
+                return
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+            if event["status"] in TERMINAL_STATUSES:
+                return
+
+
+async def stream_project_events(project_id: str) -> AsyncIterator[str]:
+    """SSE generator for every run of a project; stays open until the client leaves"""
+    keepalive = settings.run_events_keepalive_seconds
+    async with broker.subscribe(project_id=project_id) as queue:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
@@ -0,0 +1,298 @@
+"""Forecast service - Monte Carlo expansion forecasts for many projects at once
+
+Expansion Forecast Service Layer
+
+Backend port of the frontend's deterministic projection
+(frontend/src/utils/riskModel.js: calculateExpansionFactor,
+generateProjectedPolygon, generateRiskTimeline) as a Monte Carlo model,
+so timelines come with uncertainty instead of a single line:
+- each ensemble member draws its own expansion rate (log-normal around
+  the work type's rate) and a risk score path (random walk from the
+  current score, drifting with the project's loss trend)
+- expansion factor per member and horizon is calculateExpansionFactor:
+  min(max_expansion, (1 + rate * days / 30) * (1 + score / 100 * 0.5))
+- ensembles are (projects x members x horizons) arrays, simulated in
+  chunks of projects sized so one chunk stays within
+  forecast_max_chunk_elements; percentiles are taken over the member axis
+
+Key Functions:
+- simulate_ensembles(): score and expansion ensembles for many projects
+- project_polygon(): generateProjectedPolygon for one expansion factor
+- forecast_projects(): cached envelopes and projected polygons
+- get_project_forecast() / get_forecast_map(): API entry points
+
+Caching:
+- Keyed by project, its risk version (changes when a new run lands, see
+  risk_service.RiskEngine) and the horizons / ensemble size requested
+- Seeds derive from the same key, so a forecast is reproducible on every
+  instance
+"""
+
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+
+from app.config import settings
+from app.schemas.forecast import ForecastMapResponse, ProjectedPolygon, ProjectForecast
+from app.services.risk_service import (
+    VARIABLES,
+    WORK_TYPES,
+    ProjectRisk,
+    related_id,
+    risk_engine,
+    risk_level,
+)
+from app.utils.geo import iter_polygons
+
+PERCENTILES = (5, 25, 50, 75, 95)
+# Envelope percentiles that also get a projected polygon
+POLYGON_PERCENTILES = (50, 95)
+MAX_HORIZONS = 120
+
+TEMPORAL_TREND = VARIABLES.index("temporal_trend")
+
+
+def _seed(*parts: Any) -> int:
+    return zlib.crc32("|".join(str(part) for part in parts).encode())
+
+
+def expansion_factor(
+    expansion_rate: np.ndarray,
+    max_expansion: np.ndarray,
+    days: np.ndarray,
+    score: np.ndarray,
+) -> np.ndarray:
+    """calculateExpansionFactor, broadcast over any shape"""
+    time_expansion = 1 + expansion_rate * days / 30
+    risk_multiplier = 1 + score / 100 * 0.5
+    return np.minimum(max_expansion, time_expansion * risk_multiplier)
+
+
+def simulate_ensembles(
+    scores: np.ndarray,
+    trends: np.ndarray,
+    expansion_rates: np.ndarray,
+    max_expansions: np.ndarray,
+    horizons: np.ndarray,
+    samples: int,
+    seeds: Sequence[int],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Risk score and expansion factor ensembles, both (projects x samples x
+    horizons). Horizons are days from today, ascending; each project has
+    its own seed so results do not depend on which projects share a batch.
+    """
+    n, h = len(scores), len(horizons)
+    steps = np.diff(np.concatenate([[0], horizons])) / 30  # months per horizon step
+
+    # Per-project draws, stacked: (projects, samples, ...)
+    rate_noise = np.empty((n, samples))
+    score_noise = np.empty((n, samples, h))
+    for i, seed in enumerate(seeds):
+        rng = np.random.default_rng(seed)
+        rate_noise[i] = rng.standard_normal(samples)
+        score_noise[i] = rng.standard_normal((samples, h))
+
+    rates = expansion_rates[:, None] * np.exp(settings.forecast_rate_sigma * rate_noise)
+    drift = trends[:, None, None] * settings.forecast_trend_points * steps
+    shocks = settings.forecast_score_sigma * np.sqrt(steps) * score_noise
+    paths = np.clip(scores[:, None, None] + np.cumsum(drift + shocks, axis=2), 1, 100)
+
+    expansion = expansion_factor(
+        rates[:, :, None], max_expansions[:, None, None], horizons[None, None, :], paths,
+    )
+    return paths, expansion
+
+
+def project_polygon(
+    geojson: Dict[str, Any],
+    factor: float,
+    work_type: str,
+    seed: int,
+) -> Optional[Dict[str, Any]]:
+    """
+    generateProjectedPolygon: scale every ring from its centroid by the
+    expansion factor, more along a random main axis for linear works, with
+    +-10% per-vertex irregularity. Returns a MultiPolygon.
+    """
+    rng = np.random.default_rng(seed)
+    rotation = rng.uniform(0, 2 * np.pi)
+    polygons = []
+    for polygon in iter_polygons(geojson):
+        rings = []
+        for ring in polygon:
+            coords = np.asarray(ring, dtype=np.float64)[:, :2]
+            if len(coords) < 4:
+                continue
+            centroid = coords[:-1].mean(axis=0)  # without the closing point
+            offset = coords - centroid
+            local = np.full(len(coords), factor)
+            if work_type == "linear":
+                angle = np.arctan2(offset[:, 1], offset[:, 0])
+                axial = np.abs(np.cos(angle - rotation))
+                local = 1 + (factor - 1) * (0.5 + axial * 0.5)
+            local = local * rng.uniform(0.9, 1.1, len(coords))
+            local[-1] = local[0]  # keep the ring closed
+            rings.append((centroid + offset * local[:, None]).round(7).tolist())
+        if rings:
+            polygons.append(rings)
+    return {"type": "MultiPolygon", "coordinates": polygons} if polygons else None
+
+
+class ForecastCache:
+    """Bounded LRU of forecast key -> ProjectForecast"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, ProjectForecast]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[ProjectForecast]:
+        with self._lock:
+            forecast = self._entries.get(key)
+            if forecast is not None:
+                self._entries.move_to_end(key)
+            return forecast
+
+    def put(self, key: Tuple, forecast: ProjectForecast) -> None:
+        with self._lock:
+            self._entries[key] = forecast
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = ForecastCache(settings.forecast_cache_size)
+
+
+def _horizons(horizon_days: int, step_days: int) -> np.ndarray:
+    if step_days <= 0 or horizon_days <= 0:
+        raise HTTPException(status_code=400, detail="horizon_days and step_days must be positive")
+    horizons = np.arange(step_days, horizon_days + 1, step_days, dtype=np.float64)
+    if len(horizons) > MAX_HORIZONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_HORIZONS} horizons per forecast")
+    return horizons
+
+
+def _build_forecasts(
+    risks: List[ProjectRisk],
+    horizons: np.ndarray,
+    samples: int,
+    polygons: bool,
+) -> List[ProjectForecast]:
+    """Simulate one chunk of projects (vectorized) and summarise each"""
+    work = [WORK_TYPES[r.work_type] for r in risks]
+    seeds = [_seed(r.project["id"], r.version, samples) for r in risks]
+    paths, expansion = simulate_ensembles(
+        scores=np.array([r.score for r in risks]),
+        trends=np.array([r.variables[TEMPORAL_TREND] for r in risks]),
+        expansion_rates=np.array([w["expansion_rate"] for w in work]),
+        max_expansions=np.array([w["max_expansion"] for w in work]),
+        horizons=horizons,
+        samples=samples,
+        seeds=seeds,
+    )
+    # (percentiles, projects, horizons)
+    score_env = np.percentile(paths, PERCENTILES, axis=1)
+    expansion_env = np.percentile(expansion, PERCENTILES, axis=1)
+
+    forecasts = []
+    days = horizons.astype(int).tolist()
+    for i, risk in enumerate(risks):
+        projected = []
+        if polygons and risk.geometry:
+            for percentile in POLYGON_PERCENTILES:
+                p = PERCENTILES.index(percentile)
+                for j, day in enumerate(days):
+                    geometry = project_polygon(risk.geometry, float(expansion_env[p, i, j]), risk.work_type, seeds[i])
+                    if geometry:
+                        projected.append(ProjectedPolygon(day=day, percentile=percentile, geometry=geometry))
+        median = score_env[PERCENTILES.index(50), i]
+        forecasts.append(ProjectForecast(
+            project_id=str(risk.project["id"]),
+            work_type=risk.work_type,
+            risk_score=risk.score,
+            horizons_days=days,
+            samples=samples,
+            expansion={f"p{q}": np.round(expansion_env[k, i], 4).tolist() for k, q in enumerate(PERCENTILES)},
+            risk_score_envelope={f"p{q}": np.round(score_env[k, i], 2).tolist() for k, q in enumerate(PERCENTILES)},
+            risk_levels=[risk_level(value) for value in median],
+            exceed_max_probability=np.round(
+                (expansion[i] >= WORK_TYPES[risk.work_type]["max_expansion"]).mean(axis=0), 4,
+            ).tolist(),
+            projected_polygons=projected,
+        ))
+    return forecasts
+
+
+def forecast_projects(
+    risks: List[ProjectRisk],
+    horizon_days: Optional[int] = None,
+    step_days: Optional[int] = None,
+    samples: Optional[int] = None,
+    polygons: bool = True,
+) -> List[ProjectForecast]:
+    """Forecasts in the order of `risks`; only uncached ones are simulated"""
+    horizons = _horizons(horizon_days or settings.forecast_horizon_days, step_days or settings.forecast_step_days)
+    samples = min(samples or settings.forecast_samples, settings.forecast_max_samples)
+
+    def key(risk: ProjectRisk) -> Tuple:
+        return (str(risk.project["id"]), risk.version, tuple(horizons.tolist()), samples, polygons)
+
+    results: Dict[Tuple, ProjectForecast] = {}
+    missing = []
+    for risk in risks:
+        cached = _cache.get(key(risk))
+        if cached is not None:
+            results[key(risk)] = cached
+        else:
+            missing.append(risk)
+
+    # Peak memory is a handful of float64 arrays of chunk x samples x horizons
+    per_project = samples * len(horizons)
+    chunk = max(1, min(settings.forecast_chunk_projects, settings.forecast_max_chunk_elements // per_project))
+    for offset in range(0, len(missing), chunk):
+        batch = missing[offset:offset + chunk]
+        for risk, forecast in zip(batch, _build_forecasts(batch, horizons, samples, polygons)):
+            _cache.put(key(risk), forecast)
+            results[key(risk)] = forecast
+    return [results[key(risk)] for risk in risks]
+
+
+def get_project_forecast(
+    project_id: str,
+    horizon_days: Optional[int] = None,
+    step_days: Optional[int] = None,
+    samples: Optional[int] = None,
+) -> ProjectForecast:
+    """Forecast of one project for GET /projects/{id}/forecast"""
+    risk = risk_engine.get_score(project_id)
+    if risk is None:
+        raise HTTPException(status_code=404, detail=f"Project {project_id} not found")
+    return forecast_projects([risk], horizon_days, step_days, samples)[0]
+
+
+def get_forecast_map(
+    region_id: Optional[str] = None,
+    company_id: Optional[str] = None,
+    horizon_days: Optional[int] = None,
+    step_days: Optional[int] = None,
+    samples: Optional[int] = None,
+) -> ForecastMapResponse:
+    """Envelopes (without polygons) of every project, for GET /risk-map/forecast"""
+    risks = [
+        r for r in risk_engine.get_scores()
+        if (not region_id or related_id(r.project, "region") == region_id)
+        and (not company_id or related_id(r.project, "company") == company_id)
+    ]
+    return ForecastMapResponse(
+        projects=forecast_projects(risks, horizon_days, step_days, samples, polygons=False),
+    )
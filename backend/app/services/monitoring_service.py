@@ -0,0 +1,329 @@
+"""Monitoring service - incremental runs from acquisition watermarks
+
+Incremental Monitoring Service Layer
+
+A weekly run only has new information in the acquisitions sensed since
+the previous run, yet analyze_run() fetches a full baseline and a full
+current window every time. Here each project/geomarker keeps:
+- a watermark: the last acquisition date already processed
+  (acquisition_watermarks, 12_acquisition_watermarks.sql)
+- a cached composite of every clear observation so far (per-pixel NDVI,
+  RGB and observation day) as a compressed .npz in storage
+
+An incremental run uses the cached composite as its "before" state, looks
+up acquisitions after the watermark in the catalog, folds each one into a
+copy of the composite (cloud-masked, per pixel) and compares the two. Its
+cost grows with the number of new scenes, not with the history length.
+
+Key Functions:
+- merge_scene(): fold a cloud-masked scene (or composite of the new
+  scenes, see analysis_service.composite_scenes) into the cached composite
+- analyze_run_incremental(): incremental analysis, full analysis as fallback
+- save_checkpoint(): store the new composite and move the watermark
+
+The watermark never passes today - INGESTION_LAG (catalog_service): a
+scene Sentinel Hub ingests late is still after the watermark, and folded
+in by a later run.
+
+A run falls back to the full analysis (which then seeds the composite)
+when there is no watermark yet, the geomarker version or resolution
+changed, the cached composite is missing, or the watermark is not within
+analysis_window_days before the run's start.
+"""
+
+import io
+import zipfile
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.db.queries import WatermarkQueries
+from app.services.analysis_service import (
+    RunAnalysis,
+    SceneSource,
+    analyze_run,
+    aoi_raster,
+    as_datetime,
+    composite_scenes,
+    detect_change,
+    fetch_scene_layers,
+    unobserved_fraction,
+    workfile,
+)
+from app.services.catalog_service import INGESTION_LAG, list_acquisitions
+from app.services.storage_service import download_bytes, upload_bytes
+from app.utils.geo import bbox_from_geojson, pixel_area_ha
+from app.utils.raster import allocate, raster_shape, row_blocks
+
+# Composite layers: name -> (extra dims, dtype). observed is the proleptic
+# ordinal of the day each pixel was last seen clear, 0 = never.
+COMPOSITE_LAYERS = {
+    "ndvi": ((), np.float32),
+    "rgb": ((3,), np.uint8),
+    "observed": ((), np.int32),
+}
+
+
+def composite_path(run: Dict[str, Any], geomarker: Dict[str, Any]) -> str:
+    return f"projects/{run['project_id']}/composites/{geomarker['id']}_v{geomarker.get('version') or 1}.npz"
+
+
+def new_composite(shape: tuple, workdir: Optional[str] = None, name: str = "composite") -> Dict[str, np.ndarray]:
+    """Empty composite: NaN NDVI, never observed"""
+    composite = {
+        layer: allocate(shape + extra, dtype, workfile(workdir, f"{name}_{layer}.npy"))
+        for layer, (extra, dtype) in COMPOSITE_LAYERS.items()
+    }
+    for block in row_blocks(shape[0], settings.analysis_block_rows):
+        composite["ndvi"][block] = np.nan
+    return composite
+
+
+def copy_composite(
+    composite: Dict[str, np.ndarray],
+    workdir: Optional[str] = None,
+    name: str = "composite",
+) -> Dict[str, np.ndarray]:
+    shape = composite["ndvi"].shape
+    copy = new_composite(shape, workdir, name)
+    for block in row_blocks(shape[0], settings.analysis_block_rows):
+        for layer in COMPOSITE_LAYERS:
+            copy[layer][block] = composite[layer][block]
+    return copy
+
+
+def merge_scene(
+    composite: Dict[str, np.ndarray],
+    scene: Dict[str, np.ndarray],
+    day: date,
+    block_rows: Optional[int] = None,
+) -> int:
+    """
+    Fold one scene (or composite of scenes) into a composite in place:
+    every pixel it saw clear (finite NDVI) takes its values. The observation
+    day is the scene's own "observed" layer when it has one, else `day`.
+    Returns how many pixels changed.
+    """
+    updated = 0
+    ordinal = day.toordinal()
+    for block in row_blocks(composite["ndvi"].shape[0], block_rows):
+        ndvi = np.asarray(scene["ndvi"][block])
+        clear = np.isfinite(ndvi)
+        observed = scene["observed"][block] if "observed" in scene else ordinal
+        composite["ndvi"][block] = np.where(clear, ndvi, composite["ndvi"][block])
+        composite["rgb"][block] = np.where(clear[..., None], scene["rgb"][block], composite["rgb"][block])
+        composite["observed"][block] = np.where(clear, observed, composite["observed"][block])
+        updated += int(clear.sum())
+    return updated
+
+
+def save_composite(path: str, composite: Dict[str, np.ndarray], workdir: Optional[str] = None) -> str:
+    """
+    Upload a composite as a compressed .npz. np.savez_compressed writes each
+    layer in bounded chunks, so memmapped layers are never loaded whole; with
+    a workdir the archive is built in a file there. Only the compressed
+    archive is read back for the upload.
+    """
+    target = workfile(workdir, "composite_upload.npz")
+    with (open(target, "w+b") if target else io.BytesIO()) as f:
+        np.savez_compressed(f, **{layer: composite[layer] for layer in COMPOSITE_LAYERS})
+        f.seek(0)
+        content = f.read()
+    return upload_bytes(path=path, content=content, content_type="application/octet-stream", upsert=True)
+
+
+def read_layer(member: Any, path: Optional[str] = None, block_rows: Optional[int] = None) -> np.ndarray:
+    """
+    One .npy member of an open .npz, decompressed block_rows rows at a time
+    into an array memory-mapped at `path` (in memory when None)
+    """
+    version = np.lib.format.read_magic(member)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(member)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(member)
+    if fortran_order or not shape:
+        raise ValueError("Composite layers must be C-ordered arrays")
+    layer = allocate(shape, dtype, path)
+    row_bytes = layer[:1].nbytes
+    for block in row_blocks(shape[0], block_rows):
+        size = (block.stop - block.start) * row_bytes
+        data = member.read(size)
+        if len(data) != size:
+            raise ValueError("Truncated composite layer")
+        layer[block] = np.frombuffer(data, dtype=dtype).reshape(layer[block].shape)
+    return layer
+
+
+def load_composite(
+    path: str,
+    workdir: Optional[str] = None,
+    name: str = "previous",
+) -> Optional[Dict[str, np.ndarray]]:
+    """Cached composite, each layer streamed into a workdir memmap (see read_layer)"""
+    try:
+        with zipfile.ZipFile(io.BytesIO(download_bytes(path))) as archive:
+            composite = {}
+            for layer in COMPOSITE_LAYERS:
+                with archive.open(f"{layer}.npy") as member:
+                    composite[layer] = read_layer(
+                        member, workfile(workdir, f"{name}_{layer}.npy"), settings.analysis_block_rows,
+                    )
+            return composite
+    except Exception as e:
+        print(f"Warning: could not load composite {path}: {e}")
+        return None
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def settled_watermark(day: date) -> date:
+    """`day`, capped at the last day Sentinel Hub can no longer add scenes to"""
+    return min(day, _today() - INGESTION_LAG)
+
+
+def usable_watermark(
+    run: Dict[str, Any],
+    geomarker: Dict[str, Any],
+    watermark: Optional[Dict[str, Any]],
+    resolution: int,
+) -> Optional[date]:
+    """The watermark date when the run can continue from the cached composite"""
+    if not watermark:
+        return None
+    if watermark.get("geomarker_version") != (geomarker.get("version") or 1):
+        return None
+    if watermark.get("resolution_m") != resolution:
+        return None
+    last = date.fromisoformat(str(watermark["last_acquisition_date"])[:10])
+    start = as_datetime(run["start_date"]).date()
+    end = as_datetime(run["end_date"]).date()
+    window = timedelta(days=settings.analysis_window_days)
+    if not (start - window <= last < end):
+        return None
+    return last
+
+
+def analyze_run_incremental(
+    run: Dict[str, Any],
+    geomarker: Dict[str, Any],
+    source: SceneSource,
+    workdir: Optional[str] = None,
+) -> RunAnalysis:
+    """
+    Analyze a run from the cached composite plus acquisitions after the
+    watermark (falls back to analyze_run()).
+
+    `source` must also search the catalog (SentinelService does). The
+    returned analysis carries the new composite and watermark date; call
+    save_checkpoint() once the result has been ingested.
+    """
+    params = run.get("parameters") or {}
+    resolution = int(params.get("resolution_m", settings.analysis_resolution_m))
+    threshold = float(params.get("ndvi_threshold", settings.analysis_ndvi_threshold))
+    min_pixels = int(params.get("min_loss_pixels", settings.analysis_min_loss_pixels))
+    end = as_datetime(run["end_date"]).date()
+
+    geojson = geomarker["geojson"]
+    bbox = bbox_from_geojson(geojson)
+    shape = raster_shape(bbox, resolution)
+    if shape[0] * shape[1] < settings.analysis_memmap_min_pixels:
+        workdir = None
+
+    watermark = WatermarkQueries.get(run["project_id"], geomarker["id"])
+    since = usable_watermark(run, geomarker, watermark, resolution)
+    previous = load_composite(watermark["composite_path"], workdir) if since else None
+    if previous is not None and previous["ndvi"].shape != shape:
+        previous = None
+
+    if previous is None:
+        analysis = analyze_run(run, geomarker, source, workdir=workdir)
+        # Seed the composite with the window's least-cloudy mosaic
+        composite = new_composite(shape, workdir)
+        merge_scene(composite, analysis.after, end, settings.analysis_block_rows)
+        analysis.metadata["mode"] = "full"
+        analysis.composite = composite
+        analysis.watermark = settled_watermark(end)
+        return analysis
+
+    acquisitions = [
+        a for a in list_acquisitions(source, bbox, since + timedelta(days=1), end)
+        if a.cloud_cover <= settings.scene_max_cloud_coverage
+    ]
+    after = copy_composite(previous, workdir, "after")
+    days = [a.day for a in acquisitions]
+    if days and settings.composite_method != "none":
+        # Robust composite of the new scenes, then folded in as one
+        new = composite_scenes(source, bbox, shape, days, resolution, workdir, "new")
+        merge_scene(after, new, days[-1], settings.analysis_block_rows)
+    else:
+        for day in days:
+            day_start = datetime.combine(day, datetime.min.time())
+            scene = fetch_scene_layers(
+                source, bbox, shape, day_start, day_start + timedelta(days=1),
+                resolution, settings.scene_max_cloud_coverage, workdir, "scene",
+            )
+            merge_scene(after, scene, day, settings.analysis_block_rows)
+
+    aoi = aoi_raster(geojson, bbox, shape, workfile(workdir, "aoi.npy"))
+    result = detect_change(
+        previous["ndvi"],
+        after["ndvi"],
+        pixel_area_ha(bbox, shape),
+        aoi_mask=aoi,
+        ndvi_threshold=threshold,
+        min_loss_pixels=min_pixels,
+        block_rows=settings.analysis_block_rows,
+        workdir=workdir,
+    )
+    result.stats["cloud_fraction_before"] = unobserved_fraction(previous, aoi, settings.analysis_block_rows)
+    result.stats["cloud_fraction_after"] = unobserved_fraction(after, aoi, settings.analysis_block_rows)
+    result.stats["new_acquisition_count"] = len(acquisitions)
+
+    new_days: List[str] = [a.day.isoformat() for a in acquisitions]
+    metadata = {
+        "satellite": "Sentinel-2 L2A",
+        "engine": "local_numpy",
+        "mode": "incremental",
+        "resolution_m": resolution,
+        "size": [int(shape[1]), int(shape[0])],
+        "bbox": list(bbox),
+        "watermark_before": since.isoformat(),
+        "new_acquisitions": new_days,
+        "processed_at": datetime.now(timezone.utc).isoformat(),
+    }
+    return RunAnalysis(
+        result=result,
+        metadata=metadata,
+        before=previous,
+        after=after,
+        composite=after,
+        watermark=settled_watermark(acquisitions[-1].day if acquisitions else since),
+    )
+
+
+def save_checkpoint(
+    run: Dict[str, Any],
+    geomarker: Dict[str, Any],
+    analysis: RunAnalysis,
+    workdir: Optional[str] = None,
+) -> None:
+    """Store the run's composite and move the watermark to its last acquisition"""
+    if analysis.composite is None or analysis.watermark is None:
+        return
+    path = composite_path(run, geomarker)
+    save_composite(path, analysis.composite, workdir)
+    WatermarkQueries.upsert({
+        "project_id": run["project_id"],
+        "geomarker_id": geomarker["id"],
+        "geomarker_version": geomarker.get("version") or 1,
+        "resolution_m": analysis.metadata["resolution_m"],
+        "last_acquisition_date": analysis.watermark.isoformat(),
+        "composite_path": path,
+        "run_id": run["id"],
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    })
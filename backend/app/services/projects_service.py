@@ -12,13 +12,15 @@ Key Functions:
 Data Assembly:
 - Joins data from multiple tables (projects, companies, regions, geomarkers, runs)
 - Calculates carbon footprint from deforestation data
+- Reads cumulative figures from project rollups (see rollup_service)
 - Formats data for frontend consumption
 """
 
 from typing import List, Optional
 from datetime import datetime
 from fastapi import HTTPException
-from app.db.queries import ProjectQueries, GeomarkerQueries, RunQueries, ReportQueries
+from app.db.queries import ProjectQueries, GeomarkerQueries, RunQueries, ReportQueries, RollupQueries
+from app.services.rollup_service import CARBON_TONNES_PER_HA, get_rollups, to_rollup
 from app.schemas.projects import (
     ProjectsListResponse,
     ProjectListItem,
@@ -66,14 +68,16 @@ def get_projects_list() -> ProjectsListResponse:
     
     Data Assembly:
     1. Fetches all projects with company and region joins
-    2. For each project:
+    2. Fetches every project's rollup in one query
+    3. For each project:
        - Gets active geomarker (highest version, is_active=true)
        - Gets last completed run (latest end_date)
        - Calculates carbon footprint (hectares × 400 tonnes CO2/ha)
     
     Carbon Footprint Calculation:
-    - Based on deforestation area from last run
-    - Formula: hectares_change × 400 tonnes CO2/hectare
+    - Based on total deforestation area across all runs (project rollup),
+      falling back to the last run for projects not rolled up yet
+    - Formula: hectares × 400 tonnes CO2/hectare
     - 400 tonnes/ha is average for tropical forests
     - Returns null if no deforestation data available
     
@@ -86,6 +90,7 @@ def get_projects_list() -> ProjectsListResponse:
     """
     projects_data = ProjectQueries.get_all_with_relations()
     print("Projects data:", projects_data)
+    rollups = get_rollups([proj["id"] for proj in projects_data])
     
     projects_list = []
     for proj in projects_data:
@@ -134,8 +139,11 @@ def get_projects_list() -> ProjectsListResponse:
                     status=last_run_data["status"]
                 )
                 # Calculate carbon footprint: hectares * 400 tonnes CO2/hectare (tropical forest average)
-                if last_run_data.get("hectares_change"):
-                    carbon_footprint = last_run_data["hectares_change"] * 400
+                rollup = rollups.get(str(proj["id"]))
+                if rollup and rollup.run_count:
+                    carbon_footprint = rollup.carbon_footprint_tonnes
+                elif last_run_data.get("hectares_change"):
+                    carbon_footprint = last_run_data["hectares_change"] * CARBON_TONNES_PER_HA
                 
                 # Get latest photograph from reports (prefer after_image, fallback to before_image)
                 reports = ReportQueries.get_by_run_id(last_run_data["id"])
@@ -166,6 +174,7 @@ def get_projects_list() -> ProjectsListResponse:
             active_geomarker=active_geomarker,
             last_run=last_run,
             carbon_footprint_tonnes=carbon_footprint,
+            rollup=rollups.get(str(proj["id"])),
             latest_image_url=latest_image_url,
             center_lat=proj.get("center_lat"),
             center_lng=proj.get("center_lng"),
@@ -241,10 +250,14 @@ def get_project_detail(project_id: str) -> ProjectDetailResponse:
     run_history_data = RunQueries.get_history_for_project(project_id, limit=10)
     run_history = [RunHistoryItem(**r) for r in run_history_data]
     
+    # Cumulative figures (O(1), maintained on ingestion)
+    rollup = to_rollup(RollupQueries.get(project_id))
+    
     return ProjectDetailResponse(
         project=project_data,
         geomarkers=geomarkers,
         latest_run=latest_run,
         reports=reports,
-        run_history=run_history
+        run_history=run_history,
+        rollup=rollup
     )
@@ -1,13 +1,359 @@
+"""Risk service - weighted risk scores for every project at once
+
+Risk Engine Service Layer
+
+Backend port of the frontend risk model (frontend/src/utils/riskModel.js:
+generateRiskVariables, calculateRiskScore, getRiskLevel), fed with real
+data instead of seeded random numbers:
+- run history: loss events, exit frequency, expansion velocity, affected
+  surface and temporal trend from the project's completed runs
+- area and work type: the expected expansion velocity of projects without
+  runs yet (WORK_TYPES rates x boundary area)
+- compliance: projects.compliance when set, else the current risk_label
+
+Variables of all projects form one (projects x variables) matrix; scoring
+is a normalise / clip / dot product over that matrix.
+
+Key Functions:
+- determine_work_type(): punctual / linear / extensive from name and category
+- risk_variables(): variable matrix from per-project inputs and flat run arrays
+- score_variables(): variable matrix -> scores (1-100)
+- RiskEngine.get_scores(): cached scores, recomputing only projects whose
+  rollup changed (i.e. touched by new runs), project data or boundary
+- RiskEngine.get_score(): the same for one project, from its rows only
+- get_risk_map(): GET /risk-map, filterable by region_id and company_id
+"""
+
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.db.queries import GeomarkerQueries, ProjectQueries, RollupQueries, RunQueries
 from app.schemas.projects import RiskMapResponse, RiskProject
+from app.utils.geo import iter_polygons, polygon_area_ha
 
-def get_risk_map(region_id: str | None, company_id: str | None) -> RiskMapResponse:
-    projects = [
-        RiskProject(
-            project_id="demo-project",
-            name="Demo Road Expansion",
-            risk_label="high",
-            risk_score=0.86,
-            geometry=None,
+# Expansion per 30 days and cap, per work type (riskModel.js WORK_TYPES)
+WORK_TYPES = {
+    "punctual": {"name": "Puntual", "expansion_rate": 0.02, "max_expansion": 1.3, "directionality": "radial"},
+    "linear": {"name": "Lineal", "expansion_rate": 0.04, "max_expansion": 1.6, "directionality": "axial"},
+    "extensive": {"name": "Extensiva", "expansion_rate": 0.06, "max_expansion": 2.0, "directionality": "radial"},
+}
+
+COMPLIANCE_RISK = {"compliant": 0.1, "warning": 0.4, "violation": 0.7}
+DEFAULT_COMPLIANCE_RISK = 0.3
+# Projects without a compliance status: the deforestation risk label stands in
+RISK_LABEL_COMPLIANCE = {"low": "compliant", "medium": "warning", "high": "violation"}
+
+# Loss per run (ha) from which a run counts as a red-zone event (risk_label "high")
+RED_ZONE_HA = 10.0
+DEFAULT_AREA_HA = 100.0
+MIN_DURATION_DAYS = 30
+
+# Proximity to sensitive zones is not measured yet: these are the frontend
+# model's expected values with and without a protected_zone geomarker
+PROXIMITY_WITH_PROTECTED_ZONE = 0.7
+PROXIMITY_WITHOUT_PROTECTED_ZONE = 0.3
+
+# Column order of the variable matrix, weights and normalisation caps
+# (calculateRiskScore); temporal_trend is mapped from [-1, 1] to [0, 1]
+VARIABLES = (
+    "yellow_zone_events",
+    "red_zone_events",
+    "exit_frequency",
+    "expansion_velocity",
+    "affected_surface",
+    "project_duration",
+    "historical_risk",
+    "sensitive_zone_proximity",
+    "temporal_trend",
+)
+WEIGHTS = np.array([0.08, 0.15, 0.10, 0.12, 0.10, 0.05, 0.15, 0.12, 0.13])
+CAPS = np.array([20, 10, 5, 1000, 100, 365, 1, 1, 1], dtype=np.float64)
+TEMPORAL_TREND = VARIABLES.index("temporal_trend")
+
+
+def determine_work_type(project: Dict[str, Any]) -> str:
+    """punctual / linear / extensive from the project's category and name"""
+    category = str(project.get("category") or "").lower()
+    name = str(project.get("name") or "").lower()
+    if "transporte" in category or any(word in name for word in ("carretera", "tren", "metro", "highway")):
+        return "linear"
+    if "turismo" in category or "desarrollo" in category or "resort" in name or "industrial" in name:
+        return "extensive"
+    return "punctual"
+
+
+def compliance_risk(project: Dict[str, Any]) -> float:
+    status = project.get("compliance") or RISK_LABEL_COMPLIANCE.get(project.get("risk_label"))
+    return COMPLIANCE_RISK.get(status, DEFAULT_COMPLIANCE_RISK)
+
+
+def risk_level(score: float) -> str:
+    """getRiskLevel: low < 30 <= medium < 60 <= high < 80 <= critical"""
+    if score < 30:
+        return "low"
+    if score < 60:
+        return "medium"
+    if score < 80:
+        return "high"
+    return "critical"
+
+
+def geojson_area_ha(geojson: Optional[Dict[str, Any]]) -> float:
+    if not geojson:
+        return 0.0
+    return sum(polygon_area_ha(polygon) for polygon in iter_polygons(geojson))
+
+
+@dataclass
+class ProjectInputs:
+    """Per-project inputs of risk_variables(), one array entry per project"""
+    area_ha: np.ndarray
+    expansion_rate: np.ndarray  # of the project's work type
+    compliance: np.ndarray
+    duration_days: np.ndarray
+    protected_zone: np.ndarray  # bool
+
+
+def risk_variables(
+    inputs: ProjectInputs,
+    run_project: np.ndarray,
+    run_end_date: np.ndarray,
+    run_hectares: np.ndarray,
+) -> np.ndarray:
+    """
+    (projects x VARIABLES) matrix. Runs are flat arrays: project index,
+    end_date (datetime64[D]) and hectares lost, in any order.
+    """
+    n = len(inputs.area_ha)
+    loss = run_hectares > 0
+    red = run_hectares >= RED_ZONE_HA
+
+    run_count = np.bincount(run_project, minlength=n)
+    loss_runs = np.bincount(run_project, weights=loss, minlength=n)
+    red_events = np.bincount(run_project, weights=red, minlength=n)
+    yellow_events = loss_runs - red_events
+    total_ha = np.bincount(run_project, weights=run_hectares, minlength=n)
+
+    # Span of the run history, for per-week frequencies
+    days = run_end_date.astype(np.int64)
+    first = np.full(n, np.iinfo(np.int64).max)
+    last = np.full(n, np.iinfo(np.int64).min)
+    np.minimum.at(first, run_project, days)
+    np.maximum.at(last, run_project, days)
+    weeks = np.where(run_count > 0, np.maximum((last - first) / 7, 1), 1)
+    exit_frequency = loss_runs / weeks
+
+    # Observed expansion, or the work type's expected growth without runs
+    duration = np.maximum(inputs.duration_days, MIN_DURATION_DAYS)
+    observed_velocity = total_ha * 10_000 / duration
+    expected_velocity = (
+        inputs.expansion_rate * np.where(inputs.area_ha > 0, inputs.area_ha, DEFAULT_AREA_HA) * 10_000 / 30
+        * (0.5 + 0.5 * inputs.compliance)
+    )
+    velocity = np.where(run_count > 0, observed_velocity, expected_velocity)
+
+    loss_share = np.divide(loss_runs, run_count, out=np.zeros(n), where=run_count > 0)
+    historical = 0.5 * inputs.compliance + 0.5 * loss_share
+    proximity = np.where(inputs.protected_zone, PROXIMITY_WITH_PROTECTED_ZONE, PROXIMITY_WITHOUT_PROTECTED_ZONE)
+
+    # Trend: change between the two latest runs relative to the larger one
+    order = np.lexsort((days, run_project))
+    sorted_project = run_project[order]
+    is_last = np.append(sorted_project[1:] != sorted_project[:-1], True) if len(order) else np.zeros(0, bool)
+    last_idx = order[is_last]
+    has_previous = np.zeros(len(order), bool)
+    has_previous[1:] = sorted_project[1:] == sorted_project[:-1]
+    latest = np.zeros(n)
+    previous = np.zeros(n)
+    latest[run_project[last_idx]] = run_hectares[last_idx]
+    prev_idx = order[np.flatnonzero(is_last & has_previous) - 1]
+    previous[run_project[prev_idx]] = run_hectares[prev_idx]
+    scale = np.maximum(np.maximum(latest, previous), 1.0)
+    trend = np.clip((latest - previous) / scale, -1, 1)
+
+    return np.column_stack([
+        yellow_events, red_events, exit_frequency, velocity, total_ha,
+        duration, historical, proximity, trend,
+    ])
+
+
+def score_variables(variables: np.ndarray) -> np.ndarray:
+    """calculateRiskScore for every row: weighted normalised variables, 1-100"""
+    normalized = np.minimum(1.0, variables / CAPS)
+    normalized[:, TEMPORAL_TREND] = (variables[:, TEMPORAL_TREND] + 1) / 2
+    return np.clip(np.rint(normalized @ WEIGHTS * 100), 1, 100)
+
+
+def _duration_days(project: Dict[str, Any], today: date) -> int:
+    start = project.get("monitoring_start_date") or project.get("created_at")
+    if not start:
+        return MIN_DURATION_DAYS
+    return (today - date.fromisoformat(str(start)[:10])).days
+
+
+def _work_zones(geomarkers: List[Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, Any]], set]:
+    """project_id -> latest active non-protected geomarker; projects with a protected zone"""
+    zones: Dict[str, Dict[str, Any]] = {}
+    protected = set()
+    for marker in geomarkers:
+        pid = str(marker["project_id"])
+        if marker.get("geomarker_type") == "protected_zone":
+            protected.add(pid)
+            continue
+        if pid not in zones or (marker.get("version") or 0) > (zones[pid].get("version") or 0):
+            zones[pid] = marker
+    return zones, protected
+
+
+@dataclass
+class ProjectRisk:
+    project: Dict[str, Any]
+    geometry: Optional[Dict[str, Any]]
+    work_type: str
+    variables: np.ndarray
+    score: float
+    version: str = ""  # cache key: changes when a new run lands or inputs change
+
+
+class RiskEngine:
+    """
+    Scores cached per project and keyed by a version string (rollup
+    updated_at, risk label, compliance, boundary version). A call
+    re-reads projects, rollups and boundaries, fetches run history only
+    for projects whose version changed, then rescores the whole matrix.
+    """
+
+    def __init__(self):
+        self._cache: Dict[str, Tuple[str, ProjectRisk]] = {}
+        self._lock = threading.Lock()
+
+    def get_scores(self, today: Optional[date] = None) -> List[ProjectRisk]:
+        return self._scores(ProjectQueries.get_all_with_relations(), today, complete=True)
+
+    def get_score(self, project_id: str, today: Optional[date] = None) -> Optional[ProjectRisk]:
+        """
+        One project's score: its project, rollup, boundary and run rows
+        only. Scores are per row of the matrix, so this equals its entry in
+        get_scores().
+        """
+        project = ProjectQueries.get_by_id(project_id)
+        if not project:
+            return None
+        return self._scores([project], today, complete=False)[0]
+
+    def _scores(
+        self,
+        projects: List[Dict[str, Any]],
+        today: Optional[date],
+        complete: bool,
+    ) -> List[ProjectRisk]:
+        """Scores of `projects`; complete=True means every project, so others are evicted"""
+        today = today or datetime.now(timezone.utc).date()
+        ids = [str(p["id"]) for p in projects]
+        rollups = {str(r["project_id"]): r for r in RollupQueries.get_by_project_ids(ids)}
+        zones, protected = _work_zones(GeomarkerQueries.get_active_for_projects(ids))
+
+        def version(pid: str, project: Dict[str, Any]) -> str:
+            return "|".join(str(part) for part in (
+                (rollups.get(pid) or {}).get("updated_at"),
+                project.get("risk_label"),
+                project.get("compliance"),
+                project.get("updated_at"),
+                (zones.get(pid) or {}).get("id"),
+                pid in protected,
+                today,
+            ))
+
+        versions = {pid: version(pid, p) for pid, p in zip(ids, projects)}
+        with self._lock:
+            stale = [p for pid, p in zip(ids, projects) if self._cache.get(pid, ("",))[0] != versions[pid]]
+        if stale:
+            fresh = self._compute(stale, zones, protected, today)
+            with self._lock:
+                for risk in fresh:
+                    pid = str(risk.project["id"])
+                    risk.version = versions[pid]
+                    self._cache[pid] = (versions[pid], risk)
+                if complete:
+                    for pid in set(self._cache) - set(ids):
+                        del self._cache[pid]
+        with self._lock:
+            return [self._cache[pid][1] for pid in ids]
+
+    def _compute(
+        self,
+        projects: List[Dict[str, Any]],
+        zones: Dict[str, Dict[str, Any]],
+        protected: set,
+        today: date,
+    ) -> List[ProjectRisk]:
+        ids = [str(p["id"]) for p in projects]
+        index = {pid: i for i, pid in enumerate(ids)}
+        runs = RunQueries.get_completed_for_projects(ids)
+        work_types = [determine_work_type(p) for p in projects]
+
+        inputs = ProjectInputs(
+            area_ha=np.array([geojson_area_ha((zones.get(pid) or {}).get("geojson")) for pid in ids]),
+            expansion_rate=np.array([WORK_TYPES[w]["expansion_rate"] for w in work_types]),
+            compliance=np.array([compliance_risk(p) for p in projects]),
+            duration_days=np.array([_duration_days(p, today) for p in projects], dtype=np.float64),
+            protected_zone=np.array([pid in protected for pid in ids], dtype=bool),
+        )
+        variables = risk_variables(
+            inputs,
+            np.array([index[str(r["project_id"])] for r in runs], dtype=np.int64),
+            np.array([str(r["end_date"])[:10] for r in runs], dtype="M8[D]"),
+            np.array([float(r.get("hectares_change") or 0) for r in runs], dtype=np.float64),
         )
-    ]
+        scores = score_variables(variables)
+        return [
+            ProjectRisk(
+                project=project,
+                geometry=(zones.get(pid) or {}).get("geojson"),
+                work_type=work_type,
+                variables=variables[i],
+                score=float(scores[i]),
+            )
+            for i, (pid, project, work_type) in enumerate(zip(ids, projects, work_types))
+        ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+risk_engine = RiskEngine()
+
+
+def related_id(project: Dict[str, Any], relation: str) -> Optional[str]:
+    """Region / company id of a project row, flat or embedded"""
+    value = project.get(f"{relation}_id") or (project.get(relation) or {}).get("id")
+    return str(value) if value else None
+
+
+def get_risk_map(region_id: str | None, company_id: str | None) -> RiskMapResponse:
+    """Risk score of every project (optionally one region / company) for the map"""
+    projects = []
+    for risk in risk_engine.get_scores():
+        project = risk.project
+        if region_id and related_id(project, "region") != region_id:
+            continue
+        if company_id and related_id(project, "company") != company_id:
+            continue
+        projects.append(RiskProject(
+            project_id=str(project["id"]),
+            name=project["name"],
+            risk_label=project.get("risk_label") or "unknown",
+            risk_score=risk.score,
+            risk_level=risk_level(risk.score),
+            work_type=risk.work_type,
+            region_id=related_id(project, "region"),
+            company_id=related_id(project, "company"),
+            variables={name: round(float(value), 4) for name, value in zip(VARIABLES, risk.variables)},
+            geometry=risk.geometry,
+        ))
     return RiskMapResponse(projects=projects)
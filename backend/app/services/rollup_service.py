@@ -0,0 +1,82 @@
+"""Rollup service - cumulative per-project figures without scanning runs
+
+Rollup Service Layer
+
+Totals such as hectares lost across all runs, run counts, the loss trend
+and the worst run live in project_rollups (13_project_rollups.sql), one
+row per project. Ingestion folds each completed run into its project's
+row, so project lists and dashboards read O(1) aggregates.
+
+Key Functions:
+- apply_run_rollups(): fold ingested runs into their rollups (one RPC)
+- get_rollups(): rollups of several projects (one query)
+- backfill_rollups(): recompute every rollup from the runs table
+
+apply_run_rollups takes its row locks in the same order as the ingest
+RPCs; a deadlock that still happens (e.g. against a manual transaction)
+is retried once. A rollup update that fails does not fail the ingestion:
+the run keeps rolled_up_hectares NULL and backfill_rollups.py repairs the
+totals.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from app.db.queries import RollupQueries
+from app.schemas.projects import ProjectRollup
+
+# Postgres deadlock_detected: the losing transaction is rolled back whole
+DEADLOCK_DETECTED = "40P01"
+
+# Average above-ground carbon of tropical forest, t CO2 per hectare
+CARBON_TONNES_PER_HA = 400
+
+
+def to_rollup(row: Optional[Dict[str, Any]]) -> Optional[ProjectRollup]:
+    if not row:
+        return None
+    total = float(row.get("total_hectares_lost") or 0)
+    return ProjectRollup(
+        run_count=row.get("run_count") or 0,
+        total_hectares_lost=round(total, 4),
+        carbon_footprint_tonnes=round(total * CARBON_TONNES_PER_HA, 2),
+        trend=row.get("trend") or "unknown",
+        last_run_id=row.get("last_run_id"),
+        last_hectares_change=row.get("last_hectares_change"),
+        last_end_date=str(row["last_end_date"])[:10] if row.get("last_end_date") else None,
+        previous_hectares_change=row.get("previous_hectares_change"),
+        worst_run_id=row.get("worst_run_id"),
+        worst_hectares_change=row.get("worst_hectares_change"),
+        worst_end_date=str(row["worst_end_date"])[:10] if row.get("worst_end_date") else None,
+        updated_at=row.get("updated_at"),
+    )
+
+
+def apply_run_rollups(run_ids: List[str]) -> List[Dict[str, Any]]:
+    """Fold freshly ingested runs into their projects' rollups"""
+    if not run_ids:
+        return []
+    try:
+        try:
+            return RollupQueries.apply_runs(run_ids)
+        except Exception as e:
+            if getattr(e, "code", None) != DEADLOCK_DETECTED:
+                raise
+            return RollupQueries.apply_runs(run_ids)
+    except Exception as e:
+        print(f"Warning: could not update project rollups for {len(run_ids)} run(s): {e}")
+        return []
+
+
+def get_rollups(project_ids: List[str]) -> Dict[str, ProjectRollup]:
+    """project_id -> rollup, for the projects that have one"""
+    try:
+        rows = RollupQueries.get_by_project_ids(project_ids)
+    except Exception as e:
+        print(f"Warning: could not fetch project rollups: {e}")
+        return {}
+    return {str(row["project_id"]): to_rollup(row) for row in rows}
+
+
+def backfill_rollups() -> int:
+    """Recompute every project's rollup; returns how many projects were written"""
+    return RollupQueries.backfill()
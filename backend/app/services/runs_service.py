@@ -6,41 +6,88 @@ Run Service Layer
 Handles all business logic for deforestation analysis runs.
 
 Key Functions:
-- create_run(): Creates new analysis run (triggered by frontend)
+- create_run(): Creates new analysis run (triggered by frontend, deduplicated)
 - get_run_detail(): Fetches run status and results (polled by frontend)
 - get_run_reports(): Gets generated images/maps (displayed by frontend)
+- get_runs_batch() / get_reports_batch(): Multi-get for dashboards (one query)
+- claim_runs() / heartbeat_run(): Lease queued runs to GEE workers
 - process_gee_result(): Processes results from GEE pipeline
+- process_gee_results_bulk(): Processes a whole batch of GEE results
+- get_run_event_stream(): SSE stream of run status changes (replaces polling)
 
 Workflow:
 1. Frontend creates run -> status='queued'
-2. GEE picks up queued runs
+2. GEE workers claim queued runs -> status='processing' (leased)
 3. GEE processes satellite data
 4. GEE posts results -> status='completed'
-5. Frontend displays results
+5. Frontend displays results (pushed over SSE, see events_service)
 """
 
-import uuid
-from typing import Optional, Dict, Any
-from datetime import datetime
+import hashlib
+import json
+from typing import Optional, Dict, Any, AsyncIterator
 from fastapi import HTTPException
+from app.config import settings
 from app.db.queries import RunQueries, ReportQueries, ProjectQueries, GeomarkerQueries
+from app.utils.fingerprint import run_fingerprint
+from app.services.scheduler_service import select_runs_to_claim
+from app.services.cadence_service import cadence_scheduler
+from app.services.timeseries_service import record_run
+from app.services.rollup_service import apply_run_rollups
+from app.services.alerts_service import raise_alerts
+from app.services.webhook_service import alert_raised_event, emit_events, run_completed_event
+from app.services.events_service import (
+    broker,
+    publish_run_update,
+    stream_run_events,
+    stream_project_events,
+)
 from app.schemas.runs import (
     RunCreate,
     RunCreateResponse,
     RunDetail,
     ReportBase,
     ReportsResponse,
+    RunsBatchResponse,
+    ReportsBatchResponse,
     GEEResultInput,
     GEEResultResponse,
-    DeforestationResponse,
-    DeforestationStats,
-    OutputLinks,
-    DeforestationPolygon,
+    GEEBulkResultItem,
+    GEEBulkResultResponse,
+    RunClaimResponse,
+    RunHeartbeatResponse,
 )
 
 
+IN_FLIGHT_STATUSES = ["queued", "processing"]
+REUSABLE_STATUSES = IN_FLIGHT_STATUSES + ["completed"]
+
+
+def find_equivalent_run(fingerprint: str, include_completed: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Existing run with the same parameter fingerprint, if any.
+    
+    A completed run is preferred (its stats and reports are reused as-is),
+    then the newest in-flight one.
+    """
+    statuses = REUSABLE_STATUSES if include_completed else IN_FLIGHT_STATUSES
+    matches = RunQueries.find_by_fingerprint(fingerprint, statuses)
+    for run in matches:
+        if run["status"] == "completed":
+            return run
+    return matches[0] if matches else None
+
+
 def create_run(project_id: str, run_data: RunCreate) -> RunCreateResponse:
-    """Create a new run for a project"""
+    """
+    Create a new run for a project.
+    
+    Deduplication: runs are fingerprinted on geomarker (version), date range,
+    method, cloud_threshold and parameters. If an identical run is queued or
+    processing it is returned instead of queueing GEE work twice; if one has
+    completed, its results are reused (deduplicated=True). force=True skips
+    the completed-result reuse, but never queues a second in-flight copy.
+    """
     # Validate project exists
     project = ProjectQueries.get_by_id(project_id)
     if not project:
@@ -54,6 +101,22 @@ def create_run(project_id: str, run_data: RunCreate) -> RunCreateResponse:
             detail=f"Geomarker {run_data.geomarker_id} does not belong to project {project_id}"
         )
     
+    fingerprint = run_fingerprint(
+        geomarker_id=run_data.geomarker_id,
+        start_date=run_data.start_date,
+        end_date=run_data.end_date,
+        method=run_data.method,
+        cloud_threshold=run_data.cloud_threshold,
+        parameters=run_data.parameters,
+    )
+    existing = find_equivalent_run(fingerprint, include_completed=not run_data.force)
+    if existing:
+        return RunCreateResponse(
+            run_id=existing["id"],
+            status=existing["status"],
+            deduplicated=True
+        )
+    
     # Create run with status 'queued'
     run_dict = {
         "project_id": project_id,
@@ -65,9 +128,26 @@ def create_run(project_id: str, run_data: RunCreate) -> RunCreateResponse:
         "cloud_threshold": run_data.cloud_threshold,
         "parameters": run_data.parameters or {},
         "status": "queued",
+        "fingerprint": fingerprint,
     }
     
-    created_run = RunQueries.create(run_dict)
+    try:
+        created_run = RunQueries.create(run_dict)
+    except Exception as e:
+        # Lost a race against an identical request (uq_runs_fingerprint_in_flight)
+        if getattr(e, "code", None) != "23505":
+            raise
+        existing = find_equivalent_run(fingerprint, include_completed=False)
+        if not existing:
+            raise
+        return RunCreateResponse(
+            run_id=existing["id"],
+            status=existing["status"],
+            deduplicated=True
+        )
+    
+    # Recurring runs continue from this one (no-op unless the scheduler runs)
+    cadence_scheduler.observe_run(created_run)
     
     return RunCreateResponse(
         run_id=created_run["id"],
@@ -96,54 +176,170 @@ def get_run_reports(run_id: str) -> ReportsResponse:
     return ReportsResponse(run_id=run_id, reports=reports)
 
 
-def process_gee_result(gee_data: GEEResultInput) -> GEEResultResponse:
+MAX_BATCH_IDS = 100
+
+
+def parse_id_list(raw: str, param: str) -> list[str]:
+    """Split a comma-separated ID query param, dropping blanks and duplicates"""
+    ids = list(dict.fromkeys(i.strip() for i in raw.split(",") if i.strip()))
+    if not ids:
+        raise HTTPException(status_code=400, detail=f"{param} must contain at least one ID")
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{param} accepts at most {MAX_BATCH_IDS} IDs per request"
+        )
+    return ids
+
+
+def get_runs_batch(run_ids: list[str]) -> RunsBatchResponse:
+    """Get several runs with a single query, keyed by run_id"""
+    rows = RunQueries.get_by_ids(run_ids)
+    runs = {r["id"]: RunDetail(**r) for r in rows}
+    missing = [run_id for run_id in run_ids if run_id not in runs]
+    
+    return RunsBatchResponse(runs=runs, missing=missing)
+
+
+def get_reports_batch(run_ids: list[str]) -> ReportsBatchResponse:
     """
-    Process results submitted by GEE pipeline.
+    Get reports for several runs with a single query, keyed by run_id.
     
-    This is called by the GEE pipeline after satellite analysis completes.
+    Unlike get_run_reports() there is no per-run existence check: unknown
+    or report-less runs simply map to an empty list.
+    """
+    reports: dict[str, list[ReportBase]] = {run_id: [] for run_id in run_ids}
+    for r in ReportQueries.get_by_run_ids(run_ids):
+        reports.setdefault(r["run_id"], []).append(ReportBase(**r))
     
-    Actions performed:
-    1. Validate run exists
-    2. Extract affected area from stats
-    3. Calculate risk label based on deforestation severity:
-       - >= 10 hectares: HIGH risk
-       - >= 3 hectares: MEDIUM risk
-       - > 0 hectares: LOW risk
-       - 0 hectares: UNKNOWN
-    4. Update run with:
-       - status='completed'
-       - stats (all analysis metrics)
-       - hectares_change (total affected area)
-       - finished_at (completion timestamp)
-    5. Update project risk_label
-    6. Create report entries for:
-       - before_image
-       - after_image
-       - delta_map
-       - loss_polygons_geojson
+    return ReportsBatchResponse(reports=reports)
+
+
+def get_run_event_stream(run_id: str) -> AsyncIterator[str]:
+    """
+    Open an SSE stream of status changes for one run.
     
-    Args:
-        gee_data: Results from GEE pipeline with stats, URLs, metadata
+    The first event is the current state, served from the broker cache when
+    another client is already watching the run (no extra DB read). The stream
+    ends once the run is completed or failed.
+    """
+    initial = None
+    if broker.snapshot(run_id) is None:
+        initial = RunQueries.get_by_id(run_id)
+        if not initial:
+            raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
     
-    Returns:
-        Success response with run_id and status
+    return stream_run_events(run_id, initial)
+
+
+def get_project_run_event_stream(project_id: str) -> AsyncIterator[str]:
+    """Open an SSE stream of status changes for every run of a project"""
+    project = ProjectQueries.get_by_id(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail=f"Project {project_id} not found")
+    
+    return stream_project_events(project_id)
+
+
+MAX_CLAIM_LIMIT = 100
+
+
+def claim_runs(worker: str, limit: int) -> RunClaimResponse:
     """
-    run = RunQueries.get_by_id(gee_data.run_id)
-    if not run:
-        raise HTTPException(status_code=404, detail=f"Run {gee_data.run_id} not found")
+    Lease up to `limit` queued runs to a GEE worker.
     
-    # Extract affected area for risk calculation
-    affected_area_ha = gee_data.stats.get("affected_area_ha", 0)
+    With the scheduler enabled (default), scheduler_service picks the runs by
+    risk/age priority under the concurrency cap and per-company fair share,
+    and the claim_run_ids RPC (8_run_scheduler.sql) leases exactly those.
+    Otherwise the claim_runs RPC (7_run_leases.sql) leases the oldest ones.
+    
+    Both RPCs re-queue expired leases first and use FOR UPDATE SKIP LOCKED,
+    so concurrent workers never receive the same run (a run taken by another
+    worker in the meantime is simply skipped). Workers must call
+    heartbeat_run() before the lease expires.
+    """
+    if not worker.strip():
+        raise HTTPException(status_code=400, detail="worker must not be empty")
+    if limit < 1 or limit > MAX_CLAIM_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"limit must be between 1 and {MAX_CLAIM_LIMIT}"
+        )
     
-    # Determine risk label based on deforestation severity
+    if settings.run_scheduler_enabled:
+        picked = select_runs_to_claim(limit)
+        claimed = RunQueries.claim_ids(
+            picked,
+            worker=worker,
+            lease_seconds=settings.run_lease_seconds,
+            max_attempts=settings.run_max_attempts,
+        )
+        # Hand runs to the worker in scheduler priority order
+        rank = {run_id: i for i, run_id in enumerate(picked)}
+        claimed.sort(key=lambda r: rank.get(r["id"], len(rank)))
+    else:
+        claimed = RunQueries.claim(
+            worker=worker,
+            limit=limit,
+            lease_seconds=settings.run_lease_seconds,
+            max_attempts=settings.run_max_attempts,
+        )
+    for run in claimed:
+        publish_run_update(run)
+    
+    return RunClaimResponse(
+        worker=worker,
+        lease_seconds=settings.run_lease_seconds,
+        runs=[RunDetail(**r) for r in claimed],
+    )
+
+
+def heartbeat_run(run_id: str, worker: str) -> RunHeartbeatResponse:
+    """Extend a worker's lease on a processing run"""
+    run = RunQueries.heartbeat(run_id, worker, settings.run_lease_seconds)
+    if not run:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Worker {worker} does not hold a lease on run {run_id}"
+        )
+    
+    return RunHeartbeatResponse(
+        run_id=run["id"],
+        worker=worker,
+        lease_expires_at=run["lease_expires_at"],
+    )
+
+
+def risk_label_for_area(affected_area_ha: float) -> str:
+    """Risk label from deforestation severity (hectares affected)"""
     if affected_area_ha >= 10:
-        risk_label = "high"
+        return "high"
     elif affected_area_ha >= 3:
-        risk_label = "medium"
+        return "medium"
     elif affected_area_ha > 0:
+        return "low"
+    return "unknown"
+
+
+def gee_result_fingerprint(gee_data: GEEResultInput) -> str:
+    """Deterministic idempotency key for a GEE payload (used when none is sent)"""
+    canonical = json.dumps(gee_data.model_dump(exclude={"idempotency_key"}), sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def build_gee_ingestion(gee_data: GEEResultInput) -> Dict[str, Any]:
+    """
+    Turn a GEE payload into the parameters of the ingest_gee_result RPC.
+    
+    Pure function (no DB access) so single and bulk ingestion share it.
+    """
+    # Extract affected area for risk calculation
+    affected_area_ha = gee_data.stats.get("affected_area_ha", 0)
+    risk_label = risk_label_for_area(affected_area_ha)
+    if risk_label == "unknown" and gee_data.stats.get("method") == "statistics":
+        # Statistics-only run: the pre-check saw enough clear pixels and no
+        # loss, which is a low risk rather than an unknown one
         risk_label = "low"
-    else:
-        risk_label = "unknown"
     
     # Merge output URLs into stats.images for easier frontend access
     stats_with_images = dict(gee_data.stats or {})
@@ -167,25 +363,9 @@ def process_gee_result(gee_data: GEEResultInput) -> GEEResultResponse:
 
     if output_images:
         stats_with_images["images"] = {**existing_images, **output_images}
-
-    # Update run with completed status and results
-    run_update = {
-        "status": "completed",
-        "stats": stats_with_images,
-        "hectares_change": affected_area_ha,
-        "finished_at": datetime.utcnow().isoformat(),
-    }
-    RunQueries.update(gee_data.run_id, run_update)
-    
-    # Update project risk label and newest image based on latest analysis
-    project_update = {"risk_label": risk_label}
     
     # Set project's image_url to the newest image (after_rgb) if available
     newest_image = output_images.get("after_rgb") or output_images.get("before_rgb")
-    if newest_image:
-        project_update["image_url"] = newest_image
-    
-    ProjectQueries.update(gee_data.project_id, project_update)
     
     # Create report entries for frontend to display
     reports_to_create = []
@@ -201,58 +381,223 @@ def process_gee_result(gee_data: GEEResultInput) -> GEEResultResponse:
     }
     
     for key, report_type in output_mapping.items():
-        if key in gee_data.outputs and gee_data.outputs[key]:
+        if key in outputs and outputs[key]:
             reports_to_create.append({
-                "run_id": gee_data.run_id,
                 "report_type": report_type,
-                "public_url": gee_data.outputs[key],
+                "public_url": outputs[key],
                 "metadata": gee_data.metadata,  # Satellite info, processing date
             })
     
     # Add loss polygons GeoJSON
     if gee_data.loss_polygons_url:
         reports_to_create.append({
-            "run_id": gee_data.run_id,
             "report_type": "loss_polygons_geojson",
             "public_url": gee_data.loss_polygons_url,
             "metadata": gee_data.metadata,
         })
     
-    # Batch create all reports
-    if reports_to_create:
-        ReportQueries.create_many(reports_to_create)
+    return {
+        "p_run_id": gee_data.run_id,
+        "p_project_id": gee_data.project_id,
+        "p_idempotency_key": gee_data.idempotency_key or gee_result_fingerprint(gee_data),
+        "p_stats": stats_with_images,
+        "p_hectares_change": affected_area_ha,
+        "p_risk_label": risk_label,
+        "p_image_url": newest_image,
+        "p_reports": reports_to_create,
+    }
+
+
+def process_gee_result(gee_data: GEEResultInput) -> GEEResultResponse:
+    """
+    Process results submitted by GEE pipeline.
+    
+    This is called by the GEE pipeline after satellite analysis completes.
+    
+    Actions performed (steps 4-6 run atomically in ONE round-trip through
+    the ingest_gee_result Postgres function, see 5_ingest_gee_result.sql):
+    1. Extract affected area from stats
+    2. Calculate risk label based on deforestation severity:
+       - >= 10 hectares: HIGH risk
+       - >= 3 hectares: MEDIUM risk
+       - > 0 hectares: LOW risk
+       - 0 hectares: UNKNOWN (LOW for statistics-only runs, see
+         analysis_service.precheck_run)
+    3. Validate run exists (inside the RPC, row locked)
+    4. Update run with:
+       - status='completed'
+       - stats (all analysis metrics)
+       - hectares_change (total affected area)
+       - finished_at (completion timestamp)
+    5. Update project risk_label
+    6. Replace report entries for:
+       - before_image
+       - after_image
+       - delta_map
+       - loss_polygons_geojson
+    7. Publish the completed run to SSE subscribers
+    8. Append the run to the project's NDVI time series (timeseries_service)
+    9. Fold the run into the project's rollup (rollup_service)
+    10. Raise alerts from the run and the updated rollup (alerts_service)
+    11. Queue run.completed / alert.raised webhook events (webhook_service;
+        delivered in the background, never on this request)
+    
+    Idempotency:
+    - The key is gee_data.idempotency_key (or the Idempotency-Key header),
+      falling back to a hash of the payload
+    - A retry with the same key is a no-op and reports duplicate=True
+    - A new key for an already completed run replaces its results
+      (reports are replaced, never appended)
+    
+    Args:
+        gee_data: Results from GEE pipeline with stats, URLs, metadata
+    
+    Returns:
+        Success response with run_id and status
+    """
+    params = build_gee_ingestion(gee_data)
+    result = RunQueries.ingest_gee_result(params)
+    
+    outcome = (result or {}).get("outcome")
+    if outcome == "not_found" or not result:
+        raise HTTPException(status_code=404, detail=f"Run {gee_data.run_id} not found")
+    
+    duplicate = outcome == "duplicate"
+    if not duplicate:
+        # Push the completion to SSE subscribers once reports are in place
+        publish_run_update(result.get("run"))
+        record_completed_run(result.get("run"))
+        rollups = apply_run_rollups([gee_data.run_id])
+        alerts = raise_alerts([result.get("run")], rollups)
+        emit_ingestion_events([(result.get("run"), params["p_risk_label"])], alerts)
+    
+    risk_label = params["p_risk_label"]
+    message = f"Run completed successfully. Risk level: {risk_label}"
+    if duplicate:
+        message = "Result already ingested (idempotent retry); no changes made"
     
     return GEEResultResponse(
         success=True,
         run_id=gee_data.run_id,
         status="completed",
-        message=f"Run completed successfully. Risk level: {risk_label}"
+        message=message,
+        duplicate=duplicate,
     )
 
 
-# Keep mock function for backward compatibility
-def get_deforestation_result(project_id: str, latest: bool = True) -> DeforestationResponse:
-    run_id = str(uuid.uuid4())
-    polygons = [
-        DeforestationPolygon(
-            id=str(uuid.uuid4()),
-            area_ha=2.3,
-            confidence="high",
-            geometry={"type": "Polygon", "coordinates": [[[0,0],[0,1],[1,1],[0,0]]]},
+MAX_BULK_ITEMS = 2000
+BULK_CHUNK_SIZE = 250
+
+
+def process_gee_results_bulk(items: list[GEEResultInput]) -> GEEBulkResultResponse:
+    """
+    Process a batch of GEE results with set-based writes.
+    
+    Each chunk of BULK_CHUNK_SIZE items is a single ingest_gee_results RPC
+    (6_ingest_gee_results_bulk.sql) that updates runs, project risk labels
+    and reports with one statement per table, so hundreds of runs land in
+    a handful of queries. Per-item idempotency works as in process_gee_result.
+    
+    Items repeating a run_id already seen in the batch are rejected; unknown
+    runs are reported as not_found without failing the rest of the batch.
+    """
+    if len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_ITEMS} results per request"
         )
-    ]
-    return DeforestationResponse(
-        project_id=project_id,
-        run_id=run_id,
-        start_date="2026-01-01",
-        end_date="2026-01-28",
-        stats=DeforestationStats(area_ha=2.3, polygon_count=len(polygons)),
-        outputs=OutputLinks(
-            before_rgb=None,
-            after_rgb=None,
-            delta_png=None,
-            report_pdf=None,
-            polygons_geojson=None,
-        ),
-        polygons=polygons,
+    
+    results: dict[int, GEEBulkResultItem] = {}
+    pending: list[tuple[int, Dict[str, Any]]] = []
+    seen_run_ids: set[str] = set()
+    
+    for index, gee_data in enumerate(items):
+        if gee_data.run_id in seen_run_ids:
+            results[index] = GEEBulkResultItem(
+                run_id=gee_data.run_id,
+                status="rejected",
+                message="run_id appears more than once in this batch"
+            )
+            continue
+        seen_run_ids.add(gee_data.run_id)
+        
+        params = build_gee_ingestion(gee_data)
+        item = {key.removeprefix("p_"): value for key, value in params.items()}
+        item["end_date"] = gee_data.end_date.isoformat()
+        pending.append((index, item))
+    
+    for offset in range(0, len(pending), BULK_CHUNK_SIZE):
+        chunk = pending[offset:offset + BULK_CHUNK_SIZE]
+        rows = RunQueries.ingest_gee_results([item for _, item in chunk])
+        outcomes = {str(row["run_id"]): row for row in rows}
+        ingested_ids = []
+        ingested_runs = []
+        ingested_labels = []
+        
+        for index, item in chunk:
+            row = outcomes.get(item["run_id"], {"outcome": "not_found"})
+            outcome = row.get("outcome")
+            if outcome == "not_found":
+                results[index] = GEEBulkResultItem(
+                    run_id=item["run_id"],
+                    status="not_found",
+                    message=f"Run {item['run_id']} not found"
+                )
+            elif outcome == "duplicate":
+                results[index] = GEEBulkResultItem(
+                    run_id=item["run_id"],
+                    status="completed",
+                    duplicate=True,
+                    message="Result already ingested (idempotent retry); no changes made"
+                )
+            else:
+                publish_run_update(row.get("run"))
+                record_completed_run(row.get("run"))
+                ingested_ids.append(item["run_id"])
+                ingested_runs.append(row.get("run"))
+                ingested_labels.append(item["risk_label"])
+                results[index] = GEEBulkResultItem(
+                    run_id=item["run_id"],
+                    status="completed",
+                    message=f"Run completed successfully. Risk level: {item['risk_label']}"
+                )
+        # One rollup update, alert evaluation and webhook enqueue per chunk
+        rollups = apply_run_rollups(ingested_ids)
+        alerts = raise_alerts(ingested_runs, rollups)
+        emit_ingestion_events(list(zip(ingested_runs, ingested_labels)), alerts)
+    
+    ordered = [results[i] for i in range(len(items))]
+    duplicates = sum(1 for r in ordered if r.duplicate)
+    ingested = sum(1 for r in ordered if r.status == "completed") - duplicates
+    
+    return GEEBulkResultResponse(
+        results=ordered,
+        ingested=ingested,
+        duplicates=duplicates,
+        failed=len(ordered) - ingested - duplicates,
     )
+
+
+def record_completed_run(run: Optional[Dict[str, Any]]) -> None:
+    """Append a freshly ingested run to the project's NDVI time series"""
+    try:
+        record_run(run)
+    except Exception as e:
+        # The store is derived data: a missed point is caught up on read
+        print(f"Warning: could not record run in time series: {e}")
+
+
+def emit_ingestion_events(
+    runs: list[tuple[Optional[Dict[str, Any]], str]],
+    alerts: list[Dict[str, Any]],
+) -> None:
+    """Queue run.completed for each (run, risk_label) and alert.raised for each alert"""
+    if not settings.webhooks_enabled:
+        return
+    try:
+        events = [run_completed_event(run, label) for run, label in runs if run]
+        events += [alert_raised_event(alert) for alert in alerts]
+    except Exception as e:
+        print(f"Warning: could not build webhook events: {e}")
+        return
+    emit_events(events)
@@ -0,0 +1,154 @@
+"""Run scheduler - priority and fair-share ordering of queued runs
+
+Scheduler Service Layer
+
+Decides WHICH queued runs a GEE worker gets from POST /runs/claim.
+
+Ordering (priority heap):
+- Project risk_label weight (high > medium > low/unknown)
+- Plus run age, so old work is never starved indefinitely
+  (priority grows by aging_per_hour for every hour in the queue)
+
+Limits:
+- Concurrency cap: total runs in 'processing' never exceed max_concurrency
+- Fair share: one company may hold at most company_share of the cap while
+  other companies have queued work; spare capacity is lent out again when
+  nobody else is waiting (work conserving)
+
+A company queueing 500 backfill runs therefore cannot starve the weekly
+monitoring of high-risk projects: those are popped first and always find a
+free share.
+"""
+
+import heapq
+import math
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.config import settings
+from app.db.queries import RunQueries
+
+RISK_WEIGHTS = {
+    "high": 4.0,
+    "medium": 2.0,
+    "low": 1.0,
+    "unknown": 1.0,
+}
+
+
+@dataclass(frozen=True)
+class QueuedRun:
+    run_id: str
+    project_id: str
+    company_id: Optional[str]
+    risk_label: str
+    created_at: datetime
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "QueuedRun":
+        project = row.get("project") or {}
+        created_at = row["created_at"]
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        return cls(
+            run_id=row["id"],
+            project_id=row["project_id"],
+            company_id=project.get("company_id"),
+            risk_label=project.get("risk_label") or "unknown",
+            created_at=created_at,
+        )
+
+
+@dataclass
+class RunScheduler:
+    max_concurrency: int
+    company_share: float
+    aging_per_hour: float
+    work_conserving: bool = True
+
+    def priority(self, run: QueuedRun, now: datetime) -> float:
+        """Higher is more urgent"""
+        age_hours = max(0.0, (now - run.created_at).total_seconds() / 3600)
+        return RISK_WEIGHTS.get(run.risk_label, 1.0) + self.aging_per_hour * age_hours
+
+    def company_quota(self) -> int:
+        return max(1, math.floor(self.max_concurrency * self.company_share))
+
+    def plan(
+        self,
+        candidates: Iterable[QueuedRun],
+        in_flight_by_company: Dict[Optional[str], int],
+        limit: int,
+        now: Optional[datetime] = None,
+    ) -> List[str]:
+        """Pick up to `limit` run IDs to claim, most urgent first"""
+        now = now or datetime.now(timezone.utc)
+        running = Counter(in_flight_by_company)
+        slots = min(limit, self.max_concurrency - sum(running.values()))
+        if slots <= 0:
+            return []
+
+        heap = []
+        seen = set()
+        for run in candidates:
+            if run.run_id in seen:
+                continue
+            seen.add(run.run_id)
+            # created_at breaks ties FIFO; run_id keeps tuples comparable
+            heapq.heappush(heap, (-self.priority(run, now), run.created_at, run.run_id, run))
+
+        quota = self.company_quota()
+        picked: List[str] = []
+        deferred: List[QueuedRun] = []
+        while heap and len(picked) < slots:
+            run = heapq.heappop(heap)[-1]
+            if running[run.company_id] >= quota:
+                deferred.append(run)
+                continue
+            running[run.company_id] += 1
+            picked.append(run.run_id)
+
+        # Lend unused capacity to over-quota companies, still in priority order
+        if self.work_conserving:
+            for run in deferred:
+                if len(picked) >= slots:
+                    break
+                picked.append(run.run_id)
+
+        return picked
+
+
+scheduler = RunScheduler(
+    max_concurrency=settings.run_max_concurrency,
+    company_share=settings.run_company_share,
+    aging_per_hour=settings.run_scheduler_aging_per_hour,
+    work_conserving=settings.run_scheduler_work_conserving,
+)
+
+
+def select_runs_to_claim(limit: int) -> List[str]:
+    """
+    Choose the queued runs the next claim should lease.
+
+    Candidates are the oldest queued runs plus the oldest queued runs of
+    high/medium risk projects (so a long backfill queue cannot hide them),
+    bounded by run_scheduler_candidate_window each.
+
+    Expired leases are re-queued first, on every claim: runs of a dead
+    worker would otherwise count against the concurrency cap, the plan
+    would stay empty and claim_run_ids (which also re-queues) never run.
+    """
+    RunQueries.requeue_expired(settings.run_max_attempts)
+    window = settings.run_scheduler_candidate_window
+    rows = RunQueries.get_queued_candidates(window, risk_labels=["high", "medium"])
+    rows += RunQueries.get_queued_candidates(window)
+    candidates = [QueuedRun.from_row(r) for r in rows]
+
+    in_flight = Counter(
+        (r.get("project") or {}).get("company_id") for r in RunQueries.get_processing_companies()
+    )
+    return scheduler.plan(candidates, in_flight, limit)
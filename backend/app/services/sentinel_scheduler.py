@@ -0,0 +1,288 @@
+"""Sentinel scheduler - one rate-limited gate for every Sentinel Hub call
+
+Sentinel Scheduler Service Layer
+
+Concurrent tile fetches, statistics and catalog searches all share one
+Sentinel Hub account, whose quota limits both requests and processing
+units (PU) per minute. Every SentinelService call goes through the
+process-wide SentinelScheduler:
+- Two token buckets (requests/minute, PU/minute) sized from our quota
+  make callers wait *before* sending instead of collecting 429s
+- 429 and 5xx responses are retried with jittered exponential backoff
+  (full jitter); a Retry-After header wins when present (milliseconds on
+  Sentinel Hub's 429s, standard seconds or HTTP date otherwise)
+- A RunBudget caps the PU one run may spend; the request that would
+  exceed it fails with ProcessingBudgetExceeded instead of being sent
+- Counters (requests, retries, throttled, ...) are exposed through
+  snapshot() and GET /health/sentinel
+
+Key Functions:
+- estimate_processing_units(): PU cost of a Process API request
+- SentinelScheduler.call(): run one request under the limits
+- get_scheduler(): the shared scheduler, configured from settings
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from app.config import settings
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+BURST_SECONDS = 10
+
+
+class ProcessingBudgetExceeded(RuntimeError):
+    """A run tried to spend more processing units than its budget"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilling `rate` tokens per second up to `capacity`"""
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Take tokens now (the balance may go negative); seconds to wait before using them"""
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until `tokens` are available; returns the seconds waited"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+class RunBudget:
+    """Processing units one run may spend (None = unlimited)"""
+
+    def __init__(self, limit: Optional[float]):
+        self.limit = limit
+        self.spent = 0.0
+        self._lock = threading.Lock()
+
+    def charge(self, units: float) -> None:
+        with self._lock:
+            if self.limit is not None and self.spent + units > self.limit:
+                raise ProcessingBudgetExceeded(
+                    f"Request needs {units:.2f} PU but only {self.limit - self.spent:.2f} "
+                    f"of the run's {self.limit:.2f} PU budget remain"
+                )
+            self.spent += units
+
+    def refund(self, units: float) -> None:
+        with self._lock:
+            self.spent = max(0.0, self.spent - units)
+
+
+def estimate_processing_units(
+    width: int,
+    height: int,
+    input_bands: int = 3,
+    float32: bool = False,
+    dates: int = 1,
+) -> float:
+    """
+    Processing units of one Process API request (Sentinel Hub's formula):
+    512 x 512 px is 1 PU per 3 input bands, FLOAT32 output doubles it,
+    each extra date adds one more, with a 0.005 PU floor.
+    """
+    area = max(width * height / (512 * 512), 0.01)
+    units = area * (input_bands / 3) * (2 if float32 else 1) * max(1, dates)
+    return round(max(units, 0.005), 4)
+
+
+def _response_of(exc: BaseException) -> Any:
+    """HTTP response behind requests / sentinelhub / urllib errors, if any"""
+    for candidate in (exc, getattr(exc, "request_exception", None), exc.__cause__):
+        if candidate is None:
+            continue
+        response = getattr(candidate, "response", None)
+        if response is not None:
+            return response
+        if hasattr(candidate, "code") and hasattr(candidate, "headers"):
+            return candidate  # urllib.error.HTTPError
+    return None
+
+
+def status_of(exc: BaseException) -> Optional[int]:
+    response = _response_of(exc)
+    status = getattr(response, "status_code", None) or getattr(response, "code", None)
+    return int(status) if status else None
+
+
+def retry_after_of(exc: BaseException) -> Optional[float]:
+    """
+    Retry-After in seconds. Sentinel Hub's rate limiter answers 429 with
+    milliseconds; other responses (e.g. a 503 from a proxy) follow the HTTP
+    standard: seconds or an HTTP date.
+    """
+    headers = getattr(_response_of(exc), "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    return seconds / 1000 if status_of(exc) == 429 else seconds
+
+
+class SentinelScheduler:
+    """Token buckets + retry/backoff shared by every Sentinel Hub request"""
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        processing_units_per_minute: float,
+        max_retries: int = 5,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None,
+    ):
+        # Bursts of up to BURST_SECONDS worth of quota, then the steady rate
+        self.requests = TokenBucket(
+            requests_per_minute / 60, max(1.0, requests_per_minute * BURST_SECONDS / 60), clock, sleep,
+        )
+        self.units = TokenBucket(
+            processing_units_per_minute / 60,
+            max(1.0, processing_units_per_minute * BURST_SECONDS / 60),
+            clock,
+            sleep,
+        )
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "retries": 0,
+            "throttled": 0,
+            "server_errors": 0,
+            "budget_exceeded": 0,
+            "processing_units": 0.0,
+            "wait_seconds": 0.0,
+        }
+
+    def _count(self, **increments: float) -> None:
+        with self._lock:
+            for name, value in increments.items():
+                self._counters[name] += value
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                name: round(value, 4) if isinstance(value, float) else value
+                for name, value in self._counters.items()
+            }
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max, base * 2^attempt)]"""
+        ceiling = min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt)
+        return self._rng.uniform(0, ceiling)
+
+    def call(
+        self,
+        fn: Callable[[], T],
+        processing_units: float = 0.0,
+        budget: Optional[RunBudget] = None,
+    ) -> T:
+        """
+        Run fn() under the request and PU rate limits, retrying 429/5xx.
+
+        The run budget is charged once up front (refunded if the request
+        finally fails); rate-limit tokens are taken for every attempt.
+        """
+        if budget is not None:
+            try:
+                budget.charge(processing_units)
+            except ProcessingBudgetExceeded:
+                self._count(budget_exceeded=1)
+                raise
+
+        attempt = 0
+        while True:
+            waited = self.requests.acquire()
+            if processing_units:
+                waited += self.units.acquire(processing_units)
+            self._count(requests=1, wait_seconds=waited)
+            try:
+                result = fn()
+            except Exception as exc:
+                status = status_of(exc)
+                if status not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                    self._count(failed=1)
+                    if budget is not None:
+                        budget.refund(processing_units)
+                    raise
+                if status == 429:
+                    self._count(throttled=1)
+                else:
+                    self._count(server_errors=1)
+                delay = retry_after_of(exc)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                self._count(retries=1, wait_seconds=delay)
+                self._sleep(delay)
+                attempt += 1
+                continue
+            self._count(succeeded=1, processing_units=processing_units)
+            return result
+
+
+_scheduler: Optional[SentinelScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> SentinelScheduler:
+    """The process-wide scheduler every SentinelService shares"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = SentinelScheduler(
+                requests_per_minute=settings.sentinel_requests_per_minute,
+                processing_units_per_minute=settings.sentinel_processing_units_per_minute,
+                max_retries=settings.sentinel_max_retries,
+                backoff_base_seconds=settings.sentinel_backoff_base_seconds,
+                backoff_max_seconds=settings.sentinel_backoff_max_seconds,
+            )
+        return _scheduler
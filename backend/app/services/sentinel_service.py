@@ -1,28 +1,44 @@
-"""Sentinel Hub service for fetching and storing RGB satellite images."""
+"""Sentinel Hub service for fetching satellite scenes, NDVI statistics and storing RGB images."""
 
 from __future__ import annotations
 
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Tuple, Any
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple, Any
 import os
 
 from dotenv import load_dotenv
 
 import numpy as np
-from PIL import Image
 from sentinelhub import (
     SHConfig,
     BBox,
     CRS,
     DataCollection,
+    DownloadRequest,
     MimeType,
+    Geometry,
     MosaickingOrder,
+    SentinelHubCatalog,
+    SentinelHubDownloadClient,
     SentinelHubRequest,
+    SentinelHubStatistical,
     bbox_to_dimensions,
 )
+from sentinelhub.download.handlers import fail_user_errors
+from sentinelhub.download.models import DownloadResponse
 
+from app.config import settings
 from app.services.storage_service import upload_bytes
+from app.services.sentinel_scheduler import (
+    RunBudget,
+    SentinelScheduler,
+    estimate_processing_units,
+    get_scheduler,
+)
+from app.services.statistics_service import parse_statistics
+from app.utils.geo import bbox_from_geojson, multipolygon
+from app.utils.raster import encode_png, fetch_tiled, raster_shape
 
 
 EVALSCRIPT_RGB = """
@@ -39,10 +55,100 @@ function evaluatePixel(sample) {
 }
 """
 
+# Everything a run needs from one acquisition, as a multi-response request:
+# display RGB, FLOAT32 NDVI (NaN where no data / cloud / shadow) and SCL
+EVALSCRIPT_SCENE = """
+//VERSION=3
+function setup() {
+  return {
+    input: [{ bands: ["B02", "B03", "B04", "B08", "SCL", "dataMask"] }],
+    output: [
+      { id: "rgb", bands: 3, sampleType: "UINT8" },
+      { id: "ndvi", bands: 1, sampleType: "FLOAT32" },
+      { id: "scl", bands: 1, sampleType: "UINT8" }
+    ]
+  };
+}
+
+// SCL: 0 no data, 1 saturated, 3 cloud shadow, 8/9 cloud, 10 cirrus
+var MASKED = [0, 1, 3, 8, 9, 10];
+
+function evaluatePixel(sample) {
+  var ndvi = NaN;
+  var total = sample.B08 + sample.B04;
+  if (sample.dataMask === 1 && MASKED.indexOf(sample.SCL) === -1 && total > 0) {
+    ndvi = (sample.B08 - sample.B04) / total;
+  }
+  return {
+    rgb: [sample.B04 * 255, sample.B03 * 255, sample.B02 * 255],
+    ndvi: [ndvi],
+    scl: [sample.SCL]
+  };
+}
+"""
+
+# Statistical API aggregates: clear-sky NDVI and a "below the floor" flag.
+# Cloud, shadow and no-data pixels are excluded through dataMask, so the
+# API's noDataCount / sampleCount is the cloud (or no data) fraction.
+# __NDVI_FLOOR__ is substituted per request.
+EVALSCRIPT_STATISTICS = """
+//VERSION=3
+function setup() {
+  return {
+    input: [{ bands: ["B04", "B08", "SCL", "dataMask"] }],
+    output: [
+      { id: "ndvi", bands: 1, sampleType: "FLOAT32" },
+      { id: "below", bands: 1, sampleType: "FLOAT32" },
+      { id: "dataMask", bands: 1 }
+    ]
+  };
+}
+
+var MASKED = [0, 1, 3, 8, 9, 10];
+var FLOOR = __NDVI_FLOOR__;
+
+function evaluatePixel(sample) {
+  var total = sample.B08 + sample.B04;
+  var clear = sample.dataMask === 1 && MASKED.indexOf(sample.SCL) === -1 && total > 0;
+  var ndvi = clear ? (sample.B08 - sample.B04) / total : 0;
+  return {
+    ndvi: [ndvi],
+    below: [ndvi < FLOOR ? 1 : 0],
+    dataMask: [clear ? 1 : 0]
+  };
+}
+"""
+
+SCENE_RESPONSES = (
+    ("rgb", MimeType.PNG),
+    ("ndvi", MimeType.TIFF),
+    ("scl", MimeType.TIFF),
+)
+
+
+class ScheduledDownloadClient(SentinelHubDownloadClient):
+    """Download client making exactly one HTTP attempt per download.
+
+    SentinelHubDownloadClient waits out 429 responses itself, in a loop
+    with no limit, so throttling would never reach SentinelScheduler.call.
+    Here 429 and 5xx are raised as requests.HTTPError (other 4xx as
+    DownloadFailedException, as before), and the shared scheduler owns
+    rate limiting, retries and backoff.
+    """
+
+    @fail_user_errors
+    def _execute_download(self, request: DownloadRequest) -> DownloadResponse:
+        response = self._do_download(request)
+        response.raise_for_status()
+        return DownloadResponse.from_response(response, request)
+
 
 @dataclass
 class SentinelService:
     config: SHConfig
+    # Every request goes through the shared rate limiter; budget caps one run's PU
+    scheduler: SentinelScheduler = field(default_factory=get_scheduler)
+    budget: Optional[RunBudget] = None
 
     def fetch_rgb_image(
         self,
@@ -51,31 +157,42 @@ class SentinelService:
         date_to: datetime,
         resolution: int = 20,
         max_cloud_coverage: int = 30,
+        size: Optional[Tuple[int, int]] = None,
+        mosaic_path: Optional[str] = None,
     ) -> Tuple[np.ndarray, dict[str, Any]]:
         """Fetch an RGB image from Sentinel Hub.
 
+        Areas larger than one request allows (sentinel_max_tile_px per side)
+        are fetched as concurrent tiles into one mosaic, memory-mapped to
+        mosaic_path when given.
+
         Returns a tuple of (rgb_array, metadata).
         """
-        bbox_obj = BBox(bbox=bbox, crs=CRS.WGS84)
-        size = bbox_to_dimensions(bbox_obj, resolution=resolution)
-
-        request = SentinelHubRequest(
-            evalscript=EVALSCRIPT_RGB,
-            input_data=[
-                SentinelHubRequest.input_data(
-                    data_collection=DataCollection.SENTINEL2_L2A,
-                    time_interval=(date_from.date().isoformat(), date_to.date().isoformat()),
-                    mosaicking_order=MosaickingOrder.LEAST_CC,
-                    maxcc=max_cloud_coverage / 100.0,
+        if size is None:
+            shape = raster_shape(bbox, resolution)
+            if max(shape) > settings.sentinel_max_tile_px:
+                mosaic = fetch_tiled(
+                    self.fetch_rgb_image,
+                    bbox,
+                    shape,
+                    channels=3,
+                    dtype=np.uint8,
+                    path=mosaic_path,
+                    max_tile_px=settings.sentinel_max_tile_px,
+                    max_workers=settings.sentinel_tile_workers,
+                    date_from=date_from,
+                    date_to=date_to,
+                    resolution=resolution,
+                    max_cloud_coverage=max_cloud_coverage,
                 )
-            ],
-            responses=[SentinelHubRequest.output_response("default", MimeType.PNG)],
-            bbox=bbox_obj,
-            size=size,
-            config=self.config,
+                return mosaic, {"size": (shape[1], shape[0]), "bbox": bbox}
+
+        request, size = self._build_request(
+            EVALSCRIPT_RGB, bbox, date_from, date_to, resolution, max_cloud_coverage,
+            [("default", MimeType.PNG)], size,
         )
 
-        data = request.get_data()
+        data = self._send(request, estimate_processing_units(*size, input_bands=3))
         if not data:
             raise RuntimeError("No imagery returned from Sentinel Hub")
 
@@ -91,31 +208,185 @@ class SentinelService:
 
         return img_rgb, {"size": size, "bbox": bbox}
 
-    def save_rgb_image(self, rgb_array: np.ndarray, path: str) -> str:
-        """Save RGB image to Supabase storage and return public URL."""
-        if rgb_array.dtype != np.uint8:
-            rgb_array = np.clip(rgb_array, 0, 255).astype(np.uint8)
+    def fetch_scene(
+        self,
+        bbox: Tuple[float, float, float, float],
+        date_from: datetime,
+        date_to: datetime,
+        resolution: int = 20,
+        max_cloud_coverage: int = 30,
+        size: Optional[Tuple[int, int]] = None,
+    ) -> Tuple[dict[str, np.ndarray], dict[str, Any]]:
+        """Fetch display RGB, NDVI and the scene classification in ONE request.
+
+        The three outputs come back as one tar multipart response and are
+        decoded into separate arrays, so a run pays for one request per
+        date instead of one per product. Large areas are tiled by the
+        caller (see app.utils.raster.fetch_tiled_layers) with an explicit
+        (width, height) size.
+
+        Returns a tuple of (layers, metadata) where layers has:
+        - rgb: uint8 (rows, cols, 3)
+        - ndvi: float32 (rows, cols), NaN where no data, cloud or shadow
+        - scl: uint8 (rows, cols) Sentinel-2 scene classification
+        """
+        request, size = self._build_request(
+            EVALSCRIPT_SCENE, bbox, date_from, date_to, resolution, max_cloud_coverage,
+            list(SCENE_RESPONSES), size,
+        )
 
-        image = Image.fromarray(rgb_array, mode="RGB")
-        with _BytesIO() as buffer:
-            image.save(buffer, format="PNG")
-            content = buffer.getvalue()
+        data = self._send(request, estimate_processing_units(*size, input_bands=5, float32=True))
+        if not data:
+            raise RuntimeError("No imagery returned from Sentinel Hub")
 
-        return upload_bytes(path=path, content=content, content_type="image/png")
+        return split_multipart(data[0]), {"size": size, "bbox": bbox}
+
+    def fetch_statistics(
+        self,
+        geojson: dict[str, Any],
+        date_from: datetime,
+        date_to: datetime,
+        resolution: int = 20,
+        max_cloud_coverage: int = 30,
+        ndvi_floor: float = 0.3,
+        aggregation_days: Optional[int] = None,
+    ) -> list[dict[str, Any]]:
+        """Per-interval NDVI aggregates inside a geometry, without imagery.
+
+        Uses the Statistical API: Sentinel Hub reduces the pixels itself and
+        returns a few numbers per interval (see
+        app.services.statistics_service.parse_statistics). The geometry is
+        reprojected to its UTM zone so resolution is in metres. Without
+        aggregation_days the whole range is one interval.
+        """
+        min_lng, min_lat, max_lng, max_lat = bbox_from_geojson(geojson)
+        utm = CRS.get_utm_from_wgs84((min_lng + max_lng) / 2, (min_lat + max_lat) / 2)
+        geometry = Geometry(multipolygon(geojson), crs=CRS.WGS84).transform(utm)
+        days = aggregation_days or max(1, (date_to - date_from).days)
+
+        request = SentinelHubStatistical(
+            aggregation=SentinelHubStatistical.aggregation(
+                evalscript=EVALSCRIPT_STATISTICS.replace("__NDVI_FLOOR__", repr(float(ndvi_floor))),
+                time_interval=(date_from.date().isoformat(), date_to.date().isoformat()),
+                aggregation_interval=f"P{days}D",
+                resolution=(resolution, resolution),
+            ),
+            input_data=[
+                SentinelHubStatistical.input_data(
+                    DataCollection.SENTINEL2_L2A,
+                    maxcc=max_cloud_coverage / 100.0,
+                    mosaicking_order=MosaickingOrder.LEAST_CC,
+                )
+            ],
+            geometry=geometry,
+            config=self.config,
+        )
 
+        rows, cols = raster_shape((min_lng, min_lat, max_lng, max_lat), resolution)
+        units = estimate_processing_units(cols, rows, input_bands=3, float32=True)
+        data = self._send(request, units)
+        return parse_statistics(data[0]) if data else []
 
-class _BytesIO:
-    """Small context-managed BytesIO wrapper to avoid importing io globally."""
+    def search_catalog(
+        self,
+        bbox: Tuple[float, float, float, float],
+        date_from: date,
+        date_to: date,
+    ) -> list[dict[str, Any]]:
+        """List Sentinel-2 L2A acquisitions over bbox, date_to inclusive.
+
+        Catalog API (STAC) search returning only id, datetime and
+        cloud_cover per granule; no processing units are spent. See
+        app.services.catalog_service for the cached, per-day view.
+        """
+        catalog = SentinelHubCatalog(config=self.config)
+        catalog.client = ScheduledDownloadClient(config=self.config)
+
+        def search() -> list[dict[str, Any]]:
+            # The search is a lazy paginated iterator: consume it under the scheduler
+            return list(catalog.search(
+                DataCollection.SENTINEL2_L2A,
+                bbox=BBox(bbox=bbox, crs=CRS.WGS84),
+                time=(date_from.isoformat(), (date_to + timedelta(days=1)).isoformat()),
+                fields={"include": ["id", "properties.datetime", "properties.eo:cloud_cover"], "exclude": []},
+            ))
+
+        results = self.scheduler.call(search)
+        return [
+            {
+                "id": item["id"],
+                "datetime": item["properties"]["datetime"],
+                "cloud_cover": item["properties"].get("eo:cloud_cover"),
+            }
+            for item in results
+        ]
+
+    def _send(self, request: Any, processing_units: float) -> Any:
+        """request.get_data() under the shared rate limits and this run's budget"""
+        request.download_client_class = ScheduledDownloadClient
+        return self.scheduler.call(request.get_data, processing_units=processing_units, budget=self.budget)
+
+    def _build_request(
+        self,
+        evalscript: str,
+        bbox: Tuple[float, float, float, float],
+        date_from: datetime,
+        date_to: datetime,
+        resolution: int,
+        max_cloud_coverage: int,
+        responses: list[Tuple[str, MimeType]],
+        size: Optional[Tuple[int, int]] = None,
+    ) -> Tuple[SentinelHubRequest, Tuple[int, int]]:
+        """Build a least-cloudy Sentinel-2 L2A request over bbox.
+
+        Several (identifier, mime_type) responses make Sentinel Hub answer
+        with one tar archive holding every output.
+        """
+        bbox_obj = BBox(bbox=bbox, crs=CRS.WGS84)
+        size = size or bbox_to_dimensions(bbox_obj, resolution=resolution)
+
+        request = SentinelHubRequest(
+            evalscript=evalscript,
+            input_data=[
+                SentinelHubRequest.input_data(
+                    data_collection=DataCollection.SENTINEL2_L2A,
+                    time_interval=(date_from.date().isoformat(), date_to.date().isoformat()),
+                    mosaicking_order=MosaickingOrder.LEAST_CC,
+                    maxcc=max_cloud_coverage / 100.0,
+                )
+            ],
+            responses=[SentinelHubRequest.output_response(name, mime) for name, mime in responses],
+            bbox=bbox_obj,
+            size=size,
+            config=self.config,
+        )
+        return request, size
+
+    def save_rgb_image(self, rgb_array: np.ndarray, path: str) -> str:
+        """Save RGB image to Supabase storage and return public URL.
+
+        Encoded block by block, so memory-mapped mosaics are never loaded whole.
+        """
+        content = encode_png(rgb_array[..., :3])
+        return upload_bytes(path=path, content=content, content_type="image/png")
 
-    def __enter__(self):
-        from io import BytesIO
 
-        self._buffer = BytesIO()
-        return self._buffer
+def split_multipart(payload: Any) -> dict[str, np.ndarray]:
+    """Decoded tar multipart response -> {output id: array}.
 
-    def __exit__(self, exc_type, exc, tb):
-        self._buffer.close()
-        return False
+    sentinelhub decodes the archive into {"rgb.png": array, "ndvi.tif": ...};
+    single-band outputs are squeezed to (rows, cols).
+    """
+    layers = {}
+    for name, array in payload.items():
+        key = name.rsplit(".", 1)[0]
+        if key == "userdata":
+            continue
+        array = np.asarray(array)
+        if array.ndim == 3 and array.shape[-1] == 1:
+            array = array[..., 0]
+        layers[key] = array
+    return layers
 
 
 def _build_config() -> SHConfig:
@@ -133,6 +404,9 @@ def _build_config() -> SHConfig:
     )
     config.sh_base_url = os.getenv("SH_BASE_URL", config.sh_base_url)
     config.sh_token_url = os.getenv("SH_TOKEN_URL", config.sh_token_url)
+    # Retries and backoff are owned by the shared SentinelScheduler (requests
+    # go through ScheduledDownloadClient, which also passes 429s back)
+    config.max_download_attempts = 1
 
     if not config.sh_client_id or not config.sh_client_secret:
         raise RuntimeError(
@@ -142,5 +416,6 @@ def _build_config() -> SHConfig:
     return config
 
 
-def get_sentinel_service() -> SentinelService:
-    return SentinelService(config=_build_config())
+def get_sentinel_service(pu_budget: Optional[float] = None) -> SentinelService:
+    """Service on the shared scheduler; pu_budget caps the processing units it may spend"""
+    return SentinelService(config=_build_config(), budget=RunBudget(pu_budget) if pu_budget else None)
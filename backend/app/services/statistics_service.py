@@ -0,0 +1,194 @@
+"""Statistics service - cheap per-geomarker NDVI aggregates (no imagery)
+
+Statistics Service Layer
+
+Most monitoring runs find nothing, and for those a few numbers are
+enough. The Sentinel Hub Statistical API computes them server-side and
+answers with kilobytes of JSON instead of megabytes of imagery:
+- mean NDVI of the clear (cloud-free) pixels inside the geomarker
+- below_fraction: share of clear pixels with NDVI under statistics_ndvi_floor
+- cloud_fraction: share of pixels that are cloud, shadow or no data
+
+Key Functions:
+- parse_statistics(): Statistical API response -> one dict per interval
+- statistics_cache_key(): cache key of one geomarker version + interval
+- get_interval_statistics(): aggregates for a list of intervals, cached
+
+Caching:
+- One ndvi_statistics row per geomarker version and interval
+  (11_ndvi_statistics.sql); a version's geometry never changes, so rows
+  never go stale
+- Intervals that ended less than INGESTION_LAG ago are not stored, as
+  late acquisitions may still be ingested by Sentinel Hub
+- A run's "before" window is the previous run's "after" window when the
+  cadence matches the analysis window, so a steady-state check costs one
+  Statistical API request
+"""
+
+import math
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Protocol, Tuple, runtime_checkable
+
+from app.db.queries import StatisticsQueries
+
+# Sentinel-2 scenes can appear in Sentinel Hub a day or two after sensing
+INGESTION_LAG = timedelta(days=2)
+
+Interval = Tuple[date, date]
+
+
+@runtime_checkable
+class StatisticsSource(Protocol):
+    """Anything that returns aggregates like SentinelService.fetch_statistics"""
+
+    def fetch_statistics(
+        self,
+        geojson: Dict[str, Any],
+        date_from: datetime,
+        date_to: datetime,
+        resolution: int = 20,
+        max_cloud_coverage: int = 30,
+        ndvi_floor: float = 0.3,
+    ) -> List[Dict[str, Any]]:
+        ...
+
+
+def _number(value: Any) -> Optional[float]:
+    """Statistical API numbers; "NaN" (no clear pixel) becomes None"""
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def _band_stats(outputs: Dict[str, Any], output: str) -> Dict[str, Any]:
+    bands = (outputs.get(output) or {}).get("bands") or {}
+    band = bands.get("B0") or next(iter(bands.values()), {})
+    return band.get("stats") or {}
+
+
+def parse_statistics(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Statistical API response -> one dict per aggregation interval.
+
+    Expects the outputs of EVALSCRIPT_STATISTICS: "ndvi" and "below", with
+    cloudy / no-data pixels excluded through dataMask. Intervals the API
+    reports an error for are skipped.
+    """
+    intervals = []
+    for item in payload.get("data") or []:
+        if item.get("error"):
+            continue
+        outputs = item.get("outputs") or {}
+        ndvi = _band_stats(outputs, "ndvi")
+        below = _band_stats(outputs, "below")
+        samples = int(ndvi.get("sampleCount") or 0)
+        no_data = int(ndvi.get("noDataCount") or 0)
+        below_fraction = _number(below.get("mean"))
+        intervals.append({
+            "interval_from": str(item["interval"]["from"])[:10],
+            "interval_to": str(item["interval"]["to"])[:10],
+            "mean_ndvi": _number(ndvi.get("mean")),
+            "below_fraction": round(below_fraction, 6) if below_fraction is not None else None,
+            "cloud_fraction": round(no_data / samples, 6) if samples else None,
+            "valid_pixel_count": samples - no_data,
+            "sample_count": samples,
+        })
+    return intervals
+
+
+def statistics_cache_key(
+    geomarker: Dict[str, Any],
+    interval: Interval,
+    resolution: int,
+    max_cloud_coverage: int,
+    ndvi_floor: float,
+) -> str:
+    """Geomarker id + version, interval and every parameter that changes the numbers"""
+    return ":".join([
+        str(geomarker["id"]),
+        f"v{geomarker.get('version') or 1}",
+        interval[0].isoformat(),
+        interval[1].isoformat(),
+        f"{resolution}m",
+        f"cc{max_cloud_coverage}",
+        f"floor{float(ndvi_floor)}",
+    ])
+
+
+def _empty_interval(interval: Interval) -> Dict[str, Any]:
+    """No acquisition in the interval passed the cloud filter"""
+    return {
+        "interval_from": interval[0].isoformat(),
+        "interval_to": interval[1].isoformat(),
+        "mean_ndvi": None,
+        "below_fraction": None,
+        "cloud_fraction": None,
+        "valid_pixel_count": 0,
+        "sample_count": 0,
+    }
+
+
+def get_interval_statistics(
+    geomarker: Dict[str, Any],
+    intervals: List[Interval],
+    source: StatisticsSource,
+    resolution: int,
+    max_cloud_coverage: int,
+    ndvi_floor: float,
+    today: Optional[date] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Aggregates of a geomarker for each (from, to) interval, in order.
+
+    Cached intervals are read back in one query; each missing interval is
+    one Statistical API request over exactly that interval. Every
+    returned dict has a "cached" flag.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    keys = [
+        statistics_cache_key(geomarker, interval, resolution, max_cloud_coverage, ndvi_floor)
+        for interval in intervals
+    ]
+    cached = {row["cache_key"]: row for row in StatisticsQueries.get_by_cache_keys(keys)}
+
+    results = []
+    to_store = []
+    for key, interval in zip(keys, intervals):
+        if key in cached:
+            results.append({**cached[key], "cached": True})
+            continue
+
+        fetched = source.fetch_statistics(
+            geomarker["geojson"],
+            datetime.combine(interval[0], datetime.min.time()),
+            datetime.combine(interval[1], datetime.min.time()),
+            resolution=resolution,
+            max_cloud_coverage=max_cloud_coverage,
+            ndvi_floor=ndvi_floor,
+        )
+        row = {
+            **(fetched[0] if fetched else _empty_interval(interval)),
+            # Key rows by the requested interval, not the API's echo of it
+            "interval_from": interval[0].isoformat(),
+            "interval_to": interval[1].isoformat(),
+        }
+        if interval[1] + INGESTION_LAG <= today:
+            to_store.append({
+                **row,
+                "cache_key": key,
+                "geomarker_id": geomarker["id"],
+                "geomarker_version": geomarker.get("version") or 1,
+                "resolution_m": resolution,
+                "max_cloud_coverage": max_cloud_coverage,
+                "ndvi_floor": float(ndvi_floor),
+            })
+        results.append({**row, "cached": False})
+
+    if to_store:
+        try:
+            StatisticsQueries.upsert_many(to_store)
+        except Exception as e:
+            # The numbers are still valid for this run
+            print(f"Warning: could not cache NDVI statistics: {e}")
+    return results
@@ -7,11 +7,24 @@ def public_url(path: str, bucket: str | None = None) -> str:
     bucket = bucket or settings.supabase_bucket_results
     return _sb.storage.from_(bucket).get_public_url(path)
 
-def upload_bytes(path: str, content: bytes, content_type: str, bucket: str | None = None) -> str:
+def upload_bytes(
+    path: str,
+    content: bytes,
+    content_type: str,
+    bucket: str | None = None,
+    upsert: bool = False,
+) -> str:
     bucket = bucket or settings.supabase_bucket_results
+    file_options = {"content-type": content_type}
+    if upsert:
+        file_options["upsert"] = "true"
     _sb.storage.from_(bucket).upload(
         path=path,
         file=content,
-        file_options={"content-type": content_type},
+        file_options=file_options,
     )
     return public_url(path, bucket=bucket)
+
+def download_bytes(path: str, bucket: str | None = None) -> bytes:
+    bucket = bucket or settings.supabase_bucket_results
+    return _sb.storage.from_(bucket).download(path)
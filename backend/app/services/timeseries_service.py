@@ -0,0 +1,294 @@
+"""Time-series service - per-project NDVI trend without re-running analyses
+
+Time-Series Service Layer
+
+Each completed run adds one point to its project's NDVI history. Points
+live in a compact append-only file per project, one fixed-size binary
+record per run (TIMESERIES_DTYPE), so:
+- ingestion appends a few dozen bytes (no read-modify-write)
+- a read is one np.fromfile of a contiguous columnar array; range
+  queries are binary searches and downsampling is np.add.reduceat
+
+Key Functions:
+- record_run(): append a completed run (called by process_gee_result)
+- read_timeseries(): points between two dates at run/week/month/year resolution
+- backfill_project(): rebuild a project's file from its completed runs
+- get_project_timeseries(): GET /projects/{id}/timeseries
+
+The runs table stays the source of truth; files are derived data under
+settings.timeseries_dir. A file that is missing (new instance, wiped
+disk) is rebuilt from the project's completed runs on first read, and
+runs completed on another instance are caught up by finished_at, at most
+once per timeseries_catchup_seconds per project, so most reads never
+leave the process. The catch-up watermark is the time of the last query
+to the runs table (kept next to the file), not the newest local record:
+runs appended here by record_run must not hide older runs of another
+instance. A run that is ingested again is appended again: reads keep its
+latest record.
+"""
+
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+
+from app.config import settings
+from app.db.queries import ProjectQueries, RunQueries
+from app.schemas.projects import ProjectTimeSeriesResponse, TimeSeriesPoint
+
+# Bump the file suffix when the record layout changes
+TIMESERIES_DTYPE = np.dtype([
+    ("date", "<M8[D]"),  # run end_date
+    ("finished_at", "<M8[s]"),
+    ("run_id", "S36"),
+    ("mean_ndvi_before", "<f4"),  # NaN when the run did not report it
+    ("mean_ndvi_after", "<f4"),
+    ("mean_delta_ndvi", "<f4"),
+    ("loss_ha", "<f4"),
+    ("cloud_fraction", "<f4"),
+])
+FILE_SUFFIX = ".ts1"
+# Sidecar with the UTC time the runs table was last read for the file
+WATERMARK_SUFFIX = ".since"
+
+RESOLUTIONS = {"run": None, "week": "W", "month": "M", "year": "Y"}
+
+_write_lock = threading.Lock()
+# File path -> time.monotonic() of its last catch-up with the runs table
+_caught_up: Dict[str, float] = {}
+
+
+def timeseries_path(project_id: str) -> str:
+    return os.path.join(settings.timeseries_dir, f"{project_id}{FILE_SUFFIX}")
+
+
+def _float(value: Any) -> float:
+    try:
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _day(value: Any) -> np.datetime64:
+    return np.datetime64(str(value)[:10], "D")
+
+
+def _instant(value: Any) -> np.datetime64:
+    if not value:
+        return np.datetime64("NaT", "s")
+    text = str(value).replace("Z", "+00:00")
+    return np.datetime64(datetime.fromisoformat(text).replace(tzinfo=None), "s")
+
+
+def run_record(run: Dict[str, Any]) -> np.ndarray:
+    """One completed run (a runs row) as a TIMESERIES_DTYPE record"""
+    stats = run.get("stats") or {}
+    loss = run.get("hectares_change")
+    if loss is None:
+        loss = stats.get("affected_area_ha")
+    cloud = stats.get("cloud_fraction_after", stats.get("cloud_fraction"))
+    record = np.zeros(1, dtype=TIMESERIES_DTYPE)
+    record["date"] = _day(run["end_date"])
+    record["finished_at"] = _instant(run.get("finished_at"))
+    record["run_id"] = str(run["id"]).encode()
+    record["mean_ndvi_before"] = _float(stats.get("mean_ndvi_before"))
+    record["mean_ndvi_after"] = _float(stats.get("mean_ndvi_after"))
+    record["mean_delta_ndvi"] = _float(stats.get("mean_delta_ndvi"))
+    record["loss_ha"] = _float(loss)
+    record["cloud_fraction"] = _float(cloud)
+    return record
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _read_watermark(path: str) -> Optional[datetime]:
+    try:
+        with open(path + WATERMARK_SUFFIX) as f:
+            return datetime.fromisoformat(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_watermark(path: str, queried_at: datetime) -> None:
+    with open(path + WATERMARK_SUFFIX + ".tmp", "w") as f:
+        f.write(queried_at.isoformat())
+    os.replace(path + WATERMARK_SUFFIX + ".tmp", path + WATERMARK_SUFFIX)
+
+
+def _append(project_id: str, records: np.ndarray) -> None:
+    os.makedirs(settings.timeseries_dir, exist_ok=True)
+    with _write_lock, open(timeseries_path(project_id), "ab") as f:
+        f.write(records.tobytes())
+
+
+def record_run(run: Optional[Dict[str, Any]]) -> None:
+    """Append a just-completed run to its project's series"""
+    if not run or not run.get("end_date"):
+        return
+    _append(str(run["project_id"]), run_record(run))
+
+
+def backfill_project(project_id: str) -> int:
+    """Rewrite a project's file from every completed run; returns the point count"""
+    queried_at = _utcnow()
+    runs = RunQueries.get_completed_since(project_id)
+    records = np.concatenate([run_record(run) for run in runs]) if runs else np.zeros(0, TIMESERIES_DTYPE)
+    os.makedirs(settings.timeseries_dir, exist_ok=True)
+    path = timeseries_path(project_id)
+    with _write_lock:
+        records.tofile(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        _write_watermark(path, queried_at)
+    _caught_up[path] = time.monotonic()
+    return len(records)
+
+
+def _load(project_id: str) -> np.ndarray:
+    path = timeseries_path(project_id)
+    if not os.path.exists(path):
+        backfill_project(project_id)
+        return np.fromfile(path, dtype=TIMESERIES_DTYPE)
+    records = np.fromfile(path, dtype=TIMESERIES_DTYPE)
+
+    # Catch up on runs completed on other instances (usually no rows); runs
+    # ingested here are appended by record_run and need no query
+    now = time.monotonic()
+    if now - _caught_up.get(path, float("-inf")) < settings.timeseries_catchup_seconds:
+        return records
+    _caught_up[path] = now
+    watermark = _read_watermark(path)
+    since = None
+    if watermark is not None:
+        since = (watermark - timedelta(seconds=settings.timeseries_catchup_overlap_seconds)).strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        )
+    queried_at = _utcnow()
+    # Records already in the file, re-ingested runs included, are skipped
+    known = set(zip(records["run_id"].tolist(), records["finished_at"].tolist()))
+    missed = [
+        run for run in RunQueries.get_completed_since(project_id, since)
+        if (str(run["id"]).encode(), _instant(run.get("finished_at")).item()) not in known
+    ]
+    if missed:
+        extra = np.concatenate([run_record(run) for run in missed])
+        _append(project_id, extra)
+        records = np.concatenate([records, extra])
+    with _write_lock:
+        _write_watermark(path, queried_at)
+    return records
+
+
+def latest_per_run(records: np.ndarray) -> np.ndarray:
+    """Keep the last record of each run, sorted by date"""
+    if not len(records):
+        return records
+    reversed_ids = records["run_id"][::-1]
+    _, first = np.unique(reversed_ids, return_index=True)
+    latest = records[len(records) - 1 - first]
+    return latest[np.argsort(latest["date"], kind="stable")]
+
+
+def _nanmean_reduce(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    present = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(present, values, 0).astype(np.float64), starts)
+    counts = np.add.reduceat(present.astype(np.int64), starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def downsample(records: np.ndarray, resolution: str) -> Dict[str, np.ndarray]:
+    """
+    Date-sorted records -> one point per period (or per run). NDVI columns
+    are averaged over the runs that reported them, loss is summed.
+    Expects at least one record.
+    """
+    unit = RESOLUTIONS[resolution]
+    if unit is None:
+        periods = records["date"]
+        starts = np.arange(len(records))
+    else:
+        # datetime64 weeks start on Thursdays (1970-01-01); shift to Mondays
+        shift = np.timedelta64(3 if unit == "W" else 0, "D")
+        keys = (records["date"] + shift).astype(f"M8[{unit}]")
+        periods, starts = np.unique(keys, return_index=True)
+        periods = periods.astype("M8[D]") - shift
+    loss = records["loss_ha"].astype(np.float64)
+    return {
+        "date": periods,
+        "run_count": np.diff(np.append(starts, len(records))),
+        "mean_ndvi_before": _nanmean_reduce(records["mean_ndvi_before"], starts),
+        "mean_ndvi_after": _nanmean_reduce(records["mean_ndvi_after"], starts),
+        "mean_delta_ndvi": _nanmean_reduce(records["mean_delta_ndvi"], starts),
+        "loss_ha": np.add.reduceat(np.nan_to_num(loss), starts),
+        "cloud_fraction": _nanmean_reduce(records["cloud_fraction"], starts),
+    }
+
+
+def _rounded(value: float, digits: int) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def read_timeseries(
+    project_id: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    resolution: str = "run",
+) -> List[Dict[str, Any]]:
+    """
+    Points of a project between date_from and date_to (inclusive, by run
+    end_date). cumulative_loss_ha counts every run up to the point,
+    including those before date_from.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution!r}; expected one of {list(RESOLUTIONS)}")
+    records = latest_per_run(_load(project_id))
+
+    dates = records["date"]
+    lo = np.searchsorted(dates, np.datetime64(date_from, "D"), "left") if date_from else 0
+    hi = np.searchsorted(dates, np.datetime64(date_to, "D"), "right") if date_to else len(records)
+    if hi <= lo:
+        return []
+    prior_loss = float(np.nansum(records["loss_ha"][:lo], dtype=np.float64))
+    points = downsample(records[lo:hi], resolution)
+    cumulative = prior_loss + np.cumsum(points["loss_ha"])
+
+    return [
+        {
+            "date": points["date"][i].item(),
+            "run_count": int(points["run_count"][i]),
+            "mean_ndvi_before": _rounded(points["mean_ndvi_before"][i], 6),
+            "mean_ndvi_after": _rounded(points["mean_ndvi_after"][i], 6),
+            "mean_delta_ndvi": _rounded(points["mean_delta_ndvi"][i], 6),
+            "loss_ha": round(float(points["loss_ha"][i]), 4),
+            "cumulative_loss_ha": round(float(cumulative[i]), 4),
+            "cloud_fraction": _rounded(points["cloud_fraction"][i], 6),
+        }
+        for i in range(len(points["date"]))
+    ]
+
+
+def get_project_timeseries(
+    project_id: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    resolution: str = "run",
+) -> ProjectTimeSeriesResponse:
+    """NDVI trend of a project for GET /projects/{id}/timeseries"""
+    if not ProjectQueries.get_by_id(project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    if date_from and date_to and date_to < date_from:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    points = read_timeseries(project_id, date_from, date_to, resolution)
+    return ProjectTimeSeriesResponse(
+        project_id=project_id,
+        resolution=resolution,
+        date_from=date_from,
+        date_to=date_to,
+        points=[TimeSeriesPoint(**point) for point in points],
+    )
@@ -0,0 +1,402 @@
+"""Webhook service - batched, asynchronous pushes of ingestion events
+
+Webhook Service Layer
+
+Subscribers register an endpoint (POST /webhooks) and receive events
+instead of polling:
+- run.completed: a GEE result was ingested (process_gee_result)
+- alert.raised: an alert rule fired on that run (alerts_service)
+
+Delivery never happens on the request path. Ingestion makes one
+enqueue_webhook_events call per result (or bulk chunk), which fans events
+out to a persistent outbox (15_webhooks.sql). The WebhookDispatcher,
+started in main.py, then:
+- claims due outbox rows under a lease, so rows of a dead instance are
+  claimed again and events survive restarts (delivery is at-least-once;
+  receivers dedupe on the event id)
+- groups them per endpoint into batches of webhook_batch_size events,
+  one POST per batch, signed with the endpoint's secret
+- posts batches from a pool of webhook_workers asyncio workers; at most
+  max_concurrency batches are in flight per endpoint and the rest wait
+  in memory, so a slow receiver holds neither workers nor other endpoints
+- retries failures with exponential backoff and jitter, and dead-letters
+  deliveries after webhook_max_attempts (GET /webhooks/{id}/dead-letters,
+  POST /webhooks/{id}/dead-letters/replay)
+- deletes delivered rows older than webhook_retention_days, every
+  webhook_prune_interval_seconds, so the outbox does not grow forever
+
+With webhooks_enabled off nothing runs the dispatcher, so emit_events()
+does not enqueue either.
+
+Key Functions:
+- run_completed_event() / alert_raised_event(): event builders
+- emit_events(): enqueue events (called by process_gee_result)
+- WebhookDispatcher.run_forever(): background delivery loop (main.py)
+- create_endpoint() / list_endpoints() / delete_endpoint(): /webhooks routes
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import secrets
+import socket
+import time
+import uuid
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from app.config import settings
+from app.db.queries import WebhookQueries
+from app.schemas.webhooks import (
+    DeadLetter,
+    DeadLettersResponse,
+    ReplayResponse,
+    WebhookEndpoint,
+    WebhookEndpointCreate,
+    WebhookEndpointCreated,
+    WebhookEndpointsResponse,
+)
+
+EVENT_TYPES = ("run.completed", "alert.raised")
+SIGNATURE_HEADER = "X-Bioma-Signature"
+# Delivered rows deleted per prune_delivered call
+PRUNE_BATCH = 10000
+
+
+def _event(event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": str(uuid.uuid4()),
+        "type": event_type,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "data": data,
+    }
+
+
+def run_completed_event(run: Dict[str, Any], risk_label: Optional[str]) -> Dict[str, Any]:
+    return _event("run.completed", {
+        "run_id": str(run["id"]),
+        "project_id": str(run["project_id"]),
+        "start_date": str(run.get("start_date"))[:10],
+        "end_date": str(run.get("end_date"))[:10],
+        "hectares_change": run.get("hectares_change"),
+        "risk_label": risk_label,
+        "finished_at": run.get("finished_at"),
+    })
+
+
+def alert_raised_event(alert: Dict[str, Any]) -> Dict[str, Any]:
+    return _event("alert.raised", {
+        "alert_id": str(alert["id"]) if alert.get("id") else None,
+        "project_id": str(alert["project_id"]),
+        "run_id": alert.get("run_id"),
+        "rule": alert.get("rule"),
+        "severity": alert.get("severity"),
+        "title": alert.get("title"),
+        "message": alert.get("message"),
+        "metric": alert.get("metric"),
+    })
+
+
+def sign(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds before the next attempt: exponential, capped, with jitter"""
+    delay = min(settings.webhook_backoff_max_seconds, settings.webhook_backoff_base_seconds * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+@dataclass
+class WebhookBatch:
+    """Claimed deliveries of one endpoint, sent in one POST"""
+    endpoint_id: str
+    url: str
+    secret: Optional[str]
+    max_concurrency: int
+    deliveries: List[Dict[str, Any]]  # claimed outbox rows
+
+    def body(self) -> bytes:
+        events = [
+            {
+                "id": str(row["event_id"]),
+                "type": row["event_type"],
+                "created_at": str(row["created_at"]),
+                "attempt": row["attempts"],
+                "data": row["payload"],
+            }
+            for row in self.deliveries
+        ]
+        return json.dumps({"events": events}, separators=(",", ":"), default=str).encode()
+
+
+def make_batches(rows: List[Dict[str, Any]], batch_size: int) -> List[WebhookBatch]:
+    """Claimed rows -> batches per endpoint, in claim order"""
+    per_endpoint: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        per_endpoint[str(row["endpoint_id"])].append(row)
+    batches = []
+    for endpoint_id, deliveries in per_endpoint.items():
+        first = deliveries[0]
+        for offset in range(0, len(deliveries), batch_size):
+            batches.append(WebhookBatch(
+                endpoint_id=endpoint_id,
+                url=first["url"],
+                secret=first.get("secret"),
+                max_concurrency=max(1, int(first.get("max_concurrency") or 1)),
+                deliveries=deliveries[offset:offset + batch_size],
+            ))
+    return batches
+
+
+class WebhookDispatcher:
+    """
+    Outbox poller feeding a pool of async delivery workers.
+
+    `outbox` provides enqueue / claim / mark_delivered / retry /
+    dead_letter / prune_delivered (WebhookQueries in production).
+    """
+
+    def __init__(self, outbox: Any = WebhookQueries, workers: Optional[int] = None,
+                 batch_size: Optional[int] = None, poll_seconds: Optional[float] = None):
+        self.outbox = outbox
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._inflight: Dict[str, int] = defaultdict(int)
+        # Batches waiting for a free slot of their endpoint
+        self._parked: Dict[str, Deque[WebhookBatch]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def enqueue(self, events: List[Dict[str, Any]]) -> int:
+        """Write events to the outbox and wake the dispatcher; safe from any thread"""
+        count = self.outbox.enqueue(events)
+        if count:
+            self.wake()
+        return count
+
+    async def run_forever(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._ready = asyncio.Queue()
+        claim_limit = settings.webhook_claim_limit
+        next_prune = time.monotonic()
+        async with httpx.AsyncClient(timeout=settings.webhook_timeout_seconds) as client:
+            workers = [
+                asyncio.create_task(self._worker(client))
+                for _ in range(self.workers or settings.webhook_workers)
+            ]
+            try:
+                while True:
+                    self._wakeup.clear()
+                    if time.monotonic() >= next_prune:
+                        await self.prune_once()
+                        next_prune = time.monotonic() + settings.webhook_prune_interval_seconds
+                    try:
+                        claimed = await self.dispatch_once()
+                    except Exception as e:
+                        print(f"Warning: webhook dispatcher could not claim deliveries: {e}")
+                        claimed = 0
+                    if claimed >= claim_limit:
+                        continue
+                    try:
+                        await asyncio.wait_for(
+                            self._wakeup.wait(), timeout=self.poll_seconds or settings.webhook_poll_seconds,
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+    async def prune_once(self) -> int:
+        """Delete delivered rows past webhook_retention_days; returns the count"""
+        before = (datetime.now(timezone.utc) - timedelta(days=settings.webhook_retention_days)).isoformat()
+        pruned = 0
+        try:
+            while True:
+                count = await asyncio.to_thread(self.outbox.prune_delivered, before, PRUNE_BATCH)
+                pruned += count
+                if count < PRUNE_BATCH:
+                    return pruned
+        except Exception as e:
+            print(f"Warning: webhook dispatcher could not prune delivered rows: {e}")
+            return pruned
+
+    async def dispatch_once(self) -> int:
+        """Claim due deliveries and hand them to the workers; returns the claim size"""
+        # Endpoints with batches still waiting get nothing new until they drain
+        busy = [endpoint_id for endpoint_id, parked in self._parked.items() if parked]
+        rows = await asyncio.to_thread(
+            self.outbox.claim, self.worker_id, settings.webhook_claim_limit, settings.webhook_lease_seconds, busy,
+        )
+        for batch in make_batches(rows, self.batch_size or settings.webhook_batch_size):
+            self._submit(batch)
+        return len(rows)
+
+    def _submit(self, batch: WebhookBatch) -> None:
+        if self._inflight[batch.endpoint_id] < batch.max_concurrency:
+            self._inflight[batch.endpoint_id] += 1
+            self._ready.put_nowait(batch)
+        else:
+            self._parked.setdefault(batch.endpoint_id, deque()).append(batch)
+
+    def _release(self, endpoint_id: str) -> None:
+        parked = self._parked.get(endpoint_id)
+        if parked:
+            # Hand the slot straight to the endpoint's next batch
+            self._ready.put_nowait(parked.popleft())
+            if not parked:
+                del self._parked[endpoint_id]
+                self._wakeup.set()  # the endpoint can be claimed for again
+            return
+        self._inflight[endpoint_id] -= 1
+        if not self._inflight[endpoint_id]:
+            del self._inflight[endpoint_id]
+
+    async def _worker(self, client: httpx.AsyncClient) -> None:
+        while True:
+            batch = await self._ready.get()
+            try:
+                await self.deliver(client, batch)
+            except Exception as e:
+                # Left leased: the lease expires and the batch is retried
+                print(f"Warning: webhook delivery to {batch.url} failed unexpectedly: {e}")
+            finally:
+                self._release(batch.endpoint_id)
+
+    async def deliver(self, client: httpx.AsyncClient, batch: WebhookBatch) -> bool:
+        """POST one batch; mark it delivered, or schedule retries / dead-letter it"""
+        body = batch.body()
+        headers = {"Content-Type": "application/json", "X-Bioma-Delivery": str(uuid.uuid4())}
+        if batch.secret:
+            headers[SIGNATURE_HEADER] = sign(batch.secret, body)
+        try:
+            response = await client.post(batch.url, content=body, headers=headers)
+            error = None if response.is_success else f"HTTP {response.status_code}"
+        except httpx.HTTPError as e:
+            error = f"{type(e).__name__}: {e}"
+
+        ids = [row["id"] for row in batch.deliveries]
+        if error is None:
+            await asyncio.to_thread(self.outbox.mark_delivered, ids)
+            return True
+        await asyncio.to_thread(self._fail, batch, error)
+        return False
+
+    def _fail(self, batch: WebhookBatch, error: str) -> None:
+        dead = [row for row in batch.deliveries if row["attempts"] >= settings.webhook_max_attempts]
+        retry = [row for row in batch.deliveries if row["attempts"] < settings.webhook_max_attempts]
+        if dead:
+            self.outbox.dead_letter([row["id"] for row in dead], error)
+        if retry:
+            delay = retry_delay(min(row["attempts"] for row in retry))
+            next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+            self.outbox.retry([row["id"] for row in retry], error, next_attempt_at.isoformat())
+
+    def wake(self) -> None:
+        # enqueue() runs in request threads; the event belongs to the loop
+        if self._wakeup is None or self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            pass
+
+
+webhook_dispatcher = WebhookDispatcher()
+
+
+def emit_events(events: List[Dict[str, Any]]) -> int:
+    """
+    Queue events for delivery (one outbox write). Nothing is queued while
+    webhooks_enabled is off. Failures are logged: ingestion must not fail
+    because of a webhook.
+    """
+    if not events or not settings.webhooks_enabled:
+        return 0
+    try:
+        return webhook_dispatcher.enqueue(events)
+    except Exception as e:
+        print(f"Warning: could not queue {len(events)} webhook event(s): {e}")
+        return 0
+
+
+def _to_endpoint(row: Dict[str, Any]) -> WebhookEndpoint:
+    return WebhookEndpoint(
+        id=str(row["id"]),
+        url=row["url"],
+        event_types=row.get("event_types") or [],
+        project_id=str(row["project_id"]) if row.get("project_id") else None,
+        max_concurrency=row["max_concurrency"],
+        is_active=row["is_active"],
+        created_at=str(row["created_at"]),
+    )
+
+
+def create_endpoint(data: WebhookEndpointCreate) -> WebhookEndpointCreated:
+    unknown = sorted(set(data.event_types) - set(EVENT_TYPES))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown event types {unknown}; expected {list(EVENT_TYPES)}")
+    secret = data.secret or secrets.token_hex(32)
+    row = WebhookQueries.create_endpoint({
+        "url": data.url,
+        "secret": secret,
+        "event_types": data.event_types,
+        "project_id": data.project_id,
+        "max_concurrency": data.max_concurrency,
+    })
+    return WebhookEndpointCreated(**_to_endpoint(row).model_dump(), secret=secret)
+
+
+def list_endpoints() -> WebhookEndpointsResponse:
+    return WebhookEndpointsResponse(endpoints=[_to_endpoint(row) for row in WebhookQueries.get_endpoints()])
+
+
+def _require_endpoint(endpoint_id: str) -> None:
+    if not WebhookQueries.get_endpoint(endpoint_id):
+        raise HTTPException(status_code=404, detail=f"Webhook endpoint {endpoint_id} not found")
+
+
+def delete_endpoint(endpoint_id: str) -> None:
+    _require_endpoint(endpoint_id)
+    WebhookQueries.delete_endpoint(endpoint_id)
+
+
+def list_dead_letters(endpoint_id: str, limit: int = 100) -> DeadLettersResponse:
+    _require_endpoint(endpoint_id)
+    rows = WebhookQueries.get_dead_letters(endpoint_id, max(1, min(limit, 1000)))
+    return DeadLettersResponse(
+        endpoint_id=endpoint_id,
+        dead_letters=[
+            DeadLetter(
+                id=row["id"],
+                event_id=str(row["event_id"]),
+                event_type=row["event_type"],
+                payload=row["payload"],
+                attempts=row["attempts"],
+                last_error=row.get("last_error"),
+                created_at=str(row["created_at"]),
+            )
+            for row in rows
+        ],
+    )
+
+
+def replay_dead_letters(endpoint_id: str) -> ReplayResponse:
+    _require_endpoint(endpoint_id)
+    requeued = WebhookQueries.replay_dead_letters(endpoint_id)
+    webhook_dispatcher.wake()
+    return ReplayResponse(endpoint_id=endpoint_id, requeued=requeued)
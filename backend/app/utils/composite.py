@@ -0,0 +1,148 @@
+"""Cloud-masked multi-date compositing, one scene at a time
+
+A single least-cloudy scene per window still carries residual cloud,
+haze and shadow, which show up as false NDVI drops. A composite of every
+acquisition in the window, with SCL-masked pixels left out, is far more
+stable. Scenes are added one by one, so only the accumulators stay in
+memory (O(pixels), independent of the number of scenes):
+
+- "median": per-pixel median of the clear observations. Each pixel keeps
+  a reservoir of at most `samples` observations, so the median is exact
+  up to that many clear observations and an unbiased sample median above
+- "weighted": per-pixel mean weighted by SCL class quality (vegetation,
+  bare soil and water count fully, unclassified / dark pixels less)
+
+RGB is the quality-weighted mean for both methods. Accumulators can live
+in memory-mapped .npy files for large AOIs.
+"""
+
+import os
+import warnings
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.utils.raster import allocate, row_blocks
+
+# SCL class -> quality weight; 0 = masked (no data, saturated, cloud
+# shadow, cloud medium/high, cirrus)
+SCL_QUALITY = np.zeros(256, dtype=np.float32)
+SCL_QUALITY[[4, 5, 6]] = 1.0  # vegetation, bare soil, water
+SCL_QUALITY[7] = 0.5  # unclassified
+SCL_QUALITY[2] = 0.3  # dark area pixels (often unflagged shadow)
+SCL_QUALITY[11] = 0.2  # snow / ice
+
+METHODS = ("median", "weighted")
+
+
+class Compositor:
+    """Streaming per-pixel composite of NDVI and RGB over a stack of scenes"""
+
+    def __init__(
+        self,
+        shape: Tuple[int, int],
+        method: str = "median",
+        samples: int = 5,
+        block_rows: Optional[int] = None,
+        workdir: Optional[str] = None,
+        name: str = "composite",
+        seed: int = 0,
+    ):
+        if method not in METHODS:
+            raise ValueError(f"Unknown composite method {method!r}; expected one of {METHODS}")
+        self.shape = shape
+        self.method = method
+        self.samples = samples
+        self.block_rows = block_rows
+        self.scenes = 0
+        self._workdir = workdir
+        self._name = name
+        self._rng = np.random.default_rng(seed)
+
+        def buffer(layer: str, extra: Tuple[int, ...], dtype) -> np.ndarray:
+            shape_ = extra + shape if layer == "reservoir" else shape + extra
+            return allocate(shape_, dtype, self._path(f"acc_{layer}"))
+
+        self.count = buffer("count", (), np.uint16)  # clear observations per pixel
+        self.observed = buffer("observed", (), np.int32)  # ordinal of the latest clear day, 0 = never
+        self.weight = buffer("weight", (), np.float32)
+        self.rgb_sum = buffer("rgb_sum", (3,), np.float32)
+        if method == "median":
+            self.reservoir = buffer("reservoir", (samples,), np.float32)
+            for block in row_blocks(shape[0], block_rows):
+                self.reservoir[:, block] = np.nan
+        else:
+            self.ndvi_sum = buffer("ndvi_sum", (), np.float32)
+
+    def _path(self, layer: str) -> Optional[str]:
+        return os.path.join(self._workdir, f"{self._name}_{layer}.npy") if self._workdir else None
+
+    def add(self, scene: Dict[str, np.ndarray], day: Optional[date] = None) -> int:
+        """
+        Add one scene (ndvi, scl and optionally rgb layers, as returned by
+        SentinelService.fetch_scene) acquired on `day`. Scenes must be added
+        in date order for `observed` to hold the latest clear day. Returns
+        the scene's number of clear pixels.
+        """
+        clear_total = 0
+        for block in row_blocks(self.shape[0], self.block_rows):
+            ndvi = np.asarray(scene["ndvi"][block], dtype=np.float32)
+            quality = SCL_QUALITY[np.asarray(scene["scl"][block])]
+            clear = np.isfinite(ndvi) & (quality > 0)
+            clear_total += int(clear.sum())
+
+            weight = np.where(clear, quality, 0).astype(np.float32)
+            self.weight[block] += weight
+            if "rgb" in scene:
+                self.rgb_sum[block] += weight[..., None] * np.asarray(scene["rgb"][block], dtype=np.float32)
+
+            if self.method == "weighted":
+                self.ndvi_sum[block] += np.where(clear, ndvi * weight, 0)
+            else:
+                self._sample(block, ndvi, clear)
+
+            self.count[block] += clear
+            if day is not None:
+                self.observed[block] = np.where(clear, day.toordinal(), self.observed[block])
+        self.scenes += 1
+        return clear_total
+
+    def _sample(self, block: slice, ndvi: np.ndarray, clear: np.ndarray) -> None:
+        """Reservoir sampling: the n-th observation replaces a random slot with p = k/n"""
+        count = np.asarray(self.count[block]).astype(np.int64)
+        rows, cols = np.nonzero(clear)
+        seen = count[rows, cols]
+        slot = np.where(seen < self.samples, seen, self._rng.integers(0, seen + 1))
+        keep = slot < self.samples
+        reservoir = self.reservoir[:, block]
+        reservoir[slot[keep], rows[keep], cols[keep]] = ndvi[rows[keep], cols[keep]]
+        self.reservoir[:, block] = reservoir
+
+    def result(self) -> Dict[str, np.ndarray]:
+        """
+        Composite layers: ndvi (float32, NaN where never seen clear), rgb
+        (uint8), count (clear observations per pixel) and observed (ordinal
+        of the latest clear day, 0 = never).
+        """
+        out = {
+            "ndvi": allocate(self.shape, np.float32, self._path("ndvi")),
+            "rgb": allocate(self.shape + (3,), np.uint8, self._path("rgb")),
+            "count": allocate(self.shape, np.uint16, self._path("count")),
+            "observed": allocate(self.shape, np.int32, self._path("observed")),
+        }
+        for block in row_blocks(self.shape[0], self.block_rows):
+            weight = np.asarray(self.weight[block])
+            seen = weight > 0
+            safe = np.where(seen, weight, 1)
+            if self.method == "weighted":
+                ndvi = np.where(seen, self.ndvi_sum[block] / safe, np.nan)
+            else:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN pixels
+                    ndvi = np.nanmedian(self.reservoir[:, block], axis=0)
+            out["ndvi"][block] = ndvi
+            out["rgb"][block] = np.clip(np.rint(self.rgb_sum[block] / safe[..., None]), 0, 255)
+            out["count"][block] = self.count[block]
+            out["observed"][block] = self.observed[block]
+        return out
@@ -0,0 +1,37 @@
+"""Canonical fingerprints for run deduplication"""
+
+import hashlib
+import json
+from datetime import date
+from typing import Any, Optional
+
+
+def run_fingerprint(
+    geomarker_id: str,
+    start_date: date | str,
+    end_date: date | str,
+    method: str,
+    cloud_threshold: int,
+    parameters: Optional[dict[str, Any]] = None,
+) -> str:
+    """
+    Hash of everything that determines a run's analysis output.
+
+    Geomarker IDs are per version, so a new boundary version gets a new
+    fingerprint. Cadence is excluded: it only affects scheduling. Parameters
+    are serialized with sorted keys so key order never matters.
+    """
+    canonical = json.dumps(
+        {
+            "geomarker_id": str(geomarker_id),
+            "start_date": str(start_date)[:10],
+            "end_date": str(end_date)[:10],
+            "method": method.strip().lower(),
+            "cloud_threshold": int(cloud_threshold),
+            "parameters": parameters or {},
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
@@ -0,0 +1,111 @@
+"""Streaming GeoJSON reader: features of a FeatureCollection one at a time
+
+iter_features() reads a FeatureCollection from an iterable of byte chunks
+(e.g. an HTTP response body) and yields each feature as soon as it has
+been read, so memory holds one feature plus the read buffer instead of
+the whole document. Values are decoded with json.JSONDecoder.raw_decode;
+when a value runs past the buffered text, at least as much text again is
+read before retrying, which keeps re-decoding of large features linear.
+
+Top-level members other than "features" (type, bbox, crs, ...) are read
+and skipped wherever they appear.
+"""
+
+import codecs
+import json
+from typing import Any, Dict, Iterable, Iterator
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+MIN_READ_CHARS = 64 * 1024
+
+
+class _Reader:
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Drop consumed text and read more; False once the stream is exhausted"""
+        if self.eof:
+            return False
+        pieces = [self.buf[self.pos:]]
+        self.pos = 0
+        size, target = len(pieces[0]), max(2 * len(pieces[0]), MIN_READ_CHARS)
+        while size < target:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.eof = True
+                pieces.append(self._utf8.decode(b"", final=True))
+                break
+            text = self._utf8.decode(chunk)
+            pieces.append(text)
+            size += len(text)
+        self.buf = "".join(pieces)
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of stream), not consumed"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Invalid GeoJSON: expected {char!r}, found {found or 'end of stream'!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if not self.fill():
+                    raise ValueError(f"Invalid GeoJSON: {e}") from None
+                continue
+            # A number ending with the buffer may continue in the next chunk
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_features(chunks: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    """Yield the features of a FeatureCollection read from byte chunks"""
+    reader = _Reader(chunks)
+    reader.expect("{")
+    while True:
+        char = reader.peek()
+        if char == "}":
+            return
+        if char == ",":
+            reader.pos += 1
+            continue
+        if not char:
+            raise ValueError("Invalid GeoJSON: truncated document")
+        key = reader.value()
+        reader.expect(":")
+        if key != "features":
+            reader.value()
+            continue
+        reader.expect("[")
+        while True:
+            char = reader.peek()
+            if char == "]":
+                reader.pos += 1
+                break
+            if char == ",":
+                reader.pos += 1
+                continue
+            if not char:
+                raise ValueError("Invalid GeoJSON: truncated features array")
+            yield reader.value()
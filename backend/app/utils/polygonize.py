@@ -0,0 +1,331 @@
+"""Raster-to-vector: labelled loss patches -> GeoJSON polygons
+
+polygonize() turns the label raster of analysis_service.detect_change()
+into a FeatureCollection with one feature per loss patch:
+- Boundary edges between loss and non-loss pixels are extracted with array
+  operations, a block of rows at a time (memmaps are never loaded whole)
+- Every edge keeps the patch on its left, so each edge has exactly one
+  successor (found with one sort + searchsorted); rings are the cycles of
+  that successor array, ordered with pointer doubling instead of a Python
+  walk, and ring areas/orientations are segment sums over all rings at once
+- At saddle points (two patch pixels touching diagonally) the ring turns
+  left, so rings never self-intersect; diagonal-only parts of a patch
+  become separate polygons of a MultiPolygon
+- Outer rings are counter-clockwise and holes clockwise (RFC 7946)
+- Only corner vertices are kept, then rings are simplified with
+  Douglas-Peucker (tolerance in pixels)
+- Patches under the minimum mapping unit are dropped before tracing
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from app.utils.geo import EARTH_RADIUS_M, BBox
+from app.utils.raster import row_blocks
+
+# Edge directions, counter-clockwise order: a left turn is (d + 1) % 4
+EAST, NORTH, WEST, SOUTH = 0, 1, 2, 3
+DIRECTION_XY = np.array([[1, 0], [0, 1], [-1, 0], [0, -1]])  # (x=col, y=-row)
+
+
+def _boundary_edges(labels: np.ndarray, block_rows: Optional[int]) -> Tuple[np.ndarray, ...]:
+    """All patch boundary edges as (start_vertex, end_vertex, direction, label)"""
+    rows, cols = labels.shape
+    stride = cols + 1  # vertex key = row * stride + col on the pixel-corner grid
+    starts, ends, dirs, labs = [], [], [], []
+
+    for block in row_blocks(rows, block_rows):
+        r0, r1 = block.start, block.stop
+        padded = np.zeros((r1 - r0 + 2, cols + 2), dtype=np.int32)
+        padded[1:-1, 1:-1] = labels[r0:r1]
+        if r0 > 0:
+            padded[0, 1:-1] = labels[r0 - 1]
+        if r1 < rows:
+            padded[-1, 1:-1] = labels[r1]
+        core = padded[1:-1, 1:-1]
+        inside = core > 0
+
+        sides = (
+            (padded[:-2, 1:-1], WEST, (0, 1), (0, 0)),  # top edge, walked west
+            (padded[2:, 1:-1], EAST, (1, 0), (1, 1)),  # bottom edge, walked east
+            (padded[1:-1, :-2], SOUTH, (0, 0), (1, 0)),  # left edge, walked south
+            (padded[1:-1, 2:], NORTH, (1, 1), (0, 1)),  # right edge, walked north
+        )
+        for neighbour, direction, (sr, sc), (er, ec) in sides:
+            rr, cc = np.nonzero(inside & (neighbour == 0))
+            r = rr.astype(np.int64) + r0
+            c = cc.astype(np.int64)
+            starts.append((r + sr) * stride + c + sc)
+            ends.append((r + er) * stride + c + ec)
+            dirs.append(np.full(len(r), direction, dtype=np.int8))
+            labs.append(core[rr, cc])
+
+    return (
+        np.concatenate(starts),
+        np.concatenate(ends),
+        np.concatenate(dirs),
+        np.concatenate(labs),
+    )
+
+
+def _successors(starts: np.ndarray, ends: np.ndarray, dirs: np.ndarray) -> np.ndarray:
+    """Index of the edge that continues each edge's ring"""
+    order = np.argsort(starts, kind="stable")
+    sorted_starts = starts[order]
+    first = np.searchsorted(sorted_starts, ends, side="left")
+    count = np.searchsorted(sorted_starts, ends, side="right") - first
+    successor = order[first]
+    # Saddle vertex: two outgoing edges, take the left turn
+    saddle = count == 2
+    alternative = order[np.minimum(first + 1, len(order) - 1)]
+    take_alternative = saddle & (dirs[successor] != (dirs + 1) % 4)
+    successor[take_alternative] = alternative[take_alternative]
+    return successor
+
+
+def _jump_to(successor: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """First edge with `target` set at or after each edge's successor (pointer doubling)"""
+    nxt = successor.copy()
+    pending = ~target[nxt]
+    while pending.any():
+        nxt[pending] = nxt[nxt[pending]]
+        pending = ~target[nxt]
+    return nxt
+
+
+def _order_rings(successor: np.ndarray, dirs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Corner edges of every ring in walking order.
+
+    Returns (edges, offsets): edges[offsets[k]:offsets[k + 1]] is ring k.
+    """
+    n = len(successor)
+    predecessor = np.empty(n, dtype=np.int64)
+    predecessor[successor] = np.arange(n)
+    corner = dirs != dirs[predecessor]
+
+    corners = np.flatnonzero(corner)
+    compact = np.full(n, -1, dtype=np.int64)
+    compact[corners] = np.arange(len(corners))
+    nxt = compact[_jump_to(successor, corner)[corners]]
+    m = len(corners)
+
+    _, ring = connected_components(
+        coo_matrix((np.ones(m), (np.arange(m), nxt)), shape=(m, m)), directed=True, connection="weak"
+    )
+    # List ranking: distance to the ring's last corner (the one before its
+    # smallest index), by pointer doubling
+    first_of_ring = np.full(ring.max() + 1, m, dtype=np.int64)
+    np.minimum.at(first_of_ring, ring, np.arange(m))
+    last = nxt == first_of_ring[ring]
+    pointer = np.where(last, np.arange(m), nxt)
+    distance = (~last).astype(np.int64)
+    while True:
+        moving = pointer != pointer[pointer]
+        if not moving.any():
+            break
+        distance[moving] += distance[pointer[moving]]
+        pointer[moving] = pointer[pointer[moving]]
+
+    order = np.lexsort((-distance, ring))
+    offsets = np.flatnonzero(np.r_[True, np.diff(ring[order]) != 0, True])
+    return corners[order], offsets
+
+
+def simplify_ring(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Douglas-Peucker on a closed ring given without its closing vertex.
+
+    Returns the indices of the vertices to keep.
+    """
+    n = len(points)
+    if tolerance <= 0 or n <= 4:
+        return np.arange(n)
+    far = int(np.argmax(((points - points[0]) ** 2).sum(axis=1)))
+    closed = np.vstack([points, points[:1]])
+    keep = np.zeros(n + 1, dtype=bool)
+    keep[[0, far, n]] = True
+    stack = [(0, far), (far, n)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        a, b = closed[i], closed[j]
+        offsets = closed[i + 1:j] - a
+        ab = b - a
+        length = float(np.hypot(*ab))
+        if length == 0:
+            dist = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            dist = np.abs(ab[0] * offsets[:, 1] - ab[1] * offsets[:, 0]) / length
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            mid = i + 1 + k
+            keep[mid] = True
+            stack += [(i, mid), (mid, j)]
+    kept = np.flatnonzero(keep[:-1])
+    return kept if len(kept) >= 3 else np.arange(n)
+
+
+def _inside(point: np.ndarray, ring: np.ndarray) -> bool:
+    """Even-odd point-in-ring test (ring without closing vertex)"""
+    x, y = point
+    x1, y1 = ring[:, 0], ring[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return bool(np.count_nonzero(crosses & (x < x_at)) % 2)
+
+
+def _confidence_scores(mean_delta: np.ndarray, ndvi_threshold: float) -> np.ndarray:
+    """0.5 at the threshold drop, 1.0 at twice the threshold drop"""
+    scale = abs(ndvi_threshold) or 0.2
+    return np.clip(-mean_delta / (2 * scale), 0.0, 1.0)
+
+
+def polygonize(
+    labels: np.ndarray,
+    bbox: BBox,
+    delta: Optional[np.ndarray] = None,
+    pixel_ha: float = 0.0,
+    min_area_ha: float = 0.0,
+    simplify_px: float = 0.5,
+    ndvi_threshold: float = -0.2,
+    block_rows: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Vectorize a label raster (0 = no loss, 1..n = patch id) into a GeoJSON
+    FeatureCollection.
+
+    Feature properties: id, area_ha (geodesic, from the unsimplified pixel
+    outline), confidence ('high' | 'medium' | 'low', from the mean NDVI
+    drop), confidence_score, mean_delta_ndvi, pixel_count.
+
+    Args:
+        labels: (rows, cols) int raster over bbox, row 0 = north (may be a memmap)
+        delta: delta-NDVI raster used for confidence (optional)
+        pixel_ha: pixel area, used for the min_area_ha pre-filter
+        min_area_ha: minimum mapping unit; smaller patches are dropped
+        simplify_px: Douglas-Peucker tolerance in pixels (0 = exact outline)
+    """
+    rows, cols = labels.shape
+    n_labels = max((int(np.max(labels[b], initial=0)) for b in row_blocks(rows, block_rows)), default=0)
+
+    # Per-patch pixel counts and delta sums in one pass over the blocks
+    counts = np.zeros(n_labels + 1, dtype=np.int64)
+    delta_sums = np.zeros(n_labels + 1, dtype=np.float64)
+    for block in row_blocks(rows, block_rows):
+        block_labels = np.asarray(labels[block]).ravel()
+        counts += np.bincount(block_labels, minlength=n_labels + 1)
+        if delta is not None:
+            weights = np.nan_to_num(np.asarray(delta[block], dtype=np.float64).ravel())
+            delta_sums += np.bincount(block_labels, weights=weights, minlength=n_labels + 1)
+
+    kept = (counts * pixel_ha >= min_area_ha) & (counts > 0)
+    kept[0] = False
+    empty = {"type": "FeatureCollection", "features": []}
+    if not kept.any():
+        return empty
+
+    starts, ends, dirs, labs = _boundary_edges(labels, block_rows)
+    mask = kept[labs]
+    starts, ends, dirs, labs = starts[mask], ends[mask], dirs[mask], labs[mask]
+    if not len(starts):
+        return empty
+    successor = _successors(starts, ends, dirs)
+
+    stride = cols + 1
+    min_lng, min_lat, max_lng, max_lat = bbox
+    dx = (max_lng - min_lng) / cols
+    dy = (max_lat - min_lat) / rows
+
+    edges, offsets = _order_rings(successor, dirs)
+    ring_starts = offsets[:-1]
+    ring_sizes = np.diff(offsets)
+    ring_labels = labs[edges[ring_starts]]
+
+    # Vertex coordinates in pixel units (x = col, y = -row) and lng/lat
+    keys = starts[edges]
+    x = (keys % stride).astype(np.float64)
+    y = -(keys // stride).astype(np.float64)
+    following = np.arange(len(keys)) + 1
+    following[offsets[1:] - 1] = ring_starts  # close every ring
+    lng = min_lng + x * dx
+    lat = max_lat + y * dy
+
+    # Orientation (shoelace) and geodesic area of every ring at once
+    signed = np.add.reduceat(x * y[following] - x[following] * y, ring_starts) / 2
+    rad_lng, rad_lat = np.radians(lng), np.radians(lat)
+    excess = (rad_lng[following] - rad_lng) * (2 + np.sin(rad_lat) + np.sin(rad_lat[following]))
+    ring_ha = np.abs(np.add.reduceat(excess, ring_starts)) * EARTH_RADIUS_M ** 2 / 2 / 10_000
+    is_outer = signed > 0
+    area_ha = np.bincount(ring_labels, weights=np.where(is_outer, ring_ha, -ring_ha), minlength=n_labels + 1)
+
+    points = np.column_stack([x, y])
+    lnglat = np.round(np.column_stack([lng, lat]), 7).tolist()
+    offset_list = offsets.tolist()
+
+    def ring_coordinates(k: int) -> list:
+        start, stop = offset_list[k], offset_list[k + 1]
+        if simplify_px > 0 and stop - start > 4:
+            coords = [lnglat[start + i] for i in simplify_ring(points[start:stop], simplify_px).tolist()]
+        else:
+            coords = lnglat[start:stop]
+        return coords + coords[:1]
+
+    outers: Dict[int, List[int]] = {}
+    holes: Dict[int, List[int]] = {}
+    for k, (label, outer) in enumerate(zip(ring_labels.tolist(), is_outer.tolist())):
+        (outers if outer else holes).setdefault(label, []).append(k)
+
+    # Per-patch properties for all patches at once
+    if delta is not None:
+        mean_delta = delta_sums / np.maximum(counts, 1)
+    else:
+        mean_delta = np.full(n_labels + 1, ndvi_threshold)
+    scores = np.round(_confidence_scores(mean_delta, ndvi_threshold), 3).tolist()
+    area_list = np.round(area_ha, 4).tolist()
+    mean_list = np.round(mean_delta, 4).tolist()
+    count_list = counts.tolist()
+
+    features = []
+    for label in sorted(outers):
+        polygons = [[k] for k in outers[label]]
+        for k in holes.get(label, []):
+            owner = 0
+            if len(polygons) > 1:
+                # Centre of the patch pixel left of the hole's first edge
+                edge = edges[ring_starts[k]]
+                step = DIRECTION_XY[dirs[edge]]
+                probe = points[ring_starts[k]] + step * 0.5 + np.array([-step[1], step[0]]) * 0.5
+                owner = next(
+                    (i for i, p in enumerate(polygons) if _inside(probe, points[offsets[p[0]]:offsets[p[0] + 1]])),
+                    0,
+                )
+            polygons[owner].append(k)
+
+        coordinates = [[ring_coordinates(k) for k in p] for p in polygons]
+        if len(coordinates) == 1:
+            geometry = {"type": "Polygon", "coordinates": coordinates[0]}
+        else:
+            geometry = {"type": "MultiPolygon", "coordinates": coordinates}
+
+        score = scores[label]
+        features.append({
+            "type": "Feature",
+            "geometry": geometry,
+            "properties": {
+                "id": str(label),
+                "area_ha": area_list[label],
+                "confidence": "high" if score >= 0.75 else "medium" if score >= 0.6 else "low",
+                "confidence_score": score,
+                "mean_delta_ndvi": mean_list[label] if delta is not None else None,
+                "pixel_count": count_list[label],
+            },
+        })
+
+    return {"type": "FeatureCollection", "features": features}
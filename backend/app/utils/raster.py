@@ -0,0 +1,203 @@
+"""Raster tiling, memory-mapped mosaics and block-wise PNG encoding
+
+Large AOIs (e.g. a 12,000 ha corridor at 10 m) exceed the Sentinel Hub
+per-request size limit and do not comfortably fit in RAM, so:
+- plan_tiles() splits the raster into pixel-aligned tiles under the limit
+- fetch_tiled() / fetch_tiled_layers() fetch tiles concurrently into one
+  mosaic per output, each a .npy memmap on disk when a path is given
+- row_blocks() / encode_png() let callers process and encode the mosaic a
+  band of rows at a time, keeping peak memory bounded
+"""
+
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.geo import BBox, bbox_size_m
+
+# Sentinel Hub Process API: at most 2500 x 2500 px per request
+MAX_TILE_PX = 2500
+
+
+@dataclass(frozen=True)
+class Tile:
+    row: int
+    col: int
+    rows: int
+    cols: int
+    bbox: BBox
+
+    @property
+    def window(self) -> Tuple[slice, slice]:
+        return slice(self.row, self.row + self.rows), slice(self.col, self.col + self.cols)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height), the order SentinelHubRequest expects"""
+        return self.cols, self.rows
+
+
+def raster_shape(bbox: BBox, resolution: float) -> Tuple[int, int]:
+    """(rows, cols) of a raster covering bbox at `resolution` metres per pixel"""
+    width, height = bbox_size_m(bbox)
+    return max(1, round(height / resolution)), max(1, round(width / resolution))
+
+
+def plan_tiles(bbox: BBox, shape: Tuple[int, int], max_tile_px: int = MAX_TILE_PX) -> List[Tile]:
+    """
+    Split a (rows, cols) raster over bbox into near-equal tiles of at most
+    max_tile_px per side. Tile bboxes follow pixel edges exactly, so the
+    tiles mosaic back without gaps or overlap. Row 0 is the northern edge.
+    """
+    rows, cols = shape
+    min_lng, min_lat, max_lng, max_lat = bbox
+    dx = (max_lng - min_lng) / cols
+    dy = (max_lat - min_lat) / rows
+    row_edges = np.linspace(0, rows, -(-rows // max_tile_px) + 1).round().astype(int)
+    col_edges = np.linspace(0, cols, -(-cols // max_tile_px) + 1).round().astype(int)
+
+    tiles = []
+    for r0, r1 in zip(row_edges[:-1], row_edges[1:]):
+        for c0, c1 in zip(col_edges[:-1], col_edges[1:]):
+            tiles.append(Tile(
+                row=int(r0),
+                col=int(c0),
+                rows=int(r1 - r0),
+                cols=int(c1 - c0),
+                bbox=(min_lng + c0 * dx, max_lat - r1 * dy, min_lng + c1 * dx, max_lat - r0 * dy),
+            ))
+    return tiles
+
+
+def allocate(shape: Tuple[int, ...], dtype: Any, path: Optional[str] = None) -> np.ndarray:
+    """Zeroed array, memory-mapped to a .npy file at `path` when given"""
+    if path is None:
+        return np.zeros(shape, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+
+def row_blocks(rows: int, block_rows: Optional[int]) -> Iterator[slice]:
+    """Consecutive row slices of at most block_rows rows (all rows if None)"""
+    step = max(1, block_rows or rows)
+    for start in range(0, rows, step):
+        yield slice(start, min(start + step, rows))
+
+
+def fetch_tiled_layers(
+    fetch: Callable[..., Tuple[Dict[str, np.ndarray], Any]],
+    bbox: BBox,
+    shape: Tuple[int, int],
+    layers: Dict[str, Tuple[Tuple[int, ...], Any]],
+    paths: Optional[Dict[str, str]] = None,
+    max_tile_px: int = MAX_TILE_PX,
+    max_workers: int = 4,
+    **fetch_kwargs: Any,
+) -> Dict[str, np.ndarray]:
+    """
+    Fetch several aligned mosaics (e.g. rgb, ndvi, scl) tile by tile.
+
+    `layers` maps output name -> (extra dims, dtype), e.g. {"rgb": ((3,), uint8),
+    "ndvi": ((), float32)}. `fetch` is called as
+    fetch(tile_bbox, size=(width, height), **fetch_kwargs) and returns
+    ({name: array}, metadata), like SentinelService.fetch_scene. Tiles are
+    fetched by up to max_workers threads and written straight into the
+    mosaics (memory-mapped to paths[name] when given), so at most
+    max_workers tiles are held in memory at once.
+    """
+    paths = paths or {}
+    out = {
+        name: allocate(shape + tuple(extra), dtype, paths.get(name))
+        for name, (extra, dtype) in layers.items()
+    }
+
+    def load(tile: Tile) -> None:
+        data, _ = fetch(tile.bbox, size=tile.size, **fetch_kwargs)
+        for name, mosaic in out.items():
+            array = np.asarray(data[name])[: tile.rows, : tile.cols]
+            if mosaic.ndim == 3:
+                if array.ndim == 2:
+                    array = array[..., None]
+                array = array[..., : mosaic.shape[2]]
+            elif array.ndim == 3:
+                array = array[..., 0]
+            mosaic[tile.window] = array
+
+    tiles = plan_tiles(bbox, shape, max_tile_px)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tiles)))) as pool:
+        # list() re-raises the first tile error
+        list(pool.map(load, tiles))
+
+    for mosaic in out.values():
+        if isinstance(mosaic, np.memmap):
+            mosaic.flush()
+    return out
+
+
+def fetch_tiled(
+    fetch: Callable[..., Tuple[np.ndarray, Any]],
+    bbox: BBox,
+    shape: Tuple[int, int],
+    channels: int,
+    dtype: Any,
+    path: Optional[str] = None,
+    max_tile_px: int = MAX_TILE_PX,
+    max_workers: int = 4,
+    **fetch_kwargs: Any,
+) -> np.ndarray:
+    """
+    Fetch one (rows, cols, channels) mosaic tile by tile.
+
+    Same as fetch_tiled_layers() for a fetch returning (array, metadata),
+    like SentinelService.fetch_rgb_image.
+    """
+    def fetch_one(tile_bbox: BBox, **kwargs: Any) -> Tuple[Dict[str, np.ndarray], Any]:
+        data, metadata = fetch(tile_bbox, **kwargs)
+        return {"data": data}, metadata
+
+    return fetch_tiled_layers(
+        fetch_one,
+        bbox,
+        shape,
+        {"data": ((channels,), dtype)},
+        paths={"data": path} if path else None,
+        max_tile_px=max_tile_px,
+        max_workers=max_workers,
+        **fetch_kwargs,
+    )["data"]
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode_png(image: np.ndarray, block_rows: int = 512) -> bytes:
+    """
+    Encode a uint8 (rows, cols), (rows, cols, 3) or (rows, cols, 4) array as
+    PNG, compressing block_rows rows at a time (works on memmaps without
+    loading them).
+    """
+    rows, cols = image.shape[:2]
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    color_type = {1: 0, 3: 2, 4: 6}[channels]
+
+    parts = [
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", struct.pack(">IIBBBBB", cols, rows, 8, color_type, 0, 0, 0)),
+    ]
+    compressor = zlib.compressobj(6)
+    for block in row_blocks(rows, block_rows):
+        pixels = np.asarray(image[block])
+        if pixels.dtype != np.uint8:
+            pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+        scanlines = np.zeros((pixels.shape[0], 1 + cols * channels), dtype=np.uint8)
+        scanlines[:, 1:] = pixels.reshape(pixels.shape[0], -1)  # filter byte 0 = None
+        data = compressor.compress(scanlines.tobytes())
+        if data:
+            parts.append(_png_chunk(b"IDAT", data))
+    parts.append(_png_chunk(b"IDAT", compressor.flush()))
+    parts.append(_png_chunk(b"IEND", b""))
+    return b"".join(parts)
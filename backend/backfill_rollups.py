@@ -0,0 +1,20 @@
+"""
+Backfill Project Rollups
+
+One-shot job after running 13_project_rollups.sql. This script will:
+1. Recompute every project's rollup (run count, total hectares lost,
+   trend, worst run) from its completed runs, in one statement
+2. Mark every completed run as rolled up, so later ingestions only add
+   their own difference
+
+Safe to re-run at any time (e.g. after a failed rollup update was logged).
+"""
+
+from app.services.rollup_service import backfill_rollups
+
+
+if __name__ == "__main__":
+    print("\n📈 Project Rollup Backfill")
+    print("=" * 70)
+    projects = backfill_rollups()
+    print(f"✅ Rolled up {projects} projects")
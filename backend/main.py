@@ -1,12 +1,35 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.router import api_router
+from app.config import settings
+from app.services.cadence_service import cadence_scheduler
+from app.services.analytics_service import analytics_refresher
+from app.services.webhook_service import webhook_dispatcher
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background workers with the app and stop them on shutdown"""
+    tasks = []
+    if settings.cadence_scheduler_enabled:
+        tasks.append(asyncio.create_task(cadence_scheduler.run_forever()))
+    if settings.analytics_refresh_enabled:
+        tasks.append(asyncio.create_task(analytics_refresher.run_forever()))
+    if settings.webhooks_enabled:
+        tasks.append(asyncio.create_task(webhook_dispatcher.run_forever()))
+    yield
+    for task in tasks:
+        task.cancel()
+
 
 def create_app() -> FastAPI:
     app = FastAPI(
         title="Bioma API",
         version="0.1.0",
-        description="Backend API for Bioma deforestation monitoring system"
+        description="Backend API for Bioma deforestation monitoring system",
+        lifespan=lifespan,
     )
     
     # Configure CORS - Allow all origins for ngrok/demo deployment
@@ -3,9 +3,12 @@ Populate Satellite Images for All Projects
 
 This script will:
 1. Get all active projects from your database
-2. For each project, fetch current and historical satellite images
-3. Store the images in Supabase storage
-4. Update the project records with image URLs
+2. For each project, look up available acquisitions in the Sentinel Hub
+   catalog and pick the clearest date near "now" and near the baseline,
+   widening the search window when none is clear enough
+3. Fetch current and historical satellite images for those dates
+4. Store the images in Supabase storage
+5. Update the project records with image URLs
 
 You can run this:
 - Once to populate all projects
@@ -14,6 +17,7 @@ You can run this:
 
 from datetime import datetime, timedelta
 from app.db.queries import ProjectQueries, GeomarkerQueries
+from app.services.catalog_service import find_acquisition
 from app.services.sentinel_service import get_sentinel_service
 from app.db.session import supabase
 import json
@@ -32,6 +36,21 @@ def get_bbox_from_geojson(geojson: dict) -> tuple:
     return tuple(bounds)
 
 
+MAX_CLOUD_COVERAGE = 30
+
+
+def fetch_acquisition(service, bbox: tuple, acquisition):
+    """Fetch the RGB image of one catalog acquisition (a one-day window)"""
+    day = datetime.combine(acquisition.day, datetime.min.time())
+    return service.fetch_rgb_image(
+        bbox=bbox,
+        date_from=day,
+        date_to=day + timedelta(days=1),
+        resolution=20,  # 20m for faster processing
+        max_cloud_coverage=MAX_CLOUD_COVERAGE
+    )
+
+
 def populate_project_images(project_id: str, days_back: int = 30):
     """Fetch and store satellite images for a single project
     
@@ -73,25 +92,21 @@ def populate_project_images(project_id: str, days_back: int = 30):
     date_baseline = date_current - timedelta(days=days_back)
     
     try:
+        # Pick acquisition dates from the catalog (no processing units spent)
+        baseline = find_acquisition(service, bbox, date_baseline.date(), MAX_CLOUD_COVERAGE)
+        current = find_acquisition(service, bbox, date_current.date(), MAX_CLOUD_COVERAGE)
+        if not baseline or not current:
+            missing = "baseline" if not baseline else "current"
+            print(f"   ⚠️  No {missing} acquisition under {MAX_CLOUD_COVERAGE}% cloud, skipping")
+            return None
+        
         # Fetch baseline image
-        print(f"   🛰️  Fetching baseline image ({date_baseline.date()})...")
-        rgb_baseline, _ = service.fetch_rgb_image(
-            bbox=bbox,
-            date_from=date_baseline - timedelta(days=7),
-            date_to=date_baseline + timedelta(days=7),
-            resolution=20,  # 20m for faster processing
-            max_cloud_coverage=30
-        )
+        print(f"   🛰️  Fetching baseline image ({baseline.day}, {baseline.cloud_cover}% cloud)...")
+        rgb_baseline, _ = fetch_acquisition(service, bbox, baseline)
         
         # Fetch current image
-        print(f"   🛰️  Fetching current image ({date_current.date()})...")
-        rgb_current, _ = service.fetch_rgb_image(
-            bbox=bbox,
-            date_from=date_current - timedelta(days=7),
-            date_to=date_current + timedelta(days=7),
-            resolution=20,
-            max_cloud_coverage=30
-        )
+        print(f"   🛰️  Fetching current image ({current.day}, {current.cloud_cover}% cloud)...")
+        rgb_current, _ = fetch_acquisition(service, bbox, current)
         
         # Save images
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -0,0 +1,91 @@
+"""
+Process Queued Runs Locally
+
+This script will:
+1. Claim queued runs one at a time (same lease as a GEE worker, see
+   POST /runs/claim)
+2. Compute NDVI change detection in-process (app/services/analysis_service.py),
+   heartbeating the lease while it runs
+3. Ingest the results exactly like a GEE submission
+
+Runs are claimed one by one so no claimed run waits for the others, and
+the lease is extended every third of run_lease_seconds, so a long analysis
+is never claimed again by another worker. A run that fails stays leased
+and is requeued once its lease expires.
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+from app.config import settings
+from app.services.analysis_service import process_run_locally
+from app.services.runs_service import claim_runs, heartbeat_run
+
+WORKER = "local-numpy"
+
+
+@contextmanager
+def keep_lease(run_id: str, interval: float) -> Iterator[None]:
+    """Heartbeat the run's lease every `interval` seconds until the block exits"""
+    stop = threading.Event()
+
+    def beat() -> None:
+        while not stop.wait(interval):
+            try:
+                heartbeat_run(run_id, WORKER)
+            except Exception as e:
+                print(f"   ⚠️  Could not extend lease on run {run_id}: {e}")
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def process_queued_runs(limit: int = 10) -> int:
+    """Claim and analyze up to `limit` runs, one at a time; returns how many completed"""
+    interval = settings.run_lease_seconds / 3
+    attempted = completed = 0
+    while attempted < limit:
+        claimed = claim_runs(worker=WORKER, limit=1).runs
+        if not claimed:
+            break
+        run = claimed[0]
+        attempted += 1
+        print(f"\n[{attempted}/{limit}] Run {run.id}")
+        try:
+            with keep_lease(run.id, interval):
+                result = process_run_locally(run.id)
+            print(f"   ✅ {result.message}")
+            completed += 1
+        except Exception as e:
+            print(f"   ❌ Failed: {e}")
+
+    print("\n" + "=" * 70)
+    print(f"✅ Completed: {completed}")
+    print(f"❌ Failed: {attempted - completed}")
+    print("=" * 70)
+    return completed
+
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n🛰️  Local NDVI Run Processor")
+    print("=" * 70)
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--help':
+        print("\nUsage:")
+        print("  python process_queued_runs.py              # Claim and process up to 10 runs")
+        print("  python process_queued_runs.py --limit 50   # Claim and process up to 50 runs")
+        sys.exit(0)
+
+    limit = 10
+    if len(sys.argv) > 2 and sys.argv[1] == '--limit':
+        limit = int(sys.argv[2])
+
+    process_queued_runs(limit=limit)
@@ -0,0 +1,103 @@
+"""Alert rule and GET /alerts tests (queries stubbed)"""
+
+from fastapi.testclient import TestClient
+from main import app
+from app.config import settings
+from app.db.queries import AlertQueries, GeomarkerQueries, RollupQueries, RunQueries
+from app.schemas.runs import GEEResultInput
+from app.services.alerts_service import decode_cursor, encode_cursor, evaluate_rules
+from app.services.runs_service import process_gee_result
+
+ZONE = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]}
+GEOMARKERS = {
+    "gm-work": {"id": "gm-work", "geomarker_type": "work_zone",
+                "geojson": {"type": "Feature", "geometry": ZONE, "properties": {"area_hectares": 20}}},
+    "gm-protected": {"id": "gm-protected", "geomarker_type": "protected_zone", "geojson": ZONE},
+}
+
+
+def run(run_id, hectares, geomarker_id="gm-work", project_id="proj-1"):
+    return {"id": run_id, "project_id": project_id, "geomarker_id": geomarker_id, "hectares_change": hectares,
+            "start_date": "2026-01-01", "end_date": "2026-01-28"}
+
+
+def rules(alerts):
+    return sorted((a["run_id"], a["rule"], a["severity"]) for a in alerts)
+
+
+def test_loss_and_risk_jump_rules():
+    rollups = [{"project_id": "proj-1", "last_run_id": "run-2", "last_hectares_change": 12.0,
+                "previous_hectares_change": 1.0, "total_hectares_lost": 13.0}]
+    alerts = evaluate_rules([run("run-1", 0.2), run("run-2", 12.0)], rollups, GEOMARKERS)
+    assert rules(alerts) == [("run-2", "loss_threshold", "critical"), ("run-2", "risk_jump", "critical")]
+    jump = next(a for a in alerts if a["rule"] == "risk_jump")
+    assert jump["metric"]["from"] == "low" and jump["metric"]["to"] == "high"
+    assert jump["geometry"] == ZONE
+
+
+def test_boundary_breach_rules():
+    # Any loss inside a protected zone
+    alerts = evaluate_rules([run("run-1", 0.8, "gm-protected")], [], GEOMARKERS)
+    assert rules(alerts) == [("run-1", "boundary_breach", "critical")]
+
+    # Cumulative loss crossing the authorized 20 ha fires once, on the crossing batch
+    crossing = [{"project_id": "proj-1", "last_run_id": "run-x", "total_hectares_lost": 21.0}]
+    assert rules(evaluate_rules([run("run-3", 2.0)], crossing, GEOMARKERS)) == [("run-3", "boundary_breach", "critical")]
+    after = [{"project_id": "proj-1", "last_run_id": "run-x", "total_hectares_lost": 23.0}]
+    assert evaluate_rules([run("run-4", 2.0)], after, GEOMARKERS) == []
+
+
+def test_ingestion_raises_alerts(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "timeseries_dir", str(tmp_path))
+    stored = []
+    monkeypatch.setattr(RunQueries, "ingest_gee_result", staticmethod(
+        lambda params: {"outcome": "ingested", "run": run(params["p_run_id"], params["p_hectares_change"], "gm-protected")}
+    ))
+    monkeypatch.setattr(RollupQueries, "apply_runs", staticmethod(lambda ids: []))
+    monkeypatch.setattr(GeomarkerQueries, "get_by_ids", staticmethod(lambda ids: [GEOMARKERS[i] for i in ids]))
+    monkeypatch.setattr(AlertQueries, "replace_for_runs", staticmethod(
+        lambda run_ids, alerts: stored.append((run_ids, rules(alerts))) or alerts
+    ))
+
+    process_gee_result(GEEResultInput(
+        project_id="proj-1", run_id="run-1", start_date="2026-01-01", end_date="2026-01-28",
+        stats={"affected_area_ha": 4.0}, outputs={}, loss_polygons_url="", metadata={},
+    ))
+    assert stored == [(["run-1"], [("run-1", "boundary_breach", "critical"), ("run-1", "loss_threshold", "warning")])]
+
+
+def alert_id(i):
+    return f"00000000-0000-4000-8000-{i:012d}"
+
+
+def test_alerts_cursor_pagination(monkeypatch):
+    rows = [
+        {"id": alert_id(i), "project_id": "proj-1", "severity": "warning", "rule": "loss_threshold", "run_id": None,
+         "title": "Vegetation loss detected", "message": "", "created_at": f"2026-01-{i:02d}T00:00:00+00:00"}
+        for i in range(5, 0, -1)
+    ]
+    calls = []
+
+    def get_page(limit, project_id=None, severity=None, rule=None, before=None):
+        calls.append((project_id, severity, before))
+        start = 0 if before is None else next(i for i, r in enumerate(rows) if r["id"] == before[1]) + 1
+        return rows[start:start + limit]
+
+    monkeypatch.setattr(AlertQueries, "get_page", staticmethod(get_page))
+    client = TestClient(app)
+
+    first = client.get("/alerts", params={"limit": 2, "severity": "warning"}).json()
+    assert [a["id"] for a in first["alerts"]] == [alert_id(5), alert_id(4)]
+    second = client.get("/alerts", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [a["id"] for a in second["alerts"]] == [alert_id(3), alert_id(2)]
+    last = client.get("/alerts", params={"limit": 2, "cursor": second["next_cursor"]}).json()
+    assert [a["id"] for a in last["alerts"]] == [alert_id(1)] and last["next_cursor"] is None
+    assert calls[1][2] == ("2026-01-04T00:00:00+00:00", alert_id(4))
+
+    assert decode_cursor(encode_cursor(rows[0])) == (rows[0]["created_at"], alert_id(5))
+    assert client.get("/alerts", params={"cursor": "not-a-cursor"}).status_code == 400
+    # Crafted cursors never reach the PostgREST filter
+    for key in (['2026-01-01",id.gt.0', alert_id(1)], ["2026-01-01T00:00:00Z", "a-1),or(id.gt.0"], [1, 2]):
+        crafted = encode_cursor({"created_at": key[0], "id": key[1]})
+        assert client.get("/alerts", params={"cursor": crafted}).status_code == 400
+    assert client.get("/alerts", params={"severity": "urgent"}).status_code == 400
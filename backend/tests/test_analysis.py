@@ -0,0 +1,194 @@
+"""Local NDVI change detection tests (synthetic rasters, stubbed Sentinel source)"""
+
+import json
+
+import numpy as np
+
+from app.db.queries import GeomarkerQueries, RunQueries
+from app.schemas.runs import GEEResultResponse
+from app.services import analysis_service
+from app.services.analysis_service import analyze_run, cloud_fraction, detect_change
+from app.utils.geo import bbox_from_geojson, pixel_area_ha, polygon_mask
+
+SQUARE = {
+    "type": "Feature",
+    "geometry": {
+        "type": "Polygon",
+        "coordinates": [[[-92.0, 16.0], [-91.99, 16.0], [-91.99, 16.01], [-92.0, 16.01], [-92.0, 16.0]]],
+    },
+}
+
+
+def _forest(shape):
+    return np.full(shape, 0.8, dtype=np.float32)
+
+
+def _cleared(ndvi, rows, cols):
+    out = ndvi.copy()
+    out[rows, cols] = 0.1
+    return out
+
+
+def test_detect_change_labels_patches_and_drops_noise():
+    before = _forest((20, 20))
+    after = _cleared(before, slice(2, 6), slice(2, 6))  # 16 px patch
+    after = _cleared(after, slice(10, 12), slice(14, 16))  # 4 px patch
+    after = _cleared(after, 18, 0)  # single noisy pixel
+
+    result = detect_change(before, after, pixel_ha=0.04, min_loss_pixels=3)
+
+    assert result.stats["loss_pixel_count"] == 20
+    assert result.stats["polygon_count"] == 2
+    assert result.stats["affected_area_ha"] == 0.8
+    assert set(np.unique(result.labels)) == {0, 1, 2}
+    assert not result.loss_mask[18, 0]
+    assert result.stats["mean_delta_ndvi"] < 0
+
+
+def test_detect_change_ignores_invalid_and_outside_pixels():
+    before = _forest((10, 10))
+    after = _cleared(before, slice(0, 10), slice(0, 10))
+    after[:5] = np.nan  # clouds over the north half
+    aoi = np.zeros((10, 10), dtype=bool)
+    aoi[:, :5] = True
+
+    result = detect_change(before, after, pixel_ha=1.0, aoi_mask=aoi)
+
+    assert result.stats["loss_pixel_count"] == 25
+    assert result.stats["valid_pixel_fraction"] == 0.5
+
+
+def test_polygon_mask_and_pixel_area():
+    bbox = bbox_from_geojson(SQUARE)
+    assert bbox == (-92.0, 16.0, -91.99, 16.01)
+    assert polygon_mask(SQUARE, bbox, (8, 8)).all()
+
+    half = {"type": "Polygon", "coordinates": [[[-92.0, 16.0], [-91.995, 16.0], [-91.995, 16.01], [-92.0, 16.01], [-92.0, 16.0]]]}
+    mask = polygon_mask(half, bbox, (8, 8))
+    assert mask[:, :4].all() and not mask[:, 4:].any()
+
+    # ~1.07 km x 1.11 km over 100 x 100 pixels -> ~0.0119 ha each
+    assert abs(pixel_area_ha(bbox, (100, 100)) - 0.0119) < 0.0005
+
+
+class StubSource:
+    """Serves a synthetic scene per call: intact forest, then `cleared` applied"""
+
+    def __init__(self, cleared=None):
+        self.cleared = cleared
+        self.calls = []
+
+    def fetch_scene(self, bbox, date_from, date_to, resolution=20, max_cloud_coverage=30, size=None):
+        self.calls.append((bbox, date_from.date().isoformat(), date_to.date().isoformat(), size))
+        width, height = size
+        ndvi = _forest((height, width))
+        if self.cleared is not None and date_to.date().isoformat() == "2026-01-29":
+            ndvi = self.cleared(ndvi)
+        scene = {
+            "rgb": np.full((height, width, 3), 60, dtype=np.uint8),
+            "ndvi": ndvi,
+            "scl": np.full((height, width, 1), 4, dtype=np.uint8),  # vegetation
+        }
+        return scene, {"bbox": bbox}
+
+
+RUN = {
+    "id": "run-1",
+    "project_id": "proj-1",
+    "geomarker_id": "geo-1",
+    "start_date": "2026-01-01",
+    "end_date": "2026-01-29",
+    "cloud_threshold": 20,
+    "parameters": {"min_loss_pixels": 1},
+}
+
+
+def test_analyze_run_uses_before_and_after_windows():
+    source = StubSource(lambda b: _cleared(b, slice(0, 10), slice(0, 10)))
+
+    analysis = analyze_run(RUN, {"geojson": SQUARE}, source)
+    result, metadata = analysis.result, analysis.metadata
+
+    assert [c[2] for c in source.calls] == ["2026-01-01", "2026-01-29"]
+    assert source.calls[0][0] == (-92.0, 16.0, -91.99, 16.01)
+    assert result.stats["loss_pixel_count"] == 100
+    assert result.stats["affected_area_ha"] > 0
+    assert metadata["engine"] == "local_numpy"
+    assert result.stats["cloud_fraction_after"] == 0.0
+    assert analysis.after["rgb"].shape == analysis.after["ndvi"].shape + (3,)
+
+
+def test_process_run_locally_ingests_stats(monkeypatch):
+    source = StubSource(lambda b: _cleared(b, slice(None), slice(None)))
+    submitted = []
+
+    def fake_process(gee_data):
+        submitted.append(gee_data)
+        return GEEResultResponse(success=True, run_id=gee_data.run_id, status="completed", message="ok")
+
+    monkeypatch.setattr(RunQueries, "get_by_id", staticmethod(lambda run_id: RUN))
+    monkeypatch.setattr(GeomarkerQueries, "get_by_id", staticmethod(lambda gid: {"geojson": SQUARE}))
+    monkeypatch.setattr(analysis_service, "process_gee_result", fake_process)
+    uploads = {}
+
+    def fake_upload(path, content, content_type):
+        uploads[path] = json.loads(content) if path.endswith(".geojson") else content
+        return f"https://storage/{path}"
+
+    monkeypatch.setattr(analysis_service, "upload_bytes", fake_upload)
+
+    response = analysis_service.process_run_locally("run-1", source=source)
+
+    assert response.status == "completed"
+    stats = submitted[0].stats
+    # The whole ~119 ha square was cleared
+    assert 110 < stats["affected_area_ha"] < 130
+    assert stats["polygon_count"] == stats["mapped_polygon_count"] == 1
+    path = next(p for p in uploads if p.endswith(".geojson"))
+    assert path.startswith("projects/proj-1/runs/run-1/loss_polygons_")
+    assert submitted[0].loss_polygons_url == f"https://storage/{path}"
+    assert uploads[path]["features"][0]["properties"]["area_ha"] == stats["mapped_area_ha"]
+    outputs = submitted[0].outputs
+    assert outputs["before_image_url"].endswith(".png") and outputs["after_image_url"].endswith(".png")
+
+
+def test_blocked_memmapped_detection_matches_in_memory(tmp_path):
+    before = _forest((40, 30))
+    after = _cleared(before, slice(5, 25), 10)  # vertical strip crossing block seams
+    after = _cleared(after, slice(8, 10), slice(20, 22))  # 4 px, straddles the seam at row 9
+    after = _cleared(after, 9, 0)  # single pixel exactly on a seam
+    after = _cleared(after, 10, 1)  # diagonal neighbour in the next block
+
+    whole = detect_change(before, after, pixel_ha=0.01, min_loss_pixels=3)
+    blocked = detect_change(before, after, pixel_ha=0.01, min_loss_pixels=3, block_rows=3, workdir=str(tmp_path))
+
+    assert isinstance(blocked.labels, np.memmap)
+    assert blocked.stats == whole.stats
+    assert whole.stats["polygon_count"] == 2
+    assert np.array_equal(blocked.labels, whole.labels)
+
+
+def test_analyze_run_tiles_large_aoi_into_memmap(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_service.settings, "sentinel_max_tile_px", 20)
+    monkeypatch.setattr(analysis_service.settings, "analysis_memmap_min_pixels", 0)
+    monkeypatch.setattr(analysis_service.settings, "analysis_block_rows", 7)
+    source = StubSource(lambda b: _cleared(b, slice(None), slice(None)))
+
+    analysis = analyze_run(RUN, {"geojson": SQUARE}, source, workdir=str(tmp_path))
+    result, metadata = analysis.result, analysis.metadata
+
+    rows, cols = metadata["size"][1], metadata["size"][0]
+    sizes = [c[3] for c in source.calls]
+    assert len(sizes) == 2 * 9  # 56 x 54 px -> 3 x 3 tiles, before and after
+    assert max(max(s) for s in sizes) <= 20
+    assert sum(w * h for w, h in sizes) == 2 * rows * cols
+    assert (tmp_path / "after_ndvi.npy").exists()
+    assert isinstance(analysis.after["rgb"], np.memmap)
+    assert result.stats["loss_pixel_count"] == rows * cols
+    assert result.stats["polygon_count"] == 1
+
+
+def test_cloud_fraction_counts_cloud_classes_inside_aoi():
+    scl = np.array([[4, 8, 9], [3, 10, 5]], dtype=np.uint8)
+    aoi = np.array([[True, True, True], [True, False, False]])
+    assert cloud_fraction(scl, aoi, block_rows=1) == 0.75
@@ -0,0 +1,92 @@
+"""Analytics snapshot tests (export stubbed)"""
+
+from datetime import date, datetime, timezone
+
+from fastapi.testclient import TestClient
+from main import app
+from app.config import settings
+from app.db.queries import AnalyticsQueries
+from app.services import analytics_service
+from app.services.analytics_service import AnalyticsSnapshot, build_snapshot
+
+ROWS = {
+    "regions": [
+        {"id": "r-qroo", "name": "Quintana Roo", "country_code": "MX", "admin_level": "state"},
+        {"id": "r-tab", "name": "Tabasco", "country_code": "MX", "admin_level": "state"},
+    ],
+    "companies": [{"id": "c-1", "name": "SEDENA"}, {"id": "c-2", "name": "PEMEX"}],
+    "projects": [
+        {"id": "p-1", "name": "Tren Maya", "region_id": "r-qroo", "company_id": "c-1", "risk_label": "high"},
+        {"id": "p-2", "name": "AIFA", "region_id": "r-qroo", "company_id": "c-1", "risk_label": "low"},
+        {"id": "p-3", "name": "Dos Bocas", "region_id": "r-tab", "company_id": "c-2", "risk_label": "medium"},
+    ],
+    "runs": [
+        {"id": "run-1", "project_id": "p-1", "end_date": "2026-01-10", "hectares_change": 2.0},
+        {"id": "run-2", "project_id": "p-2", "end_date": "2026-01-20", "hectares_change": 1.0},
+        {"id": "run-3", "project_id": "p-1", "end_date": "2026-02-05", "hectares_change": 4.0},
+        {"id": "run-4", "project_id": "p-3", "end_date": "2026-02-07", "hectares_change": None},
+    ],
+}
+
+
+def use_snapshot(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "analytics_snapshot_path", str(tmp_path / "snapshot.npz"))
+    analytics_service.set_snapshot(build_snapshot(**ROWS, built_at=datetime(2026, 3, 1, tzinfo=timezone.utc)))
+
+
+def test_hectares_by_region_month(monkeypatch, tmp_path):
+    use_snapshot(monkeypatch, tmp_path)
+    items = analytics_service.hectares_by_region_month().items
+    assert [(i.region, i.month, i.hectares_lost, i.run_count) for i in items] == [
+        ("Quintana Roo", date(2026, 1, 1), 3.0, 2),
+        ("Quintana Roo", date(2026, 2, 1), 4.0, 1),
+        ("Tabasco", date(2026, 2, 1), 0.0, 1),
+    ]
+    ranged = analytics_service.hectares_by_region_month(date_from=date(2026, 2, 1)).items
+    assert len(ranged) == 2
+
+
+def test_company_risk_and_carbon_by_state(monkeypatch, tmp_path):
+    use_snapshot(monkeypatch, tmp_path)
+    companies = {i.company: i for i in analytics_service.company_risk_distribution().items}
+    assert companies["SEDENA"].project_count == 2
+    assert companies["SEDENA"].risk_distribution == {"high": 1, "medium": 0, "low": 1, "unknown": 0}
+    assert companies["SEDENA"].hectares_lost == 7.0
+
+    carbon = analytics_service.carbon_by_state()
+    states = {i.state: i for i in carbon.items}
+    assert states["Quintana Roo"].carbon_tonnes == 2800.0
+    assert states["Tabasco"].project_count == 1
+    assert carbon.total_carbon_tonnes == 2800.0
+
+
+def test_refresh_pages_export_and_persists(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "analytics_snapshot_path", str(tmp_path / "snapshot.npz"))
+    monkeypatch.setattr(settings, "analytics_export_page_size", 2)
+    pages = []
+
+    def fake_page(table, columns, offset, limit, filters=None):
+        pages.append((table, offset))
+        return ROWS[table][offset:offset + limit]
+
+    monkeypatch.setattr(AnalyticsQueries, "export_page", staticmethod(fake_page))
+    snapshot = analytics_service.refresh_snapshot()
+    assert len(snapshot.runs["hectares"]) == 4
+    assert ("runs", 2) in pages and ("runs", 4) in pages
+
+    loaded = AnalyticsSnapshot.load(settings.analytics_snapshot_path)
+    assert loaded.regions["name"].tolist() == ["Quintana Roo", "Tabasco"]
+    assert loaded.runs["end_date"].dtype == snapshot.runs["end_date"].dtype
+
+
+def test_endpoints_serve_snapshot_or_503(monkeypatch, tmp_path):
+    client = TestClient(app)
+    monkeypatch.setattr(settings, "analytics_snapshot_path", str(tmp_path / "missing.npz"))
+    analytics_service.set_snapshot(None)
+    assert client.get("/analytics/carbon-by-state").status_code == 503
+
+    use_snapshot(monkeypatch, tmp_path)
+    response = client.get("/analytics/hectares-by-region-month", params={"from": "2026-02-01"})
+    assert response.status_code == 200
+    assert response.json()["snapshot_at"].startswith("2026-03-01")
+    assert client.get("/analytics/company-risk").status_code == 200
@@ -0,0 +1,140 @@
+"""Cadence auto-scheduler tests (timer heap, no DB)"""
+
+from datetime import date, datetime, timezone
+
+import pytest
+
+from app.services.cadence_service import CadenceScheduler
+
+NOW = datetime(2026, 3, 1, 12, tzinfo=timezone.utc)
+
+
+def _row(project_id, last_end_date=None, cadence="weekly", **extra):
+    return {
+        "project_id": project_id,
+        "geomarker_id": f"geo-{project_id}",
+        "last_end_date": last_end_date,
+        "cadence": cadence,
+        "method": "ndvi",
+        "cloud_threshold": 20,
+        "parameters": {},
+        **extra,
+    }
+
+
+def _scheduler(rows, batch_size=500):
+    inserts = []
+    scheduler = CadenceScheduler(
+        load_rows=lambda: rows,
+        insert_runs=lambda runs: inserts.append(runs) or runs,
+        batch_size=batch_size,
+    )
+    scheduler.rebuild(now=NOW)
+    return scheduler, inserts
+
+
+def test_rebuild_continues_from_latest_run():
+    scheduler, inserts = _scheduler([
+        _row("due", last_end_date="2026-02-20"),
+        _row("later", last_end_date="2026-02-28"),
+    ])
+    assert len(scheduler) == 2
+    assert scheduler.create_due_runs(now=NOW) == 1
+    (run,) = inserts[0]
+    assert (run["project_id"], run["start_date"], run["end_date"]) == ("due", "2026-02-22", "2026-03-01")
+    assert run["status"] == "queued" and run["cloud_threshold"] == 20
+    # Next window is not due yet, nothing else is created
+    assert scheduler.create_due_runs(now=NOW) == 0
+    assert scheduler.next_due() == datetime(2026, 3, 7, tzinfo=timezone.utc)
+
+
+def test_due_runs_are_inserted_in_batches():
+    rows = [_row(f"p{i}", last_end_date="2026-02-01") for i in range(5)]
+    scheduler, inserts = _scheduler(rows, batch_size=2)
+    assert scheduler.create_due_runs(now=NOW) == 5
+    assert [len(batch) for batch in inserts] == [2, 2, 1]
+
+
+def test_manual_run_reschedules_project():
+    scheduler, inserts = _scheduler([_row("p1", last_end_date="2026-02-22")])
+    scheduler.observe_run({
+        "project_id": "p1",
+        "geomarker_id": "geo-p1",
+        "end_date": "2026-03-01",
+        "cadence": "monthly",
+    })
+    assert len(scheduler) == 1
+    assert scheduler.create_due_runs(now=NOW) == 0
+    assert scheduler.next_due() == datetime(2026, 3, 31, tzinfo=timezone.utc)
+
+
+def test_monitoring_end_date_stops_schedule():
+    scheduler, _ = _scheduler([
+        _row("ended", last_end_date="2026-02-22", monitoring_end_date=date(2026, 2, 1)),
+    ])
+    assert len(scheduler) == 0
+    assert scheduler.next_due() is None
+
+
+def test_failed_insert_keeps_windows_due():
+    rows = [_row(f"p{i}", last_end_date="2026-02-20") for i in range(3)]
+    calls = []
+
+    def insert_runs(runs):
+        calls.append(runs)
+        if len(calls) <= 2:
+            raise RuntimeError("database unavailable")
+        return runs
+
+    scheduler = CadenceScheduler(load_rows=lambda: rows, insert_runs=insert_runs)
+    scheduler.rebuild(now=NOW)
+    with pytest.raises(RuntimeError):
+        scheduler.create_due_runs(now=NOW)
+    # The batch, then its first row alone: a transient error stops the fallback
+    assert [len(c) for c in calls] == [3, 1]
+    assert scheduler.next_due() == datetime(2026, 3, 1, tzinfo=timezone.utc)
+    # The retry creates the same windows, then the projects move on
+    assert scheduler.create_due_runs(now=NOW) == 3
+    assert calls[0] == calls[2]
+    assert scheduler.next_due() == datetime(2026, 3, 8, tzinfo=timezone.utc)
+
+
+def test_observe_run_is_noop_until_loaded():
+    scheduler = CadenceScheduler(load_rows=lambda: [], insert_runs=lambda runs: runs)
+    scheduler.observe_run({"project_id": "p1", "geomarker_id": "geo-p1", "end_date": "2026-03-01"})
+    assert len(scheduler) == 0
+
+
+class ForeignKeyViolation(Exception):
+    code = "23503"
+
+
+def test_permanent_row_failure_only_drops_that_project():
+    rows = [_row(p, last_end_date="2026-02-20") for p in ("p0", "gone", "p2")]
+    inserted = []
+
+    def insert_runs(runs):
+        if any(run["project_id"] == "gone" for run in runs):
+            raise ForeignKeyViolation("runs_project_id_fkey")
+        inserted.extend(run["project_id"] for run in runs)
+        return runs
+
+    scheduler = CadenceScheduler(load_rows=lambda: rows, insert_runs=insert_runs)
+    scheduler.rebuild(now=NOW)
+    assert scheduler.create_due_runs(now=NOW) == 2
+    assert inserted == ["p0", "p2"] and len(scheduler) == 2
+    assert scheduler.next_due() == datetime(2026, 3, 8, tzinfo=timezone.utc)
+
+
+def test_deactivated_projects_leave_the_heap():
+    rows = [_row(p, last_end_date="2026-02-20") for p in ("p0", "inactive")]
+    inserts = []
+    scheduler = CadenceScheduler(
+        load_rows=lambda: rows,
+        insert_runs=lambda runs: inserts.append(runs) or runs,
+        load_active=lambda ids: [{"project_id": "p0", "geomarker_id": "geo-v2", "monitoring_end_date": None}],
+    )
+    scheduler.rebuild(now=NOW)
+    assert scheduler.create_due_runs(now=NOW) == 1
+    assert [(r["project_id"], r["geomarker_id"]) for r in inserts[0]] == [("p0", "geo-v2")]
+    assert len(scheduler) == 1
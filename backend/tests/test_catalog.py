@@ -0,0 +1,72 @@
+"""Catalog pre-check tests (acquisition lookup, per-day cache, window widening)"""
+
+from datetime import date, timedelta
+
+from app.services.catalog_service import CatalogCache, find_acquisition, list_acquisitions
+
+BBOX = (-92.0, 16.0, -91.99, 16.01)
+TODAY = date(2026, 3, 1)
+
+
+class FakeCatalog:
+    """Serves acquisitions {day: cloud_cover} and records every search"""
+
+    def __init__(self, acquisitions):
+        self.acquisitions = acquisitions
+        self.searches = []
+
+    def search_catalog(self, bbox, date_from, date_to):
+        self.searches.append((date_from, date_to))
+        return [
+            {"id": f"S2_{day:%Y%m%d}_{i}", "datetime": f"{day.isoformat()}T16:30:00Z", "cloud_cover": cover}
+            for day, covers in self.acquisitions.items()
+            if date_from <= day <= date_to
+            for i, cover in enumerate(covers)
+        ]
+
+
+def test_list_acquisitions_caches_each_searched_day():
+    catalog = FakeCatalog({date(2026, 1, 10): [20.0, 40.0], date(2026, 1, 15): [5.0]})
+    cache = CatalogCache()
+
+    first = list_acquisitions(catalog, BBOX, date(2026, 1, 8), date(2026, 1, 16), today=TODAY, cache=cache)
+    assert [(a.day, a.cloud_cover) for a in first] == [(date(2026, 1, 10), 30.0), (date(2026, 1, 15), 5.0)]
+    assert len(first[0].scene_ids) == 2
+
+    # Empty days are cached too; only the two new days are searched
+    again = list_acquisitions(catalog, BBOX, date(2026, 1, 6), date(2026, 1, 16), today=TODAY, cache=cache)
+    assert again == first
+    assert catalog.searches == [(date(2026, 1, 8), date(2026, 1, 16)), (date(2026, 1, 6), date(2026, 1, 7))]
+
+
+def test_recent_days_are_not_cached():
+    catalog = FakeCatalog({})
+    cache = CatalogCache()
+    list_acquisitions(catalog, BBOX, TODAY - timedelta(days=3), TODAY, today=TODAY, cache=cache)
+    list_acquisitions(catalog, BBOX, TODAY - timedelta(days=3), TODAY, today=TODAY, cache=cache)
+    # The last two days may still receive late acquisitions
+    assert catalog.searches[1] == (TODAY - timedelta(days=1), TODAY)
+
+
+def test_find_acquisition_prefers_closest_clear_date():
+    catalog = FakeCatalog({
+        date(2026, 2, 1): [10.0],
+        date(2026, 2, 4): [60.0],  # closest, but too cloudy
+        date(2026, 2, 7): [25.0],
+    })
+    best = find_acquisition(catalog, BBOX, date(2026, 2, 4), 30, initial_days=7, today=TODAY, cache=CatalogCache())
+    assert best.day == date(2026, 2, 1)  # 3 days away, clearer than Feb 7 at the same distance
+    assert len(catalog.searches) == 1
+
+
+def test_find_acquisition_widens_window_then_gives_up():
+    catalog = FakeCatalog({date(2026, 1, 10): [12.0]})
+    cache = CatalogCache()
+
+    best = find_acquisition(catalog, BBOX, date(2026, 2, 1), 30, initial_days=7, max_days=28, today=TODAY, cache=cache)
+    assert best.day == date(2026, 1, 10)
+    # ±7, then ±14 and ±28 only search the days they add
+    assert catalog.searches[0] == (date(2026, 1, 25), date(2026, 2, 8))
+    assert catalog.searches[1:3] == [(date(2026, 1, 18), date(2026, 1, 24)), (date(2026, 2, 9), date(2026, 2, 15))]
+
+    assert find_acquisition(catalog, BBOX, date(2026, 2, 1), 10, initial_days=7, max_days=28, today=TODAY, cache=cache) is None
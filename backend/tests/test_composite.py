@@ -0,0 +1,95 @@
+"""Multi-date compositing tests (cloud masking, median / weighted, streaming)"""
+
+from datetime import date
+
+import numpy as np
+
+from app.services.analysis_service import analyze_run
+from app.services.catalog_service import _cache
+from app.utils.composite import Compositor
+
+from tests.test_analysis import RUN, SQUARE, _forest
+
+
+def _scene(ndvi, scl=4, rgb=100):
+    ndvi = np.asarray(ndvi, dtype=np.float32)
+    return {
+        "ndvi": ndvi,
+        "scl": np.full(ndvi.shape, scl, dtype=np.uint8) if np.isscalar(scl) else np.asarray(scl, dtype=np.uint8),
+        "rgb": np.full(ndvi.shape + (3,), rgb, dtype=np.uint8),
+    }
+
+
+def test_median_ignores_masked_pixels_and_outliers():
+    compositor = Compositor((1, 3), method="median", block_rows=1)
+    compositor.add(_scene([[0.80, 0.70, np.nan]]), date(2026, 1, 1))
+    compositor.add(_scene([[0.78, 0.10, np.nan]], scl=[[4, 9, 4]]), date(2026, 1, 6))  # cloud at col 1
+    compositor.add(_scene([[0.30, 0.72, np.nan]]), date(2026, 1, 11))  # unflagged haze at col 0
+
+    out = compositor.result()
+    assert out["ndvi"][0, 0] == np.float32(0.78)
+    assert abs(out["ndvi"][0, 1] - 0.71) < 1e-6  # median of the two clear views
+    assert np.isnan(out["ndvi"][0, 2])
+    assert out["count"].tolist() == [[3, 2, 0]]
+    assert out["observed"][0, 1] == date(2026, 1, 11).toordinal() and out["observed"][0, 2] == 0
+
+
+def test_weighted_uses_scl_quality():
+    compositor = Compositor((1, 1), method="weighted")
+    compositor.add(_scene([[0.8]], scl=4, rgb=200))  # vegetation: weight 1
+    compositor.add(_scene([[0.2]], scl=7, rgb=50))  # unclassified: weight 0.5
+
+    out = compositor.result()
+    assert abs(out["ndvi"][0, 0] - 0.6) < 1e-6
+    assert out["rgb"][0, 0].tolist() == [150, 150, 150]
+
+
+def test_memory_does_not_grow_with_scene_count(tmp_path):
+    compositor = Compositor((4, 4), method="median", samples=3, workdir=str(tmp_path), name="after")
+    rng = np.random.default_rng(1)
+    for _ in range(25):
+        compositor.add(_scene(rng.uniform(0.6, 0.9, (4, 4))))
+
+    assert compositor.reservoir.shape == (3, 4, 4)
+    assert isinstance(compositor.reservoir, np.memmap)
+    out = compositor.result()
+    assert (tmp_path / "after_ndvi.npy").exists()
+    assert out["count"].min() == 25
+    assert ((out["ndvi"] >= 0.6) & (out["ndvi"] <= 0.9)).all()
+
+
+class HazySource:
+    """Three acquisitions per window; the after window's least cloudy one has unflagged haze"""
+
+    DAYS = {
+        date(2025, 12, 20): 10.0, date(2025, 12, 25): 20.0, date(2025, 12, 30): 30.0,
+        date(2026, 1, 18): 5.0, date(2026, 1, 23): 20.0, date(2026, 1, 28): 25.0,
+    }
+
+    def __init__(self):
+        self.fetches = []
+
+    def search_catalog(self, bbox, date_from, date_to):
+        return [
+            {"id": f"S2_{day}", "datetime": f"{day}T16:00:00Z", "cloud_cover": cover}
+            for day, cover in self.DAYS.items() if date_from <= day <= date_to
+        ]
+
+    def fetch_scene(self, bbox, date_from, date_to, resolution=20, max_cloud_coverage=30, size=None):
+        self.fetches.append(date_from.date())
+        width, height = size
+        ndvi = _forest((height, width))
+        if date_from.date() == date(2026, 1, 18):
+            ndvi[: height // 2] = 0.3
+        return _scene(ndvi), {}
+
+
+def test_analyze_run_composites_away_single_scene_haze():
+    _cache.clear()
+    source = HazySource()
+    analysis = analyze_run(RUN, {"geojson": SQUARE}, source)
+
+    assert sorted(source.fetches) == sorted(HazySource.DAYS)
+    assert analysis.result.stats["loss_pixel_count"] == 0
+    assert analysis.metadata["composite"]["after_scenes"] == ["2026-01-18", "2026-01-23", "2026-01-28"]
+    assert analysis.result.stats["cloud_fraction_after"] == 0.0
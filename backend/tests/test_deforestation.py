@@ -0,0 +1,87 @@
+"""Loss polygon streaming, caching and /deforestation tests (storage stubbed)"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from app.config import settings
+from app.db.queries import ProjectQueries, ReportQueries, RunQueries
+from app.services import deforestation_service
+from app.services.deforestation_service import build_layer
+from app.utils.geojson_stream import iter_features
+
+
+def square(x, y, size, n=1):
+    """Closed ring with n points per side"""
+    side = [i / n * size for i in range(n)]
+    ring = [[x + d, y] for d in side] + [[x + size, y + d] for d in side]
+    ring += [[x + size - d, y + size] for d in side] + [[x, y + size - d] for d in side]
+    return ring + [ring[0]]
+
+
+def collection(count=20):
+    features = [
+        {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [square(i * 0.01, 0.0, 0.005, n=10)]},
+         "properties": {"id": str(i + 1), "area_ha": float(i + 1), "confidence": "high", "note": "zoné ✓"}}
+        for i in range(count)
+    ]
+    return {"type": "FeatureCollection", "features": features, "bbox": [0, 0, 1, 1]}
+
+
+def chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_stream_parser_matches_json_load():
+    doc = collection()
+    data = json.dumps(doc).encode()
+    # Tiny chunks split numbers, strings and multi-byte characters
+    assert list(iter_features(chunks(data, 7))) == doc["features"]
+    assert list(iter_features([b'{"features": [], "type": "FeatureCollection"}'])) == []
+    with pytest.raises(ValueError):
+        list(iter_features(chunks(data[:-40], 7)))
+
+
+def test_layer_simplifies_and_filters():
+    layer = build_layer(collection()["features"], tolerance=1e-4)
+    assert len(layer) == 20
+    ring = layer.geometry(0)["coordinates"][0]
+    assert len(ring) == 5 and ring[0] == ring[-1]  # collinear points dropped
+    assert list(layer.select(min_area_ha=18)) == [17, 18, 19]
+    assert list(layer.select(bbox=(0.021, -1, 0.032, 1))) == [2, 3]
+
+
+def test_deforestation_endpoint_downloads_each_run_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "deforestation_cache_dir", str(tmp_path))
+    deforestation_service._cache.clear()
+    monkeypatch.setattr(ProjectQueries, "get_by_id", staticmethod(lambda pid: {"id": pid} if pid == "proj-1" else None))
+    monkeypatch.setattr(RunQueries, "get_last_completed_for_project", staticmethod(lambda pid: {
+        "id": "run-9", "start_date": "2026-01-01", "end_date": "2026-01-28",
+    }))
+    monkeypatch.setattr(ReportQueries, "get_by_run_id", staticmethod(lambda run_id: [
+        {"report_type": "loss_polygons_geojson", "public_url": "https://storage/run-9.geojson"},
+        {"report_type": "after_image", "public_url": "https://storage/after.png"},
+    ]))
+    downloads = []
+    data = json.dumps(collection()).encode()
+    monkeypatch.setattr(deforestation_service, "stream_url", lambda url: downloads.append(url) or iter(chunks(data, 1000)))
+    client = TestClient(app)
+
+    body = client.get("/deforestation", params={"project_id": "proj-1", "min_area_ha": 19}).json()
+    assert body["run_id"] == "run-9"
+    assert [p["id"] for p in body["polygons"]] == ["19", "20"]
+    assert body["stats"] == {"area_ha": 39.0, "polygon_count": 2}
+    assert body["outputs"]["after_rgb"] == "https://storage/after.png"
+
+    body = client.get("/deforestation", params={"project_id": "proj-1", "bbox": "0.0,0.0,0.004,0.004"}).json()
+    assert [p["id"] for p in body["polygons"]] == ["1"]
+    assert len(downloads) == 1
+
+    # A restart keeps the parsed layer on disk
+    deforestation_service._cache.clear()
+    assert len(client.get("/deforestation", params={"project_id": "proj-1"}).json()["polygons"]) == 20
+    assert len(downloads) == 1
+
+    assert client.get("/deforestation", params={"project_id": "proj-1", "bbox": "1,2,3"}).status_code == 400
+    assert client.get("/deforestation", params={"project_id": "other"}).status_code == 404
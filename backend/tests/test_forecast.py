@@ -0,0 +1,106 @@
+"""Monte Carlo expansion forecast tests (risk engine stubbed)"""
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from app.services import forecast_service
+from app.services.forecast_service import expansion_factor, forecast_projects, project_polygon, simulate_ensembles
+from app.services.risk_service import ProjectRisk
+
+SQUARE = {"type": "Polygon", "coordinates": [[[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]]}
+
+
+def make_risk(pid, score=50.0, work_type="linear", version="v1", trend=0.0):
+    variables = np.zeros(9)
+    variables[-1] = trend
+    return ProjectRisk(
+        project={"id": pid, "region_id": "r-1", "company_id": "c-1"},
+        geometry=SQUARE, work_type=work_type, variables=variables, score=score, version=version,
+    )
+
+
+def test_expansion_factor_matches_frontend_model():
+    # extensive: 6% per 30 days, capped at 2.0
+    assert expansion_factor(np.array(0.06), np.array(2.0), np.array(60), np.array(40)) == pytest.approx(1.12 * 1.2)
+    assert expansion_factor(np.array(0.06), np.array(2.0), np.array(900), np.array(100)) == 2.0
+
+
+def test_ensembles_are_per_project_reproducible():
+    horizons = np.array([30.0, 60.0, 90.0])
+    args = dict(trends=np.array([0.0, 1.0]), expansion_rates=np.array([0.04, 0.04]),
+                max_expansions=np.array([1.6, 1.6]), horizons=horizons, samples=200)
+    paths, expansion = simulate_ensembles(scores=np.array([50.0, 50.0]), seeds=[1, 2], **args)
+    assert paths.shape == expansion.shape == (2, 200, 3)
+    assert (expansion <= 1.6).all() and (paths >= 1).all() and (paths <= 100).all()
+    # An upward loss trend drifts scores up
+    assert paths[1, :, -1].mean() > paths[0, :, -1].mean()
+    # A project's draws do not depend on its batch
+    alone, _ = simulate_ensembles(scores=np.array([50.0]), seeds=[2], **{
+        k: (v[1:] if k != "horizons" and k != "samples" else v) for k, v in args.items()
+    })
+    assert np.array_equal(alone[0], paths[1])
+
+
+def test_projected_polygon_grows_and_stays_closed():
+    grown = project_polygon(SQUARE, 1.5, "punctual", seed=7)
+    ring = np.array(grown["coordinates"][0][0])
+    assert np.array_equal(ring[0], ring[-1])
+    offsets = np.abs(ring[:-1] - 0.5)
+    assert (offsets > 0.5 * 1.5 * 0.9 - 1e-9).all() and (offsets < 0.5 * 1.5 * 1.1 + 1e-9).all()
+
+
+def test_forecasts_are_cached_per_run_version(monkeypatch):
+    forecast_service._cache.clear()
+    built = []
+    real_build = forecast_service._build_forecasts
+    monkeypatch.setattr(forecast_service, "_build_forecasts", lambda risks, *a: built.append(len(risks)) or real_build(risks, *a))
+
+    first = forecast_projects([make_risk("p-1"), make_risk("p-2")], horizon_days=90, step_days=30, samples=100)
+    assert built == [2]
+    assert first[0].horizons_days == [30, 60, 90]
+    assert first[0].expansion["p5"][-1] <= first[0].expansion["p50"][-1] <= first[0].expansion["p95"][-1]
+    assert {(p.day, p.percentile) for p in first[0].projected_polygons} >= {(90, 50), (90, 95)}
+
+    again = forecast_projects([make_risk("p-1"), make_risk("p-2", version="v2")], horizon_days=90, step_days=30, samples=100)
+    assert built == [2, 1]  # only the project with a new run is simulated
+    assert again[0] is first[0]
+
+
+def test_forecast_endpoints(monkeypatch):
+    forecast_service._cache.clear()
+
+    class Engine:
+        def get_scores(self):
+            return [make_risk("p-1"), make_risk("p-2", work_type="extensive")]
+
+        def get_score(self, project_id):
+            return next((r for r in self.get_scores() if r.project["id"] == project_id), None)
+
+    monkeypatch.setattr(forecast_service, "risk_engine", Engine())
+    client = TestClient(app)
+
+    body = client.get("/projects/p-2/forecast", params={"horizon_days": 60, "samples": 50}).json()
+    assert body["work_type"] == "extensive"
+    assert len(body["risk_levels"]) == 2
+    assert client.get("/projects/missing/forecast").status_code == 404
+    assert client.get("/projects/p-1/forecast", params={"horizon_days": 100000, "step_days": 1}).status_code == 400
+
+    projects = client.get("/risk-map/forecast", params={"region_id": "r-1"}).json()["projects"]
+    assert [p["project_id"] for p in projects] == ["p-1", "p-2"]
+    assert projects[0]["projected_polygons"] == []
+    for params in ({"samples": -5}, {"horizon_days": 0}, {"step_days": -30}):
+        assert client.get("/risk-map/forecast", params=params).status_code == 422
+
+
+def test_chunks_stay_within_element_budget(monkeypatch):
+    forecast_service._cache.clear()
+    monkeypatch.setattr(forecast_service.settings, "forecast_max_chunk_elements", 1000)
+    built = []
+    real_build = forecast_service._build_forecasts
+    monkeypatch.setattr(forecast_service, "_build_forecasts", lambda risks, *a: built.append(len(risks)) or real_build(risks, *a))
+
+    # 100 samples x 3 horizons: three projects per chunk
+    risks = [make_risk(f"p-{i}") for i in range(7)]
+    forecast_projects(risks, horizon_days=90, step_days=30, samples=100, polygons=False)
+    assert built == [3, 3, 1]
@@ -0,0 +1,102 @@
+"""GEE result ingestion tests (RPC stubbed)"""
+
+from fastapi.testclient import TestClient
+from main import app
+from app.db.queries import RunQueries
+from app.schemas.runs import GEEResultInput
+from app.services.runs_service import build_gee_ingestion, gee_result_fingerprint
+
+PAYLOAD = {
+    "project_id": "proj-1",
+    "run_id": "run-1",
+    "start_date": "2026-01-01",
+    "end_date": "2026-01-28",
+    "stats": {"affected_area_ha": 12.4},
+    "outputs": {
+        "before_image_url": "https://storage/before.png",
+        "after_image_url": "https://storage/after.png",
+    },
+    "loss_polygons_url": "https://storage/polygons.geojson",
+    "metadata": {"satellite": "Sentinel-2"},
+}
+
+
+def test_build_gee_ingestion_params():
+    params = build_gee_ingestion(GEEResultInput(**PAYLOAD))
+    assert params["p_risk_label"] == "high"
+    assert params["p_image_url"] == "https://storage/after.png"
+    assert params["p_stats"]["images"]["before_rgb"] == "https://storage/before.png"
+    assert [r["report_type"] for r in params["p_reports"]] == [
+        "before_image", "after_image", "loss_polygons_geojson"
+    ]
+
+
+def test_fingerprint_is_stable_and_payload_sensitive():
+    a = gee_result_fingerprint(GEEResultInput(**PAYLOAD))
+    b = gee_result_fingerprint(GEEResultInput(**{**PAYLOAD, "idempotency_key": "ignored"}))
+    c = gee_result_fingerprint(GEEResultInput(**{**PAYLOAD, "stats": {"affected_area_ha": 1}}))
+    assert a == b
+    assert a != c
+
+
+def test_retry_with_same_key_is_reported_as_duplicate(monkeypatch):
+    seen_keys = []
+
+    def fake_ingest(params):
+        key = params["p_idempotency_key"]
+        outcome = "duplicate" if key in seen_keys else "ingested"
+        seen_keys.append(key)
+        return {"outcome": outcome, "run": {"id": "run-1", "project_id": "proj-1", "status": "completed"}}
+
+    monkeypatch.setattr(RunQueries, "ingest_gee_result", staticmethod(fake_ingest))
+    client = TestClient(app)
+    headers = {"Idempotency-Key": "gee-batch-42"}
+    first = client.post("/runs/run-1/gee-result", json=PAYLOAD, headers=headers)
+    second = client.post("/runs/run-1/gee-result", json=PAYLOAD, headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert first.json()["duplicate"] is False
+    assert second.json()["duplicate"] is True
+    assert seen_keys == ["gee-batch-42", "gee-batch-42"]
+
+
+def test_unknown_run_returns_404(monkeypatch):
+    monkeypatch.setattr(
+        RunQueries, "ingest_gee_result", staticmethod(lambda params: {"outcome": "not_found"})
+    )
+    client = TestClient(app)
+    r = client.post("/runs/run-1/gee-result", json=PAYLOAD)
+    assert r.status_code == 404
+
+
+def test_bulk_ingestion_returns_per_item_results(monkeypatch):
+    calls = []
+
+    def fake_bulk(items):
+        calls.append(items)
+        rows = []
+        for item in items:
+            if item["run_id"] == "missing":
+                rows.append({"run_id": item["run_id"], "outcome": "not_found", "run": None})
+            else:
+                rows.append({
+                    "run_id": item["run_id"],
+                    "outcome": "ingested",
+                    "run": {"id": item["run_id"], "project_id": item["project_id"], "status": "completed"},
+                })
+        return rows
+
+    monkeypatch.setattr(RunQueries, "ingest_gee_results", staticmethod(fake_bulk))
+    batch = [
+        {**PAYLOAD, "run_id": "run-1"},
+        {**PAYLOAD, "run_id": "run-2", "stats": {"affected_area_ha": 0}},
+        {**PAYLOAD, "run_id": "missing"},
+        {**PAYLOAD, "run_id": "run-1"},
+    ]
+    client = TestClient(app)
+    r = client.post("/runs/gee-results", json=batch)
+    assert r.status_code == 200
+    body = r.json()
+    assert len(calls) == 1
+    assert [i["run_id"] for i in calls[0]] == ["run-1", "run-2", "missing"]
+    assert [x["status"] for x in body["results"]] == ["completed", "completed", "not_found", "rejected"]
+    assert (body["ingested"], body["duplicates"], body["failed"]) == (2, 0, 2)
@@ -0,0 +1,173 @@
+"""Incremental monitoring tests (watermarks, cached composites, catalog-driven fetches)"""
+
+from datetime import date
+
+import numpy as np
+
+from app.db.queries import WatermarkQueries
+from app.services import monitoring_service
+from app.services.catalog_service import CatalogSource, _cache
+from app.services.monitoring_service import (
+    analyze_run_incremental,
+    load_composite,
+    merge_scene,
+    new_composite,
+    save_checkpoint,
+    save_composite,
+)
+
+from tests.test_analysis import SQUARE, _forest
+
+GEOMARKER = {"id": "geo-1", "version": 1, "geojson": SQUARE}
+RUN_1 = {"id": "run-1", "project_id": "proj-1", "start_date": "2026-01-01", "end_date": "2026-01-08", "parameters": {"min_loss_pixels": 1}}
+RUN_2 = {**RUN_1, "id": "run-2", "start_date": "2026-01-08", "end_date": "2026-01-15"}
+
+
+class CatalogScenes:
+    """Scenes per acquisition day: {day: ndvi transform}; one-day fetches only"""
+
+    def __init__(self, days):
+        self.days = days
+        self.fetches = []
+
+    def search_catalog(self, bbox, date_from, date_to):
+        return [
+            {"id": f"S2_{day}", "datetime": f"{day.isoformat()}T16:00:00Z", "cloud_cover": 40.0}
+            for day in self.days if date_from <= day <= date_to
+        ]
+
+    def fetch_scene(self, bbox, date_from, date_to, resolution=20, max_cloud_coverage=30, size=None):
+        self.fetches.append((date_from.date(), date_to.date()))
+        width, height = size
+        ndvi = _forest((height, width))
+        transform = self.days.get(date_from.date())
+        if transform is not None:
+            ndvi = transform(ndvi)
+        rgb = np.full((height, width, 3), date_from.day, dtype=np.uint8)
+        return {"rgb": rgb, "ndvi": ndvi, "scl": np.full((height, width), 4, dtype=np.uint8)}, {}
+
+
+def _storage(monkeypatch):
+    files, watermarks = {}, {}
+
+    def upload(path, content, content_type, upsert=False):
+        files[path] = content
+        return f"https://storage/{path}"
+
+    monkeypatch.setattr(monitoring_service, "upload_bytes", upload)
+    monkeypatch.setattr(monitoring_service, "download_bytes", lambda path: files[path])
+    monkeypatch.setattr(WatermarkQueries, "get", staticmethod(lambda pid, gid: watermarks.get((pid, gid))))
+    monkeypatch.setattr(WatermarkQueries, "upsert", staticmethod(
+        lambda row: watermarks.__setitem__((row["project_id"], row["geomarker_id"]), row) or row
+    ))
+    _cache.clear()
+    return files, watermarks
+
+
+def test_merge_scene_keeps_last_clear_observation():
+    composite = {
+        "ndvi": np.array([[0.5, np.nan]], dtype=np.float32),
+        "rgb": np.zeros((1, 2, 3), dtype=np.uint8),
+        "observed": np.zeros((1, 2), dtype=np.int32),
+    }
+    scene = {"ndvi": np.array([[np.nan, 0.7]], dtype=np.float32), "rgb": np.full((1, 2, 3), 9, dtype=np.uint8)}
+
+    assert merge_scene(composite, scene, date(2026, 1, 5)) == 1
+    assert composite["ndvi"][0, 0] == 0.5 and composite["ndvi"][0, 1] == np.float32(0.7)
+    assert composite["rgb"][0, 1].tolist() == [9, 9, 9] and composite["rgb"][0, 0].tolist() == [0, 0, 0]
+    assert composite["observed"].tolist() == [[0, date(2026, 1, 5).toordinal()]]
+
+
+def test_composite_streams_through_workdir_memmaps(monkeypatch, tmp_path):
+    files, _ = _storage(monkeypatch)
+    monkeypatch.setattr(monitoring_service.settings, "analysis_block_rows", 7)
+    composite = new_composite((30, 20), str(tmp_path), "seed")
+    composite["ndvi"][:] = np.linspace(0, 1, 600, dtype=np.float32).reshape(30, 20)
+    composite["rgb"][5:9] = 200
+    composite["observed"][-1] = 739000
+    save_composite("composite.npz", composite, str(tmp_path))
+
+    loaded = load_composite("composite.npz", str(tmp_path))
+    for layer, array in composite.items():
+        assert isinstance(loaded[layer], np.memmap)
+        assert loaded[layer].dtype == array.dtype and np.array_equal(loaded[layer], array)
+    assert (tmp_path / "previous_ndvi.npy").exists()
+    # Without a workdir the layers stay in memory
+    assert not isinstance(load_composite("composite.npz")["rgb"], np.memmap)
+
+
+def test_second_run_fetches_only_new_acquisitions(monkeypatch):
+    files, watermarks = _storage(monkeypatch)
+
+    def clear_north(ndvi):
+        out = ndvi.copy()
+        out[:10] = 0.1
+        return out
+
+    def cloudy_south(ndvi):
+        out = clear_north(ndvi)
+        out[30:] = np.nan
+        return out
+
+    source = CatalogScenes({date(2026, 1, 11): clear_north, date(2026, 1, 13): cloudy_south})
+    assert isinstance(source, CatalogSource)
+
+    # No watermark yet: full analysis seeds the composite
+    first = analyze_run_incremental(RUN_1, GEOMARKER, source)
+    assert first.metadata["mode"] == "full" and first.watermark == date(2026, 1, 8)
+    save_checkpoint(RUN_1, GEOMARKER, first)
+    assert list(files) == ["projects/proj-1/composites/geo-1_v1.npz"]
+    full_fetches = len(source.fetches)
+
+    second = analyze_run_incremental(RUN_2, GEOMARKER, source)
+    new_fetches = source.fetches[full_fetches:]
+    assert new_fetches == [(date(2026, 1, 11), date(2026, 1, 12)), (date(2026, 1, 13), date(2026, 1, 14))]
+    assert second.metadata["mode"] == "incremental"
+    assert second.metadata["new_acquisitions"] == ["2026-01-11", "2026-01-13"]
+
+    # The north strip is loss; under Jan 13's clouds Jan 11 stays the latest view
+    rows, cols = second.after["ndvi"].shape
+    assert second.result.stats["loss_pixel_count"] == 10 * cols
+    assert second.result.stats["new_acquisition_count"] == 2
+    assert second.after["observed"][0, 0] == date(2026, 1, 13).toordinal()
+    assert second.after["observed"][-1, 0] == date(2026, 1, 11).toordinal()
+
+    save_checkpoint(RUN_2, GEOMARKER, second)
+    assert watermarks[("proj-1", "geo-1")]["last_acquisition_date"] == "2026-01-13"
+    assert watermarks[("proj-1", "geo-1")]["run_id"] == "run-2"
+
+
+def test_watermark_stays_behind_the_ingestion_lag(monkeypatch):
+    _, watermarks = _storage(monkeypatch)
+    source = CatalogScenes({date(2026, 1, 11): lambda ndvi: ndvi, date(2026, 1, 13): lambda ndvi: ndvi})
+
+    # A full run ending yesterday only vouches for scenes two days old
+    monkeypatch.setattr(monitoring_service, "_today", lambda: date(2026, 1, 9))
+    first = analyze_run_incremental(RUN_1, GEOMARKER, source)
+    assert first.watermark == date(2026, 1, 7)
+    save_checkpoint(RUN_1, GEOMARKER, first)
+
+    monkeypatch.setattr(monitoring_service, "_today", lambda: date(2026, 1, 14))
+    second = analyze_run_incremental(RUN_2, GEOMARKER, source)
+    assert second.metadata["new_acquisitions"] == ["2026-01-11", "2026-01-13"]
+    save_checkpoint(RUN_2, GEOMARKER, second)
+    assert watermarks[("proj-1", "geo-1")]["last_acquisition_date"] == "2026-01-12"
+
+    # Jan 13 may still change in the catalog, so the next run looks at it again
+    third = analyze_run_incremental(RUN_2, GEOMARKER, source)
+    assert third.metadata["new_acquisitions"] == ["2026-01-13"]
+
+
+def test_new_geomarker_version_rebuilds_from_scratch(monkeypatch):
+    _storage(monkeypatch)
+    source = CatalogScenes({})
+    save_checkpoint(RUN_1, GEOMARKER, analyze_run_incremental(RUN_1, GEOMARKER, source))
+
+    again = analyze_run_incremental(RUN_2, {**GEOMARKER, "version": 2}, source)
+    assert again.metadata["mode"] == "full"
+
+    # Same version, no new acquisitions: nothing fetched, nothing changed
+    fetched = len(source.fetches)
+    quiet = analyze_run_incremental(RUN_2, GEOMARKER, source)
+    assert quiet.metadata["mode"] == "incremental" and len(source.fetches) == fetched
+    assert quiet.result.stats["loss_pixel_count"] == 0 and quiet.watermark == date(2026, 1, 8)
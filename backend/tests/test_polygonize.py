@@ -0,0 +1,78 @@
+"""Loss mask polygonization tests"""
+
+import numpy as np
+
+from app.utils.geo import polygon_area_ha
+from app.utils.polygonize import polygonize
+
+BBOX = (-92.0, 16.0, -91.99, 16.01)
+
+
+def _signed_area(ring):
+    pts = np.asarray(ring)
+    return float(np.sum(pts[:-1, 0] * pts[1:, 1] - pts[1:, 0] * pts[:-1, 1])) / 2
+
+
+def test_square_with_hole_is_oriented_and_sized():
+    labels = np.zeros((10, 10), dtype=np.int32)
+    labels[2:8, 2:8] = 1
+    labels[4:6, 4:6] = 0
+
+    features = polygonize(labels, BBOX, simplify_px=0)["features"]
+
+    assert len(features) == 1
+    geometry = features[0]["geometry"]
+    assert geometry["type"] == "Polygon"
+    outer, hole = geometry["coordinates"]
+    assert len(outer) == 5 and len(hole) == 5
+    assert _signed_area(outer) > 0 > _signed_area(hole)  # RFC 7946 right-hand rule
+    assert outer[0] == outer[-1]
+    # 32 of 100 pixels over a ~119 ha bbox
+    assert abs(features[0]["properties"]["area_ha"] - 0.32 * polygon_area_ha([[
+        [BBOX[0], BBOX[1]], [BBOX[2], BBOX[1]], [BBOX[2], BBOX[3]], [BBOX[0], BBOX[3]], [BBOX[0], BBOX[1]]
+    ]])) < 0.01
+    assert features[0]["properties"]["pixel_count"] == 32
+
+
+def test_diagonal_pixels_become_multipolygon_parts():
+    labels = np.zeros((4, 4), dtype=np.int32)
+    labels[1, 1] = labels[2, 2] = 1
+
+    geometry = polygonize(labels, BBOX, simplify_px=0)["features"][0]["geometry"]
+
+    assert geometry["type"] == "MultiPolygon"
+    assert [len(p[0]) for p in geometry["coordinates"]] == [5, 5]
+
+
+def test_min_mapping_unit_and_confidence():
+    labels = np.zeros((12, 12), dtype=np.int32)
+    labels[0:5, 0:5] = 1
+    labels[9:11, 9:11] = 2
+    delta = np.where(labels == 1, -0.45, -0.25).astype(np.float32)
+
+    features = polygonize(labels, BBOX, delta=delta, pixel_ha=0.1, min_area_ha=1.0, ndvi_threshold=-0.2)["features"]
+
+    assert [f["properties"]["id"] for f in features] == ["1"]
+    props = features[0]["properties"]
+    assert props["confidence"] == "high"
+    assert props["mean_delta_ndvi"] == -0.45
+
+
+def test_blocked_polygonization_matches_whole_raster():
+    rng = np.random.default_rng(1)
+    labels = (rng.random((40, 40)) < 0.3).astype(np.int32) * np.arange(1, 41)[:, None]
+
+    whole = polygonize(labels, BBOX, simplify_px=1.0)
+    blocked = polygonize(labels, BBOX, simplify_px=1.0, block_rows=7)
+
+    assert whole == blocked
+
+
+def test_staircase_is_simplified():
+    labels = np.tril(np.ones((30, 30), dtype=np.int32))
+
+    exact = polygonize(labels, BBOX, simplify_px=0)["features"][0]
+    simple = polygonize(labels, BBOX, simplify_px=1.0)["features"][0]
+
+    assert len(simple["geometry"]["coordinates"][0]) < len(exact["geometry"]["coordinates"][0]) // 4
+    assert simple["properties"]["area_ha"] == exact["properties"]["area_ha"]
@@ -0,0 +1,79 @@
+"""Raster tiling / mosaic / PNG encoding tests"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+from app.utils.raster import encode_png, fetch_tiled, fetch_tiled_layers, plan_tiles, raster_shape
+
+BBOX = (-95.0, 16.0, -94.0, 17.0)
+
+
+def test_plan_tiles_covers_raster_exactly():
+    tiles = plan_tiles(BBOX, (5200, 2600), max_tile_px=2500)
+
+    assert len(tiles) == 3 * 2
+    assert all(t.rows <= 2500 and t.cols <= 2500 for t in tiles)
+    covered = np.zeros((5200, 2600), dtype=np.int8)
+    for t in tiles:
+        covered[t.window] += 1
+    assert (covered == 1).all()
+    # Tile bboxes follow pixel edges: outer edges match the AOI bbox
+    assert min(t.bbox[0] for t in tiles) == -95.0
+    assert max(t.bbox[3] for t in tiles) == 17.0
+    assert abs(min(t.bbox[1] for t in tiles) - 16.0) < 1e-9
+
+
+def test_raster_shape_from_resolution():
+    rows, cols = raster_shape((-92.0, 16.0, -91.99, 16.01), 10)
+    assert (rows, cols) == (111, 107)
+
+
+def test_fetch_tiled_writes_mosaic_to_memmap(tmp_path):
+    shape = (45, 70)
+
+    def fetch(bbox, size, offset):
+        width, height = size
+        tile = np.full((height, width, 3), offset, dtype=np.uint8)
+        tile[..., 1] = width
+        return tile, {}
+
+    mosaic = fetch_tiled(
+        fetch, BBOX, shape, channels=3, dtype=np.uint8,
+        path=str(tmp_path / "rgb.npy"), max_tile_px=20, max_workers=3, offset=7,
+    )
+
+    assert isinstance(mosaic, np.memmap)
+    assert mosaic.shape == (45, 70, 3)
+    assert (mosaic[..., 0] == 7).all()
+    assert set(np.unique(mosaic[..., 1])) <= {17, 18}
+    assert np.load(tmp_path / "rgb.npy", mmap_mode="r").shape == (45, 70, 3)
+
+
+def test_encode_png_block_by_block_round_trips():
+    rgb = np.random.default_rng(0).integers(0, 255, size=(37, 23, 3), dtype=np.uint8)
+
+    decoded = np.asarray(Image.open(io.BytesIO(encode_png(rgb, block_rows=5))))
+
+    assert np.array_equal(decoded, rgb)
+
+
+def test_fetch_tiled_layers_assembles_every_output():
+    def fetch(bbox, size):
+        width, height = size
+        return {
+            "rgb": np.full((height, width, 3), 9, dtype=np.uint8),
+            "ndvi": np.full((height, width), 0.5, dtype=np.float32),
+            "scl": np.full((height, width, 1), 4, dtype=np.uint8),
+        }, {}
+
+    layers = fetch_tiled_layers(
+        fetch, BBOX, (30, 25),
+        {"rgb": ((3,), np.uint8), "ndvi": ((), np.float32), "scl": ((), np.uint8)},
+        max_tile_px=10,
+    )
+
+    assert layers["rgb"].shape == (30, 25, 3) and (layers["rgb"] == 9).all()
+    assert layers["ndvi"].shape == (30, 25) and (layers["ndvi"] == 0.5).all()
+    assert layers["scl"].shape == (30, 25) and (layers["scl"] == 4).all()
@@ -0,0 +1,131 @@
+"""Risk engine tests (queries stubbed)"""
+
+from datetime import date
+
+import numpy as np
+from fastapi.testclient import TestClient
+from main import app
+from app.db.queries import GeomarkerQueries, ProjectQueries, RollupQueries, RunQueries
+from app.services import risk_service
+from app.services.risk_service import (
+    ProjectInputs,
+    RiskEngine,
+    determine_work_type,
+    risk_variables,
+    score_variables,
+)
+
+SQUARE = {"type": "Polygon", "coordinates": [[[-87.0, 20.0], [-86.99, 20.0], [-86.99, 20.01], [-87.0, 20.01], [-87.0, 20.0]]]}
+
+
+def test_score_matches_frontend_model():
+    # calculateRiskScore on hand-normalised values
+    variables = np.array([[10, 5, 2.5, 500, 50, 365, 0.5, 0.5, 0.0]])
+    expected = (0.08 * 0.5 + 0.15 * 0.5 + 0.10 * 0.5 + 0.12 * 0.5 + 0.10 * 0.5
+                + 0.05 * 1.0 + 0.15 * 0.5 + 0.12 * 0.5 + 0.13 * 0.5)
+    assert score_variables(variables)[0] == round(expected * 100)
+    assert score_variables(np.zeros((1, 9)) - 1)[0] == 1  # clipped to 1-100
+
+
+def test_work_type():
+    assert determine_work_type({"name": "Tren Maya Tramo 5"}) == "linear"
+    assert determine_work_type({"name": "Parque Industrial"}) == "extensive"
+    assert determine_work_type({"name": "Refinería Dos Bocas"}) == "punctual"
+
+
+def test_risk_variables_from_run_history():
+    inputs = ProjectInputs(
+        area_ha=np.array([100.0, 100.0]),
+        expansion_rate=np.array([0.02, 0.06]),
+        compliance=np.array([0.1, 0.7]),
+        duration_days=np.array([100.0, 100.0]),
+        protected_zone=np.array([False, True]),
+    )
+    runs_project = np.array([0, 0, 0])
+    runs_date = np.array(["2026-01-01", "2026-01-15", "2026-01-08"], dtype="M8[D]")
+    runs_ha = np.array([12.0, 4.0, 0.0])
+    variables = risk_variables(inputs, runs_project, runs_date, runs_ha)
+
+    col = {name: i for i, name in enumerate(risk_service.VARIABLES)}
+    assert variables[0, col["red_zone_events"]] == 1
+    assert variables[0, col["yellow_zone_events"]] == 1
+    assert variables[0, col["affected_surface"]] == 16.0
+    assert variables[0, col["expansion_velocity"]] == 1600.0  # 16 ha over 100 days
+    assert variables[0, col["temporal_trend"]] == 1.0  # 0 ha -> 4 ha between the last two runs
+    assert variables[0, col["exit_frequency"]] == 1.0  # 2 loss runs over 2 weeks
+    # No runs: the work type's expected growth stands in
+    assert variables[1, col["expansion_velocity"]] == 0.06 * 100 * 10_000 / 30 * 0.85
+    assert variables[1, col["sensitive_zone_proximity"]] == 0.7
+
+
+def stub_queries(monkeypatch, rollups, fetched):
+    projects = [
+        {"id": "p-1", "name": "Tren Maya", "risk_label": "high", "region_id": "r-1", "company_id": "c-1",
+         "monitoring_start_date": "2025-06-01"},
+        {"id": "p-2", "name": "Puerto", "risk_label": "low", "region_id": "r-2", "company_id": "c-1",
+         "monitoring_start_date": "2025-06-01"},
+    ]
+    runs = [
+        {"project_id": "p-1", "end_date": "2026-01-07", "hectares_change": 11.0},
+        {"project_id": "p-2", "end_date": "2026-01-07", "hectares_change": 0.0},
+    ]
+    monkeypatch.setattr(ProjectQueries, "get_all_with_relations", staticmethod(lambda: projects))
+    monkeypatch.setattr(ProjectQueries, "get_by_id", staticmethod(
+        lambda pid: next((p for p in projects if p["id"] == pid), None)
+    ))
+    monkeypatch.setattr(RollupQueries, "get_by_project_ids", staticmethod(lambda ids: rollups))
+    monkeypatch.setattr(GeomarkerQueries, "get_active_for_projects", staticmethod(lambda ids: [
+        {"id": f"g-{pid}", "project_id": pid, "geomarker_type": "work_zone", "version": 1, "geojson": SQUARE}
+        for pid in ids
+    ]))
+
+    def fake_runs(ids):
+        fetched.append(sorted(ids))
+        return [r for r in runs if r["project_id"] in ids]
+
+    monkeypatch.setattr(RunQueries, "get_completed_for_projects", staticmethod(fake_runs))
+
+
+def test_engine_recomputes_only_touched_projects(monkeypatch):
+    rollups = [
+        {"project_id": "p-1", "updated_at": "2026-01-08T00:00:00Z"},
+        {"project_id": "p-2", "updated_at": "2026-01-08T00:00:00Z"},
+    ]
+    fetched = []
+    stub_queries(monkeypatch, rollups, fetched)
+    engine = RiskEngine()
+
+    first = engine.get_scores(today=date(2026, 2, 1))
+    assert fetched == [["p-1", "p-2"]]
+    assert first[0].score > first[1].score
+
+    engine.get_scores(today=date(2026, 2, 1))
+    assert len(fetched) == 1  # nothing changed: served from the cache
+
+    rollups[1] = {"project_id": "p-2", "updated_at": "2026-01-15T00:00:00Z"}  # a new run landed
+    engine.get_scores(today=date(2026, 2, 1))
+    assert fetched[-1] == ["p-2"]
+
+
+def test_single_project_score_reads_only_that_project(monkeypatch):
+    fetched = []
+    stub_queries(monkeypatch, [], fetched)
+    today = date(2026, 2, 1)
+
+    alone = RiskEngine().get_score("p-2", today=today)
+    assert fetched == [["p-2"]]
+    assert alone.score == RiskEngine().get_scores(today=today)[1].score
+    assert RiskEngine().get_score("missing", today=today) is None
+
+
+def test_risk_map_endpoint_filters(monkeypatch):
+    fetched = []
+    stub_queries(monkeypatch, [], fetched)
+    monkeypatch.setattr(risk_service, "risk_engine", RiskEngine())
+    client = TestClient(app)
+
+    body = client.get("/risk-map", params={"region_id": "r-2"}).json()
+    assert [p["project_id"] for p in body["projects"]] == ["p-2"]
+    assert body["projects"][0]["work_type"] == "punctual"
+    assert body["projects"][0]["geometry"] == SQUARE
+    assert len(client.get("/risk-map", params={"company_id": "c-1"}).json()["projects"]) == 2
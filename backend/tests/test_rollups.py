@@ -0,0 +1,117 @@
+"""Per-project rollup tests (RPCs stubbed)"""
+
+from app.db.queries import ProjectQueries, GeomarkerQueries, RunQueries, ReportQueries, RollupQueries
+from app.schemas.runs import GEEResultInput
+from app.services import projects_service
+from app.services.rollup_service import apply_run_rollups
+from app.services.runs_service import process_gee_result, process_gee_results_bulk
+
+ROLLUP = {
+    "project_id": "proj-1",
+    "run_count": 3,
+    "total_hectares_lost": 2.5,
+    "trend": "increasing",
+    "last_run_id": "run-3",
+    "last_hectares_change": 1.5,
+    "last_end_date": "2026-01-21",
+    "previous_hectares_change": 0.5,
+    "worst_run_id": "run-3",
+    "worst_hectares_change": 1.5,
+    "worst_end_date": "2026-01-21",
+    "updated_at": "2026-01-22T00:00:00+00:00",
+}
+
+
+def payload(run_id):
+    return {
+        "project_id": "proj-1",
+        "run_id": run_id,
+        "start_date": "2026-01-01",
+        "end_date": "2026-01-28",
+        "stats": {"affected_area_ha": 1.0},
+        "outputs": {},
+        "loss_polygons_url": "",
+        "metadata": {},
+    }
+
+
+def test_ingestion_folds_run_into_rollup(monkeypatch):
+    applied = []
+    monkeypatch.setattr(RunQueries, "ingest_gee_result", staticmethod(
+        lambda params: {"outcome": "ingested", "run": {"id": params["p_run_id"], "project_id": "proj-1"}}
+    ))
+    monkeypatch.setattr(RollupQueries, "apply_runs", staticmethod(lambda ids: applied.append(ids) or []))
+
+    process_gee_result(GEEResultInput(**payload("run-1")))
+    assert applied == [["run-1"]]
+
+    # An idempotent retry changes nothing, so the rollup is left alone
+    monkeypatch.setattr(RunQueries, "ingest_gee_result", staticmethod(
+        lambda params: {"outcome": "duplicate", "run": {"id": params["p_run_id"]}}
+    ))
+    process_gee_result(GEEResultInput(**payload("run-1")))
+    assert applied == [["run-1"]]
+
+
+def test_bulk_ingestion_applies_rollups_once_per_chunk(monkeypatch):
+    applied = []
+    monkeypatch.setattr(RunQueries, "ingest_gee_results", staticmethod(lambda items: [
+        {"run_id": item["run_id"], "outcome": "duplicate" if item["run_id"] == "run-2" else "ingested",
+         "run": {"id": item["run_id"]}}
+        for item in items
+    ]))
+    monkeypatch.setattr(RollupQueries, "apply_runs", staticmethod(lambda ids: applied.append(ids) or []))
+
+    process_gee_results_bulk([GEEResultInput(**payload(f"run-{i}")) for i in range(1, 4)])
+    assert applied == [["run-1", "run-3"]]
+
+
+def test_rollup_failure_does_not_fail_ingestion(monkeypatch):
+    def broken(ids):
+        raise RuntimeError("rpc down")
+
+    monkeypatch.setattr(RunQueries, "ingest_gee_result", staticmethod(
+        lambda params: {"outcome": "ingested", "run": {"id": params["p_run_id"]}}
+    ))
+    monkeypatch.setattr(RollupQueries, "apply_runs", staticmethod(broken))
+    assert process_gee_result(GEEResultInput(**payload("run-1"))).success
+
+
+def test_deadlocked_rollup_is_retried_once(monkeypatch):
+    class Deadlock(Exception):
+        code = "40P01"
+
+    calls = []
+
+    def deadlock_once(ids):
+        calls.append(ids)
+        if len(calls) == 1:
+            raise Deadlock("deadlock detected")
+        return [ROLLUP]
+
+    monkeypatch.setattr(RollupQueries, "apply_runs", staticmethod(deadlock_once))
+    assert apply_run_rollups(["run-3"]) == [ROLLUP]
+    assert calls == [["run-3"], ["run-3"]]
+
+
+def test_projects_list_reads_carbon_from_rollups(monkeypatch):
+    fetched = []
+    monkeypatch.setattr(ProjectQueries, "get_all_with_relations", staticmethod(lambda: [
+        {"id": "proj-1", "name": "A", "status": "active", "risk_label": "low"},
+        {"id": "proj-2", "name": "B", "status": "active", "risk_label": "low"},
+    ]))
+    monkeypatch.setattr(GeomarkerQueries, "get_active_for_project", staticmethod(lambda pid: None))
+    monkeypatch.setattr(RunQueries, "get_last_completed_for_project", staticmethod(lambda pid: {
+        "id": f"last-{pid}", "end_date": "2026-01-21", "hectares_change": 1.5, "status": "completed",
+    }))
+    monkeypatch.setattr(ReportQueries, "get_by_run_id", staticmethod(lambda rid: []))
+    monkeypatch.setattr(RollupQueries, "get_by_project_ids", staticmethod(
+        lambda ids: fetched.append(ids) or [ROLLUP]
+    ))
+
+    projects = projects_service.get_projects_list().projects
+    assert fetched == [["proj-1", "proj-2"]]  # one query for every project
+    assert projects[0].carbon_footprint_tonnes == 1000.0  # 2.5 ha in total, not just the last run
+    assert projects[0].rollup.trend == "increasing"
+    assert projects[1].carbon_footprint_tonnes == 600.0  # no rollup yet: last run only
+    assert projects[1].rollup is None
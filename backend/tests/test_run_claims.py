@@ -0,0 +1,69 @@
+"""Run claim/lease API tests (RPCs stubbed)"""
+
+import time
+from types import SimpleNamespace
+
+import process_queued_runs
+from fastapi.testclient import TestClient
+from main import app
+from app.config import settings
+from app.db.queries import RunQueries
+from app.services import runs_service
+
+
+def test_claim_leases_runs_and_validates_limit(monkeypatch):
+    calls = []
+
+    def fake_claim_ids(run_ids, worker, lease_seconds, max_attempts):
+        calls.append((worker, run_ids))
+        return [{
+            "id": "run-1",
+            "project_id": "proj-1",
+            "start_date": "2026-01-01",
+            "end_date": "2026-01-28",
+            "cadence": "weekly",
+            "method": "ndvi",
+            "cloud_threshold": 30,
+            "status": "processing",
+            "created_at": "2026-01-29T00:00:00",
+            "lease_owner": worker,
+            "lease_expires_at": "2026-01-29T00:10:00",
+            "attempts": 1,
+        }]
+
+    monkeypatch.setattr(runs_service, "select_runs_to_claim", lambda limit: ["run-1"] * min(limit, 1))
+    monkeypatch.setattr(RunQueries, "claim_ids", staticmethod(fake_claim_ids))
+    client = TestClient(app)
+    r = client.post("/runs/claim", params={"worker": "gee-1", "limit": 5})
+    assert r.status_code == 200
+    assert calls == [("gee-1", ["run-1"])]
+    assert r.json()["runs"][0]["lease_owner"] == "gee-1"
+    assert client.post("/runs/claim", params={"worker": "gee-1", "limit": 0}).status_code == 400
+
+
+def test_heartbeat_without_lease_conflicts(monkeypatch):
+    monkeypatch.setattr(RunQueries, "heartbeat", staticmethod(lambda *a: None))
+    client = TestClient(app)
+    r = client.post("/runs/run-1/heartbeat", params={"worker": "gee-2"})
+    assert r.status_code == 409
+
+
+def test_local_processor_claims_one_run_at_a_time_and_heartbeats(monkeypatch):
+    queue = ["run-1", "run-2"]
+    claims, beats = [], []
+
+    def claim_runs(worker, limit):
+        claims.append(limit)
+        return SimpleNamespace(runs=[SimpleNamespace(id=queue.pop(0))] if queue else [])
+
+    def process_run_locally(run_id):
+        time.sleep(0.1)
+        return SimpleNamespace(message="done")
+
+    monkeypatch.setattr(settings, "run_lease_seconds", 0.06)
+    monkeypatch.setattr(process_queued_runs, "claim_runs", claim_runs)
+    monkeypatch.setattr(process_queued_runs, "heartbeat_run", lambda run_id, worker: beats.append(run_id))
+    monkeypatch.setattr(process_queued_runs, "process_run_locally", process_run_locally)
+    assert process_queued_runs.process_queued_runs(limit=5) == 2
+    assert claims == [1, 1, 1]
+    assert beats.count("run-1") >= 2 and beats.count("run-2") >= 2
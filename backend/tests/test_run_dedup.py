@@ -0,0 +1,62 @@
+"""Run deduplication tests (queries stubbed)"""
+
+from fastapi.testclient import TestClient
+from main import app
+from app.db.queries import ProjectQueries, GeomarkerQueries, RunQueries
+from app.utils.fingerprint import run_fingerprint
+
+BODY = {
+    "geomarker_id": "geo-1",
+    "start_date": "2026-01-01",
+    "end_date": "2026-01-28",
+    "parameters": {"b": 2, "a": 1},
+}
+
+
+def test_fingerprint_ignores_key_order_but_not_values():
+    a = run_fingerprint("geo-1", "2026-01-01", "2026-01-28", "ndvi", 30, {"a": 1, "b": 2})
+    b = run_fingerprint("geo-1", "2026-01-01", "2026-01-28", "NDVI", 30, {"b": 2, "a": 1})
+    c = run_fingerprint("geo-2", "2026-01-01", "2026-01-28", "ndvi", 30, {"a": 1, "b": 2})
+    assert a == b
+    assert a != c
+
+
+def _stub_project(monkeypatch, existing_runs):
+    created = []
+    monkeypatch.setattr(ProjectQueries, "get_by_id", staticmethod(lambda pid: {"id": pid}))
+    monkeypatch.setattr(
+        GeomarkerQueries, "get_by_id", staticmethod(lambda gid: {"id": gid, "project_id": "proj-1"})
+    )
+    monkeypatch.setattr(
+        RunQueries, "find_by_fingerprint",
+        staticmethod(lambda fp, statuses: [r for r in existing_runs if r["status"] in statuses]),
+    )
+
+    def fake_create(data):
+        created.append(data)
+        return {**data, "id": "new-run"}
+
+    monkeypatch.setattr(RunQueries, "create", staticmethod(fake_create))
+    return created
+
+
+def test_identical_in_flight_run_is_returned(monkeypatch):
+    created = _stub_project(monkeypatch, [{"id": "run-1", "status": "queued"}])
+    client = TestClient(app)
+    r = client.post("/projects/proj-1/runs", json=BODY)
+    assert r.status_code == 201
+    assert r.json() == {"run_id": "run-1", "status": "queued", "deduplicated": True}
+    assert created == []
+
+
+def test_completed_run_is_reused_unless_forced(monkeypatch):
+    created = _stub_project(monkeypatch, [{"id": "run-1", "status": "completed"}])
+    client = TestClient(app)
+    reused = client.post("/projects/proj-1/runs", json=BODY).json()
+    assert reused["run_id"] == "run-1" and reused["deduplicated"] is True
+
+    forced = client.post("/projects/proj-1/runs", json={**BODY, "force": True}).json()
+    assert forced == {"run_id": "new-run", "status": "queued", "deduplicated": False}
+    assert created[0]["fingerprint"] == run_fingerprint(
+        "geo-1", "2026-01-01", "2026-01-28", "ndvi", 30, {"a": 1, "b": 2}
+    )
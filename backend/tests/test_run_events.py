@@ -0,0 +1,70 @@
+"""Run event broker tests (SSE pub/sub)"""
+
+import asyncio
+import threading
+
+from app.services.events_service import RunEventBroker, format_sse
+
+
+def _run(run_id="run-1", project_id="proj-1", status="queued", hectares=None):
+    return {
+        "id": run_id,
+        "project_id": project_id,
+        "status": status,
+        "hectares_change": hectares,
+        "finished_at": None,
+    }
+
+
+def test_shared_poll_serves_all_watchers_with_one_fetch():
+    calls = []
+
+    def fetcher(run_ids, project_ids, since):
+        calls.append((sorted(run_ids), sorted(project_ids)))
+        return [_run(status="completed", hectares=4.2)]
+
+    async def scenario():
+        broker = RunEventBroker(poll_interval=3600, fetcher=fetcher)
+        async with broker.subscribe(run_id="run-1") as q1, \
+                broker.subscribe(run_id="run-1") as q2, \
+                broker.subscribe(project_id="proj-1") as q3:
+            await broker.poll_once()
+            events = [await asyncio.wait_for(q.get(), 1) for q in (q1, q2, q3)]
+            # Unchanged state on the next tick is not re-delivered
+            await broker.poll_once()
+            await asyncio.sleep(0)
+            assert all(q.empty() for q in (q1, q2, q3))
+        return events
+
+    events = asyncio.run(scenario())
+    assert calls == [(["run-1"], ["proj-1"]), (["run-1"], ["proj-1"])]
+    assert {e["status"] for e in events} == {"completed"}
+    assert events[0]["hectares_change"] == 4.2
+
+
+def test_publish_from_worker_thread_reaches_subscriber():
+    async def scenario():
+        broker = RunEventBroker(poll_interval=3600, fetcher=lambda *a: [])
+        async with broker.subscribe(run_id="run-1") as queue:
+            worker = threading.Thread(
+                target=broker.publish, args=(_run(status="completed"),)
+            )
+            worker.start()
+            worker.join()
+            return await asyncio.wait_for(queue.get(), 1)
+
+    event = asyncio.run(scenario())
+    assert event["run_id"] == "run-1"
+    assert event["status"] == "completed"
+
+
+def test_unwatched_runs_are_not_cached():
+    broker = RunEventBroker(poll_interval=3600, fetcher=lambda *a: [])
+    broker.publish(_run(run_id="run-9"))
+    assert broker.snapshot("run-9") is None
+
+
+def test_format_sse_framing():
+    frame = format_sse({"run_id": "run-1", "status": "queued"})
+    assert frame.startswith("event: run\ndata: ")
+    assert frame.endswith("\n\n")
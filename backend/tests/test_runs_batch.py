@@ -0,0 +1,57 @@
+"""Batch multi-get endpoint tests (queries stubbed)"""
+
+from fastapi.testclient import TestClient
+from main import app
+from app.db.queries import RunQueries, ReportQueries
+
+RUN = {
+    "id": "run-1",
+    "project_id": "proj-1",
+    "start_date": "2026-01-01",
+    "end_date": "2026-01-28",
+    "cadence": "weekly",
+    "method": "ndvi",
+    "cloud_threshold": 30,
+    "status": "completed",
+    "created_at": "2026-01-29T00:00:00",
+}
+
+
+def test_get_runs_batch_uses_one_query(monkeypatch):
+    calls = []
+
+    def fake_get_by_ids(run_ids):
+        calls.append(run_ids)
+        return [RUN]
+
+    monkeypatch.setattr(RunQueries, "get_by_ids", staticmethod(fake_get_by_ids))
+    client = TestClient(app)
+    r = client.get("/runs", params={"ids": "run-1, run-2,run-1"})
+    assert r.status_code == 200
+    body = r.json()
+    assert calls == [["run-1", "run-2"]]
+    assert body["runs"]["run-1"]["status"] == "completed"
+    assert body["missing"] == ["run-2"]
+
+
+def test_get_reports_batch_keyed_by_run(monkeypatch):
+    report = {
+        "run_id": "run-1",
+        "report_type": "after_image",
+        "public_url": "https://example.supabase.co/storage/after.png",
+        "created_at": "2026-01-29T00:00:00",
+    }
+    monkeypatch.setattr(ReportQueries, "get_by_run_ids", staticmethod(lambda ids: [report]))
+    client = TestClient(app)
+    r = client.get("/reports", params={"run_ids": "run-1,run-2"})
+    assert r.status_code == 200
+    reports = r.json()["reports"]
+    assert [x["report_type"] for x in reports["run-1"]] == ["after_image"]
+    assert reports["run-2"] == []
+
+
+def test_batch_rejects_empty_and_oversized_id_lists():
+    client = TestClient(app)
+    assert client.get("/runs", params={"ids": " , "}).status_code == 400
+    too_many = ",".join(f"run-{i}" for i in range(101))
+    assert client.get("/reports", params={"run_ids": too_many}).status_code == 400
@@ -0,0 +1,82 @@
+"""Run scheduler tests (pure planning, no DB)"""
+
+from datetime import datetime, timedelta, timezone
+
+from app.db.queries import RunQueries
+from app.services import scheduler_service
+from app.services.scheduler_service import QueuedRun, RunScheduler, select_runs_to_claim
+
+NOW = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def _run(run_id, company, risk, hours_ago):
+    return QueuedRun(
+        run_id=run_id,
+        project_id=f"proj-{run_id}",
+        company_id=company,
+        risk_label=risk,
+        created_at=NOW - timedelta(hours=hours_ago),
+    )
+
+
+def _scheduler(**overrides):
+    config = dict(max_concurrency=10, company_share=0.5, aging_per_hour=0.1)
+    config.update(overrides)
+    return RunScheduler(**config)
+
+
+def test_high_risk_runs_jump_a_large_backfill():
+    backfill = [_run(f"bf-{i}", "acme", "low", hours_ago=2) for i in range(500)]
+    urgent = [_run("hr-1", "gov", "high", hours_ago=0), _run("hr-2", "gov", "high", hours_ago=0)]
+    picked = _scheduler().plan(backfill + urgent, {}, limit=3, now=NOW)
+    assert picked[:2] == ["hr-1", "hr-2"]
+    assert picked[2].startswith("bf-")
+
+
+def test_company_share_caps_backfill_while_others_wait():
+    backfill = [_run(f"bf-{i}", "acme", "medium", hours_ago=i) for i in range(20)]
+    monitoring = [_run(f"m-{i}", "gov", "low", hours_ago=0) for i in range(3)]
+    picked = _scheduler(work_conserving=False).plan(backfill + monitoring, {"acme": 3}, limit=7, now=NOW)
+    assert sum(p.startswith("bf-") for p in picked) == 2  # quota 5, 3 already running
+    assert sum(p.startswith("m-") for p in picked) == 3
+
+
+def test_spare_capacity_is_lent_when_work_conserving():
+    backfill = [_run(f"bf-{i}", "acme", "low", hours_ago=1) for i in range(20)]
+    picked = _scheduler().plan(backfill, {}, limit=8, now=NOW)
+    assert len(picked) == 8
+
+
+def test_concurrency_cap_limits_claims():
+    queued = [_run(f"r-{i}", f"c-{i}", "high", hours_ago=0) for i in range(10)]
+    assert len(_scheduler().plan(queued, {"x": 4, "y": 4}, limit=10, now=NOW)) == 2
+    assert _scheduler().plan(queued, {"x": 10}, limit=10, now=NOW) == []
+
+
+def test_expired_leases_are_requeued_when_they_fill_the_cap(monkeypatch):
+    # Every slot is held by runs of a crashed worker, and nothing is queued
+    runs = [{"id": f"r-{i}", "project_id": "p", "status": "processing", "expired": True,
+             "created_at": "2026-03-01T00:00:00+00:00", "project": {"company_id": "acme", "risk_label": "low"}}
+            for i in range(3)]
+
+    def requeue_expired(max_attempts):
+        for run in runs:
+            if run["status"] == "processing" and run["expired"]:
+                run["status"] = "queued"
+        return 3
+
+    monkeypatch.setattr(RunQueries, "requeue_expired", staticmethod(requeue_expired))
+    monkeypatch.setattr(RunQueries, "get_queued_candidates", staticmethod(
+        lambda limit, risk_labels=None: [] if risk_labels else [r for r in runs if r["status"] == "queued"]
+    ))
+    monkeypatch.setattr(RunQueries, "get_processing_companies", staticmethod(
+        lambda: [r for r in runs if r["status"] == "processing"]
+    ))
+    monkeypatch.setattr(scheduler_service, "scheduler", _scheduler(max_concurrency=3, company_share=1.0))
+    assert sorted(select_runs_to_claim(limit=5)) == ["r-0", "r-1", "r-2"]
+
+
+def test_aging_eventually_beats_risk():
+    old_low = _run("old", "acme", "low", hours_ago=40)
+    fresh_high = _run("fresh", "gov", "high", hours_ago=0)
+    assert _scheduler().plan([fresh_high, old_low], {}, limit=1, now=NOW) == ["old"]
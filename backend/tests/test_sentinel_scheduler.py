@@ -0,0 +1,227 @@
+"""Sentinel request scheduler tests (token buckets, retries against a local fake server)"""
+
+import json
+import random
+import threading
+import urllib.request
+from datetime import datetime
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services import sentinel_scheduler
+from app.services.sentinel_scheduler import (
+    ProcessingBudgetExceeded,
+    RunBudget,
+    SentinelScheduler,
+    TokenBucket,
+    estimate_processing_units,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeSentinelHub:
+    """Local HTTP server answering with a scripted list of (status, headers)"""
+
+    def __init__(self, script, body=None):
+        self.script = list(script)
+        self.hits = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path.endswith("/oauth/token"):
+                    # OAuth for sentinelhub's session; not part of the script
+                    status, headers = 200, {"Content-Type": "application/json"}
+                    body = json.dumps({"access_token": "token", "token_type": "Bearer", "expires_in": 3600}).encode()
+                else:
+                    fake.hits += 1
+                    status, headers = fake.script.pop(0) if fake.script else (200, {})
+                    body = json.dumps(body_of(status)).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        def body_of(status):
+            return body if body is not None and status == 200 else {"status": status}
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.url = f"{self.base_url}/api/v1/process"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def request(self):
+        req = urllib.request.Request(self.url, data=b"{}", method="POST")
+        with urllib.request.urlopen(req, timeout=5) as response:
+            return json.loads(response.read())
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def _scheduler(clock, **kwargs):
+    return SentinelScheduler(
+        requests_per_minute=kwargs.pop("requests_per_minute", 600),
+        processing_units_per_minute=kwargs.pop("processing_units_per_minute", 600),
+        clock=clock,
+        sleep=clock.sleep,
+        rng=random.Random(7),
+        **kwargs,
+    )
+
+
+def test_token_bucket_allows_burst_then_paces(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3, clock=clock, sleep=clock.sleep)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() == 0.5
+    clock.now += 10  # refills, but never beyond capacity
+    assert [bucket.acquire() for _ in range(4)] == [0.0, 0.0, 0.0, 0.5]
+    # A big request waits for all of its tokens
+    assert bucket.acquire(5) == pytest.approx(2.5)
+
+
+def test_retries_throttling_from_fake_server(clock):
+    hub = FakeSentinelHub([
+        (429, {"Retry-After": "1500"}),  # Sentinel Hub sends milliseconds
+        (503, {}),
+        (429, {}),
+        (200, {}),
+    ])
+    try:
+        scheduler = _scheduler(clock, backoff_base_seconds=2, backoff_max_seconds=5)
+        assert scheduler.call(hub.request, processing_units=1.0) == {"status": 200}
+    finally:
+        hub.close()
+
+    assert hub.hits == 4
+    assert clock.sleeps[0] == 1.5
+    assert 0 <= clock.sleeps[1] <= 4 and 0 <= clock.sleeps[2] <= 5  # jittered, capped
+    counters = scheduler.snapshot()
+    assert counters["requests"] == 4 and counters["retries"] == 3
+    assert counters["throttled"] == 2 and counters["server_errors"] == 1
+    assert counters["succeeded"] == 1 and counters["processing_units"] == 1.0
+
+
+def test_standard_retry_after_is_in_seconds(clock):
+    hub = FakeSentinelHub([(503, {"Retry-After": "2"}), (200, {})])
+    try:
+        assert _scheduler(clock).call(hub.request) == {"status": 200}
+    finally:
+        hub.close()
+    assert clock.sleeps == [2.0]
+
+
+def test_service_throttling_reaches_the_scheduler(monkeypatch, clock):
+    pytest.importorskip("sentinelhub")
+    from sentinelhub import DataCollection, SHConfig
+
+    from app.services import sentinel_service
+    from tests.test_analysis import SQUARE
+
+    # sentinelhub's OAuth session refuses plain http otherwise
+    monkeypatch.setenv("OAUTHLIB_INSECURE_TRANSPORT", "1")
+    hub = FakeSentinelHub(
+        [(429, {"Retry-After": "250"}), (503, {}), (200, {"Content-Type": "application/json"})],
+        body={"data": []},
+    )
+    try:
+        config = SHConfig()
+        config.sh_client_id, config.sh_client_secret = "client", "secret"
+        config.sh_base_url = hub.base_url
+        config.sh_token_url = f"{hub.base_url}/oauth/token"
+        config.max_download_attempts = 1
+        # Sentinel-2 L2A pins its own service URL; point a copy at the fake
+        collection = DataCollection.SENTINEL2_L2A.define_from(
+            f"S2L2A_FAKE_{hub.server.server_port}", service_url=hub.base_url,
+        )
+        monkeypatch.setattr(sentinel_service, "DataCollection", SimpleNamespace(SENTINEL2_L2A=collection))
+        scheduler = _scheduler(clock, backoff_base_seconds=2, backoff_max_seconds=5)
+        service = sentinel_service.SentinelService(config=config, scheduler=scheduler)
+        assert service.fetch_statistics(SQUARE, datetime(2026, 1, 1), datetime(2026, 1, 29)) == []
+    finally:
+        hub.close()
+
+    # Both errors came back from sentinelhub's client instead of being retried inside it
+    assert hub.hits == 3
+    assert clock.sleeps[0] == 0.25 and 0 <= clock.sleeps[1] <= 4
+    counters = scheduler.snapshot()
+    assert counters["throttled"] == 1 and counters["server_errors"] == 1 and counters["succeeded"] == 1
+
+
+def test_gives_up_after_max_retries_and_never_retries_client_errors(clock):
+    hub = FakeSentinelHub([(429, {})] * 3 + [(400, {})])
+    try:
+        scheduler = _scheduler(clock, max_retries=2)
+        with pytest.raises(HTTPError) as throttled:
+            scheduler.call(hub.request)
+        assert throttled.value.code == 429 and hub.hits == 3
+
+        with pytest.raises(HTTPError) as bad_request:
+            scheduler.call(hub.request)
+        assert bad_request.value.code == 400 and hub.hits == 4
+    finally:
+        hub.close()
+    assert scheduler.snapshot()["failed"] == 2
+
+
+def test_run_budget_blocks_requests_before_sending(clock):
+    scheduler = _scheduler(clock)
+    budget = RunBudget(limit=5.0)
+    calls = []
+
+    scheduler.call(lambda: calls.append(1), processing_units=4.0, budget=budget)
+    with pytest.raises(ProcessingBudgetExceeded):
+        scheduler.call(lambda: calls.append(2), processing_units=2.0, budget=budget)
+
+    assert calls == [1] and budget.spent == 4.0
+    assert scheduler.snapshot()["budget_exceeded"] == 1
+
+
+def test_processing_unit_rate_limits_large_requests(clock):
+    # 60 PU/min = 1 PU/s, bursts of 10 PU
+    scheduler = _scheduler(clock, processing_units_per_minute=60)
+    units = estimate_processing_units(1024, 1024, input_bands=3)
+    assert units == 4.0
+    for _ in range(4):
+        scheduler.call(lambda: None, processing_units=units)
+    # 16 PU against a 10 PU burst: the last two requests wait 2 s and 4 s
+    assert sum(clock.sleeps) == pytest.approx(6.0)
+
+
+def test_sentinel_health_exposes_counters(monkeypatch, clock):
+    from main import app
+
+    scheduler = _scheduler(clock)
+    scheduler.call(lambda: None, processing_units=0.5)
+    monkeypatch.setattr(sentinel_scheduler, "_scheduler", scheduler)
+
+    body = TestClient(app).get("/health/sentinel").json()
+    assert body["requests"] == 1 and body["processing_units"] == 0.5
@@ -0,0 +1,152 @@
+"""Statistics-only pre-check tests (Statistical API payloads, cache, triggers)"""
+
+from datetime import date
+
+from app.db.queries import GeomarkerQueries, RunQueries, StatisticsQueries
+from app.schemas.runs import GEEResultResponse
+from app.services import analysis_service
+from app.services.analysis_service import precheck_run
+from app.services.runs_service import build_gee_ingestion
+from app.services.statistics_service import get_interval_statistics, parse_statistics
+
+from tests.test_analysis import RUN, SQUARE, StubSource, _cleared
+
+GEOMARKER = {"id": "geo-1", "version": 2, "geojson": SQUARE}
+
+
+def _payload(mean, below, samples=1000, no_data=100, interval=("2026-01-15", "2026-01-29")):
+    def output(value):
+        return {"bands": {"B0": {"stats": {
+            "min": 0.0, "max": 1.0, "mean": value, "stDev": 0.1,
+            "sampleCount": samples, "noDataCount": no_data,
+        }}}}
+
+    return {"data": [{
+        "interval": {"from": f"{interval[0]}T00:00:00Z", "to": f"{interval[1]}T00:00:00Z"},
+        "outputs": {"ndvi": output(mean), "below": output(below)},
+    }], "status": "OK"}
+
+
+class StatsSource(StubSource):
+    """Scenes like StubSource plus Statistical API answers keyed by interval end"""
+
+    def __init__(self, by_end, cleared=None):
+        super().__init__(cleared)
+        self.by_end = by_end
+        self.stat_calls = []
+
+    def fetch_statistics(self, geojson, date_from, date_to, resolution=20, max_cloud_coverage=30, ndvi_floor=0.3):
+        end = date_to.date().isoformat()
+        self.stat_calls.append((date_from.date().isoformat(), end))
+        return parse_statistics(self.by_end[end])
+
+
+def test_parse_statistics_reads_means_and_cloud_fraction():
+    parsed = parse_statistics(_payload(0.72, 0.05, samples=1000, no_data=250))
+    assert parsed == [{
+        "interval_from": "2026-01-15",
+        "interval_to": "2026-01-29",
+        "mean_ndvi": 0.72,
+        "below_fraction": 0.05,
+        "cloud_fraction": 0.25,
+        "valid_pixel_count": 750,
+        "sample_count": 1000,
+    }]
+
+    fully_cloudy = parse_statistics(_payload("NaN", "NaN", no_data=1000))[0]
+    assert fully_cloudy["mean_ndvi"] is None and fully_cloudy["valid_pixel_count"] == 0
+    assert parse_statistics({"data": [{"interval": {}, "error": {"type": "EXECUTION_ERROR"}}]}) == []
+
+
+def test_interval_statistics_are_cached_per_geomarker_version(monkeypatch):
+    store = {}
+    monkeypatch.setattr(StatisticsQueries, "get_by_cache_keys", staticmethod(
+        lambda keys: [store[k] for k in keys if k in store]
+    ))
+    monkeypatch.setattr(StatisticsQueries, "upsert_many", staticmethod(
+        lambda rows: store.update({r["cache_key"]: r for r in rows}) or rows
+    ))
+    source = StatsSource({"2026-01-15": _payload(0.8, 0.0), "2026-01-29": _payload(0.8, 0.0)})
+    intervals = [(date(2026, 1, 1), date(2026, 1, 15)), (date(2026, 1, 15), date(2026, 1, 29))]
+
+    def fetch(geomarker, today=date(2026, 2, 1)):
+        return get_interval_statistics(geomarker, intervals, source, 20, 30, 0.3, today=today)
+
+    first = fetch(GEOMARKER)
+    assert len(source.stat_calls) == 2 and not any(r["cached"] for r in first)
+    second = fetch(GEOMARKER)
+    assert len(source.stat_calls) == 2 and all(r["cached"] for r in second)
+    assert second[1]["mean_ndvi"] == 0.8
+
+    # A new geomarker version has new geometry: nothing is reused
+    fetch({**GEOMARKER, "version": 3})
+    assert len(source.stat_calls) == 4
+
+    # Intervals too recent for late acquisitions are not stored
+    store.clear()
+    fetch(GEOMARKER, today=date(2026, 1, 30))
+    assert len(store) == 1 and next(iter(store)).startswith("geo-1:v2:2026-01-01:2026-01-15:")
+
+
+def _no_cache(monkeypatch):
+    monkeypatch.setattr(StatisticsQueries, "get_by_cache_keys", staticmethod(lambda keys: []))
+    monkeypatch.setattr(StatisticsQueries, "upsert_many", staticmethod(lambda rows: rows))
+
+
+def test_precheck_triggers_on_ndvi_drop_and_cloud_cover(monkeypatch):
+    _no_cache(monkeypatch)
+    stable = StatsSource({"2026-01-01": _payload(0.8, 0.02), "2026-01-29": _payload(0.79, 0.02)})
+    check = precheck_run(RUN, GEOMARKER, stable)
+    assert not check.needs_imagery
+    assert stable.stat_calls == [("2025-12-18", "2026-01-01"), ("2026-01-15", "2026-01-29")]
+    assert check.stats["affected_area_ha"] == 0.0 and check.stats["method"] == "statistics"
+
+    dropped = StatsSource({"2026-01-01": _payload(0.8, 0.02), "2026-01-29": _payload(0.6, 0.02)})
+    assert precheck_run(RUN, GEOMARKER, dropped).triggers == ["mean_ndvi_drop"]
+
+    # 1000 px of 0.04 ha = 40 ha; 5% more below the floor = 2 ha
+    cleared = StatsSource({"2026-01-01": _payload(0.8, 0.02), "2026-01-29": _payload(0.78, 0.07)})
+    assert precheck_run(RUN, GEOMARKER, cleared).triggers == ["non_vegetated_area_growth"]
+
+    cloudy = StatsSource({"2026-01-01": _payload(0.8, 0.0), "2026-01-29": _payload(0.8, 0.0, no_data=950)})
+    assert precheck_run(RUN, GEOMARKER, cloudy).triggers == ["insufficient_clear_pixels"]
+
+
+def _ingest(monkeypatch, source):
+    submitted = []
+
+    def fake_process(gee_data):
+        submitted.append(gee_data)
+        return GEEResultResponse(success=True, run_id=gee_data.run_id, status="completed", message="ok")
+
+    _no_cache(monkeypatch)
+    monkeypatch.setattr(RunQueries, "get_by_id", staticmethod(lambda run_id: RUN))
+    monkeypatch.setattr(GeomarkerQueries, "get_by_id", staticmethod(lambda gid: GEOMARKER))
+    monkeypatch.setattr(analysis_service, "process_gee_result", fake_process)
+    monkeypatch.setattr(analysis_service, "upload_bytes", lambda path, content, content_type: f"https://storage/{path}")
+    analysis_service.process_run_locally("run-1", source=source)
+    return submitted[0]
+
+
+def test_stable_run_is_ingested_without_imagery(monkeypatch):
+    source = StatsSource({"2026-01-01": _payload(0.8, 0.02), "2026-01-29": _payload(0.8, 0.02)})
+    gee_data = _ingest(monkeypatch, source)
+
+    assert source.calls == []  # no scene requested
+    assert gee_data.stats["method"] == "statistics"
+    assert gee_data.outputs == {} and gee_data.metadata["engine"] == "statistical_api"
+    # No loss on clear pixels is a low risk, not an unknown one
+    assert build_gee_ingestion(gee_data)["p_risk_label"] == "low"
+
+
+def test_triggered_run_fetches_full_imagery(monkeypatch):
+    source = StatsSource(
+        {"2026-01-01": _payload(0.8, 0.02), "2026-01-29": _payload(0.5, 0.3)},
+        cleared=lambda b: _cleared(b, slice(None), slice(None)),
+    )
+    gee_data = _ingest(monkeypatch, source)
+
+    assert len(source.calls) == 2
+    assert gee_data.stats["method"] == "local_numpy"
+    assert gee_data.stats["statistics_triggers"] == ["mean_ndvi_drop", "non_vegetated_area_growth"]
+    assert gee_data.stats["affected_area_ha"] > 100
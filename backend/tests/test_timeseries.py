@@ -0,0 +1,129 @@
+"""Per-project NDVI time-series store tests (runs table stubbed)"""
+
+from datetime import date, datetime, timezone
+
+from fastapi.testclient import TestClient
+from main import app
+from app.config import settings
+from app.db.queries import ProjectQueries, RunQueries
+from app.services import timeseries_service
+from app.services.timeseries_service import read_timeseries, record_run
+
+NOW = datetime(2026, 2, 1, 12, tzinfo=timezone.utc)
+
+
+def make_run(run_id, end_date, loss, ndvi_after=0.7, finished_at="2026-02-01T00:00:00Z"):
+    return {
+        "id": run_id,
+        "project_id": "proj-1",
+        "end_date": end_date,
+        "finished_at": finished_at,
+        "hectares_change": loss,
+        "stats": {"mean_ndvi_before": 0.8, "mean_ndvi_after": ndvi_after, "cloud_fraction_after": 0.1},
+    }
+
+
+def use_store(monkeypatch, tmp_path, runs, catchup_seconds=0):
+    monkeypatch.setattr(settings, "timeseries_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "timeseries_catchup_seconds", catchup_seconds)
+    monkeypatch.setattr(timeseries_service, "_utcnow", lambda: NOW)
+    calls = []
+
+    def fake_completed(project_id, finished_since=None):
+        calls.append(finished_since)
+        return [r for r in runs if not finished_since or r["finished_at"] >= finished_since]
+
+    monkeypatch.setattr(RunQueries, "get_completed_since", staticmethod(fake_completed))
+    return calls
+
+
+def test_missing_file_is_backfilled_then_appended(monkeypatch, tmp_path):
+    runs = [make_run("run-1", "2026-01-07", 1.0), make_run("run-2", "2026-01-14", 2.5)]
+    calls = use_store(monkeypatch, tmp_path, runs)
+
+    points = read_timeseries("proj-1")
+    assert [p["date"] for p in points] == [date(2026, 1, 7), date(2026, 1, 14)]
+    assert [p["cumulative_loss_ha"] for p in points] == [1.0, 3.5]
+    assert calls == [None]
+
+    record_run(make_run("run-3", "2026-01-21", 0.5, finished_at="2026-02-02T00:00:00Z"))
+    points = read_timeseries("proj-1")
+    assert len(points) == 3
+    assert points[-1]["loss_ha"] == 0.5
+    # Catch-up asks for runs since the last query (minus the overlap)
+    assert calls[-1] == "2026-02-01T11:55:00Z"
+
+
+def test_catch_up_query_is_rate_limited(monkeypatch, tmp_path):
+    runs = [make_run("run-1", "2026-01-07", 1.0)]
+    calls = use_store(monkeypatch, tmp_path, runs, catchup_seconds=60)
+
+    for _ in range(3):
+        assert len(read_timeseries("proj-1")) == 1
+    assert calls == [None]  # the backfill; later reads stay local
+
+    record_run(make_run("run-2", "2026-01-14", 2.0, finished_at="2026-02-02T00:00:00Z"))
+    assert len(read_timeseries("proj-1")) == 2 and calls == [None]
+
+
+def test_local_appends_do_not_hide_other_instances_runs(monkeypatch, tmp_path):
+    runs = [make_run("run-1", "2026-01-07", 1.0, finished_at="2026-02-01T11:00:00Z")]
+    use_store(monkeypatch, tmp_path, runs)
+    assert len(read_timeseries("proj-1")) == 1  # backfill at 12:00
+
+    # Ingested here at 12:30; another instance finished run-3 at 12:10
+    local = make_run("run-2", "2026-01-14", 2.0, finished_at="2026-02-01T12:30:00Z")
+    record_run(local)
+    runs += [local, make_run("run-3", "2026-01-21", 0.5, finished_at="2026-02-01T12:10:00Z")]
+
+    points = read_timeseries("proj-1")
+    assert [p["loss_ha"] for p in points] == [1.0, 2.0, 0.5]
+    assert len(read_timeseries("proj-1")) == 3  # not appended twice
+
+
+def test_reingested_run_keeps_latest_record(monkeypatch, tmp_path):
+    use_store(monkeypatch, tmp_path, [])
+    record_run(make_run("run-1", "2026-01-07", 4.0))
+    record_run(make_run("run-1", "2026-01-07", 1.5, finished_at="2026-02-03T00:00:00Z"))
+
+    points = read_timeseries("proj-1")
+    assert len(points) == 1
+    assert points[0]["loss_ha"] == 1.5
+
+
+def test_range_and_monthly_downsampling(monkeypatch, tmp_path):
+    runs = [
+        make_run("a", "2026-01-05", 1.0, ndvi_after=0.6),
+        make_run("b", "2026-01-20", 2.0, ndvi_after=0.8),
+        make_run("c", "2026-02-03", 0.0),
+        make_run("d", "2026-03-10", 3.0),
+    ]
+    use_store(monkeypatch, tmp_path, runs)
+
+    monthly = read_timeseries("proj-1", resolution="month")
+    assert [p["date"] for p in monthly] == [date(2026, 1, 1), date(2026, 2, 1), date(2026, 3, 1)]
+    assert monthly[0]["run_count"] == 2
+    assert monthly[0]["loss_ha"] == 3.0
+    assert abs(monthly[0]["mean_ndvi_after"] - 0.7) < 1e-6
+
+    ranged = read_timeseries("proj-1", date_from=date(2026, 1, 10), date_to=date(2026, 2, 28))
+    assert [p["date"] for p in ranged] == [date(2026, 1, 20), date(2026, 2, 3)]
+    assert ranged[0]["cumulative_loss_ha"] == 3.0  # includes run "a" before the range
+
+    weekly = read_timeseries("proj-1", resolution="week")
+    assert weekly[0]["date"] == date(2026, 1, 5)  # a Monday
+
+
+def test_timeseries_endpoint(monkeypatch, tmp_path):
+    use_store(monkeypatch, tmp_path, [make_run("run-1", "2026-01-07", 1.0)])
+    monkeypatch.setattr(ProjectQueries, "get_by_id", staticmethod(lambda pid: {"id": pid} if pid == "proj-1" else None))
+    client = TestClient(app)
+
+    response = client.get("/projects/proj-1/timeseries", params={"from": "2026-01-01", "resolution": "month"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["resolution"] == "month"
+    assert body["points"][0]["date"] == "2026-01-01"
+
+    assert client.get("/projects/missing/timeseries").status_code == 404
+    assert client.get("/projects/proj-1/timeseries", params={"resolution": "hour"}).status_code == 422
@@ -0,0 +1,233 @@
+"""Webhook dispatcher tests, end to end against a local HTTP sink (outbox in memory)"""
+
+import asyncio
+import contextlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from app.config import settings
+from app.db.queries import AlertQueries, GeomarkerQueries, RollupQueries, RunQueries
+from app.schemas.runs import GEEResultInput
+from app.services import webhook_service
+from app.services.runs_service import process_gee_result
+from app.services.webhook_service import WebhookDispatcher, make_batches, sign
+
+
+class MemoryOutbox:
+    """The outbox contract of WebhookQueries (15_webhooks.sql), in memory"""
+
+    def __init__(self, endpoints):
+        self.endpoints = endpoints
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def enqueue(self, events):
+        with self.lock:
+            for event in events:
+                for endpoint in self.endpoints:
+                    if not endpoint["event_types"] or event["type"] in endpoint["event_types"]:
+                        self.rows.append({
+                            "id": len(self.rows) + 1, "endpoint_id": endpoint["id"], "event_id": event["id"],
+                            "event_type": event["type"], "payload": event["data"], "created_at": event["created_at"],
+                            "status": "pending", "attempts": 0, "next_attempt_at": "",
+                        })
+            return len(self.rows)
+
+    def claim(self, worker, limit, lease_seconds, exclude_endpoints):
+        now = datetime.now(timezone.utc).isoformat()
+        claimed = []
+        with self.lock:
+            for row in self.rows:
+                if len(claimed) < limit and row["status"] == "pending" and row["next_attempt_at"] <= now \
+                        and row["endpoint_id"] not in exclude_endpoints:
+                    row["status"] = "delivering"
+                    row["attempts"] += 1
+                    endpoint = next(e for e in self.endpoints if e["id"] == row["endpoint_id"])
+                    claimed.append({**row, **{k: endpoint[k] for k in ("url", "secret", "max_concurrency")}})
+        return claimed
+
+    def _set(self, ids, **values):
+        with self.lock:
+            for row in self.rows:
+                if row["id"] in ids:
+                    row.update(values)
+
+    def mark_delivered(self, ids):
+        self._set(ids, status="delivered", delivered_at=datetime.now(timezone.utc).isoformat())
+
+    def retry(self, ids, error, next_attempt_at):
+        self._set(ids, status="pending", last_error=error, next_attempt_at=next_attempt_at)
+
+    def dead_letter(self, ids, error):
+        self._set(ids, status="dead", last_error=error)
+
+    def prune_delivered(self, before, limit):
+        with self.lock:
+            old = [row for row in self.rows if row["status"] == "delivered" and row["delivered_at"] < before][:limit]
+            self.rows = [row for row in self.rows if row not in old]
+            return len(old)
+
+    def statuses(self, endpoint_id):
+        return [row["status"] for row in self.rows if row["endpoint_id"] == endpoint_id]
+
+
+class Sink(BaseHTTPRequestHandler):
+    received = {}  # path -> list of (headers, body)
+    active = {}
+    peak = {}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with self.lock:
+            self.active[self.path] = self.active.get(self.path, 0) + 1
+            self.peak[self.path] = max(self.peak.get(self.path, 0), self.active[self.path])
+            self.received.setdefault(self.path, []).append((dict(self.headers), json.loads(body)))
+        if self.path == "/slow":
+            time.sleep(0.3)
+        with self.lock:
+            self.active[self.path] -= 1
+        self.send_response(500 if self.path == "/broken" else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sink():
+    Sink.received, Sink.active, Sink.peak = {}, {}, {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Sink)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def endpoint(endpoint_id, url, max_concurrency=2, event_types=()):
+    return {"id": endpoint_id, "url": url, "secret": "s3cret", "max_concurrency": max_concurrency,
+            "event_types": list(event_types)}
+
+
+async def stop(task):
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+async def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+def test_make_batches_groups_per_endpoint():
+    rows = [{"id": i, "endpoint_id": "a" if i % 3 else "b", "url": "u", "max_concurrency": 1} for i in range(1, 8)]
+    batches = make_batches(rows, batch_size=2)
+    assert [(b.endpoint_id, [r["id"] for r in b.deliveries]) for b in batches] == [
+        ("a", [1, 2]), ("a", [4, 5]), ("a", [7]), ("b", [3, 6]),
+    ]
+
+
+def test_slow_receiver_never_blocks_ingestion(monkeypatch, tmp_path, sink):
+    monkeypatch.setattr(settings, "webhooks_enabled", True)
+    monkeypatch.setattr(settings, "timeseries_dir", str(tmp_path))
+    monkeypatch.setattr(RunQueries, "ingest_gee_result", staticmethod(lambda params: {
+        "outcome": "ingested",
+        "run": {"id": params["p_run_id"], "project_id": "proj-1", "hectares_change": params["p_hectares_change"],
+                "start_date": "2026-01-01", "end_date": "2026-01-28"},
+    }))
+    monkeypatch.setattr(RollupQueries, "apply_runs", staticmethod(lambda ids: []))
+    monkeypatch.setattr(GeomarkerQueries, "get_by_ids", staticmethod(lambda ids: []))
+    monkeypatch.setattr(AlertQueries, "replace_for_runs", staticmethod(lambda run_ids, alerts: [
+        {**alert, "id": f"alert-{alert['run_id']}"} for alert in alerts
+    ]))
+
+    outbox = MemoryOutbox([
+        endpoint("fast", f"{sink}/fast", event_types=["alert.raised"]),
+        endpoint("slow", f"{sink}/slow", max_concurrency=1),
+    ])
+    dispatcher = WebhookDispatcher(outbox, workers=4, batch_size=2, poll_seconds=0.05)
+    monkeypatch.setattr(webhook_service, "webhook_dispatcher", dispatcher)
+
+    async def scenario():
+        task = asyncio.create_task(dispatcher.run_forever())
+        await asyncio.sleep(0.05)
+        durations = []
+        for i in range(6):
+            started = time.monotonic()
+            await asyncio.to_thread(process_gee_result, GEEResultInput(
+                project_id="proj-1", run_id=f"run-{i}", start_date="2026-01-01", end_date="2026-01-28",
+                stats={"affected_area_ha": 5.0}, outputs={}, loss_polygons_url="", metadata={},
+            ))
+            durations.append(time.monotonic() - started)
+        # Every alert reaches the fast endpoint while the slow one is still busy
+        await wait_until(lambda: sum(len(b["events"]) for _, b in Sink.received.get("/fast", [])) == 6)
+        assert "pending" in outbox.statuses("slow") or "delivering" in outbox.statuses("slow")
+        await wait_until(lambda: set(outbox.statuses("slow")) == {"delivered"})
+        await stop(task)
+        return durations
+
+    durations = asyncio.run(scenario())
+    assert max(durations) < 0.25
+    assert Sink.peak["/slow"] == 1  # max_concurrency
+    slow_events = [event for _, body in Sink.received["/slow"] for event in body["events"]]
+    assert sorted(e["type"] for e in slow_events) == ["alert.raised"] * 6 + ["run.completed"] * 6
+    assert max(len(body["events"]) for _, body in Sink.received["/slow"]) == 2  # batched
+    headers, body = Sink.received["/fast"][0]
+    raw = json.dumps(body, separators=(",", ":")).encode()
+    assert headers["X-Bioma-Signature"] == sign("s3cret", raw)
+
+
+def test_failed_deliveries_are_retried_then_dead_lettered(monkeypatch, sink):
+    monkeypatch.setattr(settings, "webhook_max_attempts", 3)
+    monkeypatch.setattr(settings, "webhook_backoff_base_seconds", 0.01)
+    outbox = MemoryOutbox([endpoint("broken", f"{sink}/broken"), endpoint("ok", f"{sink}/ok")])
+    dispatcher = WebhookDispatcher(outbox, workers=2, batch_size=10, poll_seconds=0.02)
+
+    async def scenario():
+        task = asyncio.create_task(dispatcher.run_forever())
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(dispatcher.enqueue, [webhook_service._event("run.completed", {"project_id": "p"})])
+        await wait_until(lambda: outbox.statuses("broken") == ["dead"] and outbox.statuses("ok") == ["delivered"])
+        await stop(task)
+
+    asyncio.run(scenario())
+    assert len(Sink.received["/broken"]) == 3
+    assert [e["attempt"] for _, body in Sink.received["/broken"] for e in body["events"]] == [1, 2, 3]
+    assert next(r for r in outbox.rows if r["endpoint_id"] == "broken")["last_error"] == "HTTP 500"
+
+
+def test_nothing_is_queued_while_disabled(monkeypatch):
+    outbox = MemoryOutbox([endpoint("a", "http://127.0.0.1:9/a")])
+    monkeypatch.setattr(webhook_service, "webhook_dispatcher", WebhookDispatcher(outbox))
+    event = webhook_service._event("run.completed", {"project_id": "p"})
+    monkeypatch.setattr(settings, "webhooks_enabled", False)
+    assert webhook_service.emit_events([event]) == 0 and outbox.rows == []
+    monkeypatch.setattr(settings, "webhooks_enabled", True)
+    assert webhook_service.emit_events([event]) == 1
+
+
+def test_delivered_rows_are_pruned_after_retention(monkeypatch):
+    monkeypatch.setattr(settings, "webhook_retention_days", 7)
+    monkeypatch.setattr(webhook_service, "PRUNE_BATCH", 2)
+    outbox = MemoryOutbox([])
+    outbox.rows = [
+        {"id": i, "status": status, "delivered_at": delivered_at}
+        for i, (status, delivered_at) in enumerate([
+            ("delivered", "2020-01-01T00:00:00+00:00"),
+            ("delivered", "2020-01-02T00:00:00+00:00"),
+            ("delivered", "2020-01-03T00:00:00+00:00"),
+            ("delivered", datetime.now(timezone.utc).isoformat()),
+            ("dead", None),
+            ("pending", None),
+        ])
+    ]
+    assert asyncio.run(WebhookDispatcher(outbox).prune_once()) == 3
+    assert [row["id"] for row in outbox.rows] == [3, 4, 5]